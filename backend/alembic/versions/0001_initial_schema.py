@@ -0,0 +1,90 @@
+"""initial schema
+
+Revision ID: 0001
+Revises: 
+Create Date: 2026-10-19 09:00:00.000000
+
+"""
+from alembic import context, op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision = '0001'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Existing deployments created these tables by hand; only create what is missing
+    existing = set()
+    if not context.is_offline_mode():
+        existing = set(sa.inspect(op.get_bind()).get_table_names())
+
+    if "codesystem" not in existing:
+        op.create_table(
+            "codesystem",
+            sa.Column("id", postgresql.UUID(as_uuid=True), primary_key=True),
+            sa.Column("external_id", sa.Text()),
+            sa.Column("url", sa.Text()),
+            sa.Column("version", sa.Text()),
+            sa.Column("name", sa.Text()),
+            sa.Column("title", sa.Text()),
+            sa.Column("status", sa.Text()),
+            sa.Column("publisher", sa.Text()),
+            sa.Column("content", sa.Text()),
+            sa.Column("meta", sa.JSON()),
+            sa.Column("resource", sa.JSON()),
+            sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.func.now()),
+            sa.Column("updated_at", sa.DateTime(timezone=True), server_default=sa.func.now()),
+        )
+
+    if "concept" not in existing:
+        op.create_table(
+            "concept",
+            sa.Column("id", postgresql.UUID(as_uuid=True), primary_key=True),
+            sa.Column("codesystem_id", postgresql.UUID(as_uuid=True), sa.ForeignKey("codesystem.id"), nullable=False),
+            sa.Column("code", sa.Text(), nullable=False),
+            sa.Column("display", sa.Text()),
+            sa.Column("definition", sa.Text()),
+            sa.Column("properties", sa.JSON()),
+            sa.Column("raw", sa.JSON()),
+            sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.func.now()),
+            sa.Column("updated_at", sa.DateTime(timezone=True), server_default=sa.func.now()),
+        )
+
+    if "conceptmap" not in existing:
+        op.create_table(
+            "conceptmap",
+            sa.Column("id", postgresql.UUID(as_uuid=True), primary_key=True),
+            sa.Column("source_codesystem_id", postgresql.UUID(as_uuid=True), sa.ForeignKey("codesystem.id"), nullable=False),
+            sa.Column("target_codesystem_id", postgresql.UUID(as_uuid=True), sa.ForeignKey("codesystem.id"), nullable=False),
+            sa.Column("source_code", postgresql.UUID(as_uuid=True), nullable=False),
+            sa.Column("target_code", postgresql.UUID(as_uuid=True), nullable=False),
+            sa.Column("equivalence", sa.Text()),
+            sa.Column("metadata", sa.JSON()),
+            sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.func.now()),
+            sa.Column("updated_at", sa.DateTime(timezone=True), server_default=sa.func.now()),
+        )
+
+    if "audit_log" not in existing:
+        op.create_table(
+            "audit_log",
+            sa.Column("id", postgresql.UUID(as_uuid=True), primary_key=True),
+            sa.Column("table_name", sa.Text(), nullable=False),
+            sa.Column("operation", sa.Text(), nullable=False),
+            sa.Column("record_id", postgresql.UUID(as_uuid=True), nullable=False),
+            sa.Column("user_id", sa.Text()),
+            sa.Column("changed_at", sa.DateTime(timezone=True), server_default=sa.func.now()),
+            sa.Column("old_data", sa.JSON()),
+            sa.Column("new_data", sa.JSON()),
+            sa.Column("meta", sa.JSON()),
+        )
+
+
+def downgrade() -> None:
+    op.drop_table("audit_log")
+    op.drop_table("conceptmap")
+    op.drop_table("concept")
+    op.drop_table("codesystem")
@@ -0,0 +1,76 @@
+"""add lookup indexes
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-19 09:30:00.000000
+
+"""
+from alembic import context, op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '0002'
+down_revision = '0001'
+branch_labels = None
+depends_on = None
+
+# (name, table, columns, unique, partial WHERE clause)
+INDEXES = [
+    ("uq_concept_codesystem_code", "concept", ["codesystem_id", "code"], True, None),
+    ("ix_conceptmap_source_target_code", "conceptmap",
+     ["source_codesystem_id", "target_codesystem_id", "source_code"], False, None),
+    ("ix_conceptmap_source_code", "conceptmap", ["source_code"], False, None),
+    ("ix_conceptmap_target_code", "conceptmap", ["target_code"], False, None),
+    ("ix_conceptmap_target_codesystem", "conceptmap", ["target_codesystem_id"], False, None),
+    ("ix_codesystem_url", "codesystem", ["url"], False, "url IS NOT NULL"),
+    ("ix_codesystem_name", "codesystem", ["name"], False, "name IS NOT NULL"),
+    ("ix_audit_log_table_record_changed", "audit_log",
+     ["table_name", "record_id", sa.text("changed_at DESC")], False, None),
+    ("ix_audit_log_changed_at", "audit_log", [sa.text("changed_at DESC")], False, None),
+]
+
+
+def _drop_invalid(name: str) -> None:
+    """Remove a leftover INVALID index from an interrupted concurrent build"""
+    if context.is_offline_mode():
+        return
+    invalid = op.get_bind().execute(sa.text(
+        "SELECT 1 FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid "
+        "WHERE c.relname = :name AND NOT i.indisvalid"
+    ), {"name": name}).first()
+    if invalid:
+        op.execute(f'DROP INDEX CONCURRENTLY IF EXISTS "{name}"')
+
+
+def upgrade() -> None:
+    duplicates = 0
+    if not context.is_offline_mode():
+        duplicates = op.get_bind().execute(sa.text(
+            "SELECT count(*) FROM (SELECT 1 FROM concept GROUP BY codesystem_id, code HAVING count(*) > 1) d"
+        )).scalar()
+    if duplicates:
+        raise RuntimeError(
+            f"{duplicates} duplicate (codesystem_id, code) pairs in concept; "
+            "resolve them before creating uq_concept_codesystem_code"
+        )
+
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction and does not
+    # block writes on live tables.
+    with op.get_context().autocommit_block():
+        for name, table, columns, unique, where in INDEXES:
+            _drop_invalid(name)
+            op.create_index(
+                name,
+                table,
+                columns,
+                unique=unique,
+                postgresql_where=sa.text(where) if where else None,
+                postgresql_concurrently=True,
+                if_not_exists=True,
+            )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        for name, table, _, _, _ in reversed(INDEXES):
+            op.drop_index(name, table_name=table, postgresql_concurrently=True, if_exists=True)
@@ -0,0 +1,47 @@
+"""jsonb columns and concept property index
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-19 10:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '0003'
+down_revision = '0002'
+branch_labels = None
+depends_on = None
+
+COLUMNS = [
+    ("codesystem", "meta"),
+    ("codesystem", "resource"),
+    ("concept", "properties"),
+    ("concept", "raw"),
+    ("conceptmap", "metadata"),
+]
+
+
+def upgrade() -> None:
+    # Rewrites each table under an ACCESS EXCLUSIVE lock; run in a quiet window
+    for table, column in COLUMNS:
+        op.execute(f'ALTER TABLE {table} ALTER COLUMN "{column}" TYPE JSONB USING "{column}"::jsonb')
+
+    with op.get_context().autocommit_block():
+        op.create_index(
+            "ix_concept_properties_gin",
+            "concept",
+            ["properties"],
+            postgresql_using="gin",
+            postgresql_ops={"properties": "jsonb_path_ops"},
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index("ix_concept_properties_gin", table_name="concept", postgresql_concurrently=True, if_exists=True)
+    for table, column in COLUMNS:
+        op.execute(f'ALTER TABLE {table} ALTER COLUMN "{column}" TYPE JSON USING "{column}"::json')
@@ -0,0 +1,77 @@
+"""change notification triggers
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-19 11:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '0004'
+down_revision = '0003'
+branch_labels = None
+depends_on = None
+
+CHANNEL = "fhirfly_changes"
+TABLES = ["codesystem", "concept", "conceptmap"]
+
+# Payload: table, op, row id, the key columns app.utils.events subscribers
+# use, and the writer's application_name so workers can skip their own writes
+NOTIFY_FUNCTION = f"""
+CREATE OR REPLACE FUNCTION fhirfly_notify_change() RETURNS trigger AS $$
+DECLARE
+    row_id uuid;
+    old_keys jsonb;
+    new_keys jsonb;
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        row_id := OLD.id;
+    ELSE
+        row_id := NEW.id;
+    END IF;
+    IF TG_TABLE_NAME = 'concept' THEN
+        IF TG_OP <> 'INSERT' THEN
+            old_keys := jsonb_build_object('codesystem_id', OLD.codesystem_id, 'code', OLD.code);
+        END IF;
+        IF TG_OP <> 'DELETE' THEN
+            new_keys := jsonb_build_object('codesystem_id', NEW.codesystem_id, 'code', NEW.code);
+        END IF;
+    ELSIF TG_TABLE_NAME = 'conceptmap' THEN
+        IF TG_OP <> 'INSERT' THEN
+            old_keys := jsonb_build_object(
+                'source_codesystem_id', OLD.source_codesystem_id, 'target_codesystem_id', OLD.target_codesystem_id,
+                'source_code', OLD.source_code, 'target_code', OLD.target_code);
+        END IF;
+        IF TG_OP <> 'DELETE' THEN
+            new_keys := jsonb_build_object(
+                'source_codesystem_id', NEW.source_codesystem_id, 'target_codesystem_id', NEW.target_codesystem_id,
+                'source_code', NEW.source_code, 'target_code', NEW.target_code);
+        END IF;
+    END IF;
+    PERFORM pg_notify('{CHANNEL}', jsonb_build_object(
+        'table', TG_TABLE_NAME, 'op', TG_OP, 'id', row_id,
+        'origin', current_setting('application_name'),
+        'old', old_keys, 'new', new_keys
+    )::text);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql
+"""
+
+
+def upgrade() -> None:
+    op.execute(NOTIFY_FUNCTION)
+    for table in TABLES:
+        op.execute(f"DROP TRIGGER IF EXISTS {table}_notify_change ON {table}")
+        op.execute(
+            f"CREATE TRIGGER {table}_notify_change AFTER INSERT OR UPDATE OR DELETE ON {table} "
+            f"FOR EACH ROW EXECUTE FUNCTION fhirfly_notify_change()"
+        )
+
+
+def downgrade() -> None:
+    for table in TABLES:
+        op.execute(f"DROP TRIGGER IF EXISTS {table}_notify_change ON {table}")
+    op.execute("DROP FUNCTION IF EXISTS fhirfly_notify_change()")
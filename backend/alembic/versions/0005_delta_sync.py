@@ -0,0 +1,47 @@
+"""tombstones and keyset indexes for delta sync
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-19 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision = '0005'
+down_revision = '0004'
+branch_labels = None
+depends_on = None
+
+# (name, table, columns)
+INDEXES = [
+    ("ix_codesystem_updated_at_id", "codesystem", ["updated_at", "id"]),
+    ("ix_concept_updated_at_id", "concept", ["updated_at", "id"]),
+    ("ix_conceptmap_updated_at_id", "conceptmap", ["updated_at", "id"]),
+]
+
+
+def upgrade() -> None:
+    op.create_table(
+        "tombstone",
+        sa.Column("id", postgresql.UUID(as_uuid=True), primary_key=True),
+        sa.Column("table_name", sa.Text(), nullable=False),
+        sa.Column("record_id", postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column("keys", sa.JSON()),
+        sa.Column("deleted_at", sa.DateTime(timezone=True), server_default=sa.func.now()),
+    )
+    op.create_index("ix_tombstone_table_deleted_at_id", "tombstone", ["table_name", "deleted_at", "id"])
+
+    with op.get_context().autocommit_block():
+        for name, table, columns in INDEXES:
+            op.create_index(name, table, columns, postgresql_concurrently=True, if_not_exists=True)
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        for name, table, _ in reversed(INDEXES):
+            op.drop_index(name, table_name=table, postgresql_concurrently=True, if_exists=True)
+    op.drop_index("ix_tombstone_table_deleted_at_id", table_name="tombstone")
+    op.drop_table("tombstone")
@@ -0,0 +1,28 @@
+"""row version counters for optimistic concurrency
+
+Revision ID: 0007
+Revises: 0006
+Create Date: 2026-10-19 14:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '0007'
+down_revision = '0006'
+branch_labels = None
+depends_on = None
+
+TABLES = ("codesystem", "concept", "conceptmap")
+
+
+def upgrade() -> None:
+    # A constant default is stored in the catalog (Postgres 11+), so existing rows are not rewritten
+    for table in TABLES:
+        op.add_column(table, sa.Column("version_id", sa.Integer(), nullable=False, server_default="1"))
+
+
+def downgrade() -> None:
+    for table in TABLES:
+        op.drop_column(table, "version_id")
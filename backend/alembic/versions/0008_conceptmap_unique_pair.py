@@ -0,0 +1,60 @@
+"""one conceptmap row per source/target concept pair
+
+Revision ID: 0008
+Revises: 0007
+Create Date: 2026-10-19 15:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '0008'
+down_revision = '0007'
+branch_labels = None
+depends_on = None
+
+# Keeps the oldest row of each (source_code, target_code) pair, leaving a
+# tombstone for every removed duplicate so delta sync clients drop it too
+DEDUPLICATE = """
+WITH ranked AS (
+    SELECT id, row_number() OVER (
+        PARTITION BY source_code, target_code ORDER BY created_at, id
+    ) AS position
+    FROM conceptmap
+), removed AS (
+    DELETE FROM conceptmap USING ranked
+    WHERE conceptmap.id = ranked.id AND ranked.position > 1
+    RETURNING conceptmap.id, conceptmap.source_codesystem_id, conceptmap.target_codesystem_id,
+              conceptmap.source_code, conceptmap.target_code
+)
+INSERT INTO tombstone (id, table_name, record_id, keys, deleted_at)
+SELECT gen_random_uuid(), 'conceptmap', id, json_build_object(
+    'source_codesystem_id', source_codesystem_id::text, 'target_codesystem_id', target_codesystem_id::text,
+    'source_code', source_code::text, 'target_code', target_code::text
+), now()
+FROM removed
+"""
+
+
+def upgrade() -> None:
+    op.execute(DEDUPLICATE)
+    with op.get_context().autocommit_block():
+        op.create_index(
+            "uq_conceptmap_source_target_code", "conceptmap", ["source_code", "target_code"],
+            unique=True, postgresql_concurrently=True, if_not_exists=True
+        )
+        # A prefix of the unique index; one less index to maintain on bulk inserts
+        op.drop_index("ix_conceptmap_source_code", table_name="conceptmap", postgresql_concurrently=True, if_exists=True)
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.create_index(
+            "ix_conceptmap_source_code", "conceptmap", ["source_code"],
+            postgresql_concurrently=True, if_not_exists=True
+        )
+        op.drop_index(
+            "uq_conceptmap_source_target_code", table_name="conceptmap",
+            postgresql_concurrently=True, if_exists=True
+        )
@@ -0,0 +1,24 @@
+"""content hash of ingested concepts
+
+Revision ID: 0009
+Revises: 0008
+Create Date: 2026-10-19 16:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '0009'
+down_revision = '0008'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Nullable without a default: a catalog-only change, existing rows are not rewritten
+    op.add_column("concept", sa.Column("content_hash", sa.Text(), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column("concept", "content_hash")
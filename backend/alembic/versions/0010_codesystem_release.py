@@ -0,0 +1,39 @@
+"""per-release change summaries of codesystems
+
+Revision ID: 0010
+Revises: 0009
+Create Date: 2026-10-19 17:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision = '0010'
+down_revision = '0009'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "codesystem_release",
+        sa.Column("id", postgresql.UUID(as_uuid=True), primary_key=True),
+        sa.Column("codesystem_id", postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column("version", sa.Text()),
+        sa.Column("previous_version", sa.Text()),
+        sa.Column("source", sa.Text()),
+        sa.Column("added", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("changed", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("removed", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("unchanged", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("summary", sa.JSON()),
+        sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.func.now()),
+    )
+    op.create_index("ix_codesystem_release_codesystem_created_at", "codesystem_release", ["codesystem_id", "created_at"])
+
+
+def downgrade() -> None:
+    op.drop_index("ix_codesystem_release_codesystem_created_at", table_name="codesystem_release")
+    op.drop_table("codesystem_release")
@@ -0,0 +1,134 @@
+"""statement-level change notification triggers
+
+Revision ID: 0011
+Revises: 0010
+Create Date: 2026-10-19 20:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '0011'
+down_revision = '0010'
+branch_labels = None
+depends_on = None
+
+CHANNEL = "fhirfly_changes"
+TABLES = ["codesystem", "concept", "conceptmap"]
+
+# One notification per statement instead of per row.  A statement that
+# changed a single row (an API write) still sends that row's payload, as the
+# row triggers of 0004 did.  Bulk statements (cascading deletes, mapping
+# import, ingestion, release apply) send one notification per codesystem
+# (concepts) or codesystem pair (conceptmaps) with the codes set to null and
+# no row id, which subscribers treat as "drop what you derived from it".
+NOTIFY_FUNCTION = f"""
+CREATE OR REPLACE FUNCTION fhirfly_notify_statement() RETURNS trigger AS $$
+DECLARE
+    origin text := current_setting('application_name');
+    changed jsonb;
+    no_codes jsonb;
+BEGIN
+    -- [{{id, old, new}}] with the key columns of every changed row
+    IF TG_TABLE_NAME = 'concept' THEN
+        no_codes := '{{"code": null}}';
+        IF TG_OP = 'INSERT' THEN
+            SELECT jsonb_agg(jsonb_build_object('id', n.id,
+                'new', jsonb_build_object('codesystem_id', n.codesystem_id, 'code', n.code)))
+            INTO changed FROM new_rows n;
+        ELSIF TG_OP = 'DELETE' THEN
+            SELECT jsonb_agg(jsonb_build_object('id', o.id,
+                'old', jsonb_build_object('codesystem_id', o.codesystem_id, 'code', o.code)))
+            INTO changed FROM old_rows o;
+        ELSE
+            SELECT jsonb_agg(jsonb_build_object('id', n.id,
+                'old', jsonb_build_object('codesystem_id', o.codesystem_id, 'code', o.code),
+                'new', jsonb_build_object('codesystem_id', n.codesystem_id, 'code', n.code)))
+            INTO changed FROM old_rows o JOIN new_rows n ON n.id = o.id;
+        END IF;
+    ELSIF TG_TABLE_NAME = 'conceptmap' THEN
+        no_codes := '{{"source_code": null, "target_code": null}}';
+        IF TG_OP = 'INSERT' THEN
+            SELECT jsonb_agg(jsonb_build_object('id', n.id,
+                'new', jsonb_build_object(
+                    'source_codesystem_id', n.source_codesystem_id, 'target_codesystem_id', n.target_codesystem_id,
+                    'source_code', n.source_code, 'target_code', n.target_code)))
+            INTO changed FROM new_rows n;
+        ELSIF TG_OP = 'DELETE' THEN
+            SELECT jsonb_agg(jsonb_build_object('id', o.id,
+                'old', jsonb_build_object(
+                    'source_codesystem_id', o.source_codesystem_id, 'target_codesystem_id', o.target_codesystem_id,
+                    'source_code', o.source_code, 'target_code', o.target_code)))
+            INTO changed FROM old_rows o;
+        ELSE
+            SELECT jsonb_agg(jsonb_build_object('id', n.id,
+                'old', jsonb_build_object(
+                    'source_codesystem_id', o.source_codesystem_id, 'target_codesystem_id', o.target_codesystem_id,
+                    'source_code', o.source_code, 'target_code', o.target_code),
+                'new', jsonb_build_object(
+                    'source_codesystem_id', n.source_codesystem_id, 'target_codesystem_id', n.target_codesystem_id,
+                    'source_code', n.source_code, 'target_code', n.target_code)))
+            INTO changed FROM old_rows o JOIN new_rows n ON n.id = o.id;
+        END IF;
+    ELSIF TG_OP = 'DELETE' THEN
+        SELECT jsonb_agg(jsonb_build_object('id', o.id)) INTO changed FROM old_rows o;
+    ELSE
+        SELECT jsonb_agg(jsonb_build_object('id', n.id)) INTO changed FROM new_rows n;
+    END IF;
+
+    IF changed IS NULL THEN
+        RETURN NULL;
+    END IF;
+    -- Codesystems are few and have no codes to summarize
+    IF jsonb_array_length(changed) = 1 OR no_codes IS NULL THEN
+        PERFORM pg_notify('{CHANNEL}', jsonb_build_object(
+            'table', TG_TABLE_NAME, 'op', TG_OP, 'id', c->'id', 'origin', origin,
+            'old', c->'old', 'new', c->'new'
+        )::text)
+        FROM jsonb_array_elements(changed) c;
+    ELSE
+        PERFORM pg_notify('{CHANNEL}', jsonb_build_object(
+            'table', TG_TABLE_NAME, 'op', TG_OP, 'id', NULL, 'origin', origin,
+            'old', CASE WHEN TG_OP <> 'INSERT' THEN k END,
+            'new', CASE WHEN TG_OP <> 'DELETE' THEN k END
+        )::text)
+        FROM (
+            SELECT (c->'old') || no_codes AS k FROM jsonb_array_elements(changed) c WHERE c ? 'old'
+            UNION
+            SELECT (c->'new') || no_codes FROM jsonb_array_elements(changed) c WHERE c ? 'new'
+        ) keys;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql
+"""
+
+
+def upgrade() -> None:
+    op.execute(NOTIFY_FUNCTION)
+    for table in TABLES:
+        op.execute(f"DROP TRIGGER IF EXISTS {table}_notify_change ON {table}")
+        op.execute(
+            f"CREATE TRIGGER {table}_notify_insert AFTER INSERT ON {table} "
+            f"REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION fhirfly_notify_statement()"
+        )
+        op.execute(
+            f"CREATE TRIGGER {table}_notify_update AFTER UPDATE ON {table} "
+            f"REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION fhirfly_notify_statement()"
+        )
+        op.execute(
+            f"CREATE TRIGGER {table}_notify_delete AFTER DELETE ON {table} "
+            f"REFERENCING OLD TABLE AS old_rows FOR EACH STATEMENT EXECUTE FUNCTION fhirfly_notify_statement()"
+        )
+
+
+def downgrade() -> None:
+    for table in TABLES:
+        for event in ("insert", "update", "delete"):
+            op.execute(f"DROP TRIGGER IF EXISTS {table}_notify_{event} ON {table}")
+        op.execute(
+            f"CREATE TRIGGER {table}_notify_change AFTER INSERT OR UPDATE OR DELETE ON {table} "
+            f"FOR EACH ROW EXECUTE FUNCTION fhirfly_notify_change()"
+        )
+    op.execute("DROP FUNCTION IF EXISTS fhirfly_notify_statement()")
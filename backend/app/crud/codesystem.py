@@ -1,13 +1,22 @@
-from typing import List, Optional
+import os
+from typing import Callable, Dict, List, Optional
 from uuid import UUID
 from sqlalchemy.orm import Session
-from sqlalchemy import and_, or_
-from app.models import CodeSystem
+from sqlalchemy import and_, delete, func, insert, or_, select, update
+from app.models import CodeSystem, Concept, ConceptMap, Tombstone
 from app.schemas import CodeSystemCreate, CodeSystemUpdate
+from app.crud.audit_log import audit_log
+from app.crud.sync import sync
+from app.utils.etag import PreconditionFailed, check_missed, version_guard
+from app.utils.events import ChangeEvent, publish
+from app.utils.fields import load_only_columns
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Rows per DELETE when cascading; each batch is its own short transaction
+CASCADE_BATCH_SIZE = int(os.getenv("CASCADE_BATCH_SIZE", "5000"))
+
 class CodeSystemCRUD:
     def create(self, db: Session, obj_in: CodeSystemCreate) -> CodeSystem:
         """Create a new codesystem"""
@@ -16,29 +25,31 @@ class CodeSystemCRUD:
         db.commit()
         db.refresh(db_obj)
         logger.info(f"Created codesystem with ID: {db_obj.id}")
+        publish(ChangeEvent("codesystem", "INSERT", db_obj.id))
         return db_obj
 
-    def get(self, db: Session, id: UUID) -> Optional[CodeSystem]:
+    def get(self, db: Session, id: UUID, columns: Optional[List[str]] = None) -> Optional[CodeSystem]:
         """Get codesystem by ID"""
-        return db.query(CodeSystem).filter(CodeSystem.id == id).first()
+        return db.query(CodeSystem).options(*load_only_columns(CodeSystem, columns)).filter(CodeSystem.id == id).first()
 
-    def get_by_url(self, db: Session, url: str) -> Optional[CodeSystem]:
+    def get_by_url(self, db: Session, url: str, columns: Optional[List[str]] = None) -> Optional[CodeSystem]:
         """Get codesystem by URL"""
-        return db.query(CodeSystem).filter(CodeSystem.url == url).first()
+        return db.query(CodeSystem).options(*load_only_columns(CodeSystem, columns)).filter(CodeSystem.url == url).first()
 
-    def get_by_name(self, db: Session, name: str) -> Optional[CodeSystem]:
+    def get_by_name(self, db: Session, name: str, columns: Optional[List[str]] = None) -> Optional[CodeSystem]:
         """Get codesystem by name"""
-        return db.query(CodeSystem).filter(CodeSystem.name == name).first()
+        return db.query(CodeSystem).options(*load_only_columns(CodeSystem, columns)).filter(CodeSystem.name == name).first()
 
     def get_multi(
         self, 
         db: Session, 
         skip: int = 0, 
         limit: int = 100,
-        search: Optional[str] = None
+        search: Optional[str] = None,
+        columns: Optional[List[str]] = None
     ) -> List[CodeSystem]:
         """Get multiple codesystems with optional search"""
-        query = db.query(CodeSystem)
+        query = db.query(CodeSystem).options(*load_only_columns(CodeSystem, columns))
         
         if search:
             search_filter = or_(
@@ -50,25 +61,133 @@ class CodeSystemCRUD:
         
         return query.offset(skip).limit(limit).all()
 
-    def update(self, db: Session, db_obj: CodeSystem, obj_in: CodeSystemUpdate) -> CodeSystem:
-        """Update codesystem"""
+    def update(
+        self, db: Session, id: UUID, obj_in: CodeSystemUpdate, versions: Optional[List[int]] = None
+    ) -> Optional[CodeSystem]:
+        """Update codesystem with a single UPDATE ... RETURNING.
+
+        ``versions`` (from If-Match) limits the update to those row versions;
+        PreconditionFailed is raised when the codesystem is at another one.
+        """
         update_data = obj_in.model_dump(exclude_unset=True)
-        for field, value in update_data.items():
-            setattr(db_obj, field, value)
-        
-        db.add(db_obj)
+        db_obj = db.execute(
+            update(CodeSystem).where(CodeSystem.id == id, *version_guard(CodeSystem, versions))
+            .values(**update_data, version_id=CodeSystem.version_id + 1)
+            .returning(CodeSystem),
+            execution_options={"synchronize_session": False, "populate_existing": True}
+        ).scalars().first()
+        if db_obj is None:
+            check_missed(db, CodeSystem, id, versions)
+            return None
+        # Detached, the returned attributes survive the commit without a reload
+        db.expunge(db_obj)
         db.commit()
-        db.refresh(db_obj)
-        logger.info(f"Updated codesystem with ID: {db_obj.id}")
+        logger.info(f"Updated codesystem with ID: {id}")
+        publish(ChangeEvent("codesystem", "UPDATE", id))
         return db_obj
 
-    def delete(self, db: Session, id: UUID) -> Optional[CodeSystem]:
-        """Delete codesystem"""
-        obj = db.query(CodeSystem).get(id)
-        if obj:
-            db.delete(obj)
-            db.commit()
-            logger.info(f"Deleted codesystem with ID: {id}")
+    def delete(
+        self,
+        db: Session,
+        id: UUID,
+        progress: Optional[Callable[[int, int], None]] = None,
+        batch_size: int = CASCADE_BATCH_SIZE,
+        versions: Optional[List[int]] = None
+    ) -> Optional[CodeSystem]:
+        """Delete codesystem with its concepts and the conceptmaps that use it.
+
+        Dependent rows go in set-based DELETEs of at most ``batch_size`` rows,
+        each committed on its own so locks are held only briefly. The whole
+        delete is not atomic: if it is interrupted, deleting again finishes it.
+        One audit entry summarizes the cascade. ``versions`` (from If-Match)
+        is checked before anything is deleted. Structures derived from the
+        codesystem are invalidated even when the cascade stops part way.
+        """
+        obj = db.get(CodeSystem, id)
+        if not obj:
+            return None
+        if versions is not None and obj.version_id not in versions:
+            raise PreconditionFailed(f"CodeSystem {id} was modified; If-Match does not match its current ETag")
+        
+        maps_filter = or_(ConceptMap.source_codesystem_id == id, ConceptMap.target_codesystem_id == id)
+        total = db.query(func.count(ConceptMap.id)).filter(maps_filter).scalar() + \
+            db.query(func.count(Concept.id)).filter(Concept.codesystem_id == id).scalar()
+        counts = {"conceptmap": 0, "concept": 0}
+        batches = 0
+        if progress:
+            progress(0, total)
+        
+        completed = False
+        try:
+            while True:
+                rows = db.execute(
+                    delete(ConceptMap)
+                    .where(ConceptMap.id.in_(select(ConceptMap.id).where(maps_filter).limit(batch_size)))
+                    .returning(ConceptMap.id, ConceptMap.source_codesystem_id, ConceptMap.target_codesystem_id,
+                               ConceptMap.source_code, ConceptMap.target_code)
+                    .execution_options(synchronize_session=False)
+                ).all()
+                if not rows:
+                    break
+                db.execute(insert(Tombstone), [
+                    {"table_name": "conceptmap", "record_id": row.id, "keys": {
+                        "source_codesystem_id": str(row.source_codesystem_id), "target_codesystem_id": str(row.target_codesystem_id),
+                        "source_code": str(row.source_code), "target_code": str(row.target_code),
+                    }}
+                    for row in rows
+                ])
+                db.commit()
+                counts["conceptmap"] += len(rows)
+                batches += 1
+                for source_id, target_id in {(row.source_codesystem_id, row.target_codesystem_id) for row in rows}:
+                    publish(ChangeEvent("conceptmap", "DELETE", old={
+                        "source_codesystem_id": source_id, "target_codesystem_id": target_id,
+                        "source_code": None, "target_code": None,
+                    }))
+                if progress:
+                    progress(counts["conceptmap"], total)
+        
+            while True:
+                rows = db.execute(
+                    delete(Concept)
+                    .where(Concept.id.in_(select(Concept.id).where(Concept.codesystem_id == id).limit(batch_size)))
+                    .returning(Concept.id, Concept.code)
+                    .execution_options(synchronize_session=False)
+                ).all()
+                if not rows:
+                    break
+                db.execute(insert(Tombstone), [
+                    {"table_name": "concept", "record_id": row.id, "keys": {"codesystem_id": str(id), "code": row.code}}
+                    for row in rows
+                ])
+                db.commit()
+                counts["concept"] += len(rows)
+                batches += 1
+                if progress:
+                    progress(counts["conceptmap"] + counts["concept"], total)
+        
+            # Detach with its attributes loaded so it can still be returned
+            if batches:
+                db.refresh(obj)
+            db.expunge(obj)
+            db.execute(delete(CodeSystem).where(CodeSystem.id == id).execution_options(synchronize_session=False))
+            sync.record_deletion(db, "codesystem", id, {"url": obj.url, "version": obj.version})
+            # Commits the codesystem delete together with its audit entry
+            audit_log.create_audit_log(
+                db,
+                table_name="codesystem",
+                operation="DELETE",
+                record_id=id,
+                old_data={"url": obj.url, "version": obj.version, "name": obj.name, "title": obj.title},
+                meta={"cascade": counts, "batches": batches},
+            )
+            logger.info(f"Deleted codesystem with ID: {id} ({counts['concept']} concepts, {counts['conceptmap']} conceptmaps)")
+            completed = True
+        finally:
+            # Drops every structure derived from the codesystem's concepts,
+            # also when a cancelled or failed cascade committed only some batches
+            if completed or batches:
+                publish(ChangeEvent("codesystem", "DELETE", id))
         return obj
 
     def count(self, db: Session, search: Optional[str] = None) -> int:
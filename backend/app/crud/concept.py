@@ -1,13 +1,74 @@
-from typing import List, Optional
+import hashlib
+import uuid
+from typing import Any, Dict, List, Optional, Tuple
 from uuid import UUID
-from sqlalchemy.orm import Session
-from sqlalchemy import and_, or_
+from sqlalchemy.orm import Session, aliased
+from sqlalchemy import Text, and_, cast, delete, func, or_, select, tuple_, type_coerce, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.dialects.postgresql import JSONB
 from app.models import Concept
 from app.schemas import ConceptCreate, ConceptUpdate
+from app.crud.sync import sync
+from app.utils.cache import read_cache
+from app.utils.etag import check_missed, version_guard
+from app.utils.events import ChangeEvent, publish
+from app.utils.fields import load_only_columns
+from app.utils.hierarchy import parent_codes
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Columns the change event keys are derived from
+KEY_FIELDS = ("codesystem_id", "code", "properties", "raw")
+
+def _keys(obj: Concept) -> dict:
+    return {
+        "codesystem_id": obj.codesystem_id,
+        "code": obj.code,
+        "parents": parent_codes(obj.properties, obj.raw),
+    }
+
+def _typed_values(value: str) -> List[Tuple[str, Any]]:
+    """(key, value) pairs a property value given as text may be stored as"""
+    typed: List[Tuple[str, Any]] = [("valueCode", value), ("valueString", value)]
+    if value in ("true", "false"):
+        typed.append(("valueBoolean", value == "true"))
+    elif value.lstrip("-").isdigit() and str(int(value)) == value:
+        typed.append(("valueInteger", int(value)))
+    return typed
+
+def property_filter(code: str, values: List[str], dialect: str = "postgresql"):
+    """Containment match on Concept.properties, served by the GIN (jsonb_path_ops) index.
+
+    Values are compared as text, so ``true`` matches ``valueBoolean: true``
+    and ``12`` matches ``valueInteger: 12``.
+    """
+    if dialect != "postgresql":
+        # SQLite (offline exports): scan the property array with json_each
+        prop = func.json_each(Concept.properties).table_valued("value").alias("prop")
+        return select(prop.c.value).where(
+            func.json_extract(prop.c.value, "$.code") == code,
+            or_(
+                func.json_extract(prop.c.value, "$.valueCode").in_(values),
+                func.json_extract(prop.c.value, "$.valueString").in_(values),
+                # json_type() names a JSON boolean 'true' or 'false'
+                func.json_type(prop.c.value, "$.valueBoolean").in_([v for v in values if v in ("true", "false")]),
+                and_(
+                    func.json_type(prop.c.value, "$.valueInteger") == "integer",
+                    cast(func.json_extract(prop.c.value, "$.valueInteger"), Text).in_(values),
+                ),
+            ),
+        ).exists()
+    props = type_coerce(Concept.properties, JSONB)
+    return or_(*[
+        props.contains([{"code": code, key: typed}])
+        for value in values
+        for key, typed in _typed_values(value)
+    ])
+
+# (property code, accepted values) pairs; pairs are AND-ed, values OR-ed
+PropertyFilters = List[Tuple[str, List[str]]]
+
 class ConceptCRUD:
     def create(self, db: Session, obj_in: ConceptCreate) -> Concept:
         """Create a new concept"""
@@ -16,21 +77,163 @@ class ConceptCRUD:
         db.commit()
         db.refresh(db_obj)
         logger.info(f"Created concept with ID: {db_obj.id}")
+        publish(ChangeEvent("concept", "INSERT", db_obj.id, new=_keys(db_obj)))
         return db_obj
 
-    def get(self, db: Session, id: UUID) -> Optional[Concept]:
+    def get(self, db: Session, id: UUID, columns: Optional[List[str]] = None) -> Optional[Concept]:
         """Get concept by ID"""
-        return db.query(Concept).filter(Concept.id == id).first()
+        return db.query(Concept).options(*load_only_columns(Concept, columns)).filter(Concept.id == id).first()
 
-    def get_by_code(self, db: Session, codesystem_id: UUID, code: str) -> Optional[Concept]:
+    def get_by_code(
+        self, db: Session, codesystem_id: UUID, code: str, columns: Optional[List[str]] = None
+    ) -> Optional[Concept]:
         """Get concept by codesystem ID and code"""
-        return db.query(Concept).filter(
+        return db.query(Concept).options(*load_only_columns(Concept, columns)).filter(
             and_(Concept.codesystem_id == codesystem_id, Concept.code == code)
         ).first()
 
-    def get_by_codesystem(self, db: Session, codesystem_id: UUID) -> List[Concept]:
+    def get_by_codes(self, db: Session, codesystem_id: UUID, codes: List[str]) -> List[Concept]:
+        """Get the concepts of a codesystem with the given codes"""
+        if not codes:
+            return []
+        return db.query(Concept).filter(
+            and_(Concept.codesystem_id == codesystem_id, Concept.code.in_(codes))
+        ).all()
+
+    def get_ids_by_codings(self, db: Session, codings: List[Tuple[UUID, str]]) -> Dict[Tuple[UUID, str], UUID]:
+        """Concept IDs of (codesystem_id, code) pairs across codesystems, in one query on uq_concept_codesystem_code"""
+        if not codings:
+            return {}
+        rows = db.query(Concept.codesystem_id, Concept.code, Concept.id).filter(
+            tuple_(Concept.codesystem_id, Concept.code).in_(codings)
+        ).all()
+        return {(row.codesystem_id, row.code): row.id for row in rows}
+
+    def get_hashes(self, db: Session, codesystem_id: UUID, codes: List[str]) -> Dict[str, Optional[str]]:
+        """Stored content hash of each of ``codes`` that exists in the codesystem"""
+        if not codes:
+            return {}
+        rows = db.query(Concept.code, Concept.content_hash).filter(
+            Concept.codesystem_id == codesystem_id, Concept.code.in_(codes)
+        ).all()
+        return {row.code: row.content_hash for row in rows}
+
+    def upsert_rows(self, db: Session, rows: List[Dict[str, Any]]) -> List[Any]:
+        """Insert or update full concept rows by (codesystem_id, code) in one executemany, without committing.
+
+        A row whose stored content hash already matches is left untouched.
+        Returns (id, code) of the rows written.
+        """
+        if not rows:
+            return []
+        dialect_insert = postgresql.insert if db.get_bind().dialect.name == "postgresql" else sqlite.insert
+        stmt = dialect_insert(Concept)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["codesystem_id", "code"],
+            set_={
+                "display": stmt.excluded.display,
+                "definition": stmt.excluded.definition,
+                "properties": stmt.excluded.properties,
+                "raw": stmt.excluded.raw,
+                "content_hash": stmt.excluded.content_hash,
+                "updated_at": func.now(),
+                "version_id": Concept.version_id + 1,
+            },
+            where=Concept.content_hash.is_distinct_from(stmt.excluded.content_hash),
+        ).returning(Concept.id, Concept.code)
+        return db.execute(stmt, rows).all()
+
+    def bulk_upsert(self, db: Session, codesystem_id: UUID, rows: List[Dict[str, Any]]) -> Dict[str, int]:
+        """Insert or update concepts of one codesystem by code, skipping those whose content hash is unchanged.
+
+        Each row carries code, display, definition, properties, raw and
+        content_hash.  Stored hashes are read first, so an unchanged row costs
+        one index lookup and is never written; the rest go in with one
+        executemany ``INSERT ... ON CONFLICT (codesystem_id, code) DO UPDATE``
+        whose ``WHERE`` re-checks the hash against concurrent writers.
+        Returns inserted/updated/unchanged counts.
+        """
+        # A code repeated in the batch cannot be upserted twice by one statement; the last one wins
+        by_code = {row["code"]: row for row in rows}
+        stored = self.get_hashes(db, codesystem_id, list(by_code))
+        changed = [
+            {"id": uuid.uuid4(), "codesystem_id": codesystem_id, **row}
+            for code, row in by_code.items()
+            if code not in stored or stored[code] != row["content_hash"]
+        ]
+        counts = {"inserted": 0, "updated": 0, "unchanged": len(by_code) - len(changed)}
+        if not changed:
+            db.rollback()
+            return counts
+        written = self.upsert_rows(db, changed)
+        db.commit()
+        for row in written:
+            counts["updated" if row.code in stored else "inserted"] += 1
+        # One bulk event per operation instead of one per row
+        bulk_keys = {"codesystem_id": codesystem_id, "code": None}
+        if counts["inserted"]:
+            publish(ChangeEvent("concept", "INSERT", new=bulk_keys))
+        if counts["updated"]:
+            publish(ChangeEvent("concept", "UPDATE", old=bulk_keys, new=bulk_keys))
+        # Rows a concurrent writer already brought up to date
+        counts["unchanged"] += len(changed) - len(written)
+        logger.info(
+            f"Bulk upserted concepts of codesystem {codesystem_id}: {counts['inserted']} inserted, "
+            f"{counts['updated']} updated, {counts['unchanged']} unchanged"
+        )
+        return counts
+
+    def get_by_codesystem(
+        self, db: Session, codesystem_id: UUID, columns: Optional[List[str]] = None
+    ) -> List[Concept]:
         """Get all concepts for a codesystem"""
-        return db.query(Concept).filter(Concept.codesystem_id == codesystem_id).all()
+        return db.query(Concept).options(*load_only_columns(Concept, columns)).filter(
+            Concept.codesystem_id == codesystem_id
+        ).all()
+
+    def get_for_expansion(
+        self,
+        db: Session,
+        codesystem_id: UUID,
+        codes: Optional[List[str]] = None,
+        search: Optional[str] = None,
+        with_properties: bool = False,
+        properties: Optional[PropertyFilters] = None
+    ) -> List:
+        """Get code/display rows of a codesystem for a ValueSet expansion, ordered by code"""
+        columns = [Concept.code, Concept.display]
+        if with_properties:
+            columns.append(Concept.properties)
+        query = db.query(*columns).filter(Concept.codesystem_id == codesystem_id)
+        
+        if codes:
+            query = query.filter(Concept.code.in_(codes))
+        
+        for code, values in properties or []:
+            query = query.filter(property_filter(code, values, db.get_bind().dialect.name))
+        
+        if search:
+            search_filter = or_(
+                Concept.code.ilike(f"%{search}%"),
+                Concept.display.ilike(f"%{search}%")
+            )
+            query = query.filter(search_filter)
+        
+        return query.order_by(Concept.code).all()
+
+    def get_text_rows(
+        self,
+        db: Session,
+        codesystem_id: UUID,
+        codes: Optional[List[str]] = None
+    ) -> List:
+        """Get id/code/display/definition rows of a codesystem, ordered by code"""
+        query = db.query(Concept.id, Concept.code, Concept.display, Concept.definition).filter(
+            Concept.codesystem_id == codesystem_id
+        )
+        if codes is not None:
+            query = query.filter(Concept.code.in_(codes))
+        return query.order_by(Concept.code).all()
 
     def get_multi(
         self, 
@@ -38,14 +241,23 @@ class ConceptCRUD:
         skip: int = 0, 
         limit: int = 100,
         codesystem_id: Optional[UUID] = None,
-        search: Optional[str] = None
+        search: Optional[str] = None,
+        codes: Optional[List[str]] = None,
+        properties: Optional[PropertyFilters] = None,
+        columns: Optional[List[str]] = None
     ) -> List[Concept]:
         """Get multiple concepts with optional filters"""
-        query = db.query(Concept)
+        query = db.query(Concept).options(*load_only_columns(Concept, columns))
         
         if codesystem_id:
             query = query.filter(Concept.codesystem_id == codesystem_id)
         
+        if codes is not None:
+            query = query.filter(Concept.code.in_(codes))
+        
+        for code, values in properties or []:
+            query = query.filter(property_filter(code, values, db.get_bind().dialect.name))
+        
         if search:
             search_filter = or_(
                 Concept.code.ilike(f"%{search}%"),
@@ -56,39 +268,99 @@ class ConceptCRUD:
         
         return query.offset(skip).limit(limit).all()
 
-    def update(self, db: Session, db_obj: Concept, obj_in: ConceptUpdate) -> Concept:
-        """Update concept"""
+    def update(
+        self, db: Session, id: UUID, obj_in: ConceptUpdate, versions: Optional[List[int]] = None
+    ) -> Optional[Concept]:
+        """Update concept with a single UPDATE ... RETURNING.
+
+        ``versions`` (from If-Match) limits the update to those row versions;
+        PreconditionFailed is raised when the concept is at another one.
+        """
         update_data = obj_in.model_dump(exclude_unset=True)
-        for field, value in update_data.items():
-            setattr(db_obj, field, value)
-        
-        db.add(db_obj)
+        # An edited concept no longer matches its release row, so the next ingest rewrites it
+        stmt = update(Concept).where(Concept.id == id, *version_guard(Concept, versions)).values(
+            **update_data, content_hash=None, version_id=Concept.version_id + 1
+        )
+        old_row = None
+        keyed = bool(set(KEY_FIELDS).intersection(update_data))
+        if keyed and db.get_bind().dialect.name == "postgresql":
+            # Self-join the pre-update row for the change event's old keys
+            old = aliased(Concept)
+            stmt = stmt.where(old.id == Concept.id).returning(
+                Concept, *[getattr(old, field).label(field) for field in KEY_FIELDS]
+            )
+        else:
+            if keyed:
+                # SQLite's UPDATE ... FROM sees the updated row, so read the old keys first
+                old_row = db.execute(
+                    select(*[getattr(Concept, field) for field in KEY_FIELDS]).where(Concept.id == id).with_for_update()
+                ).first()
+            stmt = stmt.returning(Concept)
+        row = db.execute(stmt, execution_options={"synchronize_session": False, "populate_existing": True}).first()
+        if row is None:
+            check_missed(db, Concept, id, versions)
+            return None
+        db_obj = row[0]
+        old_keys = _keys(old_row or (row if len(row) > 1 else db_obj))
+        # Detached, the returned attributes survive the commit without a reload
+        db.expunge(db_obj)
         db.commit()
-        db.refresh(db_obj)
-        logger.info(f"Updated concept with ID: {db_obj.id}")
+        logger.info(f"Updated concept with ID: {id}")
+        publish(ChangeEvent("concept", "UPDATE", id, old=old_keys, new=_keys(db_obj)))
         return db_obj
 
-    def delete(self, db: Session, id: UUID) -> Optional[Concept]:
-        """Delete concept"""
-        obj = db.query(Concept).get(id)
-        if obj:
-            db.delete(obj)
-            db.commit()
-            logger.info(f"Deleted concept with ID: {id}")
+    def delete(self, db: Session, id: UUID, versions: Optional[List[int]] = None) -> Optional[Concept]:
+        """Delete concept with a single DELETE ... RETURNING (see update for ``versions``)"""
+        obj = db.execute(
+            delete(Concept).where(Concept.id == id, *version_guard(Concept, versions)).returning(Concept),
+            execution_options={"synchronize_session": False}
+        ).scalars().first()
+        if obj is None:
+            check_missed(db, Concept, id, versions)
+            return None
+        db.expunge(obj)
+        old_keys = _keys(obj)
+        sync.record_deletion(db, "concept", id, {"codesystem_id": str(obj.codesystem_id), "code": obj.code})
+        db.commit()
+        logger.info(f"Deleted concept with ID: {id}")
+        publish(ChangeEvent("concept", "DELETE", id, old=old_keys))
         return obj
 
     def count(
         self, 
         db: Session, 
         codesystem_id: Optional[UUID] = None,
-        search: Optional[str] = None
+        search: Optional[str] = None,
+        codes: Optional[List[str]] = None,
+        properties: Optional[PropertyFilters] = None
+    ) -> int:
+        """Count total concepts (cached until a concept of the codesystem changes)"""
+        key = hashlib.sha256(repr((search, codes, properties)).encode("utf-8")).hexdigest()
+        namespace = f"concepts:{codesystem_id}" if codesystem_id else "concepts"
+        return read_cache.get(
+            namespace, key,
+            lambda: self._count(db, codesystem_id=codesystem_id, search=search, codes=codes, properties=properties)
+        )
+
+    def _count(
+        self,
+        db: Session,
+        codesystem_id: Optional[UUID] = None,
+        search: Optional[str] = None,
+        codes: Optional[List[str]] = None,
+        properties: Optional[PropertyFilters] = None
     ) -> int:
-        """Count total concepts"""
         query = db.query(Concept)
         
         if codesystem_id:
             query = query.filter(Concept.codesystem_id == codesystem_id)
         
+        if codes is not None:
+            query = query.filter(Concept.code.in_(codes))
+        
+        for code, values in properties or []:
+            query = query.filter(property_filter(code, values, db.get_bind().dialect.name))
+        
         if search:
             search_filter = or_(
                 Concept.code.ilike(f"%{search}%"),
@@ -1,13 +1,38 @@
-from typing import List, Optional
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
 from uuid import UUID
-from sqlalchemy.orm import Session
-from sqlalchemy import and_, or_, func
-from app.models import ConceptMap
+from sqlalchemy.orm import Session, aliased
+from sqlalchemy import and_, delete, or_, func, select, tuple_, update
+from sqlalchemy.dialects import postgresql, sqlite
+from app.models import CodeSystem, Concept, ConceptMap
 from app.schemas import ConceptMapCreate, ConceptMapUpdate
+from app.crud.sync import sync
+from app.utils.cache import read_cache
+from app.utils.etag import check_missed, version_guard
+from app.utils.events import ChangeEvent, publish
+from app.utils.fields import load_only_columns
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Columns of the change event keys
+KEY_FIELDS = ("source_codesystem_id", "target_codesystem_id", "source_code", "target_code")
+
+def _keys(obj: ConceptMap) -> dict:
+    return {
+        "source_codesystem_id": obj.source_codesystem_id,
+        "target_codesystem_id": obj.target_codesystem_id,
+        "source_code": obj.source_code,
+        "target_code": obj.target_code,
+    }
+
+class MappingRow(NamedTuple):
+    id: UUID
+    source_codesystem_id: UUID
+    target_codesystem_id: UUID
+    source_code: UUID
+    target_code: UUID
+    equivalence: Optional[str]
+
 class ConceptMapCRUD:
     def create(self, db: Session, obj_in: ConceptMapCreate) -> ConceptMap:
         """Create a new conceptmap"""
@@ -16,11 +41,38 @@ class ConceptMapCRUD:
         db.commit()
         db.refresh(db_obj)
         logger.info(f"Created conceptmap with ID: {db_obj.id}")
+        publish(ChangeEvent("conceptmap", "INSERT", db_obj.id, new=_keys(db_obj)))
         return db_obj
 
-    def get(self, db: Session, id: UUID) -> Optional[ConceptMap]:
+    def bulk_create(self, db: Session, rows: List[Dict[str, Any]]) -> int:
+        """Insert mappings with one multi-row INSERT ... ON CONFLICT DO NOTHING; returns how many were new.
+
+        A row whose source and target concepts are already mapped is skipped
+        by uq_conceptmap_source_target_code rather than failing the batch.
+        """
+        if not rows:
+            return 0
+        dialect_insert = postgresql.insert if db.get_bind().dialect.name == "postgresql" else sqlite.insert
+        # executemany with RETURNING is sent as multi-row VALUES pages of one cached statement
+        inserted = db.execute(
+            dialect_insert(ConceptMap)
+            .on_conflict_do_nothing(index_elements=["source_code", "target_code"])
+            .returning(ConceptMap.source_codesystem_id, ConceptMap.target_codesystem_id),
+            rows
+        ).all()
+        db.commit()
+        logger.info(f"Bulk inserted {len(inserted)} of {len(rows)} conceptmaps")
+        # One event per codesystem pair instead of one per row
+        for source_id, target_id in {(row.source_codesystem_id, row.target_codesystem_id) for row in inserted}:
+            publish(ChangeEvent("conceptmap", "INSERT", new={
+                "source_codesystem_id": source_id, "target_codesystem_id": target_id,
+                "source_code": None, "target_code": None,
+            }))
+        return len(inserted)
+
+    def get(self, db: Session, id: UUID, columns: Optional[List[str]] = None) -> Optional[ConceptMap]:
         """Get conceptmap by ID"""
-        return db.query(ConceptMap).filter(ConceptMap.id == id).first()
+        return db.query(ConceptMap).options(*load_only_columns(ConceptMap, columns)).filter(ConceptMap.id == id).first()
 
     def get_translation(
         self, 
@@ -38,6 +90,31 @@ class ConceptMapCRUD:
             )
         ).first()
 
+    def get_translations(
+        self,
+        db: Session,
+        source_codesystem_id: UUID,
+        target_codesystem_id: UUID,
+        source_codes: List[UUID]
+    ) -> Dict[UUID, Optional[Tuple[UUID, Optional[str]]]]:
+        """(target_code, equivalence) per source code, None when unmapped; served from the read cache"""
+        def load(missing: List[UUID]) -> Dict[UUID, Tuple[UUID, Optional[str]]]:
+            rows = db.query(ConceptMap.source_code, ConceptMap.target_code, ConceptMap.equivalence).filter(
+                and_(
+                    ConceptMap.source_codesystem_id == source_codesystem_id,
+                    ConceptMap.target_codesystem_id == target_codesystem_id,
+                    ConceptMap.source_code.in_(missing)
+                )
+            ).order_by(ConceptMap.source_code, ConceptMap.id).all()
+            found = {}
+            for source_code, target_code, equivalence in rows:
+                found.setdefault(source_code, (target_code, equivalence))
+            return found
+
+        return read_cache.get_many(
+            f"translate:{source_codesystem_id}:{target_codesystem_id}", source_codes, load
+        )
+
     def get_multi(
         self, 
         db: Session, 
@@ -45,10 +122,11 @@ class ConceptMapCRUD:
         limit: int = 100,
         source_codesystem_id: Optional[UUID] = None,
         target_codesystem_id: Optional[UUID] = None,
-        search: Optional[str] = None
+        search: Optional[str] = None,
+        columns: Optional[List[str]] = None
     ) -> List[ConceptMap]:
         """Get multiple conceptmaps with optional filters"""
-        query = db.query(ConceptMap)
+        query = db.query(ConceptMap).options(*load_only_columns(ConceptMap, columns))
         
         if source_codesystem_id:
             query = query.filter(ConceptMap.source_codesystem_id == source_codesystem_id)
@@ -64,25 +142,61 @@ class ConceptMapCRUD:
         
         return query.offset(skip).limit(limit).all()
 
-    def update(self, db: Session, db_obj: ConceptMap, obj_in: ConceptMapUpdate) -> ConceptMap:
-        """Update conceptmap"""
+    def update(
+        self, db: Session, id: UUID, obj_in: ConceptMapUpdate, versions: Optional[List[int]] = None
+    ) -> Optional[ConceptMap]:
+        """Update conceptmap with a single UPDATE ... RETURNING.
+
+        ``versions`` (from If-Match) limits the update to those row versions;
+        PreconditionFailed is raised when the conceptmap is at another one.
+        """
         update_data = obj_in.model_dump(exclude_unset=True)
-        for field, value in update_data.items():
-            setattr(db_obj, field, value)
-        
-        db.add(db_obj)
+        stmt = update(ConceptMap).where(ConceptMap.id == id, *version_guard(ConceptMap, versions)).values(
+            **update_data, version_id=ConceptMap.version_id + 1
+        )
+        old_row = None
+        keyed = bool(set(KEY_FIELDS).intersection(update_data))
+        if keyed and db.get_bind().dialect.name == "postgresql":
+            # Self-join the pre-update row for the change event's old keys
+            old = aliased(ConceptMap)
+            stmt = stmt.where(old.id == ConceptMap.id).returning(
+                ConceptMap, *[getattr(old, field).label(field) for field in KEY_FIELDS]
+            )
+        else:
+            if keyed:
+                # SQLite's UPDATE ... FROM sees the updated row, so read the old keys first
+                old_row = db.execute(
+                    select(*[getattr(ConceptMap, field) for field in KEY_FIELDS]).where(ConceptMap.id == id).with_for_update()
+                ).first()
+            stmt = stmt.returning(ConceptMap)
+        row = db.execute(stmt, execution_options={"synchronize_session": False, "populate_existing": True}).first()
+        if row is None:
+            check_missed(db, ConceptMap, id, versions)
+            return None
+        db_obj = row[0]
+        old_keys = _keys(old_row or (row if len(row) > 1 else db_obj))
+        # Detached, the returned attributes survive the commit without a reload
+        db.expunge(db_obj)
         db.commit()
-        db.refresh(db_obj)
-        logger.info(f"Updated conceptmap with ID: {db_obj.id}")
+        logger.info(f"Updated conceptmap with ID: {id}")
+        publish(ChangeEvent("conceptmap", "UPDATE", id, old=old_keys, new=_keys(db_obj)))
         return db_obj
 
-    def delete(self, db: Session, id: UUID) -> Optional[ConceptMap]:
-        """Delete conceptmap"""
-        obj = db.query(ConceptMap).get(id)
-        if obj:
-            db.delete(obj)
-            db.commit()
-            logger.info(f"Deleted conceptmap with ID: {id}")
+    def delete(self, db: Session, id: UUID, versions: Optional[List[int]] = None) -> Optional[ConceptMap]:
+        """Delete conceptmap with a single DELETE ... RETURNING (see update for ``versions``)"""
+        obj = db.execute(
+            delete(ConceptMap).where(ConceptMap.id == id, *version_guard(ConceptMap, versions)).returning(ConceptMap),
+            execution_options={"synchronize_session": False}
+        ).scalars().first()
+        if obj is None:
+            check_missed(db, ConceptMap, id, versions)
+            return None
+        db.expunge(obj)
+        old_keys = _keys(obj)
+        sync.record_deletion(db, "conceptmap", id, {key: str(value) for key, value in old_keys.items()})
+        db.commit()
+        logger.info(f"Deleted conceptmap with ID: {id}")
+        publish(ChangeEvent("conceptmap", "DELETE", id, old=old_keys))
         return obj
 
     def count(
@@ -124,4 +238,65 @@ class ConceptMapCRUD:
             )
         ).all()
 
+    def get_mappings_for_concepts(self, db: Session, concept_ids: List[UUID]) -> List[MappingRow]:
+        """Like get_by_concept_ids, as plain rows served from the read cache"""
+        def load(missing: List[UUID]) -> Dict[UUID, List[MappingRow]]:
+            found: Dict[UUID, List[MappingRow]] = {}
+            for obj in self.get_by_concept_ids(db=db, concept_ids=missing):
+                row = MappingRow(
+                    obj.id, obj.source_codesystem_id, obj.target_codesystem_id,
+                    obj.source_code, obj.target_code, obj.equivalence
+                )
+                for concept_id in {obj.source_code, obj.target_code}:
+                    found.setdefault(concept_id, []).append(row)
+            return found
+
+        rows: Dict[UUID, MappingRow] = {}
+        for mappings in read_cache.get_many("mappings", concept_ids, load).values():
+            for row in mappings or []:
+                rows[row.id] = row
+        return list(rows.values())
+
+    def get_mappings_for_codings(
+        self,
+        db: Session,
+        codings: List[Tuple[UUID, str]],
+        target_codesystem_id: Optional[UUID] = None,
+        chunk_size: int = 10000
+    ) -> List:
+        """Resolve (codesystem_id, code) pairs and their mapped target codings with one query per chunk.
+
+        Concepts without a mapping are returned with empty target columns so
+        callers can still fill in source displays.
+        """
+        if not codings:
+            return []
+        source = aliased(Concept)
+        target = aliased(Concept)
+        mapping_join = ConceptMap.source_code == source.id
+        if target_codesystem_id:
+            mapping_join = and_(mapping_join, ConceptMap.target_codesystem_id == target_codesystem_id)
+        rows = []
+        for start in range(0, len(codings), chunk_size):
+            chunk = codings[start:start + chunk_size]
+            query = db.query(
+                source.codesystem_id.label("source_codesystem_id"),
+                source.code.label("source_code"),
+                source.display.label("source_display"),
+                CodeSystem.url.label("target_url"),
+                target.code.label("target_code"),
+                target.display.label("target_display"),
+                ConceptMap.equivalence.label("equivalence")
+            ).select_from(source).outerjoin(
+                ConceptMap, mapping_join
+            ).outerjoin(
+                target, target.id == ConceptMap.target_code
+            ).outerjoin(
+                CodeSystem, CodeSystem.id == target.codesystem_id
+            ).filter(
+                tuple_(source.codesystem_id, source.code).in_(chunk)
+            )
+            rows.extend(query.all())
+        return rows
+
 conceptmap = ConceptMapCRUD()
@@ -0,0 +1,148 @@
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional
+from uuid import UUID
+from sqlalchemy.orm import Session
+from sqlalchemy import desc
+from app.models import Job
+import logging
+
+logger = logging.getLogger(__name__)
+
+PENDING_STATUSES = ("queued", "running")
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+class JobCRUD:
+    def create(self, db: Session, kind: str, params: Optional[Dict[str, Any]] = None) -> Job:
+        """Queue a new job"""
+        job = Job(kind=kind, status="queued", params=params or {}, progress=0, cancel_requested=False)
+        db.add(job)
+        db.commit()
+        db.refresh(job)
+        logger.info(f"Queued {kind} job {job.id}")
+        return job
+
+    def get(self, db: Session, id: UUID) -> Optional[Job]:
+        """Get job by ID"""
+        return db.query(Job).filter(Job.id == id).first()
+
+    def get_multi(
+        self,
+        db: Session,
+        skip: int = 0,
+        limit: int = 100,
+        status: Optional[str] = None,
+        kind: Optional[str] = None
+    ) -> List[Job]:
+        """Get jobs, most recent first"""
+        query = db.query(Job)
+        if status:
+            query = query.filter(Job.status == status)
+        if kind:
+            query = query.filter(Job.kind == kind)
+        return query.order_by(desc(Job.created_at)).offset(skip).limit(limit).all()
+
+    def count(self, db: Session, status: Optional[str] = None, kind: Optional[str] = None) -> int:
+        """Count jobs"""
+        query = db.query(Job)
+        if status:
+            query = query.filter(Job.status == status)
+        if kind:
+            query = query.filter(Job.kind == kind)
+        return query.count()
+
+    def claim_next(self, db: Session, kinds: List[str], owner: str) -> Optional[Job]:
+        """Mark the oldest queued job of ``kinds`` as running by ``owner``.
+
+        SKIP LOCKED lets every worker process claim from the same table
+        without two of them taking the same job.
+        """
+        job = db.query(Job).filter(
+            Job.status == "queued", Job.kind.in_(kinds)
+        ).order_by(Job.created_at).with_for_update(skip_locked=True).first()
+        if not job:
+            db.rollback()
+            return None
+        now = _now()
+        job.status = "running"
+        job.owner = owner
+        job.started_at = now
+        job.heartbeat_at = now
+        db.commit()
+        db.refresh(job)
+        return job
+
+    def report_progress(self, db: Session, id: UUID, progress: int, total: Optional[int] = None) -> bool:
+        """Record progress; returns whether cancellation was requested"""
+        job = self.get(db, id)
+        if not job:
+            return True
+        job.progress = progress
+        if total is not None:
+            job.total = total
+        job.heartbeat_at = _now()
+        db.commit()
+        return job.cancel_requested
+
+    def heartbeat(self, db: Session, ids: List[UUID]) -> None:
+        """Show that the jobs in ``ids`` are still being worked on"""
+        if not ids:
+            return
+        db.query(Job).filter(Job.id.in_(ids), Job.status == "running").update(
+            {Job.heartbeat_at: _now()}, synchronize_session=False
+        )
+        db.commit()
+
+    def finish(
+        self,
+        db: Session,
+        id: UUID,
+        status: str,
+        result: Optional[Dict[str, Any]] = None,
+        error: Optional[str] = None
+    ) -> None:
+        """Record the outcome of a job"""
+        job = self.get(db, id)
+        if not job:
+            return
+        job.status = status
+        job.result = result
+        job.error = error
+        job.finished_at = _now()
+        if status == "completed" and job.total is not None:
+            job.progress = job.total
+        db.commit()
+        logger.info(f"{job.kind} job {id} {status}")
+
+    def request_cancel(self, db: Session, job: Job) -> Job:
+        """Cancel a queued job now, or ask a running one to stop.
+
+        Both are conditional UPDATEs on the current status, so a job another
+        worker claims meanwhile is asked to stop rather than marked cancelled
+        under its runner.
+        """
+        cancelled = db.query(Job).filter(Job.id == job.id, Job.status == "queued").update(
+            {Job.status: "cancelled", Job.finished_at: _now()}, synchronize_session=False
+        )
+        if not cancelled:
+            db.query(Job).filter(Job.id == job.id, Job.status == "running").update(
+                {Job.cancel_requested: True}, synchronize_session=False
+            )
+        db.commit()
+        db.refresh(job)
+        return job
+
+    def fail_stale(self, db: Session, stale_after: float) -> int:
+        """Fail running jobs whose worker stopped heartbeating"""
+        cutoff = _now() - timedelta(seconds=stale_after)
+        count = db.query(Job).filter(Job.status == "running", Job.heartbeat_at < cutoff).update(
+            {Job.status: "failed", Job.error: "Worker stopped before the job finished", Job.finished_at: _now()},
+            synchronize_session=False
+        )
+        db.commit()
+        if count:
+            logger.warning(f"Failed {count} jobs abandoned by their worker")
+        return count
+
+job = JobCRUD()
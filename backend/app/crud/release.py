@@ -0,0 +1,139 @@
+import uuid
+from typing import List, Optional
+from uuid import UUID
+from sqlalchemy.orm import Session
+from sqlalchemy import delete, desc, func, insert, or_, update
+from app.models import CodeSystem, CodeSystemRelease, Concept, ConceptMap, Tombstone
+from app.crud.audit_log import audit_log
+from app.crud.concept import concept as concept_crud
+from app.utils.events import ChangeEvent, publish
+from app.utils.release_diff import ReleaseDiff
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Codes per DELETE when removing concepts; all batches share one transaction
+RELEASE_BATCH_SIZE = 5000
+
+class ReleaseCRUD:
+    def apply(
+        self,
+        db: Session,
+        codesystem_id: UUID,
+        diff: ReleaseDiff,
+        version: Optional[str],
+        source: Optional[str] = None,
+        user_id: Optional[str] = None
+    ) -> CodeSystemRelease:
+        """Apply a release diff to its codesystem in one transaction and record its change summary.
+
+        Only the delta is written: added and changed concepts are upserted,
+        removed ones are deleted together with the conceptmaps that use them
+        (with tombstones for delta sync), and unchanged concepts are not
+        touched.  The codesystem moves to ``version`` in the same transaction.
+        """
+        previous_version = db.query(CodeSystem.version).filter(CodeSystem.id == codesystem_id).scalar()
+        upserts = [{"id": uuid.uuid4(), "codesystem_id": codesystem_id, **row} for row in diff.upserts]
+        written = concept_crud.upsert_rows(db, upserts)
+
+        removed_concepts = []
+        removed_maps = []
+        removed_codes = diff.removed
+        for start in range(0, len(removed_codes), RELEASE_BATCH_SIZE):
+            concepts = db.execute(
+                delete(Concept)
+                .where(Concept.codesystem_id == codesystem_id, Concept.code.in_(removed_codes[start:start + RELEASE_BATCH_SIZE]))
+                .returning(Concept.id, Concept.code)
+                .execution_options(synchronize_session=False)
+            ).all()
+            ids = [row.id for row in concepts]
+            maps = db.execute(
+                delete(ConceptMap)
+                .where(or_(ConceptMap.source_code.in_(ids), ConceptMap.target_code.in_(ids)))
+                .returning(ConceptMap.id, ConceptMap.source_codesystem_id, ConceptMap.target_codesystem_id,
+                           ConceptMap.source_code, ConceptMap.target_code)
+                .execution_options(synchronize_session=False)
+            ).all() if ids else []
+            tombstones = [
+                {"table_name": "concept", "record_id": row.id, "keys": {"codesystem_id": str(codesystem_id), "code": row.code}}
+                for row in concepts
+            ] + [
+                {"table_name": "conceptmap", "record_id": row.id, "keys": {
+                    "source_codesystem_id": str(row.source_codesystem_id), "target_codesystem_id": str(row.target_codesystem_id),
+                    "source_code": str(row.source_code), "target_code": str(row.target_code),
+                }}
+                for row in maps
+            ]
+            if tombstones:
+                db.execute(insert(Tombstone), tombstones)
+            removed_concepts.extend(concepts)
+            removed_maps.extend(maps)
+
+        if version and version != previous_version:
+            db.execute(
+                update(CodeSystem).where(CodeSystem.id == codesystem_id)
+                .values(version=version, version_id=CodeSystem.version_id + 1)
+                .execution_options(synchronize_session=False)
+            )
+        summary = diff.summary()
+        summary["conceptmaps_removed"] = len(removed_maps)
+        counts = diff.counts()
+        release = CodeSystemRelease(
+            codesystem_id=codesystem_id,
+            version=version,
+            previous_version=previous_version,
+            source=source,
+            added=counts["added"],
+            changed=counts["changed"],
+            removed=len(removed_concepts),
+            unchanged=counts["unchanged"],
+            summary=summary,
+        )
+        db.add(release)
+        # Commits the whole release together with its audit entry
+        audit_log.create_audit_log(
+            db,
+            table_name="codesystem",
+            operation="UPDATE",
+            record_id=codesystem_id,
+            user_id=user_id,
+            old_data={"version": previous_version},
+            new_data={"version": version},
+            meta={"release": {**counts, "removed": len(removed_concepts), "conceptmaps_removed": len(removed_maps), "source": source}},
+        )
+        db.refresh(release)
+        logger.info(
+            f"Applied release {version} to codesystem {codesystem_id}: {counts['added']} added, "
+            f"{counts['changed']} changed, {len(removed_concepts)} removed, {counts['unchanged']} unchanged"
+        )
+
+        # One bulk event per operation instead of one per row
+        bulk_keys = {"codesystem_id": codesystem_id, "code": None}
+        if any(row.code in diff.added for row in written):
+            publish(ChangeEvent("concept", "INSERT", new=bulk_keys))
+        if any(row.code in diff.changed for row in written):
+            publish(ChangeEvent("concept", "UPDATE", old=bulk_keys, new=bulk_keys))
+        if removed_concepts:
+            publish(ChangeEvent("concept", "DELETE", old=bulk_keys))
+        # One event per codesystem pair instead of one per mapping
+        for source_id, target_id in {(row.source_codesystem_id, row.target_codesystem_id) for row in removed_maps}:
+            publish(ChangeEvent("conceptmap", "DELETE", old={
+                "source_codesystem_id": source_id, "target_codesystem_id": target_id,
+                "source_code": None, "target_code": None,
+            }))
+        if version and version != previous_version:
+            publish(ChangeEvent("codesystem", "UPDATE", codesystem_id))
+        return release
+
+    def get_multi(self, db: Session, codesystem_id: UUID, skip: int = 0, limit: int = 100) -> List[CodeSystemRelease]:
+        """Releases applied to a codesystem, most recent first"""
+        return db.query(CodeSystemRelease).filter(
+            CodeSystemRelease.codesystem_id == codesystem_id
+        ).order_by(desc(CodeSystemRelease.created_at)).offset(skip).limit(limit).all()
+
+    def count(self, db: Session, codesystem_id: UUID) -> int:
+        return db.query(func.count(CodeSystemRelease.id)).filter(
+            CodeSystemRelease.codesystem_id == codesystem_id
+        ).scalar()
+
+release = ReleaseCRUD()
@@ -0,0 +1,86 @@
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Type
+from uuid import UUID
+from sqlalchemy.orm import Session
+from sqlalchemy import delete, tuple_
+from app.models import Tombstone
+from app.utils.watermark import Cursor
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Tables whose deletions are recorded as tombstones
+TOMBSTONE_TABLES = ("codesystem", "concept", "conceptmap")
+# Days tombstones are kept for delta sync clients; 0 keeps them forever
+TOMBSTONE_RETENTION_DAYS = float(os.getenv("TOMBSTONE_RETENTION_DAYS", "90"))
+
+def retention_cutoff() -> Optional[datetime]:
+    """Tombstones deleted before this instant may have been pruned"""
+    if TOMBSTONE_RETENTION_DAYS <= 0:
+        return None
+    return datetime.now(timezone.utc) - timedelta(days=TOMBSTONE_RETENTION_DAYS)
+
+class SyncCRUD:
+    def record_deletion(
+        self, db: Session, table_name: str, record_id: UUID, keys: Optional[Dict[str, Any]] = None
+    ) -> Tombstone:
+        """Add a tombstone for a deleted row; committed with the caller's delete"""
+        tombstone = Tombstone(table_name=table_name, record_id=record_id, keys=keys)
+        db.add(tombstone)
+        return tombstone
+
+    def get_changed(
+        self,
+        db: Session,
+        model: Type,
+        after: Optional[Cursor],
+        until: datetime,
+        limit: int
+    ) -> List[Any]:
+        """Rows created or updated after ``after`` and no later than ``until``, in (updated_at, id) order"""
+        query = db.query(model).filter(model.updated_at <= until)
+        if after:
+            query = query.filter(tuple_(model.updated_at, model.id) > tuple_(after.at, after.id))
+        return query.order_by(model.updated_at, model.id).limit(limit).all()
+
+    def get_deleted(
+        self,
+        db: Session,
+        table_name: str,
+        after: Optional[Cursor],
+        until: datetime,
+        limit: int
+    ) -> List[Tombstone]:
+        """Tombstones of ``table_name`` after ``after`` and no later than ``until``, in (deleted_at, id) order"""
+        query = db.query(Tombstone).filter(
+            Tombstone.table_name == table_name, Tombstone.deleted_at <= until
+        )
+        if after:
+            query = query.filter(tuple_(Tombstone.deleted_at, Tombstone.id) > tuple_(after.at, after.id))
+        return query.order_by(Tombstone.deleted_at, Tombstone.id).limit(limit).all()
+
+    def prune_tombstones(self, db: Session, before: datetime, batch_size: int = 10000) -> int:
+        """Delete tombstones older than ``before`` in batches; returns how many went"""
+        removed = 0
+        # Per table, so each batch is a range of the (table_name, deleted_at, id) index
+        for table_name in TOMBSTONE_TABLES:
+            while True:
+                oldest = db.query(Tombstone.id).filter(
+                    Tombstone.table_name == table_name, Tombstone.deleted_at < before
+                ).limit(batch_size)
+                count = db.execute(delete(Tombstone).where(Tombstone.id.in_(oldest.scalar_subquery()))).rowcount
+                db.commit()
+                removed += count
+                if count < batch_size:
+                    break
+        if removed:
+            logger.info(f"Pruned {removed} tombstones deleted before {before.isoformat()}")
+        return removed
+
+    def prune_expired(self, db: Session) -> int:
+        """Delete tombstones past ``TOMBSTONE_RETENTION_DAYS``"""
+        cutoff = retention_cutoff()
+        return self.prune_tombstones(db, cutoff) if cutoff is not None else 0
+
+sync = SyncCRUD()
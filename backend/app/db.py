@@ -1,10 +1,12 @@
 import os
-from sqlalchemy import create_engine
+import socket
+from sqlalchemy import create_engine, event
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.pool import StaticPool
 import logging
 from dotenv import load_dotenv
+from app.utils.deadline import request_deadline
 
 # Load environment variables
 load_dotenv()
@@ -19,16 +21,68 @@ DB_USER = os.getenv("DB_USER", "postgres")
 DB_PASSWORD = os.getenv("DB_PASSWORD", "")
 DB_SSLMODE = os.getenv("DB_SSLMODE", "require")
 
+# Offline/edge mode: serve reads from a SQLite file written by `python -m app.export`
+OFFLINE_DB_PATH = os.getenv("OFFLINE_DB_PATH", "")
+READ_ONLY = bool(OFFLINE_DB_PATH) or os.getenv("READ_ONLY", "false").lower() == "true"
+
 # Construct database URL (using psycopg2 for synchronous operations)
-DATABASE_URL = f"postgresql+psycopg2://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}?sslmode={DB_SSLMODE}"
+if os.getenv("DATABASE_URL"):
+    DATABASE_URL = os.getenv("DATABASE_URL")
+elif OFFLINE_DB_PATH:
+    DATABASE_URL = f"sqlite:///file:{os.path.abspath(OFFLINE_DB_PATH)}?mode=ro&uri=true"
+else:
+    DATABASE_URL = f"postgresql+psycopg2://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}?sslmode={DB_SSLMODE}"
+
+IS_SQLITE = DATABASE_URL.startswith("sqlite")
 
 # Create engine
-engine = create_engine(
-    DATABASE_URL,
-    echo=False,  # Set to True for SQL query logging
-    pool_pre_ping=True,
-    pool_recycle=300,
-)
+if IS_SQLITE:
+    engine = create_engine(
+        DATABASE_URL,
+        echo=False,
+        connect_args={"check_same_thread": False},
+    )
+else:
+    engine = create_engine(
+        DATABASE_URL,
+        echo=False,  # Set to True for SQL query logging
+        pool_pre_ping=True,
+        pool_recycle=300,
+    )
+
+def instance_name() -> str:
+    """Identifies this worker process in pg_stat_activity and change notifications"""
+    return f"fhirfly-{socket.gethostname()[:40]}-{os.getpid()}"
+
+if not IS_SQLITE:
+    @event.listens_for(engine, "do_connect")
+    def _set_application_name(dialect, conn_rec, cargs, cparams):
+        # Evaluated per connection so forked workers get their own name
+        cparams["application_name"] = instance_name()
+
+if IS_SQLITE and READ_ONLY:
+    @event.listens_for(engine, "connect")
+    def _sqlite_query_only(dbapi_connection, connection_record):
+        dbapi_connection.execute("PRAGMA query_only = ON")
+
+@event.listens_for(engine, "before_cursor_execute")
+def _deadline_check(conn, cursor, statement, parameters, context, executemany):
+    deadline = request_deadline.get()
+    if deadline is not None:
+        deadline.check()
+
+@event.listens_for(engine, "handle_error")
+def _deadline_error(context):
+    deadline = request_deadline.get()
+    if deadline is not None:
+        deadline.on_error(context.original_exception)
+
+@event.listens_for(engine, "checkin")
+def _deadline_checkin(dbapi_connection, connection_record):
+    # Fires before the connection is available to anyone else
+    deadline = connection_record.info.pop("deadline", None)
+    if deadline is not None:
+        deadline.forget(dbapi_connection)
 
 # Create session factory
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
@@ -39,6 +93,10 @@ Base = declarative_base()
 def get_db():
     """Dependency to get database session"""
     db = SessionLocal()
+    deadline = request_deadline.get()
+    if deadline is not None:
+        # Each transaction gets the request's remaining time as its statement timeout
+        event.listen(db, "after_begin", deadline.on_begin)
     try:
         yield db
     except Exception as e:
@@ -0,0 +1,101 @@
+"""Export the terminology tables into a single SQLite file for offline serving.
+
+    python -m app.export OUTPUT.sqlite [--batch-size N]
+
+Codesystems, concepts, concept maps and the codesystem release history are
+streamed from the configured database into a fresh SQLite file with the same
+schema and indexes as the ORM models; the audit log is created empty.  The
+file is written next to the target and renamed into place once it is
+complete, so a server reading the previous export never sees a half-written
+one.  Serve it with
+``OFFLINE_DB_PATH=OUTPUT.sqlite``, which opens it read-only.
+"""
+import argparse
+import logging
+import os
+import sys
+import tempfile
+import time
+from typing import Dict
+
+from sqlalchemy import create_engine, event, select
+from sqlalchemy.engine import Engine
+from sqlalchemy.schema import CreateTable
+
+from app.db import engine as source_engine
+from app.models import AuditLog, CodeSystem, CodeSystemRelease, Concept, ConceptMap, Tombstone
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 5000
+# Parents before children so foreign keys always resolve
+TABLES = (CodeSystem.__table__, Concept.__table__, ConceptMap.__table__, CodeSystemRelease.__table__)
+
+
+def _sqlite_engine(path: str) -> Engine:
+    target = create_engine(f"sqlite:///{path}")
+
+    @event.listens_for(target, "connect")
+    def _fast_load(dbapi_connection, connection_record):
+        # The file is thrown away if the export fails, so skip the journal
+        dbapi_connection.execute("PRAGMA journal_mode = OFF")
+        dbapi_connection.execute("PRAGMA synchronous = OFF")
+
+    return target
+
+
+def export_sqlite(path: str, source: Engine = source_engine, batch_size: int = BATCH_SIZE) -> Dict[str, int]:
+    """Write every codesystem, concept and concept map to a SQLite file at ``path``"""
+    path = os.path.abspath(path)
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(prefix=".export-", suffix=".sqlite", dir=directory)
+    os.close(fd)
+    os.unlink(tmp_path)
+    target = _sqlite_engine(tmp_path)
+    counts = {}
+    try:
+        with source.connect() as src, target.begin() as dst:
+            for table in TABLES:
+                started = time.perf_counter()
+                # Load into a bare table and index afterwards: much faster than
+                # maintaining the indexes row by row
+                dst.execute(CreateTable(table))
+                count = 0
+                result = src.execution_options(yield_per=batch_size).execute(select(table))
+                for rows in result.partitions():
+                    dst.execute(table.insert(), [row._asdict() for row in rows])
+                    count += len(rows)
+                for index in table.indexes:
+                    index.create(dst)
+                counts[table.name] = count
+                logger.info(f"Exported {count} rows of {table.name} in {time.perf_counter() - started:.1f}s")
+            AuditLog.__table__.create(dst)
+            Tombstone.__table__.create(dst)
+        with target.connect() as conn:
+            conn.exec_driver_sql("ANALYZE")
+            conn.exec_driver_sql("VACUUM")
+        target.dispose()
+        os.replace(tmp_path, path)
+    except Exception:
+        target.dispose()
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+    logger.info(f"Wrote offline export to {path}")
+    return counts
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(prog="python -m app.export", description=__doc__.splitlines()[0])
+    parser.add_argument("output", help="SQLite file to write")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE, help="rows per insert batch")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+    counts = export_sqlite(args.output, batch_size=args.batch_size)
+    print(", ".join(f"{name}: {count}" for name, count in counts.items()))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
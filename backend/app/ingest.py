@@ -0,0 +1,464 @@
+"""Load a NAMASTE or ICD-11 TM2 release file into the configured database.
+
+    python -m app.ingest FILE [--format namaste|icd11] [--url URL] [--version V]
+                              [--release [--dry-run]] [--workers N] [--chunk-size N]
+
+NAMASTE releases are CSV, TSV or XLSX sheets with ``NAMC_CODE``,
+``NAMC_term`` and ``Short_definition``/``Long_definition`` columns; ICD-11
+releases are the WHO linearization tabulations (``Code``, ``BlockId``,
+``Title``, ``ClassKind``, ``ChapterNo``, ...), where the leading dashes of a
+title give its depth and so its parent.  The format is detected from the
+header row unless ``--format`` is given.
+
+The file is read row by row and never held in memory: rows are handed out in
+chunks of ``--chunk-size`` to ``--workers`` processes, with at most two
+chunks per worker in flight.  Each worker normalizes its chunk into concept
+rows with a content hash of display, definition, properties and the original
+row, and upserts it through its own ``SessionLocal`` in one transaction.
+Concepts whose stored hash matches are skipped without being written, so
+re-ingesting the same release only reads.  Concepts missing from the file are
+left alone.  The codesystem is looked up by URL and created if missing.
+
+With ``--release --version V`` the file is taken as the complete release V:
+it is diffed against the stored concepts by code and content hash, and only
+the added, changed and removed concepts are written, in one transaction
+that also moves the codesystem to V and records a ``codesystem_release``
+change summary.  ``--dry-run`` prints the diff without applying it.
+"""
+import argparse
+import csv
+import hashlib
+import json
+import logging
+import os
+import re
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
+from uuid import UUID
+
+from app.crud import codesystem as codesystem_crud, concept as concept_crud, release as release_crud
+from app.crud.audit_log import audit_log
+from app.db import SessionLocal, engine
+from app.models import CodeSystem
+from app.schemas import CodeSystemCreate, CodeSystemUpdate
+from app.utils.release_diff import ReleaseDiff, StoredHashes, probe, stored_hashes
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 5000
+WORKERS = min(4, os.cpu_count() or 1)
+INGEST_USER = "ingest"
+# ICD-11 tabulation titles are indented with one "- " per level
+DEPTH_PREFIX = re.compile(r"(?:-\s*)*")
+
+# One row of a release file: its cells in header order, plus the parent code
+# worked out while reading (ICD-11 only)
+Record = Tuple[List[Optional[str]], Optional[str]]
+
+
+class IngestError(Exception):
+    """The release file cannot be read or is not in a known format"""
+
+
+def _column(name: Any) -> str:
+    """Header cell as a lookup key: ``"Linearization URI"`` -> ``"linearization_uri"``"""
+    return re.sub(r"[^0-9a-z]+", "_", str(name or "").strip().lower()).strip("_")
+
+
+def _cell(value: Any) -> Optional[str]:
+    if value is None:
+        return None
+    if isinstance(value, float) and value.is_integer():
+        # Spreadsheets store numeric codes as floats
+        value = int(value)
+    value = str(value).strip()
+    return value or None
+
+
+def _csv_rows(path: str, delimiter: str) -> Iterator[List[Optional[str]]]:
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        for row in csv.reader(f, delimiter=delimiter):
+            yield [_cell(value) for value in row]
+
+
+def _xlsx_rows(path: str) -> Iterator[List[Optional[str]]]:
+    try:
+        import openpyxl
+    except ImportError:
+        raise IngestError("Reading .xlsx releases requires openpyxl (pip install openpyxl)")
+    # Read-only mode streams the sheet XML instead of building the workbook
+    workbook = openpyxl.load_workbook(path, read_only=True, data_only=True)
+    try:
+        for row in workbook.active.iter_rows(values_only=True):
+            yield [_cell(value) for value in row]
+    finally:
+        workbook.close()
+
+
+def read_table(path: str) -> Tuple[List[str], Iterator[List[Optional[str]]]]:
+    """Header and data rows of a CSV, TSV or XLSX file; blank rows are dropped"""
+    extension = os.path.splitext(path)[1].lower()
+    if extension in (".xlsx", ".xlsm"):
+        rows = _xlsx_rows(path)
+    elif extension in (".tsv", ".txt"):
+        rows = _csv_rows(path, "\t")
+    else:
+        rows = _csv_rows(path, ",")
+    rows = (row for row in rows if any(row))
+    header = next(rows, None)
+    if header is None:
+        raise IngestError(f"{path} is empty")
+    return [name or f"column_{i + 1}" for i, name in enumerate(header)], rows
+
+
+class ReleaseFormat:
+    """How the rows of one kind of release file become concepts"""
+    name = ""
+    required: Tuple[str, ...] = ()
+    codesystem: Dict[str, Any] = {}
+
+    def detect(self, columns: Set[str]) -> bool:
+        return all(column in columns for column in self.required)
+
+    def records(self, index: Dict[str, int], rows: Iterator[List[Optional[str]]]) -> Iterator[Record]:
+        """Rows in file order with their parent code; runs in the reading process"""
+        for row in rows:
+            yield row, None
+
+    def concept(self, get, raw: Dict[str, str], parent: Optional[str]) -> Optional[Dict[str, Any]]:
+        """Concept fields of one row, or ``None`` to skip it; runs in the workers"""
+        raise NotImplementedError
+
+
+class NamasteFormat(ReleaseFormat):
+    name = "namaste"
+    required = ("namc_code",)
+    codesystem = {
+        "url": "https://fhirfly.me/fhir/CodeSystem/namaste",
+        "external_id": "namaste",
+        "name": "NAMASTE",
+        "title": "National AYUSH Morbidity and Standardized Terminologies Electronic",
+        "status": "active",
+        "publisher": "Ministry of AYUSH",
+        "content": "complete",
+    }
+
+    def concept(self, get, raw, parent):
+        code = get("namc_code")
+        if code is None:
+            return None
+        return {
+            "code": code,
+            "display": get("namc_term") or get("namc_term_diacritical"),
+            "definition": get("long_definition") or get("short_definition"),
+            "properties": [],
+        }
+
+
+class ICD11Format(ReleaseFormat):
+    name = "icd11"
+    required = ("title", "classkind")
+    codesystem = {
+        "url": "http://id.who.int/icd/release/11/mms",
+        "external_id": "icd11-tm2",
+        "name": "ICD-11",
+        "title": "ICD-11 for Mortality and Morbidity Statistics (TM2)",
+        "status": "active",
+        "publisher": "World Health Organization",
+        "content": "fragment",
+    }
+
+    @staticmethod
+    def _code(get) -> Optional[str]:
+        # Chapters and blocks have no code of their own
+        return get("code") or get("blockid") or (get("chapterno") if get("classkind") == "chapter" else None)
+
+    def records(self, index, rows):
+        def getter(row):
+            return lambda column: row[index[column]] if column in index and index[column] < len(row) else None
+
+        # Codes of the nearest row at each depth above the current one
+        ancestors: List[Optional[str]] = []
+        for row in rows:
+            get = getter(row)
+            depth = DEPTH_PREFIX.match(get("title") or "").group(0).count("-")
+            del ancestors[depth:]
+            parent = next((code for code in reversed(ancestors) if code), None)
+            ancestors.extend([None] * (depth - len(ancestors)))
+            ancestors.append(self._code(get))
+            yield row, parent
+
+    def concept(self, get, raw, parent):
+        code = self._code(get)
+        if code is None:
+            return None
+        properties = []
+        if parent:
+            properties.append({"code": "parent", "valueCode": parent})
+        if get("classkind"):
+            properties.append({"code": "kind", "valueCode": get("classkind")})
+        if get("chapterno"):
+            properties.append({"code": "chapter", "valueString": get("chapterno")})
+        return {
+            "code": code,
+            "display": DEPTH_PREFIX.sub("", get("title") or "", count=1) or None,
+            "definition": None,
+            "properties": properties,
+        }
+
+
+FORMATS: Dict[str, ReleaseFormat] = {fmt.name: fmt for fmt in (NamasteFormat(), ICD11Format())}
+
+
+def detect_format(header: List[str]) -> ReleaseFormat:
+    columns = {_column(name) for name in header}
+    for fmt in FORMATS.values():
+        if fmt.detect(columns):
+            return fmt
+    raise IngestError(f"Unrecognized release header {header!r}; pass --format")
+
+
+def content_hash(concept: Dict[str, Any]) -> str:
+    """Digest of everything ingest writes to a concept row"""
+    payload = json.dumps(
+        [concept["display"], concept["definition"], concept["properties"], concept["raw"]],
+        sort_keys=True, ensure_ascii=False, separators=(",", ":"),
+    )
+    return hashlib.blake2b(payload.encode("utf-8"), digest_size=16).hexdigest()
+
+
+# Stored hashes of the codesystem a release is diffed against, per worker
+_stored: Optional[StoredHashes] = None
+
+
+def _init_worker(stored: Optional[StoredHashes] = None) -> None:
+    global _stored
+    # Forked workers must not share the parent's pooled connections
+    engine.dispose(close=False)
+    _stored = stored
+
+
+def normalize_chunk(format_name: str, header: List[str], records: List[Record]) -> List[Dict[str, Any]]:
+    """Concept rows with content hashes of one chunk; rows without a code are dropped"""
+    fmt = FORMATS[format_name]
+    index = {_column(name): i for i, name in enumerate(header)}
+    rows = []
+    for cells, parent in records:
+        def get(column: str) -> Optional[str]:
+            i = index.get(column)
+            return cells[i] if i is not None and i < len(cells) else None
+
+        raw = {name: value for name, value in zip(header, cells) if value is not None}
+        concept = fmt.concept(get, raw, parent)
+        if concept is None:
+            continue
+        concept["raw"] = raw
+        concept["content_hash"] = content_hash(concept)
+        rows.append(concept)
+    return rows
+
+
+def ingest_chunk(format_name: str, codesystem_id: UUID, header: List[str], records: List[Record]) -> Dict[str, int]:
+    """Normalize and upsert one chunk; runs in a worker process"""
+    rows = normalize_chunk(format_name, header, records)
+    db = SessionLocal()
+    try:
+        counts = concept_crud.concept.bulk_upsert(db, codesystem_id, rows)
+    finally:
+        db.close()
+    counts["skipped"] = len(records) - len(rows)
+    return counts
+
+
+def diff_chunk(format_name: str, header: List[str], records: List[Record]) -> Tuple[List[str], List[Dict[str, Any]], int]:
+    """Codes of one chunk, its rows that differ from the stored concepts, and the rows skipped"""
+    rows = normalize_chunk(format_name, header, records)
+    return [row["code"] for row in rows], probe(_stored, rows), len(records) - len(rows)
+
+
+def _map_chunks(fn, args: tuple, chunks: Iterator[List[Record]], workers: int, stored: Optional[StoredHashes] = None):
+    """Results of ``fn(*args, chunk)`` for every chunk, computed by ``workers`` processes"""
+    global _stored
+    if workers <= 1:
+        _stored = stored
+        for chunk in chunks:
+            yield fn(*args, chunk)
+        return
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(stored,)) as pool:
+        pending: Set[Future] = set()
+        for chunk in chunks:
+            # Bounded read-ahead keeps memory flat however large the file is
+            if len(pending) >= 2 * workers:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield future.result()
+            pending.add(pool.submit(fn, *args, chunk))
+        for future in wait(pending).done:
+            yield future.result()
+
+
+def _find_codesystem(fmt: ReleaseFormat, url: Optional[str], create: bool = True) -> Optional[CodeSystem]:
+    db = SessionLocal()
+    try:
+        url = url or fmt.codesystem["url"]
+        codesystem = codesystem_crud.codesystem.get_by_url(db, url, columns=["id", "version"])
+        if codesystem is None and create:
+            codesystem = codesystem_crud.codesystem.create(db, CodeSystemCreate(**{**fmt.codesystem, "url": url}))
+            logger.info(f"Created codesystem {url} for the release")
+        return codesystem
+    finally:
+        db.close()
+
+
+def _open_release(path: str, format_name: Optional[str], chunk_size: int) -> Tuple[ReleaseFormat, List[str], Iterator[List[Record]]]:
+    header, rows = read_table(path)
+    fmt = FORMATS[format_name] if format_name else detect_format(header)
+    index = {_column(name): i for i, name in enumerate(header)}
+    missing = [column for column in fmt.required if column not in index]
+    if missing:
+        raise IngestError(f"{path} is missing column(s) {', '.join(missing)} of a {fmt.name} release")
+    return fmt, header, _chunks(fmt.records(index, rows), chunk_size)
+
+
+def _chunks(records: Iterator[Record], size: int) -> Iterator[List[Record]]:
+    chunk: List[Record] = []
+    for record in records:
+        chunk.append(record)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def ingest_file(
+    path: str,
+    format_name: Optional[str] = None,
+    url: Optional[str] = None,
+    version: Optional[str] = None,
+    workers: int = WORKERS,
+    chunk_size: int = CHUNK_SIZE,
+) -> Dict[str, Any]:
+    """Upsert every concept of the release at ``path``; returns rows/inserted/updated/unchanged/skipped counts"""
+    started = time.perf_counter()
+    fmt, header, chunks = _open_release(path, format_name, chunk_size)
+    codesystem = _find_codesystem(fmt, url)
+    if version and codesystem.version != version:
+        db = SessionLocal()
+        try:
+            codesystem_crud.codesystem.update(db, codesystem.id, CodeSystemUpdate(version=version))
+        finally:
+            db.close()
+
+    totals = {"rows": 0, "inserted": 0, "updated": 0, "unchanged": 0, "skipped": 0}
+    for counts in _map_chunks(ingest_chunk, (fmt.name, codesystem.id, header), chunks, workers):
+        for key, value in counts.items():
+            totals[key] += value
+        totals["rows"] = sum(totals[key] for key in ("inserted", "updated", "unchanged", "skipped"))
+        logger.info(f"Ingested {totals['rows']} rows ({totals['inserted']} inserted, {totals['updated']} updated)")
+
+    totals["seconds"] = round(time.perf_counter() - started, 3)
+    if totals["inserted"] or totals["updated"]:
+        db = SessionLocal()
+        try:
+            audit_log.create_audit_log(
+                db,
+                table_name="codesystem",
+                operation="UPDATE",
+                record_id=codesystem.id,
+                user_id=INGEST_USER,
+                meta={"ingest": {"file": os.path.basename(path), "format": fmt.name, "version": version, **totals}},
+            )
+        finally:
+            db.close()
+    logger.info(f"Ingested {path} as {fmt.name} in {totals['seconds']}s: {totals}")
+    return totals
+
+
+def ingest_release(
+    path: str,
+    version: str,
+    format_name: Optional[str] = None,
+    url: Optional[str] = None,
+    workers: int = WORKERS,
+    chunk_size: int = CHUNK_SIZE,
+    dry_run: bool = False,
+) -> Dict[str, Any]:
+    """Move the codesystem to the complete release at ``path``, writing only what changed.
+
+    The file is diffed against the stored concepts (see
+    ``app.utils.release_diff``) and the delta, including concepts the release
+    no longer contains, is applied in one transaction with a
+    ``codesystem_release`` summary.  With ``dry_run`` nothing is written.
+    Returns added/changed/removed/unchanged/duplicates/skipped counts.
+    """
+    started = time.perf_counter()
+    fmt, header, chunks = _open_release(path, format_name, chunk_size)
+    codesystem = _find_codesystem(fmt, url, create=not dry_run)
+    db = SessionLocal()
+    try:
+        stored = stored_hashes(db, codesystem.id) if codesystem is not None else {}
+    finally:
+        db.close()
+    diff = ReleaseDiff(stored)
+    skipped = 0
+    for codes, delta, chunk_skipped in _map_chunks(diff_chunk, (fmt.name, header), chunks, workers, stored=stored):
+        diff.merge(codes, delta)
+        skipped += chunk_skipped
+        logger.info(f"Diffed {len(diff.seen)} codes ({len(diff.added)} added, {len(diff.changed)} changed)")
+
+    totals = {**diff.counts(), "skipped": skipped}
+    if not dry_run:
+        db = SessionLocal()
+        try:
+            applied = release_crud.release.apply(
+                db, codesystem.id, diff, version, source=os.path.basename(path), user_id=INGEST_USER
+            )
+            totals["removed"] = applied.removed
+            totals["conceptmaps_removed"] = applied.summary["conceptmaps_removed"]
+        finally:
+            db.close()
+    totals["seconds"] = round(time.perf_counter() - started, 3)
+    logger.info(f"{'Diffed' if dry_run else 'Applied'} release {version} from {path} in {totals['seconds']}s: {totals}")
+    return totals
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(prog="python -m app.ingest", description=__doc__.splitlines()[0])
+    parser.add_argument("file", help="release file (.csv, .tsv or .xlsx)")
+    parser.add_argument("--format", choices=sorted(FORMATS), help="release format (default: detect from the header)")
+    parser.add_argument("--url", help="codesystem URL (default: the format's canonical URL)")
+    parser.add_argument("--version", help="release version to record on the codesystem")
+    parser.add_argument("--release", action="store_true",
+                        help="the file is the complete release: also remove concepts it lacks, in one transaction")
+    parser.add_argument("--dry-run", action="store_true", help="with --release, report the diff without applying it")
+    parser.add_argument("--workers", type=int, default=WORKERS, help="worker processes (1 ingests in this process)")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE, help="rows per upsert chunk")
+    args = parser.parse_args()
+    if args.release and not args.version:
+        parser.error("--release requires --version")
+    if args.dry_run and not args.release:
+        parser.error("--dry-run requires --release")
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+    try:
+        if args.release:
+            totals = ingest_release(
+                args.file, args.version, format_name=args.format, url=args.url,
+                workers=args.workers, chunk_size=args.chunk_size, dry_run=args.dry_run,
+            )
+        else:
+            totals = ingest_file(
+                args.file, format_name=args.format, url=args.url, version=args.version,
+                workers=args.workers, chunk_size=args.chunk_size,
+            )
+    except IngestError as e:
+        print(f"error: {e}", file=sys.stderr)
+        return 2
+    print(", ".join(f"{name}: {value}" for name, value in totals.items()))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -3,12 +3,16 @@ import logging
 from datetime import datetime
 from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, PlainTextResponse
 from starlette.middleware.base import BaseHTTPMiddleware
 from contextlib import asynccontextmanager
-from app.db import engine, Base
-from app.routes import codesystem, concept, conceptmap, audit_log
+from app.db import engine, Base, READ_ONLY
+from app.routes import codesystem, concept, conceptmap, audit_log, fhir, jobs, sync
 from app.schemas import HealthResponse
+from app.utils.admission import ADMISSION_ENABLED, AdmissionMiddleware
+from app.utils.deadline import DEADLINE_ENABLED, DeadlineMiddleware
+from app.utils.metrics import registry
+from app.utils.singleflight import SINGLE_FLIGHT_ENABLED, SingleFlightMiddleware
 import uvicorn
 
 # Configure logging
@@ -35,10 +39,52 @@ async def lifespan(app: FastAPI):
     except Exception as e:
         logger.error(f"Database connection failed: {e}")
     
+    # Listen for other workers' writes before anything is cached
+    try:
+        from app.utils.changefeed import start_change_feed
+        start_change_feed()
+    except Exception as e:
+        logger.error(f"Failed to start change feed: {e}")
+    
+    # Warm in-memory terminology indexes
+    if os.getenv("WARM_INDEXES", "true").lower() == "true":
+        try:
+            from app.utils.fuzzy import fuzzy_code_index
+            from app.utils.membership import membership_index
+            db = get_sync_db()
+            try:
+                membership_index.warm(db)
+                fuzzy_code_index.warm(db)
+            finally:
+                db.close()
+            logger.info("Terminology indexes warmed")
+        except Exception as e:
+            logger.error(f"Failed to warm terminology indexes: {e}")
+    
+    # Build the shared translation snapshot if none exists yet
+    try:
+        from app.utils.snapshot import snapshot_store
+        if snapshot_store.path:
+            db = get_sync_db()
+            try:
+                snapshot_store.ensure(db)
+            finally:
+                db.close()
+    except Exception as e:
+        logger.error(f"Failed to build translation snapshot: {e}")
+    
+    # Run background jobs (imports, exports, large deletes)
+    from app.utils.jobs import job_runner
+    if not READ_ONLY:
+        job_runner.start()
+    
     yield
     
     # Shutdown
     logger.info("Shutting down FHIR Backend API...")
+    job_runner.stop()
+    from app.utils.changefeed import stop_change_feed
+    stop_change_feed()
 
 # Create FastAPI app
 app = FastAPI(
@@ -48,6 +94,20 @@ app = FastAPI(
     lifespan=lifespan
 )
 
+# Limit concurrent database-bound requests per lane; added first so only
+# single-flight leaders take a slot and shed responses still get CORS headers
+if ADMISSION_ENABLED:
+    app.add_middleware(AdmissionMiddleware)
+
+# Give each request a deadline for its database work; added after admission
+# control so time spent queued for a slot counts against it
+if DEADLINE_ENABLED:
+    app.add_middleware(DeadlineMiddleware)
+
+# Coalesce identical concurrent reads; added early so it runs inside CORS
+if SINGLE_FLIGHT_ENABLED:
+    app.add_middleware(SingleFlightMiddleware)
+
 # CORS middleware - Fixed configuration
 allowed_origins = [
     "http://localhost:3000",  # Local development
@@ -95,11 +155,38 @@ app.add_middleware(
 # Add custom CORS header middleware as backup
 app.add_middleware(CORSHeaderMiddleware)
 
+# POST operations that only read terminology and stay available in read-only mode
+READ_ONLY_POSTS = (
+    "/api/v1/conceptmaps/translate",
+    "/api/v1/conceptmaps/suggest",
+    "/api/v1/CodeSystem/$lookup",
+    "/api/v1/CodeSystem/$validate-code",
+    "/api/v1/CodeSystem/$subsumes",
+    "/api/v1/ValueSet/$expand",
+    "/api/v1/Bundle",
+)
+
+# Reject writes when serving an offline export (or READ_ONLY=true)
+class ReadOnlyMiddleware(BaseHTTPMiddleware):
+    async def dispatch(self, request: Request, call_next):
+        method = request.method
+        path = request.url.path.rstrip("/")
+        if method in ("PUT", "PATCH", "DELETE") or (method == "POST" and path not in READ_ONLY_POSTS):
+            return JSONResponse(status_code=405, content={"detail": "Server is in read-only mode"})
+        return await call_next(request)
+
+if READ_ONLY:
+    logger.info("Serving in read-only mode")
+    app.add_middleware(ReadOnlyMiddleware)
+
 # Include routers
 app.include_router(codesystem.router, prefix="/api/v1")
 app.include_router(concept.router, prefix="/api/v1")
 app.include_router(conceptmap.router, prefix="/api/v1")
 app.include_router(audit_log.router, prefix="/api/v1")
+app.include_router(fhir.router, prefix="/api/v1")
+app.include_router(sync.router, prefix="/api/v1")
+app.include_router(jobs.router, prefix="/api/v1")
 
 @app.get("/", response_model=dict)
 def root():
@@ -133,6 +220,11 @@ def health_check():
         database=database_status
     )
 
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    """Prometheus metrics of this worker process"""
+    return registry.render()
+
 @app.get("/cors-debug")
 def cors_debug(request: Request):
     """Debug endpoint to check CORS configuration"""
@@ -1,15 +1,24 @@
 import uuid
 from datetime import datetime
-from sqlalchemy import Column, String, Text, DateTime, ForeignKey, JSON
-from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy import Boolean, Column, Integer, String, Text, DateTime, ForeignKey, JSON, Index, Uuid, text
+from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from app.db import Base
 
+# JSONB on Postgres (indexable, supports containment); plain JSON elsewhere.
+# Uuid is native UUID on Postgres and CHAR(32) on SQLite (offline exports).
+JSONType = JSON().with_variant(JSONB(), "postgresql")
+
 class CodeSystem(Base):
     __tablename__ = "codesystem"
+    __table_args__ = (
+        Index("ix_codesystem_url", "url", postgresql_where=text("url IS NOT NULL")),
+        Index("ix_codesystem_name", "name", postgresql_where=text("name IS NOT NULL")),
+        Index("ix_codesystem_updated_at_id", "updated_at", "id"),
+    )
     
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    id = Column(Uuid, primary_key=True, default=uuid.uuid4)
     external_id = Column(Text)
     url = Column(Text)
     version = Column(Text)
@@ -18,10 +27,14 @@ class CodeSystem(Base):
     status = Column(Text)
     publisher = Column(Text)
     content = Column(Text)
-    meta = Column(JSON)
-    resource = Column(JSON)
+    meta = Column(JSONType)
+    resource = Column(JSONType)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+    version_id = Column(Integer, nullable=False, server_default=text("1"))  # Served as the ETag
+    
+    # ORM flushes check and increment it; set-based writes do so explicitly
+    __mapper_args__ = {"version_id_col": version_id}
     
     # Relationships
     concepts = relationship("Concept", back_populates="codesystem")
@@ -30,46 +43,128 @@ class CodeSystem(Base):
 
 class Concept(Base):
     __tablename__ = "concept"
+    __table_args__ = (
+        Index("uq_concept_codesystem_code", "codesystem_id", "code", unique=True),
+        Index(
+            "ix_concept_properties_gin", "properties",
+            postgresql_using="gin", postgresql_ops={"properties": "jsonb_path_ops"}
+        ).ddl_if(dialect="postgresql"),
+        Index("ix_concept_updated_at_id", "updated_at", "id"),
+    )
     
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    codesystem_id = Column(UUID(as_uuid=True), ForeignKey("codesystem.id"), nullable=False)
+    id = Column(Uuid, primary_key=True, default=uuid.uuid4)
+    codesystem_id = Column(Uuid, ForeignKey("codesystem.id"), nullable=False)
     code = Column(Text, nullable=False)
     display = Column(Text)
     definition = Column(Text)
-    properties = Column(JSON)
-    raw = Column(JSON)
+    properties = Column(JSONType)
+    raw = Column(JSONType)
+    content_hash = Column(Text)  # Set by `python -m app.ingest`, cleared by API edits
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+    version_id = Column(Integer, nullable=False, server_default=text("1"))  # Served as the ETag
+    
+    # ORM flushes check and increment it; set-based writes do so explicitly
+    __mapper_args__ = {"version_id_col": version_id}
     
     # Relationships
     codesystem = relationship("CodeSystem", back_populates="concepts")
 
 class ConceptMap(Base):
     __tablename__ = "conceptmap"
+    __table_args__ = (
+        Index("ix_conceptmap_source_target_code", "source_codesystem_id", "target_codesystem_id", "source_code"),
+        Index("uq_conceptmap_source_target_code", "source_code", "target_code", unique=True),
+        Index("ix_conceptmap_target_code", "target_code"),
+        Index("ix_conceptmap_target_codesystem", "target_codesystem_id"),
+        Index("ix_conceptmap_updated_at_id", "updated_at", "id"),
+    )
     
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    source_codesystem_id = Column(UUID(as_uuid=True), ForeignKey("codesystem.id"), nullable=False)
-    target_codesystem_id = Column(UUID(as_uuid=True), ForeignKey("codesystem.id"), nullable=False)
-    source_code = Column(UUID(as_uuid=True), nullable=False)  # Matches your DB schema
-    target_code = Column(UUID(as_uuid=True), nullable=False)  # Matches your DB schema
+    id = Column(Uuid, primary_key=True, default=uuid.uuid4)
+    source_codesystem_id = Column(Uuid, ForeignKey("codesystem.id"), nullable=False)
+    target_codesystem_id = Column(Uuid, ForeignKey("codesystem.id"), nullable=False)
+    source_code = Column(Uuid, nullable=False)  # Matches your DB schema
+    target_code = Column(Uuid, nullable=False)  # Matches your DB schema
     equivalence = Column(Text)
-    conceptmap_metadata = Column('metadata', JSON)  # Map to actual 'metadata' column in DB
+    conceptmap_metadata = Column('metadata', JSONType)  # Map to actual 'metadata' column in DB
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+    version_id = Column(Integer, nullable=False, server_default=text("1"))  # Served as the ETag
+    
+    # ORM flushes check and increment it; set-based writes do so explicitly
+    __mapper_args__ = {"version_id_col": version_id}
     
     # Relationships
     source_codesystem = relationship("CodeSystem", foreign_keys=[source_codesystem_id], back_populates="source_conceptmaps")
     target_codesystem = relationship("CodeSystem", foreign_keys=[target_codesystem_id], back_populates="target_conceptmaps")
 
+class CodeSystemRelease(Base):
+    """A release applied to a codesystem by `python -m app.ingest --release`, with what it changed"""
+    __tablename__ = "codesystem_release"
+    __table_args__ = (
+        Index("ix_codesystem_release_codesystem_created_at", "codesystem_id", "created_at"),
+    )
+    
+    id = Column(Uuid, primary_key=True, default=uuid.uuid4)
+    codesystem_id = Column(Uuid, nullable=False)  # No foreign key: the history outlives the codesystem
+    version = Column(Text)
+    previous_version = Column(Text)
+    source = Column(Text)  # File name of the release
+    added = Column(Integer, nullable=False, default=0)
+    changed = Column(Integer, nullable=False, default=0)
+    removed = Column(Integer, nullable=False, default=0)
+    unchanged = Column(Integer, nullable=False, default=0)
+    summary = Column(JSON)  # Codes of each set (capped) and the conceptmaps removed with the concepts
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
 class AuditLog(Base):
     __tablename__ = "audit_log"
+    __table_args__ = (
+        Index("ix_audit_log_table_record_changed", "table_name", "record_id", text("changed_at DESC")),
+        Index("ix_audit_log_changed_at", text("changed_at DESC")),
+    )
     
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    id = Column(Uuid, primary_key=True, default=uuid.uuid4)
     table_name = Column(Text, nullable=False)
     operation = Column(Text, nullable=False)  # INSERT, UPDATE, DELETE
-    record_id = Column(UUID(as_uuid=True), nullable=False)
+    record_id = Column(Uuid, nullable=False)
     user_id = Column(Text)
     changed_at = Column(DateTime(timezone=True), server_default=func.now())
     old_data = Column(JSON)
     new_data = Column(JSON)
     meta = Column(JSON)
+
+class Tombstone(Base):
+    """A deleted codesystem, concept or conceptmap, kept for delta sync clients"""
+    __tablename__ = "tombstone"
+    __table_args__ = (
+        Index("ix_tombstone_table_deleted_at_id", "table_name", "deleted_at", "id"),
+    )
+    
+    id = Column(Uuid, primary_key=True, default=uuid.uuid4)
+    table_name = Column(Text, nullable=False)
+    record_id = Column(Uuid, nullable=False)
+    keys = Column(JSON)  # Natural key of the deleted row (e.g. codesystem_id and code)
+    deleted_at = Column(DateTime(timezone=True), server_default=func.now())
+
+class Job(Base):
+    """A long-running operation run by the background job runner"""
+    __tablename__ = "job"
+    __table_args__ = (
+        Index("ix_job_status_created_at", "status", "created_at"),
+    )
+    
+    id = Column(Uuid, primary_key=True, default=uuid.uuid4)
+    kind = Column(Text, nullable=False)
+    status = Column(Text, nullable=False, default="queued")  # queued, running, completed, failed, cancelled
+    params = Column(JSON)
+    result = Column(JSON)
+    error = Column(Text)
+    progress = Column(Integer, nullable=False, default=0)
+    total = Column(Integer)
+    cancel_requested = Column(Boolean, nullable=False, default=False)
+    owner = Column(Text)  # instance_name() of the worker running it
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    started_at = Column(DateTime(timezone=True))
+    heartbeat_at = Column(DateTime(timezone=True))
+    finished_at = Column(DateTime(timezone=True))
@@ -1,18 +1,27 @@
 from typing import List, Optional
 from uuid import UUID
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
 from sqlalchemy.orm import Session
 from app.db import get_db
 from app.schemas import (
     CodeSystem, CodeSystemCreate, CodeSystemUpdate, 
-    PaginationParams, PaginatedCodeSystemResponse
+    PaginationParams, PaginatedCodeSystemResponse, PaginatedCodeSystemReleaseResponse
 )
-from app.crud import codesystem as codesystem_crud
+from app.crud import codesystem as codesystem_crud, release as release_crud
+from app.utils.etag import PreconditionFailed, etag_headers, if_match
+from app.utils.fields import FieldParams, FieldSelectionError, dump_fields, field_params, select_fields, sparse_response
+from app.utils.jobs import JobContext, JobQueueFull, accepted_response, job_runner, respond_async
 import logging
 
 logger = logging.getLogger(__name__)
 router = APIRouter(prefix="/codesystems", tags=["codesystems"])
 
+def _selected_columns(selection: FieldParams) -> Optional[List[str]]:
+    try:
+        return select_fields(CodeSystem, selection)
+    except FieldSelectionError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
 @router.post("/", response_model=CodeSystem)
 def create_codesystem(
     *,
@@ -32,16 +41,23 @@ def read_codesystems(
     db: Session = Depends(get_db),
     page: int = Query(1, ge=1, description="Page number"),
     size: int = Query(10, ge=1, le=100, description="Page size"),
-    search: Optional[str] = Query(None, description="Search term")
+    search: Optional[str] = Query(None, description="Search term"),
+    selection: FieldParams = Depends(field_params)
 ):
     """Retrieve codesystems with pagination"""
+    columns = _selected_columns(selection)
     try:
         skip = (page - 1) * size
-        codesystems = codesystem_crud.codesystem.get_multi(
-            db=db, skip=skip, limit=size, search=search
-        )
         total = codesystem_crud.codesystem.count(db=db, search=search)
         pages = (total + size - 1) // size
+        if selection.summary == "count":
+            return sparse_response({"items": [], "total": total, "page": page, "size": size, "pages": pages})
+        codesystems = codesystem_crud.codesystem.get_multi(
+            db=db, skip=skip, limit=size, search=search, columns=columns
+        )
+        if columns is not None:
+            items = [dump_fields(c, columns) for c in codesystems]
+            return sparse_response({"items": items, "total": total, "page": page, "size": size, "pages": pages})
         
         return PaginatedCodeSystemResponse(
             items=codesystems,
@@ -58,73 +74,149 @@ def read_codesystems(
 def read_codesystem(
     *,
     db: Session = Depends(get_db),
-    codesystem_id: UUID
+    response: Response,
+    codesystem_id: UUID,
+    selection: FieldParams = Depends(field_params)
 ):
     """Get a specific codesystem by ID"""
-    codesystem = codesystem_crud.codesystem.get(db=db, id=codesystem_id)
+    columns = _selected_columns(selection)
+    codesystem = codesystem_crud.codesystem.get(db=db, id=codesystem_id, columns=columns)
     if not codesystem:
         raise HTTPException(status_code=404, detail="Codesystem not found")
+    if columns is not None:
+        return sparse_response(dump_fields(codesystem, columns), headers=etag_headers(codesystem))
+    response.headers.update(etag_headers(codesystem))
     return codesystem
 
 @router.get("/by-url/{url:path}", response_model=CodeSystem)
 def read_codesystem_by_url(
     *,
     db: Session = Depends(get_db),
-    url: str
+    response: Response,
+    url: str,
+    selection: FieldParams = Depends(field_params)
 ):
     """Get a codesystem by URL"""
-    codesystem = codesystem_crud.codesystem.get_by_url(db=db, url=url)
+    columns = _selected_columns(selection)
+    codesystem = codesystem_crud.codesystem.get_by_url(db=db, url=url, columns=columns)
     if not codesystem:
         raise HTTPException(status_code=404, detail="Codesystem not found")
+    if columns is not None:
+        return sparse_response(dump_fields(codesystem, columns), headers=etag_headers(codesystem))
+    response.headers.update(etag_headers(codesystem))
     return codesystem
 
 @router.get("/by-name/{name}", response_model=CodeSystem)
 def read_codesystem_by_name(
     *,
     db: Session = Depends(get_db),
-    name: str
+    response: Response,
+    name: str,
+    selection: FieldParams = Depends(field_params)
 ):
     """Get a codesystem by name"""
-    codesystem = codesystem_crud.codesystem.get_by_name(db=db, name=name)
+    columns = _selected_columns(selection)
+    codesystem = codesystem_crud.codesystem.get_by_name(db=db, name=name, columns=columns)
     if not codesystem:
         raise HTTPException(status_code=404, detail="Codesystem not found")
+    if columns is not None:
+        return sparse_response(dump_fields(codesystem, columns), headers=etag_headers(codesystem))
+    response.headers.update(etag_headers(codesystem))
     return codesystem
 
+@router.get("/{codesystem_id}/releases", response_model=PaginatedCodeSystemReleaseResponse)
+def read_codesystem_releases(
+    *,
+    db: Session = Depends(get_db),
+    codesystem_id: UUID,
+    page: int = Query(1, ge=1, description="Page number"),
+    size: int = Query(10, ge=1, le=100, description="Page size")
+):
+    """Releases applied to a codesystem with what each added, changed and removed, most recent first"""
+    try:
+        total = release_crud.release.count(db=db, codesystem_id=codesystem_id)
+        releases = release_crud.release.get_multi(
+            db=db, codesystem_id=codesystem_id, skip=(page - 1) * size, limit=size
+        )
+        return PaginatedCodeSystemReleaseResponse(
+            items=releases,
+            total=total,
+            page=page,
+            size=size,
+            pages=(total + size - 1) // size
+        )
+    except Exception as e:
+        logger.error(f"Error retrieving codesystem releases: {e}")
+        raise HTTPException(status_code=500, detail="Failed to retrieve codesystem releases")
+
 @router.put("/{codesystem_id}", response_model=CodeSystem)
 def update_codesystem(
     *,
     db: Session = Depends(get_db),
+    response: Response,
     codesystem_id: UUID,
-    codesystem_in: CodeSystemUpdate
+    codesystem_in: CodeSystemUpdate,
+    versions: Optional[List[int]] = Depends(if_match)
 ):
-    """Update a codesystem"""
-    codesystem = codesystem_crud.codesystem.get(db=db, id=codesystem_id)
-    if not codesystem:
-        raise HTTPException(status_code=404, detail="Codesystem not found")
-    
+    """Update a codesystem (only while it still matches `If-Match`, when sent)"""
     try:
         codesystem = codesystem_crud.codesystem.update(
-            db=db, db_obj=codesystem, obj_in=codesystem_in
+            db=db, id=codesystem_id, obj_in=codesystem_in, versions=versions
         )
-        return codesystem
+    except PreconditionFailed as e:
+        raise HTTPException(status_code=412, detail=str(e))
     except Exception as e:
         logger.error(f"Error updating codesystem: {e}")
         raise HTTPException(status_code=400, detail="Failed to update codesystem")
+    if not codesystem:
+        raise HTTPException(status_code=404, detail="Codesystem not found")
+    response.headers.update(etag_headers(codesystem))
+    return codesystem
+
+def _delete_codesystem_job(db: Session, job: JobContext, params: dict) -> dict:
+    codesystem_id = UUID(params["codesystem_id"])
+    if not codesystem_crud.codesystem.delete(
+        db=db, id=codesystem_id, progress=job.progress, versions=params.get("versions")
+    ):
+        raise ValueError(f"Codesystem {codesystem_id} not found")
+    return {"codesystem_id": str(codesystem_id)}
+
+job_runner.register("codesystem-delete", _delete_codesystem_job)
 
 @router.delete("/{codesystem_id}", response_model=CodeSystem)
 def delete_codesystem(
     *,
     db: Session = Depends(get_db),
-    codesystem_id: UUID
+    request: Request,
+    codesystem_id: UUID,
+    versions: Optional[List[int]] = Depends(if_match)
 ):
-    """Delete a codesystem"""
-    codesystem = codesystem_crud.codesystem.get(db=db, id=codesystem_id)
-    if not codesystem:
-        raise HTTPException(status_code=404, detail="Codesystem not found")
+    """Delete a codesystem (as a background job with `Prefer: respond-async`).
+
+    With `If-Match` it is only deleted while it still matches.
+    """
+    if respond_async(request):
+        # Fail fast rather than queue a job that cannot succeed
+        codesystem = codesystem_crud.codesystem.get(db=db, id=codesystem_id)
+        if not codesystem:
+            raise HTTPException(status_code=404, detail="Codesystem not found")
+        if versions is not None and codesystem.version_id not in versions:
+            raise HTTPException(status_code=412, detail="If-Match does not match the codesystem's current ETag")
+        try:
+            job = job_runner.submit(
+                db, "codesystem-delete", {"codesystem_id": str(codesystem_id), "versions": versions}
+            )
+        except JobQueueFull as e:
+            raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": "30"})
+        return accepted_response(request, job)
     
     try:
-        codesystem = codesystem_crud.codesystem.delete(db=db, id=codesystem_id)
-        return codesystem
+        codesystem = codesystem_crud.codesystem.delete(db=db, id=codesystem_id, versions=versions)
+    except PreconditionFailed as e:
+        raise HTTPException(status_code=412, detail=str(e))
     except Exception as e:
         logger.error(f"Error deleting codesystem: {e}")
         raise HTTPException(status_code=400, detail="Failed to delete codesystem")
+    if not codesystem:
+        raise HTTPException(status_code=404, detail="Codesystem not found")
+    return codesystem
@@ -1,14 +1,20 @@
 from typing import List, Optional
 from uuid import UUID
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from fastapi.responses import JSONResponse
 from sqlalchemy.orm import Session
 from app.db import get_db
 from app.schemas import (
-    Concept, ConceptCreate, ConceptUpdate, 
-    PaginationParams, PaginatedConceptResponse
+    Concept, ConceptCreate, ConceptUpdate, ConceptTreeNode, CodeSuggestion,
+    PaginationParams, PaginatedConceptResponse, PaginatedConceptTreeResponse
 )
 from app.crud import concept as concept_crud, conceptmap as conceptmap_crud
 from app.models import Concept as ConceptModel
+from app.utils.etag import PreconditionFailed, etag_headers, if_match
+from app.utils.fields import FieldParams, FieldSelectionError, dump_fields, field_params, select_fields, sparse_response
+from app.utils.fuzzy import MAX_DISTANCE, fuzzy_code_index
+from app.utils.hierarchy import hierarchy_index
+from app.utils.snapshot import snapshot_store
 import logging
 
 logger = logging.getLogger(__name__)
@@ -28,56 +34,106 @@ def create_concept(
         logger.error(f"Error creating concept: {e}")
         raise HTTPException(status_code=400, detail="Failed to create concept")
 
+def _mapping_properties(concept, source_map, target_map) -> List[dict]:
+    """Concept properties plus its ConceptMap mappings, for easier consumption"""
+    props = list(concept.properties or [])
+    # If this concept is NAMASTE (source), attach its ICD11 mapping(s)
+    for m in source_map.get(concept.id, []):
+        props.append({
+            "code": "icd11Mapping",
+            "valueCode": str(m.target_code),
+            "equivalence": m.equivalence
+        })
+    # If this concept is ICD11 (target), attach its NAMASTE mapping(s)
+    for m in target_map.get(concept.id, []):
+        props.append({
+            "code": "namasteMapping",
+            "valueCode": str(m.source_code),
+            "equivalence": m.equivalence
+        })
+    return props
+
 @router.get("/", response_model=PaginatedConceptResponse)
 def read_concepts(
     db: Session = Depends(get_db),
     page: int = Query(1, ge=1, description="Page number"),
     size: int = Query(10, ge=1, le=100, description="Page size"),
     codesystem_id: Optional[UUID] = Query(None, description="Filter by codesystem ID"),
-    search: Optional[str] = Query(None, description="Search term")
+    search: Optional[str] = Query(None, description="Search term"),
+    subtree: Optional[str] = Query(None, description="Only this code and its descendants (requires codesystem_id)"),
+    property: Optional[List[str]] = Query(None, description="Property filter as code:value (repeatable, AND-ed)"),
+    selection: FieldParams = Depends(field_params)
 ):
     """Retrieve concepts with pagination"""
+    property_filters = None
+    if property:
+        property_filters = []
+        for item in property:
+            code, sep, value = item.partition(":")
+            if not sep or not code or not value:
+                raise HTTPException(status_code=400, detail=f"Invalid property filter '{item}', expected code:value")
+            property_filters.append((code, [value]))
+    
+    try:
+        columns = select_fields(Concept, selection)
+    except FieldSelectionError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    codes = None
+    if subtree is not None:
+        if not codesystem_id:
+            raise HTTPException(status_code=400, detail="subtree requires codesystem_id")
+        codes = hierarchy_index.subtree_codes(db=db, codesystem_id=codesystem_id, code=subtree)
+        if codes is None:
+            raise HTTPException(status_code=404, detail="Subtree root concept not found")
+    
     try:
-        logger.info(f"/concepts search=<{search}> page={page} size={size} codesystem_id={codesystem_id}")
+        logger.info(f"/concepts search=<{search}> page={page} size={size} codesystem_id={codesystem_id} subtree={subtree} property={property}")
         skip = (page - 1) * size
+        if codes is not None and not search and not property_filters:
+            # Page the subtree in memory so only this page's codes go to the database
+            total = len(codes)
+            codes = codes[skip:skip + size]
+            skip = 0
+        else:
+            total = concept_crud.concept.count(
+                db=db, codesystem_id=codesystem_id, search=search,
+                codes=codes, properties=property_filters
+            )
+        pages = (total + size - 1) // size
+        if selection.summary == "count":
+            return sparse_response({"items": [], "total": total, "page": page, "size": size, "pages": pages})
         concepts = concept_crud.concept.get_multi(
-            db=db, skip=skip, limit=size, codesystem_id=codesystem_id, search=search
-        )
-        total = concept_crud.concept.count(
-            db=db, codesystem_id=codesystem_id, search=search
+            db=db, skip=skip, limit=size, codesystem_id=codesystem_id, search=search,
+            codes=codes, properties=property_filters, columns=columns
         )
-        pages = (total + size - 1) // size
-        # Merge ConceptMap mappings into concept properties for easier consumption
-        concept_ids = [c.id for c in concepts]
-        mappings = conceptmap_crud.conceptmap.get_by_concept_ids(db=db, concept_ids=concept_ids)
-        logger.info(f"Found {len(mappings)} conceptmap rows for {len(concept_ids)} concepts")
-
-        # Build lookup dictionaries
+        
+        # Merge ConceptMap mappings into concept properties, unless properties are not returned
         source_map = {}
         target_map = {}
-        for m in mappings:
-            source_map.setdefault(m.source_code, []).append(m)
-            target_map.setdefault(m.target_code, []).append(m)
+        if columns is None or "properties" in columns:
+            concept_ids = [c.id for c in concepts]
+            snapshot = snapshot_store.current()
+            if snapshot:
+                mappings = snapshot.mappings_for_concepts(concept_ids)
+            else:
+                mappings = conceptmap_crud.conceptmap.get_mappings_for_concepts(db=db, concept_ids=concept_ids)
+            logger.info(f"Found {len(mappings)} conceptmap rows for {len(concept_ids)} concepts")
+            for m in mappings:
+                source_map.setdefault(m.source_code, []).append(m)
+                target_map.setdefault(m.target_code, []).append(m)
+
+        if columns is not None:
+            items = []
+            for c in concepts:
+                item = dump_fields(c, columns)
+                if "properties" in item:
+                    item["properties"] = _mapping_properties(c, source_map, target_map)
+                items.append(item)
+            return sparse_response({"items": items, "total": total, "page": page, "size": size, "pages": pages})
 
         enriched_items = []
         for c in concepts:
-            props = list(c.properties or [])
-            # If this concept is NAMASTE (source), attach its ICD11 mapping(s)
-            if c.id in source_map:
-                for m in source_map[c.id]:
-                    props.append({
-                        "code": "icd11Mapping",
-                        "valueCode": str(m.target_code),
-                        "equivalence": m.equivalence
-                    })
-            # If this concept is ICD11 (target), attach its NAMASTE mapping(s)
-            if c.id in target_map:
-                for m in target_map[c.id]:
-                    props.append({
-                        "code": "namasteMapping",
-                        "valueCode": str(m.source_code),
-                        "equivalence": m.equivalence
-                    })
             # Create a shallow copy model with updated properties
             enriched = ConceptModel(
                 id=c.id,
@@ -85,10 +141,11 @@ def read_concepts(
                 code=c.code,
                 display=c.display,
                 definition=c.definition,
-                properties=props,
+                properties=_mapping_properties(c, source_map, target_map),
                 raw=c.raw,
                 created_at=c.created_at,
-                updated_at=c.updated_at
+                updated_at=c.updated_at,
+                version_id=c.version_id
             )
             enriched_items.append(enriched)
 
@@ -103,84 +160,188 @@ def read_concepts(
         logger.error(f"Error retrieving concepts: {e}")
         raise HTTPException(status_code=500, detail="Failed to retrieve concepts")
 
+def _selected_columns(selection: FieldParams) -> Optional[List[str]]:
+    try:
+        return select_fields(Concept, selection)
+    except FieldSelectionError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
 @router.get("/{concept_id}", response_model=Concept)
 def read_concept(
     *,
     db: Session = Depends(get_db),
-    concept_id: UUID
+    response: Response,
+    concept_id: UUID,
+    selection: FieldParams = Depends(field_params)
 ):
     """Get a specific concept by ID"""
-    concept = concept_crud.concept.get(db=db, id=concept_id)
+    columns = _selected_columns(selection)
+    concept = concept_crud.concept.get(db=db, id=concept_id, columns=columns)
     if not concept:
         raise HTTPException(status_code=404, detail="Concept not found")
+    if columns is not None:
+        return sparse_response(dump_fields(concept, columns), headers=etag_headers(concept))
+    response.headers.update(etag_headers(concept))
     return concept
 
 @router.get("/by-code/{codesystem_id}/{code}", response_model=Concept)
 def read_concept_by_code(
     *,
     db: Session = Depends(get_db),
+    response: Response,
     codesystem_id: UUID,
-    code: str
+    code: str,
+    selection: FieldParams = Depends(field_params)
 ):
     """Get a concept by codesystem ID and code"""
+    columns = _selected_columns(selection)
     concept = concept_crud.concept.get_by_code(
-        db=db, codesystem_id=codesystem_id, code=code
+        db=db, codesystem_id=codesystem_id, code=code, columns=columns
     )
     if not concept:
-        raise HTTPException(status_code=404, detail="Concept not found")
+        # Near codes come from the in-memory index, not a wildcard ILIKE scan
+        suggestions = fuzzy_code_index.suggest(db=db, codesystem_id=codesystem_id, code=code)
+        return JSONResponse(
+            status_code=404,
+            content={
+                "detail": "Concept not found",
+                "suggestions": [{"code": c, "distance": d} for c, d in suggestions]
+            }
+        )
+    if columns is not None:
+        return sparse_response(dump_fields(concept, columns), headers=etag_headers(concept))
+    response.headers.update(etag_headers(concept))
     return concept
 
+@router.get("/fuzzy/{codesystem_id}/{code}", response_model=List[CodeSuggestion])
+def read_similar_codes(
+    *,
+    db: Session = Depends(get_db),
+    codesystem_id: UUID,
+    code: str,
+    limit: int = Query(5, ge=1, le=50, description="Maximum number of codes"),
+    max_distance: int = Query(MAX_DISTANCE, ge=0, le=MAX_DISTANCE, description="Maximum edit distance")
+):
+    """Get the codes of a codesystem closest to a (possibly mistyped) code"""
+    try:
+        matches = fuzzy_code_index.suggest(
+            db=db, codesystem_id=codesystem_id, code=code, limit=limit, max_distance=max_distance
+        )
+        concepts = {
+            c.code: c for c in concept_crud.concept.get_by_codes(
+                db=db, codesystem_id=codesystem_id, codes=[m for m, _ in matches]
+            )
+        }
+        return [
+            CodeSuggestion(id=concepts[m].id, code=m, display=concepts[m].display, distance=d)
+            for m, d in matches if m in concepts
+        ]
+    except Exception as e:
+        logger.error(f"Error retrieving similar codes: {e}")
+        raise HTTPException(status_code=500, detail="Failed to retrieve similar codes")
+
 @router.get("/codesystem/{codesystem_id}", response_model=List[Concept])
 def read_concepts_by_codesystem(
     *,
     db: Session = Depends(get_db),
-    codesystem_id: UUID
+    codesystem_id: UUID,
+    selection: FieldParams = Depends(field_params)
 ):
     """Get all concepts for a specific codesystem"""
+    columns = _selected_columns(selection)
     try:
         concepts = concept_crud.concept.get_by_codesystem(
-            db=db, codesystem_id=codesystem_id
+            db=db, codesystem_id=codesystem_id, columns=columns
         )
+        if columns is not None:
+            return sparse_response([dump_fields(c, columns) for c in concepts])
         return concepts
     except Exception as e:
         logger.error(f"Error retrieving concepts for codesystem: {e}")
         raise HTTPException(status_code=500, detail="Failed to retrieve concepts")
 
+@router.get("/codesystem/{codesystem_id}/children", response_model=PaginatedConceptTreeResponse)
+def read_concept_children(
+    *,
+    db: Session = Depends(get_db),
+    codesystem_id: UUID,
+    code: Optional[str] = Query(None, description="Parent code; omit for the root concepts"),
+    page: int = Query(1, ge=1, description="Page number"),
+    size: int = Query(50, ge=1, le=500, description="Page size")
+):
+    """Get the direct children of a concept (or the roots) for lazy tree loading"""
+    graph = hierarchy_index.get(db=db, codesystem_id=codesystem_id)
+    if code is not None and code not in graph:
+        raise HTTPException(status_code=404, detail="Concept not found")
+    
+    try:
+        codes = graph.child_codes(code) if code is not None else graph.roots()
+        skip = (page - 1) * size
+        page_codes = codes[skip:skip + size]
+        concepts = {
+            c.code: c for c in concept_crud.concept.get_by_codes(
+                db=db, codesystem_id=codesystem_id, codes=page_codes
+            )
+        }
+        items = [
+            ConceptTreeNode(
+                id=concepts[c].id,
+                code=c,
+                display=concepts[c].display,
+                child_count=len(graph.child_codes(c))
+            )
+            for c in page_codes if c in concepts
+        ]
+        return PaginatedConceptTreeResponse(
+            items=items,
+            total=len(codes),
+            page=page,
+            size=size,
+            pages=(len(codes) + size - 1) // size
+        )
+    except Exception as e:
+        logger.error(f"Error retrieving concept children: {e}")
+        raise HTTPException(status_code=500, detail="Failed to retrieve concept children")
+
 @router.put("/{concept_id}", response_model=Concept)
 def update_concept(
     *,
     db: Session = Depends(get_db),
+    response: Response,
     concept_id: UUID,
-    concept_in: ConceptUpdate
+    concept_in: ConceptUpdate,
+    versions: Optional[List[int]] = Depends(if_match)
 ):
-    """Update a concept"""
-    concept = concept_crud.concept.get(db=db, id=concept_id)
-    if not concept:
-        raise HTTPException(status_code=404, detail="Concept not found")
-    
+    """Update a concept (only while it still matches `If-Match`, when sent)"""
     try:
         concept = concept_crud.concept.update(
-            db=db, db_obj=concept, obj_in=concept_in
+            db=db, id=concept_id, obj_in=concept_in, versions=versions
         )
-        return concept
+    except PreconditionFailed as e:
+        raise HTTPException(status_code=412, detail=str(e))
     except Exception as e:
         logger.error(f"Error updating concept: {e}")
         raise HTTPException(status_code=400, detail="Failed to update concept")
+    if not concept:
+        raise HTTPException(status_code=404, detail="Concept not found")
+    response.headers.update(etag_headers(concept))
+    return concept
 
 @router.delete("/{concept_id}", response_model=Concept)
 def delete_concept(
     *,
     db: Session = Depends(get_db),
-    concept_id: UUID
+    concept_id: UUID,
+    versions: Optional[List[int]] = Depends(if_match)
 ):
-    """Delete a concept"""
-    concept = concept_crud.concept.get(db=db, id=concept_id)
-    if not concept:
-        raise HTTPException(status_code=404, detail="Concept not found")
-    
+    """Delete a concept (only while it still matches `If-Match`, when sent)"""
     try:
-        concept = concept_crud.concept.delete(db=db, id=concept_id)
-        return concept
+        concept = concept_crud.concept.delete(db=db, id=concept_id, versions=versions)
+    except PreconditionFailed as e:
+        raise HTTPException(status_code=412, detail=str(e))
     except Exception as e:
         logger.error(f"Error deleting concept: {e}")
         raise HTTPException(status_code=400, detail="Failed to delete concept")
+    if not concept:
+        raise HTTPException(status_code=404, detail="Concept not found")
+    return concept
@@ -1,19 +1,33 @@
-from typing import List, Optional
+from typing import Any, List, Optional
 from uuid import UUID
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Body, Depends, HTTPException, Query, Request, Response
+from fastapi.responses import JSONResponse
 from sqlalchemy.orm import Session
 from app.db import get_db
 from app.schemas import (
-    ConceptMap, ConceptMapCreate, ConceptMapUpdate, 
+    ConceptMap, ConceptMapCreate, ConceptMapUpdate, ConceptMapImportReport,
     TranslationRequest, TranslationResponse,
+    MappingSuggestionRequest, MappingSuggestionResponse,
     PaginationParams, PaginatedConceptMapResponse
 )
-from app.crud import conceptmap as conceptmap_crud, codesystem as codesystem_crud
+from app.crud import conceptmap as conceptmap_crud, concept as concept_crud
+from app.utils.etag import PreconditionFailed, etag_headers, if_match
+from app.utils.mapping_import import ImportFormatError, import_mappings, parse_csv, parse_fhir
+from app.utils.fields import FieldParams, FieldSelectionError, dump_fields, field_params, select_fields, sparse_response
+from app.utils.membership import membership_index
+from app.utils.snapshot import snapshot_store
+from app.utils.suggest import suggest_mappings, suggestion_indexes
 import logging
 
 logger = logging.getLogger(__name__)
 router = APIRouter(prefix="/conceptmaps", tags=["conceptmaps"])
 
+def _selected_columns(selection: FieldParams) -> Optional[List[str]]:
+    try:
+        return select_fields(ConceptMap, selection)
+    except FieldSelectionError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
 @router.post("/", response_model=ConceptMap)
 def create_conceptmap(
     *,
@@ -28,6 +42,40 @@ def create_conceptmap(
         logger.error(f"Error creating conceptmap: {e}")
         raise HTTPException(status_code=400, detail="Failed to create conceptmap")
 
+CSV_MEDIA_TYPES = ("text/csv", "application/csv", "text/plain")
+
+@router.post("/bulk", response_model=ConceptMapImportReport)
+def import_conceptmaps(
+    *,
+    db: Session = Depends(get_db),
+    request: Request,
+    payload: Any = Body(..., description="FHIR ConceptMap or Bundle of ConceptMaps (JSON), or mapping CSV (text/csv)"),
+    on_error: str = Query("report", pattern="^(report|reject)$", description="report: insert the valid rows; reject: insert nothing if any row is invalid")
+):
+    """Bulk import mappings keyed by codes, skipping those that already exist"""
+    if isinstance(payload, bytes):
+        media_type = request.headers.get("content-type", "").split(";")[0].strip().lower()
+        if media_type not in CSV_MEDIA_TYPES:
+            raise HTTPException(status_code=415, detail="Send a FHIR ConceptMap/Bundle as JSON or mappings as text/csv")
+        try:
+            mappings = parse_csv(payload.decode("utf-8-sig"))
+        except (UnicodeDecodeError, ImportFormatError) as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    else:
+        try:
+            mappings = parse_fhir(payload)
+        except ImportFormatError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    
+    try:
+        report = import_mappings(db=db, mappings=mappings, reject=on_error == "reject")
+    except Exception as e:
+        logger.error(f"Error importing conceptmaps: {e}")
+        raise HTTPException(status_code=500, detail="Failed to import conceptmaps")
+    if report.get("rejected"):
+        return JSONResponse(status_code=422, content=report)
+    return report
+
 @router.get("/", response_model=PaginatedConceptMapResponse)
 def read_conceptmaps(
     db: Session = Depends(get_db),
@@ -35,26 +83,34 @@ def read_conceptmaps(
     size: int = Query(10, ge=1, le=100, description="Page size"),
     source_codesystem_id: Optional[UUID] = Query(None, description="Filter by source codesystem ID"),
     target_codesystem_id: Optional[UUID] = Query(None, description="Filter by target codesystem ID"),
-    search: Optional[str] = Query(None, description="Search term")
+    search: Optional[str] = Query(None, description="Search term"),
+    selection: FieldParams = Depends(field_params)
 ):
     """Retrieve conceptmaps with pagination"""
+    columns = _selected_columns(selection)
     try:
         skip = (page - 1) * size
-        conceptmaps = conceptmap_crud.conceptmap.get_multi(
+        total = conceptmap_crud.conceptmap.count(
             db=db, 
-            skip=skip, 
-            limit=size, 
             source_codesystem_id=source_codesystem_id,
             target_codesystem_id=target_codesystem_id,
             search=search
         )
-        total = conceptmap_crud.conceptmap.count(
+        pages = (total + size - 1) // size
+        if selection.summary == "count":
+            return sparse_response({"items": [], "total": total, "page": page, "size": size, "pages": pages})
+        conceptmaps = conceptmap_crud.conceptmap.get_multi(
             db=db, 
+            skip=skip, 
+            limit=size, 
             source_codesystem_id=source_codesystem_id,
             target_codesystem_id=target_codesystem_id,
-            search=search
+            search=search,
+            columns=columns
         )
-        pages = (total + size - 1) // size
+        if columns is not None:
+            items = [dump_fields(m, columns) for m in conceptmaps]
+            return sparse_response({"items": items, "total": total, "page": page, "size": size, "pages": pages})
         
         return PaginatedConceptMapResponse(
             items=conceptmaps,
@@ -71,52 +127,62 @@ def read_conceptmaps(
 def read_conceptmap(
     *,
     db: Session = Depends(get_db),
-    conceptmap_id: UUID
+    response: Response,
+    conceptmap_id: UUID,
+    selection: FieldParams = Depends(field_params)
 ):
     """Get a specific conceptmap by ID"""
-    conceptmap = conceptmap_crud.conceptmap.get(db=db, id=conceptmap_id)
+    columns = _selected_columns(selection)
+    conceptmap = conceptmap_crud.conceptmap.get(db=db, id=conceptmap_id, columns=columns)
     if not conceptmap:
         raise HTTPException(status_code=404, detail="Conceptmap not found")
+    if columns is not None:
+        return sparse_response(dump_fields(conceptmap, columns), headers=etag_headers(conceptmap))
+    response.headers.update(etag_headers(conceptmap))
     return conceptmap
 
 @router.put("/{conceptmap_id}", response_model=ConceptMap)
 def update_conceptmap(
     *,
     db: Session = Depends(get_db),
+    response: Response,
     conceptmap_id: UUID,
-    conceptmap_in: ConceptMapUpdate
+    conceptmap_in: ConceptMapUpdate,
+    versions: Optional[List[int]] = Depends(if_match)
 ):
-    """Update a conceptmap"""
-    conceptmap = conceptmap_crud.conceptmap.get(db=db, id=conceptmap_id)
-    if not conceptmap:
-        raise HTTPException(status_code=404, detail="Conceptmap not found")
-    
+    """Update a conceptmap (only while it still matches `If-Match`, when sent)"""
     try:
         conceptmap = conceptmap_crud.conceptmap.update(
-            db=db, db_obj=conceptmap, obj_in=conceptmap_in
+            db=db, id=conceptmap_id, obj_in=conceptmap_in, versions=versions
         )
-        return conceptmap
+    except PreconditionFailed as e:
+        raise HTTPException(status_code=412, detail=str(e))
     except Exception as e:
         logger.error(f"Error updating conceptmap: {e}")
         raise HTTPException(status_code=400, detail="Failed to update conceptmap")
+    if not conceptmap:
+        raise HTTPException(status_code=404, detail="Conceptmap not found")
+    response.headers.update(etag_headers(conceptmap))
+    return conceptmap
 
 @router.delete("/{conceptmap_id}", response_model=ConceptMap)
 def delete_conceptmap(
     *,
     db: Session = Depends(get_db),
-    conceptmap_id: UUID
+    conceptmap_id: UUID,
+    versions: Optional[List[int]] = Depends(if_match)
 ):
-    """Delete a conceptmap"""
-    conceptmap = conceptmap_crud.conceptmap.get(db=db, id=conceptmap_id)
-    if not conceptmap:
-        raise HTTPException(status_code=404, detail="Conceptmap not found")
-    
+    """Delete a conceptmap (only while it still matches `If-Match`, when sent)"""
     try:
-        conceptmap = conceptmap_crud.conceptmap.delete(db=db, id=conceptmap_id)
-        return conceptmap
+        conceptmap = conceptmap_crud.conceptmap.delete(db=db, id=conceptmap_id, versions=versions)
+    except PreconditionFailed as e:
+        raise HTTPException(status_code=412, detail=str(e))
     except Exception as e:
         logger.error(f"Error deleting conceptmap: {e}")
         raise HTTPException(status_code=400, detail="Failed to delete conceptmap")
+    if not conceptmap:
+        raise HTTPException(status_code=404, detail="Conceptmap not found")
+    return conceptmap
 
 @router.post("/translate", response_model=TranslationResponse)
 def translate_concept(
@@ -126,59 +192,60 @@ def translate_concept(
 ):
     """Translate a concept from source to target codesystem"""
     try:
-        # Find source codesystem
-        source_codesystem = codesystem_crud.codesystem.get_by_url(
-            db=db, url=translation_request.source_codesystem
-        )
-        if not source_codesystem:
-            source_codesystem = codesystem_crud.codesystem.get_by_name(
-                db=db, name=translation_request.source_codesystem
-            )
-        
-        if not source_codesystem:
+        # Resolve codesystems by URL or name (cached in the membership index)
+        source_codesystem_id = membership_index.resolve_system(db, translation_request.source_codesystem)
+        if source_codesystem_id is None:
             raise HTTPException(
                 status_code=404, 
                 detail=f"Source codesystem not found: {translation_request.source_codesystem}"
             )
         
-        # Find target codesystem
-        target_codesystem = codesystem_crud.codesystem.get_by_url(
-            db=db, url=translation_request.target_codesystem
-        )
-        if not target_codesystem:
-            target_codesystem = codesystem_crud.codesystem.get_by_name(
-                db=db, name=translation_request.target_codesystem
-            )
-        
-        if not target_codesystem:
+        target_codesystem_id = membership_index.resolve_system(db, translation_request.target_codesystem)
+        if target_codesystem_id is None:
             raise HTTPException(
                 status_code=404, 
                 detail=f"Target codesystem not found: {translation_request.target_codesystem}"
             )
         
-        # Find translation - convert source_code string to UUID if needed
+        snapshot = snapshot_store.current()
+        
+        # Find translation - source_code is a concept UUID or a code of the source codesystem
         try:
-            from uuid import UUID
             source_code_uuid = UUID(translation_request.source_code)
         except ValueError:
-            # If source_code is not a valid UUID, return not found
-            return TranslationResponse(
-                target_code=None,
-                equivalence=None,
-                found=False
-            )
+            if snapshot:
+                source_code_uuid = snapshot.concept_id(source_codesystem_id, translation_request.source_code)
+            else:
+                source_concept = concept_crud.concept.get_by_code(
+                    db=db, codesystem_id=source_codesystem_id, code=translation_request.source_code
+                )
+                source_code_uuid = source_concept.id if source_concept else None
+            if source_code_uuid is None:
+                return TranslationResponse(
+                    target_code=None,
+                    equivalence=None,
+                    found=False
+                )
         
-        conceptmap = conceptmap_crud.conceptmap.get_translation(
-            db=db,
-            source_codesystem_id=source_codesystem.id,
-            target_codesystem_id=target_codesystem.id,
-            source_code=source_code_uuid
-        )
+        if snapshot:
+            conceptmap = snapshot.translate(
+                source_codesystem_id=source_codesystem_id,
+                target_codesystem_id=target_codesystem_id,
+                source_code=source_code_uuid
+            )
+            translation = (conceptmap.target_code, conceptmap.equivalence) if conceptmap else None
+        else:
+            translation = conceptmap_crud.conceptmap.get_translations(
+                db=db,
+                source_codesystem_id=source_codesystem_id,
+                target_codesystem_id=target_codesystem_id,
+                source_codes=[source_code_uuid]
+            )[source_code_uuid]
         
-        if conceptmap:
+        if translation:
             return TranslationResponse(
-                target_code=conceptmap.target_code,
-                equivalence=conceptmap.equivalence,
+                target_code=translation[0],
+                equivalence=translation[1],
                 found=True
             )
         else:
@@ -193,3 +260,58 @@ def translate_concept(
     except Exception as e:
         logger.error(f"Error translating concept: {e}")
         raise HTTPException(status_code=500, detail="Failed to translate concept")
+
+@router.post("/suggest", response_model=MappingSuggestionResponse)
+def suggest_conceptmaps(
+    *,
+    db: Session = Depends(get_db),
+    suggestion_request: MappingSuggestionRequest
+):
+    """Suggest target concepts for source concepts by TF-IDF similarity"""
+    source_codesystem_id = membership_index.resolve_system(db, suggestion_request.source_codesystem)
+    if source_codesystem_id is None:
+        raise HTTPException(
+            status_code=404,
+            detail=f"Source codesystem not found: {suggestion_request.source_codesystem}"
+        )
+    target_codesystem_id = membership_index.resolve_system(db, suggestion_request.target_codesystem)
+    if target_codesystem_id is None:
+        raise HTTPException(
+            status_code=404,
+            detail=f"Target codesystem not found: {suggestion_request.target_codesystem}"
+        )
+    
+    try:
+        items, missing = suggest_mappings(
+            db=db,
+            source_codesystem_id=source_codesystem_id,
+            target_codesystem_id=target_codesystem_id,
+            codes=suggestion_request.source_codes,
+            k=suggestion_request.k,
+            min_score=suggestion_request.min_score
+        )
+        return MappingSuggestionResponse(
+            target_codesystem_id=target_codesystem_id,
+            items=items,
+            missing=missing
+        )
+    except Exception as e:
+        logger.error(f"Error suggesting conceptmaps: {e}")
+        raise HTTPException(status_code=500, detail="Failed to suggest conceptmaps")
+
+@router.post("/suggest/index", response_model=dict)
+def rebuild_suggestion_index(
+    db: Session = Depends(get_db),
+    target_codesystem: str = Query(..., description="Target codesystem URL or name")
+):
+    """Rebuild the persisted TF-IDF index of a target codesystem"""
+    target_codesystem_id = membership_index.resolve_system(db, target_codesystem)
+    if target_codesystem_id is None:
+        raise HTTPException(status_code=404, detail=f"Target codesystem not found: {target_codesystem}")
+    
+    try:
+        index = suggestion_indexes.rebuild(db=db, codesystem_id=target_codesystem_id)
+        return index.meta
+    except Exception as e:
+        logger.error(f"Error rebuilding suggestion index: {e}")
+        raise HTTPException(status_code=500, detail="Failed to rebuild suggestion index")
@@ -0,0 +1,358 @@
+import os
+from typing import Any, Dict, Optional
+from uuid import UUID
+from fastapi import APIRouter, Body, Depends, Query, Request, Response
+from fastapi.responses import FileResponse
+from sqlalchemy.orm import Session
+from app.db import READ_ONLY, get_db
+from app.crud import concept as concept_crud, job as job_crud
+from app.utils.bulk_export import (
+    OUTPUT_FORMATS, ExportError, export_directory, parse_since, parse_types, remove_export, run_export
+)
+from app.utils.bundle import dual_code_bundle
+from app.utils.expansion import ExpansionError, expand, expansion_page, implicit_valueset
+from app.utils.fhir import operation_outcome, param, parameters, parameters_to_dict
+from app.utils.hierarchy import hierarchy_index
+from app.utils.jobs import JobQueueFull, job_runner
+from app.utils.membership import membership_index
+import logging
+
+logger = logging.getLogger(__name__)
+router = APIRouter(tags=["fhir"])
+
+
+def _property_params(properties):
+    out = []
+    for prop in properties or []:
+        if not isinstance(prop, dict) or "code" not in prop:
+            continue
+        value = next(((k, v) for k, v in prop.items() if k.startswith("value")), None)
+        part = [{"name": "code", "valueCode": prop["code"]}]
+        if value:
+            part.append({"name": "value", value[0]: value[1]})
+        out.append({"name": "property", "part": part})
+    return out
+
+
+def _lookup(db: Session, system: Optional[str], code: Optional[str], version: Optional[str]):
+    if not system or not code:
+        return operation_outcome(400, "Both 'system' and 'code' are required", code="required")
+
+    codesystem_id = membership_index.resolve_system(db, system)
+    if codesystem_id is None:
+        return operation_outcome(404, f"Unknown code system: {system}")
+    if version and membership_index.version_of(codesystem_id) not in (None, version):
+        return operation_outcome(404, f"Code system {system} version {version} not found")
+    if not membership_index.contains(db, codesystem_id, code):
+        return operation_outcome(404, f"Code '{code}' not found in {system}")
+
+    concept = concept_crud.concept.get_by_code(db=db, codesystem_id=codesystem_id, code=code)
+    if not concept:
+        return operation_outcome(404, f"Code '{code}' not found in {system}")
+    codesystem = concept.codesystem
+    result = parameters(
+        param("name", codesystem.name or codesystem.title or system),
+        param("version", codesystem.version),
+        param("display", concept.display),
+        param("definition", concept.definition),
+    )
+    result["parameter"].extend(_property_params(concept.properties))
+    return result
+
+
+def _validate_code(
+    db: Session,
+    url: Optional[str],
+    code: Optional[str],
+    version: Optional[str],
+    display: Optional[str],
+) -> Dict[str, Any]:
+    if not url or not code:
+        return parameters(param("result", False, "Boolean"), param("message", "Both 'url' and 'code' are required"))
+
+    codesystem_id = membership_index.resolve_system(db, url)
+    if codesystem_id is None:
+        return parameters(param("result", False, "Boolean"), param("message", f"Unknown code system: {url}"))
+    if version and membership_index.version_of(codesystem_id) not in (None, version):
+        return parameters(
+            param("result", False, "Boolean"),
+            param("message", f"Code system {url} version {version} not found"),
+        )
+    if not membership_index.contains(db, codesystem_id, code):
+        return parameters(
+            param("result", False, "Boolean"),
+            param("message", f"Code '{code}' not found in {url}"),
+        )
+    if display is None:
+        return parameters(param("result", True, "Boolean"))
+
+    # Only display validation needs the concept row itself
+    concept = concept_crud.concept.get_by_code(db=db, codesystem_id=codesystem_id, code=code)
+    if not concept:
+        return parameters(param("result", False, "Boolean"), param("message", f"Code '{code}' not found in {url}"))
+    if (concept.display or "").strip().lower() != display.strip().lower():
+        return parameters(
+            param("result", False, "Boolean"),
+            param("message", f"Display '{display}' does not match '{concept.display}'"),
+            param("display", concept.display),
+        )
+    return parameters(param("result", True, "Boolean"), param("display", concept.display))
+
+
+@router.get("/CodeSystem/$lookup")
+def lookup(
+    db: Session = Depends(get_db),
+    system: Optional[str] = Query(None, description="Canonical URL (or name) of the code system"),
+    code: Optional[str] = Query(None, description="Code to look up"),
+    version: Optional[str] = Query(None, description="Code system version")
+):
+    """FHIR CodeSystem $lookup"""
+    return _lookup(db, system, code, version)
+
+
+@router.post("/CodeSystem/$lookup")
+def lookup_post(
+    db: Session = Depends(get_db),
+    body: Dict[str, Any] = Body(..., description="FHIR Parameters resource")
+):
+    """FHIR CodeSystem $lookup (Parameters body)"""
+    values = parameters_to_dict(body)
+    coding = values.get("coding") or {}
+    return _lookup(
+        db,
+        values.get("system") or coding.get("system"),
+        values.get("code") or coding.get("code"),
+        values.get("version") or coding.get("version"),
+    )
+
+
+@router.get("/CodeSystem/$validate-code")
+def validate_code(
+    db: Session = Depends(get_db),
+    url: Optional[str] = Query(None, description="Canonical URL (or name) of the code system"),
+    code: Optional[str] = Query(None, description="Code to validate"),
+    version: Optional[str] = Query(None, description="Code system version"),
+    display: Optional[str] = Query(None, description="Display to check against the concept")
+):
+    """FHIR CodeSystem $validate-code"""
+    return _validate_code(db, url, code, version, display)
+
+
+@router.post("/CodeSystem/$validate-code")
+def validate_code_post(
+    db: Session = Depends(get_db),
+    body: Dict[str, Any] = Body(..., description="FHIR Parameters resource")
+):
+    """FHIR CodeSystem $validate-code (Parameters body)"""
+    values = parameters_to_dict(body)
+    coding = values.get("coding") or {}
+    return _validate_code(
+        db,
+        values.get("url") or coding.get("system"),
+        values.get("code") or coding.get("code"),
+        values.get("version") or coding.get("version"),
+        values.get("display") or coding.get("display"),
+    )
+
+
+def _subsumes(db: Session, system: Optional[str], code_a: Optional[str], code_b: Optional[str], version: Optional[str]):
+    if not system or not code_a or not code_b:
+        return operation_outcome(400, "'system', 'codeA' and 'codeB' are required", code="required")
+    codesystem_id = membership_index.resolve_system(db, system)
+    if codesystem_id is None:
+        return operation_outcome(404, f"Unknown code system: {system}")
+    if version and membership_index.version_of(codesystem_id) not in (None, version):
+        return operation_outcome(404, f"Code system {system} version {version} not found")
+    graph = hierarchy_index.get(db, codesystem_id)
+    for code in (code_a, code_b):
+        if code not in graph:
+            return operation_outcome(404, f"Code '{code}' not found in {system}")
+    return parameters(param("outcome", graph.subsumes(code_a, code_b), "Code"))
+
+
+@router.get("/CodeSystem/$subsumes")
+def subsumes(
+    db: Session = Depends(get_db),
+    system: Optional[str] = Query(None, description="Canonical URL (or name) of the code system"),
+    codeA: Optional[str] = Query(None, description="First code"),
+    codeB: Optional[str] = Query(None, description="Second code"),
+    version: Optional[str] = Query(None, description="Code system version")
+):
+    """FHIR CodeSystem $subsumes"""
+    return _subsumes(db, system, codeA, codeB, version)
+
+
+@router.post("/CodeSystem/$subsumes")
+def subsumes_post(
+    db: Session = Depends(get_db),
+    body: Dict[str, Any] = Body(..., description="FHIR Parameters resource")
+):
+    """FHIR CodeSystem $subsumes (Parameters body)"""
+    values = parameters_to_dict(body)
+    coding_a = values.get("codingA") or {}
+    coding_b = values.get("codingB") or {}
+    return _subsumes(
+        db,
+        values.get("system") or coding_a.get("system"),
+        values.get("codeA") or coding_a.get("code"),
+        values.get("codeB") or coding_b.get("code"),
+        values.get("version"),
+    )
+
+
+def _expand(db: Session, valueset: Dict[str, Any], text_filter: Optional[str], offset: int, count: int):
+    try:
+        expansion = expand(db, valueset, text_filter=text_filter)
+    except ExpansionError as e:
+        return operation_outcome(400, str(e), code="invalid")
+    return expansion_page(valueset, expansion, offset=offset, count=count, text_filter=text_filter)
+
+
+@router.get("/ValueSet/$expand")
+def expand_valueset(
+    db: Session = Depends(get_db),
+    url: str = Query(..., description="Code system URL; expands the implicit all-codes ValueSet"),
+    filter: Optional[str] = Query(None, description="Text filter on code and display"),
+    offset: int = Query(0, ge=0, description="Index of the first code to return"),
+    count: int = Query(100, ge=0, le=1000, description="Number of codes to return")
+):
+    """FHIR ValueSet $expand over a whole code system"""
+    return _expand(db, implicit_valueset(url), filter, offset, count)
+
+
+@router.post("/ValueSet/$expand")
+def expand_valueset_post(
+    db: Session = Depends(get_db),
+    body: Dict[str, Any] = Body(..., description="ValueSet resource or Parameters with a 'valueSet' parameter")
+):
+    """FHIR ValueSet $expand for a posted ValueSet definition"""
+    if body.get("resourceType") == "Parameters":
+        values = parameters_to_dict(body)
+        valueset = values.get("valueSet") or (implicit_valueset(values["url"]) if values.get("url") else None)
+    else:
+        values = {}
+        valueset = body
+    if not valueset:
+        return operation_outcome(400, "A 'valueSet' or 'url' parameter is required", code="required")
+    try:
+        offset = max(int(values.get("offset", 0)), 0)
+        count = min(max(int(values.get("count", 100)), 0), 1000)
+    except (TypeError, ValueError):
+        return operation_outcome(400, "'offset' and 'count' must be integers", code="invalid")
+    return _expand(db, valueset, values.get("filter"), offset, count)
+
+
+@router.post("/Bundle")
+def process_bundle(
+    db: Session = Depends(get_db),
+    body: Dict[str, Any] = Body(..., description="FHIR Bundle with Condition entries"),
+    target: Optional[str] = Query(None, description="Only add codings from this target code system (URL or name)")
+):
+    """Dual-code every Condition in a Bundle with its mapped target codings"""
+    if body.get("resourceType") != "Bundle":
+        return operation_outcome(400, "Expected a Bundle resource", code="invalid")
+    target_codesystem_id = None
+    if target:
+        target_codesystem_id = membership_index.resolve_system(db, target)
+        if target_codesystem_id is None:
+            return operation_outcome(404, f"Unknown code system: {target}")
+    try:
+        dual_code_bundle(db, body, target_codesystem_id=target_codesystem_id)
+    except Exception as e:
+        logger.error(f"Error processing bundle: {e}")
+        return operation_outcome(500, "Failed to process bundle", code="exception")
+    return body
+
+job_runner.register("bulk-export", run_export)
+
+def _export_job(db: Session, job_id: UUID):
+    job = job_crud.job.get(db=db, id=job_id)
+    return job if job and job.kind == "bulk-export" else None
+
+@router.get("/$export")
+def bulk_export(
+    request: Request,
+    db: Session = Depends(get_db),
+    types: Optional[str] = Query(None, alias="_type", description="Comma-separated resource types (CodeSystem, ConceptMap)"),
+    since: Optional[str] = Query(None, alias="_since", description="Only resources updated at or after this instant"),
+    output_format: Optional[str] = Query(None, alias="_outputFormat", description="application/fhir+ndjson")
+):
+    """FHIR Bulk Data system export; poll the Content-Location URL for the manifest"""
+    if READ_ONLY:
+        return operation_outcome(405, "Bulk export is not available in read-only mode", code="not-supported")
+    if output_format and output_format not in OUTPUT_FORMATS:
+        return operation_outcome(400, f"Unsupported _outputFormat: {output_format}", code="not-supported")
+    try:
+        parse_since(since)
+        params = {"types": parse_types(types), "since": since, "request": str(request.url)}
+    except ExportError as e:
+        return operation_outcome(400, str(e), code="invalid")
+    try:
+        job = job_runner.submit(db, "bulk-export", params)
+    except JobQueueFull as e:
+        response = operation_outcome(429, str(e), code="throttled")
+        response.headers["Retry-After"] = "30"
+        return response
+    location = str(request.url_for("bulk_export_status", job_id=str(job.id)))
+    return Response(status_code=202, headers={"Content-Location": location})
+
+@router.get("/$export-poll-status/{job_id}")
+def bulk_export_status(request: Request, job_id: UUID, db: Session = Depends(get_db)):
+    """202 with X-Progress while the export runs, then the completion manifest"""
+    job = _export_job(db, job_id)
+    if not job:
+        return operation_outcome(404, "Export not found")
+    if job.status in job_crud.PENDING_STATUSES:
+        progress = f"{job.status}: {job.progress} rows"
+        return Response(status_code=202, headers={"X-Progress": progress, "Retry-After": "2"})
+    if job.status == "cancelled":
+        return operation_outcome(404, "Export was cancelled")
+    if job.status == "failed":
+        return operation_outcome(500, f"Export failed: {job.error}", code="exception")
+    result = job.result or {}
+    return {
+        "transactionTime": result.get("transactionTime"),
+        "request": result.get("request"),
+        "requiresAccessToken": False,
+        "output": [
+            {
+                "type": output["type"],
+                "url": str(request.url_for("bulk_export_file", job_id=str(job_id), file_name=output["file"])),
+                "count": output["count"],
+            }
+            for output in result.get("output", [])
+        ],
+        "error": [],
+        "extension": {
+            "rows": result.get("rows"),
+            "seconds": result.get("seconds"),
+            "rowsPerSecond": result.get("rows_per_sec"),
+            "peakRssMb": result.get("peak_rss_mb"),
+        },
+    }
+
+@router.delete("/$export-poll-status/{job_id}")
+def cancel_bulk_export(job_id: UUID, db: Session = Depends(get_db)):
+    """Cancel a running export, or delete the files of a finished one"""
+    job = _export_job(db, job_id)
+    if not job:
+        return operation_outcome(404, "Export not found")
+    if job.status in job_crud.PENDING_STATUSES:
+        job_crud.job.request_cancel(db=db, job=job)
+    else:
+        remove_export(job_id)
+    return Response(status_code=202)
+
+@router.get("/$export-poll-status/{job_id}/{file_name}")
+def bulk_export_file(job_id: UUID, file_name: str, db: Session = Depends(get_db)):
+    """One gzipped NDJSON part of a completed export"""
+    job = _export_job(db, job_id)
+    # Only names listed in the manifest, so the path cannot leave the export directory
+    files = {output["file"] for output in ((job.result or {}).get("output", []) if job else [])}
+    path = os.path.join(export_directory(job_id), file_name)
+    if file_name not in files:
+        return operation_outcome(404, "Export file not found")
+    if not os.path.exists(path):
+        logger.warning(f"Export file {path} of job {job_id} is missing; EXPORT_DIR must be storage shared by every node")
+        return operation_outcome(404, "Export file not found")
+    return FileResponse(path, media_type="application/fhir+ndjson", headers={"Content-Encoding": "gzip"})
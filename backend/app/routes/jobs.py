@@ -0,0 +1,70 @@
+from typing import Optional
+from uuid import UUID
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from sqlalchemy.orm import Session
+from app.db import get_db
+from app.schemas import Job, PaginatedJobResponse
+from app.crud import job as job_crud
+import logging
+
+logger = logging.getLogger(__name__)
+router = APIRouter(prefix="/jobs", tags=["jobs"])
+
+@router.get("/", response_model=PaginatedJobResponse)
+def read_jobs(
+    db: Session = Depends(get_db),
+    page: int = Query(1, ge=1, description="Page number"),
+    size: int = Query(10, ge=1, le=100, description="Page size"),
+    status: Optional[str] = Query(None, description="Filter by status"),
+    kind: Optional[str] = Query(None, description="Filter by job kind")
+):
+    """Retrieve background jobs, most recent first"""
+    try:
+        skip = (page - 1) * size
+        jobs = job_crud.job.get_multi(db=db, skip=skip, limit=size, status=status, kind=kind)
+        total = job_crud.job.count(db=db, status=status, kind=kind)
+        pages = (total + size - 1) // size
+        return PaginatedJobResponse(items=jobs, total=total, page=page, size=size, pages=pages)
+    except Exception as e:
+        logger.error(f"Error retrieving jobs: {e}")
+        raise HTTPException(status_code=500, detail="Failed to retrieve jobs")
+
+@router.get("/{job_id}", response_model=Job)
+def read_job(
+    *,
+    db: Session = Depends(get_db),
+    job_id: UUID
+):
+    """Job status: 202 with X-Progress while queued or running, 200 once finished"""
+    job = job_crud.job.get(db=db, id=job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if job.status in job_crud.PENDING_STATUSES:
+        progress = f"{job.status}: {job.progress}" + (f"/{job.total}" if job.total is not None else "")
+        return JSONResponse(
+            status_code=202,
+            content=jsonable_encoder(Job.model_validate(job)),
+            headers={"X-Progress": progress, "Retry-After": "1"},
+        )
+    return job
+
+@router.delete("/{job_id}", response_model=Job, status_code=202)
+def cancel_job(
+    *,
+    db: Session = Depends(get_db),
+    job_id: UUID
+):
+    """Cancel a queued job, or ask a running one to stop at its next progress report"""
+    job = job_crud.job.get(db=db, id=job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if job.status not in job_crud.PENDING_STATUSES:
+        raise HTTPException(status_code=409, detail=f"Job already {job.status}")
+    
+    try:
+        return job_crud.job.request_cancel(db=db, job=job)
+    except Exception as e:
+        logger.error(f"Error cancelling job {job_id}: {e}")
+        raise HTTPException(status_code=400, detail="Failed to cancel job")
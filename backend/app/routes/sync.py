@@ -0,0 +1,81 @@
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Optional, Type
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.orm import Session
+from app.db import get_db
+from app.models import CodeSystem, Concept, ConceptMap
+from app.schemas import CodeSystemChanges, ConceptChanges, ConceptMapChanges
+from app.crud.sync import TOMBSTONE_RETENTION_DAYS, retention_cutoff, sync as sync_crud
+from app.utils.watermark import NIL_ID, Cursor, Watermark, WatermarkError, decode_watermark, encode_watermark
+import logging
+
+logger = logging.getLogger(__name__)
+router = APIRouter(prefix="/sync", tags=["sync"])
+
+# Rows younger than this are left for the next sync: updated_at is set when a
+# transaction starts, so a slow transaction can commit a row older than one
+# already handed out. Writes running longer than the lag can still be missed.
+SYNC_LAG_SECONDS = float(os.getenv("SYNC_LAG_SECONDS", "5"))
+SYNC_MAX_COUNT = 5000
+
+def _changes(db: Session, model: Type, since: Optional[str], count: int) -> dict:
+    try:
+        watermark = decode_watermark(since)
+    except WatermarkError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    # Deletions before the retention cutoff may have been pruned
+    cutoff = retention_cutoff()
+    if cutoff is not None and watermark.deleted is not None and watermark.deleted.at < cutoff:
+        raise HTTPException(
+            status_code=410,
+            detail=f"Watermark is older than the {TOMBSTONE_RETENTION_DAYS:g} day tombstone retention; sync again without _since"
+        )
+    
+    until = datetime.now(timezone.utc) - timedelta(seconds=SYNC_LAG_SECONDS)
+    table_name = model.__tablename__
+    try:
+        changed = sync_crud.get_changed(db=db, model=model, after=watermark.changed, until=until, limit=count)
+        deleted = sync_crud.get_deleted(db=db, table_name=table_name, after=watermark.deleted, until=until, limit=count)
+        next_watermark = Watermark(
+            Cursor(changed[-1].updated_at, changed[-1].id) if changed else watermark.changed,
+            # No tombstones up to until: move on, so a quiet stream does not age past the retention
+            Cursor(deleted[-1].deleted_at, deleted[-1].id) if deleted else Cursor(until, NIL_ID),
+        )
+        logger.info(f"/sync/{table_name}: {len(changed)} changed, {len(deleted)} deleted")
+        return {
+            "changed": changed,
+            "deleted": deleted,
+            "next": encode_watermark(next_watermark),
+            "more": len(changed) == count or len(deleted) == count,
+        }
+    except Exception as e:
+        logger.error(f"Error reading {table_name} changes: {e}")
+        raise HTTPException(status_code=500, detail=f"Failed to read {table_name} changes")
+
+@router.get("/codesystems", response_model=CodeSystemChanges)
+def sync_codesystems(
+    db: Session = Depends(get_db),
+    since: Optional[str] = Query(None, alias="_since", description="Watermark from the last sync, or an ISO-8601 instant"),
+    count: int = Query(1000, alias="_count", ge=1, le=SYNC_MAX_COUNT, description="Maximum changed and deleted records each")
+):
+    """Codesystems created, updated or deleted since a watermark"""
+    return _changes(db, CodeSystem, since, count)
+
+@router.get("/concepts", response_model=ConceptChanges)
+def sync_concepts(
+    db: Session = Depends(get_db),
+    since: Optional[str] = Query(None, alias="_since", description="Watermark from the last sync, or an ISO-8601 instant"),
+    count: int = Query(1000, alias="_count", ge=1, le=SYNC_MAX_COUNT, description="Maximum changed and deleted records each")
+):
+    """Concepts created, updated or deleted since a watermark"""
+    return _changes(db, Concept, since, count)
+
+@router.get("/conceptmaps", response_model=ConceptMapChanges)
+def sync_conceptmaps(
+    db: Session = Depends(get_db),
+    since: Optional[str] = Query(None, alias="_since", description="Watermark from the last sync, or an ISO-8601 instant"),
+    count: int = Query(1000, alias="_count", ge=1, le=SYNC_MAX_COUNT, description="Maximum changed and deleted records each")
+):
+    """Conceptmaps created, updated or deleted since a watermark"""
+    return _changes(db, ConceptMap, since, count)
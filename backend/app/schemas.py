@@ -40,6 +40,7 @@ class CodeSystem(CodeSystemBase):
     id: UUID
     created_at: datetime
     updated_at: datetime
+    version_id: int = 1
 
 # Concept schemas
 class ConceptBase(BaseSchema):
@@ -65,6 +66,28 @@ class Concept(ConceptBase):
     id: UUID
     created_at: datetime
     updated_at: datetime
+    version_id: int = 1
+
+# Concept hierarchy schemas
+class ConceptTreeNode(BaseSchema):
+    id: UUID
+    code: str
+    display: Optional[str] = None
+    child_count: int = 0
+
+class PaginatedConceptTreeResponse(BaseSchema):
+    items: List[ConceptTreeNode]
+    total: int
+    page: int
+    size: int
+    pages: int
+
+# Fuzzy code lookup schemas
+class CodeSuggestion(BaseSchema):
+    id: UUID
+    code: str
+    display: Optional[str] = None
+    distance: int = Field(..., description="Edit distance from the requested code")
 
 # ConceptMap schemas
 class ConceptMapBase(BaseSchema):
@@ -90,6 +113,7 @@ class ConceptMap(ConceptMapBase):
     id: UUID
     created_at: datetime
     updated_at: datetime
+    version_id: int = 1
 
 # AuditLog schemas (read-only)
 class AuditLog(BaseSchema):
@@ -103,6 +127,69 @@ class AuditLog(BaseSchema):
     new_data: Optional[Dict[str, Any]] = None
     meta: Optional[Dict[str, Any]] = None
 
+# Delta sync schemas
+class Tombstone(BaseSchema):
+    record_id: UUID
+    keys: Optional[Dict[str, Any]] = None
+    deleted_at: datetime
+
+class SyncResponse(BaseSchema):
+    deleted: List[Tombstone]
+    next: str = Field(..., description="Watermark to pass as _since on the next sync")
+    more: bool = Field(..., description="Whether more changes are waiting; sync again with next right away")
+
+class CodeSystemChanges(SyncResponse):
+    changed: List[CodeSystem]
+
+class ConceptChanges(SyncResponse):
+    changed: List[Concept]
+
+class ConceptMapChanges(SyncResponse):
+    changed: List[ConceptMap]
+
+# CodeSystem release history
+class CodeSystemRelease(BaseSchema):
+    id: UUID
+    codesystem_id: UUID
+    version: Optional[str] = None
+    previous_version: Optional[str] = None
+    source: Optional[str] = None
+    added: int
+    changed: int
+    removed: int
+    unchanged: int
+    summary: Optional[Dict[str, Any]] = None  # Counts and the first 1000 codes of each set
+    created_at: datetime
+
+# Background job schemas
+class Job(BaseSchema):
+    id: UUID
+    kind: str
+    status: str
+    progress: int
+    total: Optional[int] = None
+    result: Optional[Dict[str, Any]] = None
+    error: Optional[str] = None
+    cancel_requested: bool
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+
+# Bulk ConceptMap import
+class ConceptMapImportError(BaseSchema):
+    location: str
+    source: str
+    target: str
+    error: str
+
+class ConceptMapImportReport(BaseSchema):
+    received: int
+    inserted: int
+    duplicates: int
+    invalid: int
+    errors: List[ConceptMapImportError]  # The first 1000
+    rejected: bool = False
+
 # Translation schemas
 class TranslationRequest(BaseSchema):
     source_codesystem: str = Field(..., description="Source codesystem URL or name")
@@ -114,6 +201,31 @@ class TranslationResponse(BaseSchema):
     equivalence: Optional[str] = None
     found: bool = Field(..., description="Whether translation was found")
 
+# Mapping suggestion schemas
+class MappingSuggestionRequest(BaseSchema):
+    source_codesystem: str = Field(..., description="Source codesystem URL or name")
+    target_codesystem: str = Field(..., description="Target codesystem URL or name")
+    source_codes: Optional[List[str]] = Field(None, description="Source codes to score; all source concepts when omitted")
+    k: int = Field(5, ge=1, le=50, description="Candidates per source concept")
+    min_score: float = Field(0.0, ge=0.0, le=1.0, description="Minimum cosine similarity")
+
+class MappingCandidate(BaseSchema):
+    target_concept_id: UUID
+    code: str
+    display: Optional[str] = None
+    score: float
+
+class MappingSuggestion(BaseSchema):
+    source_concept_id: UUID
+    source_code: str
+    source_display: Optional[str] = None
+    candidates: List[MappingCandidate]
+
+class MappingSuggestionResponse(BaseSchema):
+    target_codesystem_id: UUID
+    items: List[MappingSuggestion]
+    missing: List[str] = Field(default_factory=list, description="Requested source codes that were not found")
+
 # Health check schema
 class HealthResponse(BaseSchema):
     status: str = "healthy"
@@ -154,3 +266,17 @@ class PaginatedConceptMapResponse(BaseSchema):
     page: int
     size: int
     pages: int
+
+class PaginatedCodeSystemReleaseResponse(BaseSchema):
+    items: List[CodeSystemRelease]
+    total: int
+    page: int
+    size: int
+    pages: int
+
+class PaginatedJobResponse(BaseSchema):
+    items: List[Job]
+    total: int
+    page: int
+    size: int
+    pages: int
@@ -0,0 +1,223 @@
+"""Admission control for database-bound requests.
+
+Sync routes run in Starlette's threadpool and each holds a pooled connection
+while it works, so under a burst every request is accepted and then blocks
+on the SQLAlchemy pool until ``pool_timeout``, and cheap requests queue
+behind expensive ones.  This ASGI middleware sorts requests into lanes
+(``search``, ``lookup``, ``write``, ``export``, ``sync``) by method and path
+and caps how many of each run at once.  A request over its lane's limit waits in a
+short FIFO queue; when the queue is full, or the request has waited
+``ADMISSION_QUEUE_TIMEOUT`` seconds, it is shed with ``503`` and a
+``Retry-After`` header instead of tying up a thread.  Health checks, metrics
+and the docs run in a ``health`` lane of their own, so a saturated worker
+still answers its load balancer, and ``$export`` file downloads, which
+hold no connection while they stream, are not limited at all.  Limits are per worker process; keep their
+sum within the engine's pool size plus overflow.
+"""
+import asyncio
+import json
+import os
+import re
+import weakref
+from collections import deque
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+from sqlalchemy.pool import QueuePool
+
+from app.utils.metrics import registry
+import logging
+
+logger = logging.getLogger(__name__)
+
+ADMISSION_ENABLED = os.getenv("ADMISSION_ENABLED", "true").lower() == "true"
+# lane=limit pairs; lanes left out are not limited
+ADMISSION_LIMITS = os.getenv("ADMISSION_LIMITS", "search=4,lookup=5,write=2,export=1,sync=1,health=2")
+ADMISSION_QUEUE_SIZE = int(os.getenv("ADMISSION_QUEUE_SIZE", "20"))
+ADMISSION_QUEUE_TIMEOUT = float(os.getenv("ADMISSION_QUEUE_TIMEOUT", "2.0"))
+ADMISSION_RETRY_AFTER = int(os.getenv("ADMISSION_RETRY_AFTER", "1"))
+
+# (method or "*", path pattern, lane); the first match wins
+ROUTE_LANES: List[Tuple[str, str, str]] = [
+    ("*", r"/(health|metrics|docs.*|redoc|openapi\.json|cors-debug)?", "health"),
+    ("OPTIONS", r"/.*", "health"),
+    # Files of a finished export stream from disk without a connection
+    ("GET", r"/api/v1/\$export-poll-status/[^/]+/[^/]+", "download"),
+    ("GET", r"/api/v1/sync/.*", "sync"),
+    ("POST", r"/api/v1/conceptmaps/(bulk|suggest/index)", "export"),
+    ("POST", r"/api/v1/(conceptmaps/translate|CodeSystem/\$(lookup|validate-code|subsumes)|Bundle)", "lookup"),
+    ("*", r"/api/v1/(conceptmaps/suggest|ValueSet/\$expand)", "search"),
+    ("GET", r"/api/v1/(concepts|codesystems|conceptmaps|audit-logs|jobs)", "search"),
+    ("GET", r"/api/v1/concepts/(fuzzy|codesystem)/.*", "search"),
+]
+
+requests_total = registry.counter(
+    "fhirfly_admission_requests_total",
+    "Requests by lane and outcome: admitted (ran at once), queued (ran after waiting), "
+    "queue_full or timeout (shed with 503)",
+)
+
+# Middleware instances whose lanes the gauges report
+_middlewares: "weakref.WeakSet[AdmissionMiddleware]" = weakref.WeakSet()
+
+
+def _lane_totals(read: Callable[["Lane"], int]) -> Dict[str, int]:
+    totals: Dict[str, int] = {}
+    for middleware in list(_middlewares):
+        for name, lane in middleware.lanes.items():
+            totals[name] = totals.get(name, 0) + read(lane)
+    return totals
+
+
+registry.gauge(
+    "fhirfly_admission_in_flight", "Requests running per admission lane",
+    lambda: _lane_totals(lambda lane: lane.active), label="lane",
+)
+registry.gauge(
+    "fhirfly_admission_queued", "Requests waiting per admission lane",
+    lambda: _lane_totals(lambda lane: lane.queued), label="lane",
+)
+
+
+Routes = List[Tuple[str, "re.Pattern[str]", str]]
+
+
+def compile_routes(routes: List[Tuple[str, str, str]]) -> Routes:
+    return [(method, re.compile(pattern + "/?"), lane) for method, pattern, lane in routes]
+
+
+def lane_for(routes: Routes, method: str, path: str) -> str:
+    """Lane of a request: the first matching route's, else lookup for reads and write otherwise"""
+    for route_method, pattern, lane in routes:
+        if route_method in ("*", method) and pattern.fullmatch(path):
+            return lane
+    return "lookup" if method in ("GET", "HEAD") else "write"
+
+
+def parse_limits(value: str, cast: Callable[[str], Any] = int) -> Dict[str, Any]:
+    """``lane=value,...`` pairs as a dict"""
+    limits = {}
+    for pair in value.split(","):
+        if pair.strip():
+            lane, _, limit = pair.partition("=")
+            limits[lane.strip()] = cast(limit)
+    return limits
+
+
+def pool_capacity() -> Optional[int]:
+    """Connections the engine's pool hands out at once, or None when unbounded"""
+    from app.db import engine
+    pool = engine.pool
+    if isinstance(pool, QueuePool) and pool._max_overflow >= 0:
+        return pool.size() + pool._max_overflow
+    return None
+
+
+class Lane:
+    """At most ``limit`` requests at once; the rest wait in FIFO order"""
+
+    def __init__(self, name: str, limit: int, queue_size: int):
+        self.name = name
+        self.limit = limit
+        self.queue_size = queue_size
+        self.active = 0
+        self._waiters: Deque["asyncio.Future[bool]"] = deque()
+
+    @property
+    def queued(self) -> int:
+        return len(self._waiters)
+
+    async def acquire(self, timeout: float) -> Optional[str]:
+        """Take a slot and return the admission outcome, or None when shed"""
+        if self.active < self.limit and not self._waiters:
+            self.active += 1
+            return "admitted"
+        if len(self._waiters) >= self.queue_size:
+            requests_total.inc(lane=self.name, outcome="queue_full")
+            return None
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            await asyncio.wait((waiter,), timeout=timeout)
+        except BaseException:
+            # The request went away while queued
+            if waiter.done():
+                self.release()
+            else:
+                waiter.cancel()
+                self._waiters.remove(waiter)
+            raise
+        if waiter.done():
+            return "queued"
+        waiter.cancel()
+        self._waiters.remove(waiter)
+        requests_total.inc(lane=self.name, outcome="timeout")
+        return None
+
+    def release(self) -> None:
+        # Hand the slot straight to the next waiter so nobody can overtake it
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(True)
+                return
+        self.active -= 1
+
+
+class AdmissionMiddleware:
+    def __init__(
+        self,
+        app,
+        limits: Optional[Dict[str, int]] = None,
+        routes: List[Tuple[str, str, str]] = ROUTE_LANES,
+        queue_size: int = ADMISSION_QUEUE_SIZE,
+        queue_timeout: float = ADMISSION_QUEUE_TIMEOUT,
+        retry_after: int = ADMISSION_RETRY_AFTER,
+    ):
+        self.app = app
+        limits = parse_limits(ADMISSION_LIMITS) if limits is None else limits
+        self.lanes = {name: Lane(name, limit, queue_size) for name, limit in limits.items()}
+        self.routes = compile_routes(routes)
+        self.queue_timeout = queue_timeout
+        self.retry_after = retry_after
+        _middlewares.add(self)
+        capacity = pool_capacity()
+        if capacity is not None and sum(limits.values()) > capacity:
+            logger.warning(
+                f"Admission limits allow {sum(limits.values())} concurrent requests "
+                f"but the connection pool holds {capacity}"
+            )
+
+    def lane_for(self, method: str, path: str) -> str:
+        return lane_for(self.routes, method, path)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        lane = self.lanes.get(self.lane_for(scope["method"], scope["path"]))
+        if lane is None:
+            await self.app(scope, receive, send)
+            return
+
+        outcome = await lane.acquire(self.queue_timeout)
+        if outcome is None:
+            await self._shed(send, lane)
+            return
+        requests_total.inc(lane=lane.name, outcome=outcome)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            lane.release()
+
+    async def _shed(self, send, lane: Lane) -> None:
+        body = json.dumps({"detail": f"Server is busy ({lane.name}), retry later"}).encode("utf-8")
+        await send({
+            "type": "http.response.start",
+            "status": 503,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode("latin-1")),
+                (b"retry-after", str(self.retry_after).encode("latin-1")),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body, "more_body": False})
@@ -0,0 +1,314 @@
+"""FHIR Bulk Data ``$export`` of the terminology to gzipped NDJSON.
+
+Each output stream (code systems, their concepts as ``CodeSystem`` fragments,
+and concept maps) is read through its own server-side cursor and written by
+its own thread, so the three tables are exported in parallel.  Every stream
+is split into parts of at most ``EXPORT_PART_ROWS`` resources, written as
+``<stream>-<n>.ndjson.gz`` under ``EXPORT_DIR/<job id>/``.  ``_since`` keeps
+only resources updated at or after an instant, so exports can be incremental:
+pass the previous manifest's ``transactionTime``.  Memory stays flat at one
+batch per stream regardless of table size.
+
+The job runs on one node but its status poll and file downloads may reach
+any other, which serves the files from its own ``EXPORT_DIR``: with several
+nodes that directory must be shared storage (NFS, EFS or similar mounted at
+the same path everywhere).
+"""
+import gzip
+import json
+import os
+import resource
+import shutil
+import threading
+import time
+from concurrent.futures import FIRST_EXCEPTION, ThreadPoolExecutor, wait
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session, aliased
+
+from app import db as database
+from app.models import CodeSystem, Concept, ConceptMap
+from app.utils.jobs import JobContext
+import logging
+
+logger = logging.getLogger(__name__)
+
+EXPORT_DIR = os.getenv("EXPORT_DIR", "data/exports")
+EXPORT_PART_ROWS = int(os.getenv("EXPORT_PART_ROWS", "100000"))
+EXPORT_FRAGMENT_CONCEPTS = 1000
+BATCH_SIZE = 5000
+
+RESOURCE_TYPES = ("CodeSystem", "ConceptMap")
+OUTPUT_FORMATS = ("application/fhir+ndjson", "application/ndjson", "ndjson")
+
+
+class ExportError(ValueError):
+    """Invalid $export parameters"""
+
+
+def parse_types(value: Optional[str]) -> List[str]:
+    if not value:
+        return list(RESOURCE_TYPES)
+    types = [name.strip() for name in value.split(",") if name.strip()]
+    unknown = [name for name in types if name not in RESOURCE_TYPES]
+    if unknown:
+        raise ExportError(f"Unsupported _type: {', '.join(unknown)}; supported: {', '.join(RESOURCE_TYPES)}")
+    return types
+
+
+def parse_since(value: Optional[str]) -> Optional[datetime]:
+    if not value:
+        return None
+    try:
+        since = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        raise ExportError(f"Invalid _since '{value}', expected an ISO-8601 instant")
+    return since if since.tzinfo else since.replace(tzinfo=timezone.utc)
+
+
+class PartWriter:
+    """Writes resources as NDJSON into gzipped parts of at most ``part_rows`` lines"""
+
+    def __init__(self, directory: str, stem: str, resource_type: str, part_rows: int = EXPORT_PART_ROWS):
+        self.directory = directory
+        self.stem = stem
+        self.resource_type = resource_type
+        self.part_rows = part_rows
+        self.outputs: List[Dict[str, Any]] = []
+        self._file = None
+        self._count = 0
+
+    def write(self, fhir_resource: Dict[str, Any]) -> None:
+        if self._file is None or self._count >= self.part_rows:
+            self._roll()
+        self._file.write(json.dumps(fhir_resource, separators=(",", ":"), default=str).encode("utf-8") + b"\n")
+        self._count += 1
+
+    def _roll(self) -> None:
+        self._close_part()
+        name = f"{self.stem}-{len(self.outputs) + 1}.ndjson.gz"
+        # Level 6: most of level 9's ratio at a fraction of the CPU
+        self._file = gzip.open(os.path.join(self.directory, name), "wb", compresslevel=6)
+        self.outputs.append({"type": self.resource_type, "file": name, "count": 0})
+        self._count = 0
+
+    def _close_part(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self.outputs[-1]["count"] = self._count
+            self._file = None
+
+    def close(self) -> List[Dict[str, Any]]:
+        self._close_part()
+        return self.outputs
+
+
+def _codesystem_resource(cs: CodeSystem) -> Dict[str, Any]:
+    fhir_resource = dict(cs.resource) if isinstance(cs.resource, dict) else {}
+    # Concepts are exported as fragments
+    fhir_resource.pop("concept", None)
+    fhir_resource.update({"resourceType": "CodeSystem", "id": str(cs.id)})
+    for field in ("url", "version", "name", "title", "status", "publisher", "content"):
+        value = getattr(cs, field)
+        if value is not None:
+            fhir_resource.setdefault(field, value)
+    return fhir_resource
+
+
+def _codesystems(db: Session, since: Optional[datetime]) -> Iterator[tuple]:
+    query = select(CodeSystem).order_by(CodeSystem.id)
+    if since:
+        query = query.where(CodeSystem.updated_at >= since)
+    for cs in db.execute(query.execution_options(yield_per=BATCH_SIZE)).scalars():
+        yield 1, _codesystem_resource(cs)
+
+
+def _concept_fragments(db: Session, since: Optional[datetime]) -> Iterator[tuple]:
+    """Concepts grouped into CodeSystem fragments of up to EXPORT_FRAGMENT_CONCEPTS each"""
+    query = select(
+        Concept.codesystem_id, Concept.code, Concept.display, Concept.definition, Concept.properties,
+        CodeSystem.url, CodeSystem.version
+    ).join(CodeSystem, CodeSystem.id == Concept.codesystem_id).order_by(Concept.codesystem_id, Concept.code)
+    if since:
+        query = query.where(Concept.updated_at >= since)
+
+    header, part, concepts = None, 0, []
+    for row in db.execute(query.execution_options(yield_per=BATCH_SIZE)):
+        if concepts and (row.codesystem_id != header.codesystem_id or len(concepts) >= EXPORT_FRAGMENT_CONCEPTS):
+            yield len(concepts), _fragment(header, part, concepts)
+            concepts = []
+        if header is None or row.codesystem_id != header.codesystem_id:
+            header, part = row, 0
+        if not concepts:
+            part += 1
+        concept = {"code": row.code}
+        if row.display is not None:
+            concept["display"] = row.display
+        if row.definition is not None:
+            concept["definition"] = row.definition
+        if row.properties:
+            concept["property"] = row.properties
+        concepts.append(concept)
+    if concepts:
+        yield len(concepts), _fragment(header, part, concepts)
+
+
+def _fragment(header, part: int, concepts: List[Dict[str, Any]]) -> Dict[str, Any]:
+    fhir_resource = {
+        "resourceType": "CodeSystem",
+        "id": f"{header.codesystem_id}-concepts-{part}",
+        "url": header.url,
+        "status": "active",
+        "content": "fragment",
+        "count": len(concepts),
+        "concept": concepts,
+    }
+    if header.version is not None:
+        fhir_resource["version"] = header.version
+    return fhir_resource
+
+
+def _conceptmaps(db: Session, since: Optional[datetime]) -> Iterator[tuple]:
+    source, target = aliased(Concept), aliased(Concept)
+    source_cs, target_cs = aliased(CodeSystem), aliased(CodeSystem)
+    query = select(
+        ConceptMap.id, ConceptMap.equivalence, source.code.label("source_code"), target.code.label("target_code"),
+        source_cs.url.label("source_url"), target_cs.url.label("target_url")
+    ).join(source, source.id == ConceptMap.source_code).join(target, target.id == ConceptMap.target_code) \
+        .join(source_cs, source_cs.id == ConceptMap.source_codesystem_id) \
+        .join(target_cs, target_cs.id == ConceptMap.target_codesystem_id) \
+        .order_by(ConceptMap.id)
+    if since:
+        query = query.where(ConceptMap.updated_at >= since)
+    for row in db.execute(query.execution_options(yield_per=BATCH_SIZE)):
+        yield 1, {
+            "resourceType": "ConceptMap",
+            "id": str(row.id),
+            "status": "active",
+            "sourceUri": row.source_url,
+            "targetUri": row.target_url,
+            "group": [{
+                "source": row.source_url,
+                "target": row.target_url,
+                "element": [{
+                    "code": row.source_code,
+                    "target": [{"code": row.target_code, "equivalence": row.equivalence or "relatedto"}],
+                }],
+            }],
+        }
+
+
+# _type -> (file stem, row source) streams, each written by its own thread
+STREAMS: Dict[str, List[tuple]] = {
+    "CodeSystem": [("CodeSystem", _codesystems), ("CodeSystem-concepts", _concept_fragments)],
+    "ConceptMap": [("ConceptMap", _conceptmaps)],
+}
+
+
+def peak_rss_mb() -> float:
+    """Peak resident set size of this process (Linux reports KiB)"""
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0, 1)
+
+
+def export_resources(
+    directory: str,
+    types: List[str],
+    since: Optional[datetime] = None,
+    on_progress: Optional[Callable[[int], None]] = None,
+    part_rows: int = EXPORT_PART_ROWS,
+) -> Dict[str, Any]:
+    """Write the NDJSON parts of ``types`` to ``directory``; returns outputs and throughput.
+
+    ``on_progress`` is called about once a second with the rows written so
+    far; an exception from it stops the writers and is re-raised.
+    """
+    os.makedirs(directory, exist_ok=True)
+    streams = [stream for name in types for stream in STREAMS[name]]
+    rows: Dict[str, int] = {stem: 0 for stem, _ in streams}
+    stop = threading.Event()
+
+    def write_stream(stem: str, source, resource_type: str) -> Dict[str, Any]:
+        started = time.perf_counter()
+        writer = PartWriter(directory, stem, resource_type, part_rows)
+        db = database.get_sync_db()
+        try:
+            for count, fhir_resource in source(db, since):
+                if stop.is_set():
+                    break
+                writer.write(fhir_resource)
+                rows[stem] += count
+        finally:
+            outputs = writer.close()
+            db.close()
+        seconds = time.perf_counter() - started
+        return {
+            "outputs": outputs,
+            "rows": rows[stem],
+            "seconds": round(seconds, 3),
+            "rows_per_sec": round(rows[stem] / seconds, 1) if seconds > 0 else 0.0,
+        }
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=len(streams), thread_name_prefix="export") as pool:
+        futures = {
+            pool.submit(write_stream, stem, source, "CodeSystem" if stem.startswith("CodeSystem") else "ConceptMap"): stem
+            for stem, source in streams
+        }
+        try:
+            pending = set(futures)
+            while pending:
+                done, pending = wait(pending, timeout=1.0, return_when=FIRST_EXCEPTION)
+                for future in done:
+                    future.result()
+                if on_progress:
+                    on_progress(sum(rows.values()))
+        except BaseException:
+            stop.set()
+            raise
+        stats = {futures[future]: future.result() for future in futures}
+
+    seconds = time.perf_counter() - started
+    total_rows = sum(rows.values())
+    result = {
+        "output": [output for stem, _ in streams for output in stats[stem].pop("outputs")],
+        "streams": stats,
+        "rows": total_rows,
+        "seconds": round(seconds, 3),
+        "rows_per_sec": round(total_rows / seconds, 1) if seconds > 0 else 0.0,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+    logger.info(
+        f"Exported {total_rows} rows of {', '.join(types)} in {seconds:.1f}s "
+        f"({result['rows_per_sec']} rows/s, peak RSS {result['peak_rss_mb']} MB)"
+    )
+    return result
+
+
+def export_directory(job_id) -> str:
+    return os.path.join(EXPORT_DIR, str(job_id))
+
+
+def run_export(db: Session, job: JobContext, params: Dict[str, Any]) -> Dict[str, Any]:
+    """``bulk-export`` job handler"""
+    transaction_time = datetime.now(timezone.utc)
+    directory = export_directory(job.job_id)
+    job.progress(0, force=True)
+    try:
+        result = export_resources(
+            directory,
+            params.get("types") or list(RESOURCE_TYPES),
+            since=parse_since(params.get("since")),
+            on_progress=job.progress,
+        )
+    except BaseException:
+        shutil.rmtree(directory, ignore_errors=True)
+        raise
+    result["transactionTime"] = transaction_time.isoformat()
+    result["request"] = params.get("request")
+    return result
+
+
+def remove_export(job_id) -> None:
+    shutil.rmtree(export_directory(job_id), ignore_errors=True)
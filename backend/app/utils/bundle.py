@@ -0,0 +1,90 @@
+"""Bulk dual-coding of Condition resources in a FHIR Bundle.
+
+All codings in the bundle are collected first and resolved together with
+their ConceptMap targets in one set-based query, instead of one lookup per
+entry.
+"""
+from typing import Any, Dict, List, Optional, Tuple
+from uuid import UUID
+
+from sqlalchemy.orm import Session
+
+from app.crud import conceptmap as conceptmap_crud
+from app.utils.membership import membership_index
+import logging
+
+logger = logging.getLogger(__name__)
+
+CODED_RESOURCE_TYPES = ("Condition",)
+
+
+def _codings(bundle: Dict[str, Any]) -> List[Dict[str, Any]]:
+    codings = []
+    for entry in bundle.get("entry") or []:
+        resource = (entry or {}).get("resource") or {}
+        if resource.get("resourceType") not in CODED_RESOURCE_TYPES:
+            continue
+        code = resource.get("code")
+        if isinstance(code, dict):
+            codings.extend(c for c in code.get("coding") or [] if isinstance(c, dict))
+    return codings
+
+
+def dual_code_bundle(
+    db: Session,
+    bundle: Dict[str, Any],
+    target_codesystem_id: Optional[UUID] = None,
+) -> Dict[str, int]:
+    """Add mapped target codings to every Condition in ``bundle`` (in place)"""
+    codings = _codings(bundle)
+    systems = {c.get("system") for c in codings if c.get("system")}
+    system_ids = {system: membership_index.resolve_system(db, system) for system in systems}
+
+    pairs = sorted({
+        (system_ids[c["system"]], c["code"])
+        for c in codings
+        if c.get("code") and system_ids.get(c.get("system"))
+    })
+    rows = conceptmap_crud.conceptmap.get_mappings_for_codings(
+        db=db, codings=pairs, target_codesystem_id=target_codesystem_id
+    )
+
+    resolved: Dict[Tuple[UUID, str], Dict[str, Any]] = {}
+    for row in rows:
+        item = resolved.setdefault(
+            (row.source_codesystem_id, row.source_code),
+            {"display": row.source_display, "targets": []},
+        )
+        if row.target_code is not None:
+            item["targets"].append({"system": row.target_url, "code": row.target_code, "display": row.target_display})
+
+    stats = {"entries": len(bundle.get("entry") or []), "codings": len(codings), "resolved": 0, "added": 0}
+    for entry in bundle.get("entry") or []:
+        resource = (entry or {}).get("resource") or {}
+        if resource.get("resourceType") not in CODED_RESOURCE_TYPES or not isinstance(resource.get("code"), dict):
+            continue
+        coding_list = resource["code"].setdefault("coding", [])
+        present = {(c.get("system"), c.get("code")) for c in coding_list if isinstance(c, dict)}
+        additions = []
+        for coding in coding_list:
+            if not isinstance(coding, dict):
+                continue
+            item = resolved.get((system_ids.get(coding.get("system")), coding.get("code")))
+            if item is None:
+                continue
+            stats["resolved"] += 1
+            if not coding.get("display") and item["display"]:
+                coding["display"] = item["display"]
+            for target in item["targets"]:
+                key = (target["system"], target["code"])
+                if key not in present:
+                    present.add(key)
+                    additions.append({k: v for k, v in target.items() if v is not None})
+        coding_list.extend(additions)
+        stats["added"] += len(additions)
+
+    logger.info(
+        f"Dual-coded bundle: {stats['entries']} entries, {stats['codings']} codings, "
+        f"{stats['resolved']} resolved, {stats['added']} codings added"
+    )
+    return stats
@@ -0,0 +1,396 @@
+"""Two-tier read cache shared across backend nodes.
+
+A bounded in-process LRU sits in front of a shared backend speaking the Redis
+protocol, so a value loaded by one node is a cache hit on every other node.
+Keys live in namespaces with a version number kept in the shared tier:
+invalidating a namespace bumps the version, which retires every key in it on
+all nodes at once (other nodes notice within ``CACHE_VERSION_TTL`` seconds)
+without enumerating or deleting keys.  A miss is loaded by one caller only:
+concurrent callers in the same process wait on a lock, and callers on other
+nodes wait for the value the lock holder writes to the shared tier.
+
+``CACHE_URL`` selects the shared tier: ``redis://...`` for Redis,
+``memory://`` for the in-process fake used in development and tests, and
+empty for the local tier alone.
+"""
+import os
+import pickle
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Iterable, List, Optional, Tuple
+
+from app.utils.events import ChangeEvent, on_resync, subscribe
+import logging
+
+logger = logging.getLogger(__name__)
+
+CACHE_URL = os.getenv("CACHE_URL", "")
+CACHE_PREFIX = os.getenv("CACHE_PREFIX", "fhirfly:")
+CACHE_TTL = int(os.getenv("CACHE_TTL", "300"))
+CACHE_LOCAL_MAX_ENTRIES = int(os.getenv("CACHE_LOCAL_MAX_ENTRIES", "100000"))
+CACHE_VERSION_TTL = float(os.getenv("CACHE_VERSION_TTL", "1.0"))
+# How long a loader may hold the cross-node lock, and how long others wait for it
+LOCK_TTL = 10
+LOCK_WAIT = 2.0
+LOCK_POLL = 0.02
+
+_MISSING = object()
+
+
+class CacheBackend:
+    """Shared tier operations; values are bytes"""
+
+    def get_many(self, keys: List[str]) -> List[Optional[bytes]]:
+        raise NotImplementedError
+
+    def set_many(self, items: Dict[str, bytes], ttl: int) -> None:
+        raise NotImplementedError
+
+    def add(self, key: str, value: bytes, ttl: int) -> bool:
+        """Set ``key`` only if it does not exist; whether it was set"""
+        raise NotImplementedError
+
+    def delete(self, key: str) -> None:
+        raise NotImplementedError
+
+    def incr(self, key: str) -> int:
+        raise NotImplementedError
+
+
+class InMemoryBackend(CacheBackend):
+    """Process-local stand-in for Redis with the same semantics (TTL, NX, INCR)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._data: Dict[str, Tuple[Optional[float], bytes]] = {}
+
+    def _live(self, key: str) -> Optional[bytes]:
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at is not None and expires_at <= time.monotonic():
+            del self._data[key]
+            return None
+        return value
+
+    def get_many(self, keys: List[str]) -> List[Optional[bytes]]:
+        with self._lock:
+            return [self._live(key) for key in keys]
+
+    def set_many(self, items: Dict[str, bytes], ttl: int) -> None:
+        expires_at = time.monotonic() + ttl
+        with self._lock:
+            for key, value in items.items():
+                self._data[key] = (expires_at, value)
+
+    def add(self, key: str, value: bytes, ttl: int) -> bool:
+        with self._lock:
+            if self._live(key) is not None:
+                return False
+            self._data[key] = (time.monotonic() + ttl, value)
+            return True
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def incr(self, key: str) -> int:
+        with self._lock:
+            value = int(self._live(key) or 0) + 1
+            self._data[key] = (None, str(value).encode())
+            return value
+
+    def flush(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+
+class RedisBackend(CacheBackend):
+    def __init__(self, url: str):
+        import redis  # only needed when a Redis URL is configured
+        self._client = redis.Redis.from_url(url, socket_timeout=0.5, socket_connect_timeout=0.5)
+
+    def get_many(self, keys: List[str]) -> List[Optional[bytes]]:
+        return self._client.mget(keys)
+
+    def set_many(self, items: Dict[str, bytes], ttl: int) -> None:
+        pipe = self._client.pipeline(transaction=False)
+        for key, value in items.items():
+            pipe.set(key, value, ex=ttl)
+        pipe.execute()
+
+    def add(self, key: str, value: bytes, ttl: int) -> bool:
+        return bool(self._client.set(key, value, ex=ttl, nx=True))
+
+    def delete(self, key: str) -> None:
+        self._client.delete(key)
+
+    def incr(self, key: str) -> int:
+        return int(self._client.incr(key))
+
+
+def backend_from_url(url: str) -> Optional[CacheBackend]:
+    if not url:
+        return None
+    if url.startswith("memory://"):
+        return InMemoryBackend()
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        return RedisBackend(url)
+    raise ValueError(f"Unsupported CACHE_URL: {url}")
+
+
+class LocalLRU:
+    """Bounded LRU with per-entry expiry"""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Any:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return _MISSING
+            if entry[0] <= time.monotonic():
+                del self._entries[key]
+                return _MISSING
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def put(self, key: str, value: Any, ttl: float) -> None:
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class TieredCache:
+    def __init__(
+        self,
+        shared: Optional[CacheBackend] = None,
+        prefix: str = CACHE_PREFIX,
+        ttl: int = CACHE_TTL,
+        max_local_entries: int = CACHE_LOCAL_MAX_ENTRIES,
+        version_ttl: float = CACHE_VERSION_TTL,
+    ):
+        self.shared = shared
+        self.prefix = prefix
+        self.ttl = ttl
+        self.version_ttl = version_ttl
+        self.local = LocalLRU(max_local_entries)
+        self._lock = threading.Lock()
+        # namespace -> (checked at, version)
+        self._versions: Dict[str, Tuple[float, int]] = {}
+        self._loading: Dict[str, threading.Lock] = {}
+        self.stats = {"local_hits": 0, "shared_hits": 0, "misses": 0, "shared_errors": 0}
+
+    def _shared_call(self, fn, *args, default=None):
+        """Run a shared-tier operation; an unreachable cache only costs a miss"""
+        try:
+            return fn(*args)
+        except Exception as e:
+            self.stats["shared_errors"] += 1
+            logger.warning(f"Shared cache unavailable: {e}")
+            return default
+
+    def _version(self, namespace: str) -> int:
+        now = time.monotonic()
+        checked = self._versions.get(namespace)
+        if checked is not None and (self.shared is None or now - checked[0] < self.version_ttl):
+            return checked[1]
+        version = 0
+        if self.shared is not None:
+            raw = self._shared_call(self.shared.get_many, [f"{self.prefix}version:{namespace}"], default=[None])[0]
+            version = int(raw or 0)
+        with self._lock:
+            self._versions[namespace] = (now, version)
+        return version
+
+    def _full_key(self, namespace: str, version: int, key: Hashable) -> str:
+        return f"{self.prefix}{namespace}:{version}:{key}"
+
+    def invalidate(self, namespace: str, propagate: bool = True) -> None:
+        """Retire every key of ``namespace`` on all nodes.
+
+        With ``propagate=False`` (a write another worker made, which already
+        bumped the shared version) only this process re-reads the version.
+        """
+        if self.shared is not None and not propagate:
+            with self._lock:
+                self._versions.pop(namespace, None)
+            return
+        version = None
+        if self.shared is not None:
+            version = self._shared_call(self.shared.incr, f"{self.prefix}version:{namespace}")
+        with self._lock:
+            if version is None:
+                version = self._versions.get(namespace, (0.0, 0))[1] + 1
+            self._versions[namespace] = (time.monotonic(), version)
+
+    def get_many(
+        self,
+        namespace: str,
+        keys: Iterable[Hashable],
+        loader: Callable[[List[Hashable]], Dict[Hashable, Any]],
+        ttl: Optional[int] = None,
+    ) -> Dict[Hashable, Any]:
+        """Values for ``keys``; misses in both tiers are loaded with one ``loader`` call.
+
+        ``loader`` gets the missing keys and returns a dict; keys it leaves out
+        are cached as None (negative caching).
+        """
+        ttl = ttl or self.ttl
+        version = self._version(namespace)
+        keys = list(dict.fromkeys(keys))
+        full = {key: self._full_key(namespace, version, key) for key in keys}
+        found: Dict[Hashable, Any] = {}
+        missing = []
+        for key in keys:
+            value = self.local.get(full[key])
+            if value is _MISSING:
+                missing.append(key)
+            else:
+                found[key] = value
+        self.stats["local_hits"] += len(found)
+        if missing and self.shared is not None:
+            raws = self._shared_call(self.shared.get_many, [full[k] for k in missing], default=[None] * len(missing))
+            still_missing = []
+            for key, raw in zip(missing, raws):
+                if raw is None:
+                    still_missing.append(key)
+                    continue
+                found[key] = pickle.loads(raw)
+                self.local.put(full[key], found[key], min(ttl, self.version_ttl))
+            self.stats["shared_hits"] += len(missing) - len(still_missing)
+            missing = still_missing
+        if missing:
+            self.stats["misses"] += len(missing)
+            loaded = loader(missing)
+            values = {key: loaded.get(key) for key in missing}
+            self._store(namespace, version, values, ttl)
+            found.update(values)
+        return found
+
+    def get(
+        self,
+        namespace: str,
+        key: Hashable,
+        loader: Callable[[], Any],
+        ttl: Optional[int] = None,
+    ) -> Any:
+        """Value for ``key``, loading it at most once across callers and nodes"""
+        ttl = ttl or self.ttl
+        version = self._version(namespace)
+        full_key = self._full_key(namespace, version, key)
+        value = self._lookup(full_key, ttl)
+        if value is not _MISSING:
+            return value
+        with self._lock:
+            lock = self._loading.setdefault(full_key, threading.Lock())
+        with lock:
+            try:
+                # Whoever held the lock before us may have loaded it
+                value = self._lookup(full_key, ttl)
+                if value is not _MISSING:
+                    return value
+                value = self._load_once(full_key, loader, ttl)
+                self._store(namespace, version, {key: value}, ttl)
+                return value
+            finally:
+                with self._lock:
+                    self._loading.pop(full_key, None)
+
+    def _lookup(self, full_key: str, ttl: int) -> Any:
+        value = self.local.get(full_key)
+        if value is not _MISSING:
+            self.stats["local_hits"] += 1
+            return value
+        if self.shared is None:
+            return _MISSING
+        raw = self._shared_call(self.shared.get_many, [full_key], default=[None])[0]
+        if raw is None:
+            return _MISSING
+        self.stats["shared_hits"] += 1
+        value = pickle.loads(raw)
+        self.local.put(full_key, value, min(ttl, self.version_ttl))
+        return value
+
+    def _load_once(self, full_key: str, loader: Callable[[], Any], ttl: int) -> Any:
+        self.stats["misses"] += 1
+        if self.shared is None:
+            return loader()
+        lock_key = f"{full_key}:lock"
+        acquired = self._shared_call(self.shared.add, lock_key, b"1", LOCK_TTL, default=True)
+        if not acquired:
+            # Another node is loading: wait for its value rather than hit the DB too
+            deadline = time.monotonic() + LOCK_WAIT
+            while time.monotonic() < deadline:
+                time.sleep(LOCK_POLL)
+                raw = self._shared_call(self.shared.get_many, [full_key], default=[None])[0]
+                if raw is not None:
+                    return pickle.loads(raw)
+        try:
+            return loader()
+        finally:
+            # After waiting in vain we load too, but the lock stays its holder's
+            if acquired:
+                self._shared_call(self.shared.delete, lock_key)
+
+    def _store(self, namespace: str, version: int, values: Dict[Hashable, Any], ttl: int) -> None:
+        # Local copies expire quickly so that cross-node invalidations are seen
+        local_ttl = ttl if self.shared is None else min(ttl, self.version_ttl)
+        for key, value in values.items():
+            self.local.put(self._full_key(namespace, version, key), value, local_ttl)
+        if self.shared is not None and values:
+            self._shared_call(
+                self.shared.set_many,
+                {self._full_key(namespace, version, k): pickle.dumps(v) for k, v in values.items()},
+                ttl,
+            )
+
+    def clear(self) -> None:
+        """Drop the local tier and forget namespace versions (the shared tier is untouched)"""
+        self.local.clear()
+        with self._lock:
+            self._versions.clear()
+
+    def on_concept_change(self, event: ChangeEvent) -> None:
+        propagate = not event.remote
+        self.invalidate("concepts", propagate)
+        for keys in (event.old, event.new):
+            if keys:
+                self.invalidate(f"concepts:{keys['codesystem_id']}", propagate)
+
+    def on_conceptmap_change(self, event: ChangeEvent) -> None:
+        propagate = not event.remote
+        self.invalidate("mappings", propagate)
+        for keys in (event.old, event.new):
+            if keys:
+                self.invalidate(f"translate:{keys['source_codesystem_id']}:{keys['target_codesystem_id']}", propagate)
+
+    def on_codesystem_change(self, event: ChangeEvent) -> None:
+        propagate = not event.remote
+        self.invalidate("codesystem", propagate)
+        if event.operation == "DELETE":
+            # Its concepts went with it, without an event each
+            self.invalidate("concepts", propagate)
+            self.invalidate(f"concepts:{event.record_id}", propagate)
+            self.invalidate("mappings", propagate)
+
+
+read_cache = TieredCache(shared=backend_from_url(CACHE_URL))
+subscribe("concept", read_cache.on_concept_change)
+subscribe("conceptmap", read_cache.on_conceptmap_change)
+subscribe("codesystem", read_cache.on_codesystem_change)
+on_resync(read_cache.clear)
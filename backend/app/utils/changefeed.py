@@ -0,0 +1,184 @@
+"""Postgres LISTEN/NOTIFY change feed between workers.
+
+Statement-level triggers on ``codesystem``, ``concept`` and ``conceptmap``
+(migration 0011) send a notification with the table, operation, row id, key
+columns and the ``application_name`` of the writing connection for every
+committed single-row write, and one per codesystem (or codesystem pair) with
+null codes for a statement that changed many rows.
+Each worker runs one listener thread that turns notifications from other
+workers into ``ChangeEvent(remote=True)`` and publishes them, so the same
+subscribers that handle local writes invalidate this worker's caches and
+indexes.  Its own writes are skipped; they were published in-process already.
+
+When the listening connection drops, notifications sent in the meantime are
+lost, so after reconnecting (and re-issuing LISTEN) the listener calls
+``resync()`` and every derived structure is rebuilt from the database.
+
+Changes no trigger sees, such as a rebuilt suggestion index file, are sent
+on the same channel with ``broadcast()``.
+"""
+import json
+import os
+import select
+import threading
+from typing import Any, Dict, Optional
+from uuid import UUID
+
+import psycopg2
+import psycopg2.extensions
+
+from sqlalchemy import text
+
+from app.db import engine, instance_name
+from app.utils.events import ChangeEvent, publish, resync
+import logging
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = "fhirfly_changes"
+CHANGE_FEED_ENABLED = os.getenv("CHANGE_FEED_ENABLED", "true").lower() == "true"
+# Idle time after which the connection is probed, and the reconnect backoff
+POLL_TIMEOUT = 5.0
+RECONNECT_MIN_DELAY = 0.5
+RECONNECT_MAX_DELAY = 30.0
+
+UUID_KEYS = ("codesystem_id", "source_codesystem_id", "target_codesystem_id", "source_code", "target_code")
+
+
+def _keys(raw: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    if raw is None:
+        return None
+    return {k: UUID(v) if k in UUID_KEYS and v else v for k, v in raw.items()}
+
+
+def parse_notification(payload: str) -> ChangeEvent:
+    data = json.loads(payload)
+    return ChangeEvent(
+        data["table"],
+        data["op"],
+        UUID(data["id"]) if data.get("id") else None,
+        old=_keys(data.get("old")),
+        new=_keys(data.get("new")),
+        remote=True,
+    )
+
+
+class ChangeFeedListener:
+    def __init__(self, dsn: Optional[str] = None, channel: str = CHANNEL, origin: Optional[str] = None):
+        self.dsn = dsn or engine.url.set(drivername="postgresql").render_as_string(hide_password=False)
+        self.channel = channel
+        # application_name of this worker's own connections
+        self.origin = origin or instance_name()
+        self.ready = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._conn = None
+        self.received = 0
+        self.resyncs = 0
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self._run, name="changefeed", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _connect(self):
+        conn = psycopg2.connect(self.dsn, application_name=f"{self.origin}-listen")
+        conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+        with conn.cursor() as cur:
+            cur.execute(f"LISTEN {self.channel}")
+        return conn
+
+    def _run(self) -> None:
+        delay = RECONNECT_MIN_DELAY
+        connected_before = False
+        while not self._stop.is_set():
+            try:
+                self._conn = self._connect()
+                logger.info(f"Listening for changes on channel {self.channel}")
+                if connected_before:
+                    # Writes made while we were disconnected were never delivered
+                    self.resyncs += 1
+                    logger.warning("Change feed reconnected, resyncing in-memory indexes")
+                    resync()
+                connected_before = True
+                delay = RECONNECT_MIN_DELAY
+                self.ready.set()
+                self._listen(self._conn)
+            except Exception as e:
+                self.ready.clear()
+                logger.error(f"Change feed connection failed: {e}; retrying in {delay:.1f}s")
+                self._stop.wait(delay)
+                delay = min(delay * 2, RECONNECT_MAX_DELAY)
+            finally:
+                if self._conn is not None:
+                    try:
+                        self._conn.close()
+                    except Exception:
+                        pass
+                    self._conn = None
+
+    def _listen(self, conn) -> None:
+        while not self._stop.is_set():
+            if select.select([conn], [], [], POLL_TIMEOUT) == ([], [], []):
+                # Quiet channel: make sure the connection is still alive
+                with conn.cursor() as cur:
+                    cur.execute("SELECT 1")
+            conn.poll()
+            while conn.notifies:
+                self._dispatch(conn.notifies.pop(0).payload)
+
+    def _dispatch(self, payload: str) -> None:
+        try:
+            data = json.loads(payload)
+            if data.get("origin") == self.origin:
+                return
+            event = parse_notification(payload)
+        except (ValueError, KeyError) as e:
+            logger.warning(f"Ignoring malformed change notification {payload[:200]!r}: {e}")
+            return
+        self.received += 1
+        publish(event)
+
+
+def broadcast(event: ChangeEvent) -> None:
+    """Send an event that no trigger reports to the other workers"""
+    if engine.dialect.name != "postgresql":
+        return
+    payload = json.dumps({
+        "table": event.table, "op": event.operation, "id": event.record_id, "origin": instance_name(),
+        "old": event.old, "new": event.new,
+    }, default=str)
+    try:
+        with engine.connect() as conn:
+            conn.execute(text("SELECT pg_notify(:channel, :payload)"), {"channel": CHANNEL, "payload": payload})
+            conn.commit()
+    except Exception as e:
+        logger.warning(f"Failed to broadcast {event.table} {event.operation}: {e}")
+
+
+change_feed: Optional[ChangeFeedListener] = None
+
+
+def start_change_feed(wait: float = 5.0) -> Optional[ChangeFeedListener]:
+    """Start this worker's listener; waits until LISTEN is in place so that
+    indexes warmed afterwards cannot miss a write"""
+    global change_feed
+    if not CHANGE_FEED_ENABLED or engine.dialect.name != "postgresql":
+        return None
+    if change_feed is None:
+        change_feed = ChangeFeedListener()
+        change_feed.start()
+        if not change_feed.ready.wait(wait):
+            logger.warning("Change feed not connected yet; continuing startup")
+    return change_feed
+
+
+def stop_change_feed() -> None:
+    global change_feed
+    if change_feed is not None:
+        change_feed.stop()
+        change_feed = None
@@ -0,0 +1,232 @@
+"""Per-request deadlines for database work.
+
+A slow search or count used to keep running in Postgres after the client
+or load balancer had given up, holding a pooled connection all the while.
+Every request now carries a deadline: the ``X-Request-Timeout`` header in
+seconds (capped at ``DEADLINE_MAX``), or else the default of its admission
+lane from ``DEADLINE_DEFAULTS``.  ``get_db`` hands the request's session to
+the deadline, which applies the remaining budget to each transaction as
+``SET LOCAL statement_timeout`` (a progress handler plays that part on
+SQLite) and refuses to begin one once the budget is spent.  When the client
+disconnects before its response is complete, statements in flight are
+cancelled on the server and no new ones start.
+
+Routes turn database errors into generic 500s, so the middleware rewrites
+an error response caused by the deadline: ``504`` when a statement ran out
+of time, ``503`` with ``Retry-After`` when the budget was spent before the
+database work began (typically while queued) or the request was cancelled.
+"""
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextvars import ContextVar
+from typing import Any, Dict, Optional, Set
+
+from app.utils.admission import ROUTE_LANES, compile_routes, lane_for, parse_limits
+from app.utils.metrics import registry
+import logging
+
+logger = logging.getLogger(__name__)
+
+DEADLINE_ENABLED = os.getenv("DEADLINE_ENABLED", "true").lower() == "true"
+# lane=seconds pairs; 0 means no deadline, only cancellation on disconnect
+DEADLINE_DEFAULTS = os.getenv("DEADLINE_DEFAULTS", "health=5,lookup=5,search=15,write=30,export=0,sync=30")
+DEADLINE_MAX = float(os.getenv("DEADLINE_MAX", "120"))
+DEADLINE_RETRY_AFTER = int(os.getenv("DEADLINE_RETRY_AFTER", "1"))
+DEADLINE_HEADER = b"x-request-timeout"
+
+# SQLite VM instructions between deadline checks
+SQLITE_PROGRESS_OPS = 10000
+
+# SQLSTATE query_canceled: statement_timeout or a cancel request
+PG_QUERY_CANCELED = "57014"
+
+requests_total = registry.counter(
+    "fhirfly_deadline_requests_total",
+    "Requests stopped by their deadline: timeout (a statement ran out of time, 504), "
+    "exhausted (budget spent before database work, 503) or cancelled (client disconnected)",
+)
+
+request_deadline: ContextVar[Optional["Deadline"]] = ContextVar("request_deadline", default=None)
+
+
+class DeadlineExceeded(Exception):
+    """The request's deadline passed, or its client went away, before a transaction began"""
+
+
+def is_cancellation(exc: BaseException) -> bool:
+    """Whether a DBAPI error is a statement stopped by a timeout or cancel request"""
+    if getattr(exc, "pgcode", None) == PG_QUERY_CANCELED:
+        return True
+    return isinstance(exc, sqlite3.OperationalError) and str(exc) == "interrupted"
+
+
+class Deadline:
+    """Time budget of one request and the DBAPI connections running its statements"""
+
+    def __init__(self, seconds: Optional[float]):
+        self.expires = time.monotonic() + seconds if seconds else None
+        self.outcome: Optional[str] = None  # timeout, exhausted or cancelled
+        self._lock = threading.Lock()
+        self._connections: Set[Any] = set()
+
+    def remaining(self) -> float:
+        return float("inf") if self.expires is None else self.expires - time.monotonic()
+
+    def stopped(self) -> bool:
+        return self.outcome == "cancelled" or self.remaining() <= 0
+
+    def on_begin(self, session, transaction, connection) -> None:
+        """Session ``after_begin`` hook: apply the remaining budget to the new transaction"""
+        if self.stopped():
+            self.outcome = self.outcome or "exhausted"
+            raise DeadlineExceeded("Request deadline exceeded before database work began")
+        dbapi_connection = connection.connection.dbapi_connection
+        if connection.dialect.name == "postgresql" and self.expires is not None:
+            connection.exec_driver_sql(f"SET LOCAL statement_timeout = {max(1, int(self.remaining() * 1000))}")
+        elif connection.dialect.name == "sqlite":
+            dbapi_connection.set_progress_handler(self.stopped, SQLITE_PROGRESS_OPS)
+        with self._lock:
+            self._connections.add(dbapi_connection)
+        # Read by the pool checkin hook, which calls forget()
+        connection.connection.info["deadline"] = self
+
+    def on_error(self, exc: BaseException) -> None:
+        """Engine ``handle_error`` hook: note a statement stopped by this deadline"""
+        if self.outcome is None and is_cancellation(exc):
+            self.outcome = "timeout"
+
+    def check(self) -> None:
+        """Refuse further statements once the client has gone away"""
+        if self.outcome == "cancelled":
+            raise DeadlineExceeded("Request cancelled")
+
+    def cancel(self) -> None:
+        """Stop the request's database work; called when its client disconnects"""
+        with self._lock:
+            self.outcome = "cancelled"
+            for dbapi_connection in self._connections:
+                # SQLite connections stop through their progress handler
+                if hasattr(dbapi_connection, "cancel"):
+                    try:
+                        dbapi_connection.cancel()
+                    except Exception as e:
+                        logger.warning(f"Failed to cancel statement: {e}")
+
+    def forget(self, dbapi_connection) -> None:
+        """Stop watching a connection before it goes back to the pool.
+
+        Called on pool checkin, which a commit reaches long before the request
+        ends; after this, cancelling the request can no longer reach a
+        statement of whichever request checks the connection out next.
+        """
+        with self._lock:
+            self._connections.discard(dbapi_connection)
+            if isinstance(dbapi_connection, sqlite3.Connection):
+                dbapi_connection.set_progress_handler(None, 0)
+
+
+class DeadlineMiddleware:
+    def __init__(
+        self,
+        app,
+        defaults: Optional[Dict[str, float]] = None,
+        routes=ROUTE_LANES,
+        maximum: float = DEADLINE_MAX,
+        retry_after: int = DEADLINE_RETRY_AFTER,
+    ):
+        self.app = app
+        self.defaults = parse_limits(DEADLINE_DEFAULTS, float) if defaults is None else defaults
+        self.routes = compile_routes(routes)
+        self.maximum = maximum
+        self.retry_after = retry_after
+
+    def budget(self, scope) -> Optional[float]:
+        """Seconds the request may take: its header, else its lane's default"""
+        for name, value in scope.get("headers", []):
+            if name == DEADLINE_HEADER:
+                try:
+                    seconds = float(value)
+                except ValueError:
+                    break
+                if seconds > 0:
+                    return min(seconds, self.maximum)
+                break
+        return self.defaults.get(lane_for(self.routes, scope["method"], scope["path"])) or None
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        deadline = Deadline(self.budget(scope))
+        messages: "asyncio.Queue[dict]" = asyncio.Queue()
+        disconnected = False
+        complete = False
+        rewritten = False
+
+        async def watch():
+            # Reads ahead of the app so a disconnect is seen while it works
+            nonlocal disconnected
+            while True:
+                message = await receive()
+                if message["type"] == "http.disconnect":
+                    disconnected = True
+                    if not complete:
+                        await asyncio.get_running_loop().run_in_executor(None, deadline.cancel)
+                    await messages.put(message)
+                    return
+                await messages.put(message)
+
+        async def deadline_receive():
+            if disconnected and messages.empty():
+                return {"type": "http.disconnect"}
+            return await messages.get()
+
+        async def deadline_send(message):
+            nonlocal complete, rewritten
+            if message["type"] == "http.response.start":
+                if deadline.outcome is not None and message["status"] >= 400:
+                    rewritten = True
+                    await self._error(send, deadline)
+                    complete = True
+                    return
+            elif message["type"] == "http.response.body":
+                if rewritten:
+                    return
+                if not message.get("more_body", False):
+                    complete = True
+            await send(message)
+
+        watcher = asyncio.ensure_future(watch())
+        token = request_deadline.set(deadline)
+        try:
+            await self.app(scope, deadline_receive, deadline_send)
+        finally:
+            request_deadline.reset(token)
+            watcher.cancel()
+            if deadline.outcome is not None:
+                requests_total.inc(outcome=deadline.outcome)
+                logger.info(f"{scope['method']} {scope['path']} stopped by its deadline ({deadline.outcome})")
+
+    async def _error(self, send, deadline: Deadline) -> None:
+        if deadline.outcome == "timeout":
+            status, headers, detail = 504, [], "Request deadline exceeded"
+        else:
+            status = 503
+            headers = [(b"retry-after", str(self.retry_after).encode("latin-1"))]
+            detail = "Request cancelled" if deadline.outcome == "cancelled" else "Request deadline exceeded before it could run"
+        body = json.dumps({"detail": detail}).encode("utf-8")
+        await send({
+            "type": "http.response.start",
+            "status": status,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode("latin-1")),
+                *headers,
+            ],
+        })
+        await send({"type": "http.response.body", "body": body, "more_body": False})
@@ -0,0 +1,64 @@
+"""Entity tags and ``If-Match`` preconditions for the write routes.
+
+CodeSystem, Concept and ConceptMap rows carry a ``version_id`` counter that
+every update increments in the same ``UPDATE ... RETURNING`` statement that
+applies it.  The read and write routes return it as a weak ``ETag``
+(``W/"3"``).  A PUT or DELETE sent with ``If-Match`` adds the listed versions
+to that statement's ``WHERE`` clause, so an edit based on a stale read matches
+no row and is answered with ``412 Precondition Failed`` instead of silently
+overwriting the concurrent change.  Without ``If-Match`` (or with ``*``)
+writes apply unconditionally, as before.
+"""
+from typing import Dict, List, Optional
+
+from fastapi import Header
+from sqlalchemy.orm import Session
+
+
+class PreconditionFailed(Exception):
+    """The row is no longer at a version listed in If-Match"""
+
+
+def etag(version_id: int) -> str:
+    return f'W/"{version_id}"'
+
+
+def etag_headers(obj) -> Dict[str, str]:
+    """ETag header for ``obj``, unless a sparse read left version_id unloaded"""
+    version_id = obj.__dict__.get("version_id")
+    return {"ETag": etag(version_id)} if version_id is not None else {}
+
+
+def parse_if_match(value: Optional[str]) -> Optional[List[int]]:
+    """Versions an If-Match header accepts; ``None`` when absent or ``*``.
+
+    Tags that are not ours parse to nothing, so they can never match.
+    """
+    if value is None or value.strip() == "*":
+        return None
+    versions = []
+    for tag in value.split(","):
+        tag = tag.strip()
+        if tag.startswith("W/"):
+            tag = tag[2:]
+        tag = tag.strip('"')
+        if tag.isdigit():
+            versions.append(int(tag))
+    return versions
+
+
+def if_match(value: Optional[str] = Header(None, alias="If-Match")) -> Optional[List[int]]:
+    return parse_if_match(value)
+
+
+def version_guard(model, versions: Optional[List[int]]) -> list:
+    """WHERE criteria restricting a write to the If-Match versions"""
+    if versions is None:
+        return []
+    return [model.version_id.in_(versions)]
+
+
+def check_missed(db: Session, model, id, versions: Optional[List[int]]) -> None:
+    """After a guarded write matched no row: raise if the row exists at another version"""
+    if versions is not None and db.query(model.id).filter(model.id == id).first() is not None:
+        raise PreconditionFailed(f"{model.__name__} {id} was modified; If-Match does not match its current ETag")
@@ -0,0 +1,70 @@
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional
+from uuid import UUID
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class ChangeEvent:
+    """A committed write to one of the terminology tables.
+
+    ``operation`` uses the audit log vocabulary (INSERT, UPDATE, DELETE).
+    ``old`` and ``new`` carry the key columns derived structures need, e.g.
+    ``codesystem_id`` and ``code`` for concepts.  Bulk writes publish one
+    event per codesystem (concepts) or codesystem pair (conceptmaps) with
+    the codes set to ``None`` and no ``record_id``; see ``is_bulk``.
+    ``remote`` is set for writes made by another worker, delivered by
+    ``app.utils.changefeed``.
+    """
+    table: str
+    operation: str
+    record_id: Optional[UUID] = None
+    old: Optional[Dict[str, Any]] = None
+    new: Optional[Dict[str, Any]] = None
+    remote: bool = False
+
+
+def is_bulk(event: ChangeEvent) -> bool:
+    """Whether the event stands for any number of rows of its codesystem(s),
+    so subscribers drop what they derived from them instead of patching it"""
+    keys = event.old or event.new or {}
+    return keys.get("code", keys.get("source_code", "")) is None
+
+
+Subscriber = Callable[[ChangeEvent], None]
+
+_subscribers: Dict[str, List[Subscriber]] = {}
+
+
+def subscribe(table: str, callback: Subscriber) -> None:
+    """Register a callback for committed changes to ``table``"""
+    _subscribers.setdefault(table, []).append(callback)
+
+
+_resync_callbacks: List[Callable[[], None]] = []
+
+
+def on_resync(callback: Callable[[], None]) -> None:
+    """Register a callback that drops derived state when changes may have been missed"""
+    _resync_callbacks.append(callback)
+
+
+def resync() -> None:
+    """Tell every derived structure to rebuild from the database"""
+    for callback in _resync_callbacks:
+        try:
+            callback()
+        except Exception as e:
+            logger.error(f"Resync callback {callback!r} failed: {e}")
+
+
+def publish(event: ChangeEvent) -> None:
+    """Notify subscribers of a committed change"""
+    for callback in _subscribers.get(event.table, []):
+        try:
+            callback(event)
+        except Exception as e:
+            logger.error(f"Change subscriber {callback!r} failed for {event.table}.{event.operation}: {e}")
+            # Don't raise exception to avoid breaking the main operation
@@ -0,0 +1,242 @@
+"""ValueSet $expand over the Concept table with an expansion cache.
+
+An expansion is computed once per (ValueSet definition hash, text filter,
+codesystem versions) and kept in a bounded LRU cache; later pages are sliced
+from the cached list instead of re-running the query.  Entries are dropped on
+any concept or codesystem write that touches one of their codesystems.
+"""
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Set, Tuple
+from uuid import UUID
+
+from sqlalchemy.orm import Session
+
+from app.crud import concept as concept_crud
+from app.utils.events import ChangeEvent, on_resync, subscribe
+from app.utils.hierarchy import hierarchy_index
+from app.utils.membership import membership_index
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Filter operators answered from the concept hierarchy (property "concept")
+HIERARCHY_OPS = ("is-a", "descendent-of")
+EXPANSION_CACHE_MAX_CODES = int(os.getenv("EXPANSION_CACHE_MAX_CODES", "1000000"))
+
+
+class ExpansionError(ValueError):
+    """The ValueSet definition cannot be expanded"""
+
+
+@dataclass
+class Expansion:
+    key: str
+    # (system, version, code, display)
+    contains: List[Tuple[str, Optional[str], str, Optional[str]]]
+    codesystem_ids: Set[UUID] = field(default_factory=set)
+    timestamp: str = field(default_factory=lambda: datetime.now(timezone.utc).isoformat())
+
+
+def implicit_valueset(system: str) -> Dict[str, Any]:
+    """ValueSet containing every code of one code system"""
+    system = system.split("?", 1)[0]
+    return {"resourceType": "ValueSet", "compose": {"include": [{"system": system}]}}
+
+
+def definition_hash(valueset: Dict[str, Any], text_filter: Optional[str]) -> str:
+    canonical = json.dumps(
+        {"compose": valueset.get("compose") or {}, "filter": (text_filter or "").strip().lower()},
+        sort_keys=True,
+        separators=(",", ":"),
+    )
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def _containment_filters(filters: List[Dict[str, Any]]) -> List[Tuple[str, List[str]]]:
+    """'=' and 'in' property filters, evaluated in SQL as JSONB containment"""
+    out = []
+    for flt in filters:
+        op, value = flt.get("op", "="), str(flt.get("value"))
+        if op == "=":
+            out.append((flt.get("property"), [value]))
+        elif op == "in":
+            out.append((flt.get("property"), [v.strip() for v in value.split(",") if v.strip()]))
+        elif op != "exists":
+            raise ExpansionError(f"Unsupported filter operator: {op}")
+    return out
+
+
+def _matches_exists_filters(properties, filters: List[Dict[str, Any]]) -> bool:
+    props = properties or []
+    for flt in filters:
+        present = any(isinstance(p, dict) and p.get("code") == flt.get("property") for p in props)
+        if (str(flt.get("value")).lower() == "true") != present:
+            return False
+    return True
+
+
+class ExpansionCache:
+    def __init__(self, max_codes: int = EXPANSION_CACHE_MAX_CODES):
+        self.max_codes = max_codes
+        self._entries: "OrderedDict[str, Expansion]" = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Optional[Expansion]:
+        with self._lock:
+            expansion = self._entries.get(key)
+            if expansion is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return expansion
+
+    def put(self, expansion: Expansion) -> None:
+        size = len(expansion.contains)
+        if size > self.max_codes:
+            return
+        with self._lock:
+            old = self._entries.pop(expansion.key, None)
+            if old is not None:
+                self._size -= len(old.contains)
+            self._entries[expansion.key] = expansion
+            self._size += size
+            while self._size > self.max_codes and self._entries:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= len(evicted.contains)
+
+    def invalidate_codesystem(self, codesystem_id: UUID) -> None:
+        with self._lock:
+            for key in [k for k, e in self._entries.items() if codesystem_id in e.codesystem_ids]:
+                self._size -= len(self._entries.pop(key).contains)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def on_concept_change(self, event: ChangeEvent) -> None:
+        for keys in (event.old, event.new):
+            if keys:
+                self.invalidate_codesystem(keys["codesystem_id"])
+
+    def on_codesystem_change(self, event: ChangeEvent) -> None:
+        self.invalidate_codesystem(event.record_id)
+
+
+expansion_cache = ExpansionCache()
+subscribe("concept", expansion_cache.on_concept_change)
+subscribe("codesystem", expansion_cache.on_codesystem_change)
+on_resync(expansion_cache.clear)
+
+
+def _resolve_includes(db: Session, valueset: Dict[str, Any]) -> List[Tuple[Dict[str, Any], UUID, Optional[str]]]:
+    includes = (valueset.get("compose") or {}).get("include") or []
+    if not includes:
+        raise ExpansionError("ValueSet.compose.include is required")
+    resolved = []
+    for include in includes:
+        system = include.get("system")
+        if not system:
+            raise ExpansionError("Only includes with a 'system' are supported")
+        codesystem_id = membership_index.resolve_system(db, system)
+        if codesystem_id is None:
+            raise ExpansionError(f"Unknown code system: {system}")
+        version = membership_index.version_of(codesystem_id)
+        if include.get("version") and version not in (None, include["version"]):
+            raise ExpansionError(f"Code system {system} version {include['version']} not found")
+        resolved.append((include, codesystem_id, version))
+    return resolved
+
+
+def expand(db: Session, valueset: Dict[str, Any], text_filter: Optional[str] = None) -> Expansion:
+    """Expand (or fetch from cache) the full, ordered list of codes"""
+    includes = _resolve_includes(db, valueset)
+    versions = ",".join(f"{cs_id}@{version}" for _, cs_id, version in includes)
+    key = f"{definition_hash(valueset, text_filter)}:{hashlib.sha256(versions.encode()).hexdigest()[:16]}"
+
+    cached = expansion_cache.get(key)
+    if cached is not None:
+        return cached
+
+    excluded = {
+        (exclude.get("system"), c.get("code"))
+        for exclude in (valueset.get("compose") or {}).get("exclude") or []
+        for c in exclude.get("concept") or []
+    }
+    contains = []
+    seen = set()
+    for include, codesystem_id, version in includes:
+        system = include["system"]
+        codes = [c["code"] for c in include.get("concept") or [] if c.get("code")] or None
+        filters = [f for f in include.get("filter") or [] if f.get("op") not in HIERARCHY_OPS]
+        allowed = None
+        for flt in include.get("filter") or []:
+            if flt.get("op") not in HIERARCHY_OPS:
+                continue
+            subtree = hierarchy_index.subtree_codes(db, codesystem_id, str(flt.get("value"))) or []
+            if flt["op"] == "descendent-of":
+                subtree = subtree[1:]
+            allowed = set(subtree) if allowed is None else allowed & set(subtree)
+        if allowed is not None:
+            codes = sorted(allowed.intersection(codes) if codes else allowed)
+            if not codes:
+                continue
+        exists_filters = [f for f in filters if f.get("op") == "exists"]
+        rows = concept_crud.concept.get_for_expansion(
+            db=db,
+            codesystem_id=codesystem_id,
+            codes=codes,
+            search=text_filter,
+            with_properties=bool(exists_filters),
+            properties=_containment_filters(filters),
+        )
+        for row in rows:
+            if exists_filters and not _matches_exists_filters(row.properties, exists_filters):
+                continue
+            if (system, row.code) in excluded or (system, row.code) in seen:
+                continue
+            seen.add((system, row.code))
+            contains.append((system, version, row.code, row.display))
+
+    expansion = Expansion(key=key, contains=contains, codesystem_ids={cs_id for _, cs_id, _ in includes})
+    expansion_cache.put(expansion)
+    logger.info(f"Computed expansion {key[:12]} with {len(contains)} codes")
+    return expansion
+
+
+def expansion_page(
+    valueset: Dict[str, Any],
+    expansion: Expansion,
+    offset: int,
+    count: int,
+    text_filter: Optional[str] = None,
+) -> Dict[str, Any]:
+    """Render one page of an expansion as a FHIR ValueSet resource"""
+    page = expansion.contains[offset:offset + count]
+    params = [{"name": "offset", "valueInteger": offset}, {"name": "count", "valueInteger": count}]
+    if text_filter:
+        params.append({"name": "filter", "valueString": text_filter})
+    result = {k: v for k, v in valueset.items() if k != "expansion"}
+    result["resourceType"] = "ValueSet"
+    result["expansion"] = {
+        "identifier": f"urn:uuid:{UUID(expansion.key[:32])}",
+        "timestamp": expansion.timestamp,
+        "total": len(expansion.contains),
+        "offset": offset,
+        "parameter": params,
+        "contains": [
+            {k: v for k, v in (("system", system), ("version", version), ("code", code), ("display", display)) if v is not None}
+            for system, version, code, display in page
+        ],
+    }
+    return result
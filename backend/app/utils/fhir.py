@@ -0,0 +1,45 @@
+from typing import Any, Dict, List, Optional
+from fastapi.responses import JSONResponse
+
+
+def parameters(*params: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """Build a FHIR Parameters resource, skipping ``None`` entries"""
+    return {"resourceType": "Parameters", "parameter": [p for p in params if p is not None]}
+
+
+def param(name: str, value: Any, value_type: str = "String") -> Optional[Dict[str, Any]]:
+    """A single Parameters.parameter entry, or ``None`` when there is no value"""
+    if value is None:
+        return None
+    return {"name": name, f"value{value_type}": value}
+
+
+def parameters_to_dict(resource: Dict[str, Any]) -> Dict[str, Any]:
+    """Flatten a Parameters resource into ``{name: value}`` (first value wins)"""
+    values: Dict[str, Any] = {}
+    for entry in resource.get("parameter") or []:
+        name = entry.get("name")
+        if not name or name in values:
+            continue
+        for key, value in entry.items():
+            if key.startswith("value") or key == "resource":
+                values[name] = value
+                break
+    return values
+
+
+def operation_outcome(
+    status_code: int,
+    diagnostics: str,
+    code: str = "not-found",
+    severity: str = "error",
+    issues: Optional[List[Dict[str, Any]]] = None,
+) -> JSONResponse:
+    """FHIR OperationOutcome error response"""
+    return JSONResponse(
+        status_code=status_code,
+        content={
+            "resourceType": "OperationOutcome",
+            "issue": issues or [{"severity": severity, "code": code, "diagnostics": diagnostics}],
+        },
+    )
@@ -0,0 +1,77 @@
+"""Sparse fieldsets for the REST read routes.
+
+``?_elements=code,display`` (FHIR) or ``?fields=code,display`` picks the
+fields to return, and ``?_summary=true`` picks a per-resource summary that
+leaves out the large JSON columns.  The selection is passed to the CRUD
+queries as ``load_only`` columns, so unselected columns are neither read
+from Postgres nor serialized.  ``id`` is always returned.  ``_summary=count``
+returns only the total of a list.
+"""
+from typing import Any, Dict, List, NamedTuple, Optional, Sequence, Type
+
+from fastapi import Query
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+from sqlalchemy.orm import load_only
+
+ALWAYS_INCLUDED = ("id",)
+
+# Per response schema; everything except the heavy JSON and bookkeeping columns
+SUMMARY_FIELDS: Dict[str, Sequence[str]] = {
+    "Concept": ("codesystem_id", "code", "display"),
+    "CodeSystem": ("url", "version", "name", "title", "status", "publisher", "content"),
+    "ConceptMap": ("source_codesystem_id", "target_codesystem_id", "source_code", "target_code", "equivalence"),
+}
+
+SUMMARY_MODES = ("true", "false", "count")
+
+
+class FieldSelectionError(ValueError):
+    """Unknown field or _summary mode"""
+
+
+class FieldParams(NamedTuple):
+    elements: Optional[str]
+    summary: Optional[str]
+
+
+def field_params(
+    elements: Optional[str] = Query(None, alias="_elements", description="Comma-separated fields to return"),
+    fields: Optional[str] = Query(None, description="Alias of _elements"),
+    summary: Optional[str] = Query(None, alias="_summary", description="true (summary fields), false or count"),
+) -> FieldParams:
+    return FieldParams(elements or fields, summary.lower() if summary else None)
+
+
+def select_fields(schema: Type[BaseModel], params: FieldParams) -> Optional[List[str]]:
+    """Fields of ``schema`` to return in schema order, or ``None`` for all of them"""
+    if params.summary is not None and params.summary not in SUMMARY_MODES:
+        raise FieldSelectionError(f"Invalid _summary '{params.summary}', expected one of: {', '.join(SUMMARY_MODES)}")
+    available = list(schema.model_fields)
+    if params.elements:
+        requested = {name.strip() for name in params.elements.split(",") if name.strip()}
+        unknown = sorted(requested - set(available))
+        if unknown:
+            raise FieldSelectionError(f"Unknown field(s): {', '.join(unknown)}; available: {', '.join(available)}")
+    elif params.summary == "true":
+        requested = set(SUMMARY_FIELDS[schema.__name__])
+    else:
+        return None
+    return [name for name in available if name in requested or name in ALWAYS_INCLUDED]
+
+
+def load_only_columns(model, columns: Optional[List[str]]) -> list:
+    """Query options loading only ``columns`` of ``model`` (plus its primary key)"""
+    if not columns:
+        return []
+    return [load_only(*[getattr(model, name) for name in columns])]
+
+
+def dump_fields(obj: Any, columns: List[str]) -> Dict[str, Any]:
+    # Only touch loaded attributes; reading a deferred one would query per row
+    return {name: getattr(obj, name) for name in columns}
+
+
+def sparse_response(content: Any, headers: Optional[Dict[str, str]] = None) -> JSONResponse:
+    return JSONResponse(content=jsonable_encoder(content), headers=headers)
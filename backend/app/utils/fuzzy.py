@@ -0,0 +1,266 @@
+"""Typo-tolerant code lookup ("did you mean") per codesystem.
+
+Uses a symmetric-delete dictionary: every code is indexed under all strings
+obtained by deleting up to ``MAX_DISTANCE`` characters from it.  A query
+generates the same deletes, so candidates come from a handful of dict lookups
+and only those few are checked with a real edit distance — no scan over the
+codesystem, and no leading-wildcard ILIKE in Postgres.  Codes are compared
+case-insensitively.  The index is warmed at startup together with the
+membership index and kept in sync with concept writes.
+"""
+import threading
+from typing import Dict, Iterable, List, Optional, Sequence, Set, Tuple, Union
+from uuid import UUID
+
+import numpy as np
+from sqlalchemy.orm import Session
+
+from app.models import CodeSystem, Concept
+from app.utils.events import ChangeEvent, is_bulk, on_resync, subscribe
+import logging
+
+logger = logging.getLogger(__name__)
+
+MAX_DISTANCE = 2
+# Candidate lists at least this long are verified in one vectorised pass
+BATCH_VERIFY = 64
+
+
+def _delete_levels(term: str, distance: int) -> List[Set[str]]:
+    """Strings obtained from ``term`` by deleting exactly 0, 1, ... ``distance`` characters.
+
+    Down to the empty string, so that short codes still meet on a shared
+    variant (``"A"`` and ``"B"`` are one substitution apart via ``""``).
+    """
+    levels = [{term}]
+    for _ in range(distance):
+        levels.append({w[:i] + w[i + 1:] for w in levels[-1] for i in range(len(w))})
+    return levels
+
+
+def within(a: str, b: str, distance: int) -> bool:
+    """Whether ``a`` and ``b`` are at most ``distance`` edits apart (insert,
+    delete, substitute or swap adjacent characters)"""
+    if abs(len(a) - len(b)) > distance:
+        return False
+    i, shortest = 0, min(len(a), len(b))
+    while i < shortest and a[i] == b[i]:
+        i += 1
+    if i == len(a) == len(b):
+        return True
+    if distance == 0:
+        return False
+    a, b = a[i:], b[i:]
+    # Some edit has to start at the first mismatch
+    return (
+        within(a[1:], b[1:], distance - 1)
+        or within(a[1:], b, distance - 1)
+        or within(a, b[1:], distance - 1)
+        or (len(a) > 1 and len(b) > 1 and a[0] == b[1] and a[1] == b[0] and within(a[2:], b[2:], distance - 1))
+    )
+
+
+def _encode(strings: List[str], length: int) -> np.ndarray:
+    return np.frombuffer("".join(strings).encode("utf-32-le"), dtype=np.uint32).reshape(len(strings), length)
+
+
+def edit_distances(query: str, keys: List[str], limit: int = MAX_DISTANCE) -> np.ndarray:
+    """Edit distances (capped at ``limit + 1``) from ``query`` to many keys of
+    one common length, vectorised over the keys"""
+    length = len(keys[0])
+    if abs(len(query) - length) > limit:
+        return np.full(len(keys), limit + 1)
+    a = _encode([query], len(query))[0]
+    b = _encode(keys, length)
+    previous2 = None
+    previous = np.tile(np.arange(length + 1), (len(keys), 1))
+    for i in range(1, len(query) + 1):
+        current = np.empty_like(previous)
+        current[:, 0] = i
+        for j in range(1, length + 1):
+            cost = (b[:, j - 1] != a[i - 1]).astype(previous.dtype)
+            best = np.minimum(np.minimum(previous[:, j] + 1, current[:, j - 1] + 1), previous[:, j - 1] + cost)
+            if i > 1 and j > 1:
+                swapped = (b[:, j - 2] == a[i - 1]) & (b[:, j - 1] == a[i - 2])
+                best = np.where(swapped, np.minimum(best, previous2[:, j - 2] + 1), best)
+            current[:, j] = best
+        previous2, previous = previous, current
+    return np.minimum(previous[:, -1], limit + 1)
+
+
+class SymmetricDeleteIndex:
+    """Codes of one codesystem, indexed by their deletes"""
+
+    def __init__(self, max_distance: int = MAX_DISTANCE):
+        self.max_distance = max_distance
+        # normalised code -> codes as stored (usually exactly one)
+        self._codes: Dict[str, List[str]] = {}
+        # _deletes[n][variant] -> normalised code(s) that give ``variant`` after n
+        # deletes (a bare string while there is only one, which saves most of the
+        # memory); kept apart per n so distance-1 lookups never walk level-2 lists
+        self._deletes: List[Dict[str, Union[str, List[str]]]] = [{} for _ in range(max_distance + 1)]
+
+    def add(self, code: str) -> None:
+        key = code.upper()
+        originals = self._codes.setdefault(key, [])
+        if code in originals:
+            return
+        originals.append(code)
+        if len(originals) > 1:
+            return
+        for n, variants in enumerate(_delete_levels(key, self.max_distance)[1:], start=1):
+            table = self._deletes[n]
+            for variant in variants:
+                keys = table.get(variant)
+                if keys is None:
+                    table[variant] = key
+                elif isinstance(keys, str):
+                    table[variant] = [keys, key]
+                else:
+                    keys.append(key)
+
+    def discard(self, code: str) -> None:
+        key = code.upper()
+        originals = self._codes.get(key)
+        if not originals or code not in originals:
+            return
+        originals.remove(code)
+        if originals:
+            return
+        del self._codes[key]
+        for n, variants in enumerate(_delete_levels(key, self.max_distance)[1:], start=1):
+            table = self._deletes[n]
+            for variant in variants:
+                keys = table.get(variant)
+                if keys == key:
+                    del table[variant]
+                elif isinstance(keys, list) and key in keys:
+                    keys.remove(key)
+                    if len(keys) == 1:
+                        table[variant] = keys[0]
+
+    def _keys(self, variant: str, deletes: int) -> Sequence[str]:
+        if deletes == 0:
+            return (variant,) if variant in self._codes else ()
+        keys = self._deletes[deletes].get(variant, ())
+        return (keys,) if isinstance(keys, str) else keys
+
+    def lookup(self, term: str, limit: int = 5, max_distance: Optional[int] = None) -> List[Tuple[str, int]]:
+        """Closest codes to ``term`` as (code, distance), nearest first"""
+        distance = self.max_distance if max_distance is None else min(max_distance, self.max_distance)
+        query = term.upper()
+        query_levels = _delete_levels(query, distance)
+        found: Dict[str, int] = {}
+        near = 0
+        # Codes within d edits share a variant reached by at most d deletes on
+        # each side, so stage d finds every code at distance d.  Nearer stages
+        # are complete before a farther one starts, so the search stops once
+        # ``limit`` codes at distance <= d are known.  Short candidate lists are
+        # visited first, in a fixed order so that ties resolve the same way in
+        # every worker process.
+        for d in range(distance + 1):
+            checked: Set[str] = set()
+            for i, j in [(i, j) for i in range(d + 1) for j in range(d + 1) if max(i, j) == d]:
+                for variant in sorted(query_levels[i], key=lambda v: (len(self._keys(v, j)), v)):
+                    keys = [key for key in self._keys(variant, j) if key not in found and key not in checked]
+                    if not keys:
+                        continue
+                    checked.update(keys)
+                    if i + j <= d:
+                        # i deletes plus j inserts: at most d edits
+                        hits = keys
+                    elif len(keys) >= BATCH_VERIFY:
+                        hits = [key for key, dist in zip(keys, edit_distances(query, keys, d).tolist()) if dist <= d]
+                    else:
+                        hits = [key for key in keys if within(query, key, d)]
+                    for key in hits:
+                        found[key] = d
+                        near += len(self._codes[key])
+                    if near >= limit:
+                        break
+                if near >= limit:
+                    break
+            if near >= limit:
+                break
+        matches = sorted(
+            (dist, code) for key, dist in found.items() if dist <= distance for code in self._codes[key]
+        )
+        return [(code, dist) for dist, code in matches[:limit]]
+
+    def __len__(self) -> int:
+        return len(self._codes)
+
+
+class FuzzyCodeIndex:
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._indexes: Dict[UUID, SymmetricDeleteIndex] = {}
+
+    def _build(self, codes: Iterable[str]) -> SymmetricDeleteIndex:
+        index = SymmetricDeleteIndex()
+        for code in codes:
+            index.add(code)
+        return index
+
+    def _load(self, db: Session, codesystem_id: UUID) -> SymmetricDeleteIndex:
+        rows = db.query(Concept.code).filter(Concept.codesystem_id == codesystem_id).yield_per(10000)
+        index = self._indexes[codesystem_id] = self._build(row[0] for row in rows)
+        logger.info(f"Built fuzzy code index for codesystem {codesystem_id} with {len(index)} codes")
+        return index
+
+    def get(self, db: Session, codesystem_id: UUID) -> SymmetricDeleteIndex:
+        """Index of a codesystem, building it on first use"""
+        index = self._indexes.get(codesystem_id)
+        if index is None:
+            with self._lock:
+                index = self._indexes.get(codesystem_id) or self._load(db, codesystem_id)
+        return index
+
+    def suggest(
+        self,
+        db: Session,
+        codesystem_id: UUID,
+        code: str,
+        limit: int = 5,
+        max_distance: int = MAX_DISTANCE,
+    ) -> List[Tuple[str, int]]:
+        """Codes of the codesystem within ``max_distance`` edits of ``code``"""
+        return self.get(db, codesystem_id).lookup(code, limit=limit, max_distance=max_distance)
+
+    def warm(self, db: Session) -> None:
+        """Build every codesystem's index up front"""
+        with self._lock:
+            for (codesystem_id,) in db.query(CodeSystem.id).all():
+                if codesystem_id not in self._indexes:
+                    self._load(db, codesystem_id)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._indexes.clear()
+
+    def on_concept_change(self, event: ChangeEvent) -> None:
+        with self._lock:
+            if is_bulk(event):
+                for keys in (event.old, event.new):
+                    if keys:
+                        self._indexes.pop(keys["codesystem_id"], None)
+                return
+            if event.old:
+                index = self._indexes.get(event.old["codesystem_id"])
+                if index is not None:
+                    index.discard(event.old["code"])
+            if event.new:
+                index = self._indexes.get(event.new["codesystem_id"])
+                if index is not None:
+                    index.add(event.new["code"])
+
+    def on_codesystem_change(self, event: ChangeEvent) -> None:
+        if event.operation == "DELETE":
+            with self._lock:
+                self._indexes.pop(event.record_id, None)
+
+
+fuzzy_code_index = FuzzyCodeIndex()
+subscribe("concept", fuzzy_code_index.on_concept_change)
+subscribe("codesystem", fuzzy_code_index.on_codesystem_change)
+on_resync(fuzzy_code_index.clear)
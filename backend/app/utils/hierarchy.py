@@ -0,0 +1,174 @@
+"""Concept hierarchy (is-a DAG) per codesystem.
+
+Parent links live in ``Concept.properties`` (``{"code": "parent", "valueCode":
+...}``) or, for some imports, in ``Concept.raw``.  They are parsed once per
+codesystem into parent/child adjacency maps, so ancestor and descendant
+queries walk only the nodes they return instead of scanning JSON in Postgres.
+Concept writes update the graph incrementally through ``app.utils.events``.
+"""
+import threading
+from typing import Any, Dict, Iterable, List, Optional, Set
+from uuid import UUID
+
+from sqlalchemy.orm import Session
+
+from app.models import Concept
+from app.utils.events import ChangeEvent, is_bulk, on_resync, subscribe
+import logging
+
+logger = logging.getLogger(__name__)
+
+PARENT_PROPERTIES = ("parent", "subsumedBy")
+RAW_PARENT_KEYS = ("parent", "parent_code", "parentCode", "Parent")
+
+
+def parent_codes(properties: Any, raw: Any = None) -> List[str]:
+    """Extract parent codes from a concept's properties (or raw import row)"""
+    parents = []
+    for prop in properties or []:
+        if isinstance(prop, dict) and prop.get("code") in PARENT_PROPERTIES:
+            value = prop.get("valueCode") or prop.get("valueString")
+            if value and value not in parents:
+                parents.append(str(value))
+    if not parents and isinstance(raw, dict):
+        for key in RAW_PARENT_KEYS:
+            value = raw.get(key)
+            if isinstance(value, list):
+                parents.extend(str(v) for v in value if v)
+            elif value:
+                parents.append(str(value))
+            if parents:
+                break
+    return parents
+
+
+class CodeSystemHierarchy:
+    """Parent/child adjacency for one codesystem"""
+
+    def __init__(self):
+        self.parents: Dict[str, List[str]] = {}
+        self.children: Dict[str, List[str]] = {}
+        self._roots: Optional[List[str]] = None
+
+    def set_parents(self, code: str, parents: Iterable[str]) -> None:
+        self.remove(code)
+        parents = list(parents)
+        self.parents[code] = parents
+        for parent in parents:
+            self.children.setdefault(parent, []).append(code)
+
+    def remove(self, code: str) -> None:
+        self._roots = None
+        for parent in self.parents.pop(code, []):
+            siblings = self.children.get(parent)
+            if siblings and code in siblings:
+                siblings.remove(code)
+
+    def roots(self) -> List[str]:
+        if self._roots is None:
+            self._roots = sorted(code for code, parents in self.parents.items()
+                                 if not any(p in self.parents for p in parents))
+        return self._roots
+
+    def child_codes(self, code: str) -> List[str]:
+        return sorted(c for c in self.children.get(code, []) if c in self.parents)
+
+    def _walk(self, start: str, edges: Dict[str, List[str]]) -> List[str]:
+        seen: Set[str] = set()
+        out: List[str] = []
+        stack = list(edges.get(start, []))
+        while stack:
+            code = stack.pop()
+            if code in seen or code not in self.parents:
+                continue
+            seen.add(code)
+            out.append(code)
+            stack.extend(edges.get(code, []))
+        return out
+
+    def ancestors(self, code: str) -> List[str]:
+        return self._walk(code, self.parents)
+
+    def descendants(self, code: str) -> List[str]:
+        return self._walk(code, self.children)
+
+    def subsumes(self, code_a: str, code_b: str) -> str:
+        """FHIR $subsumes outcome of ``code_a`` relative to ``code_b``"""
+        if code_a == code_b:
+            return "equivalent"
+        if code_a in self.ancestors(code_b):
+            return "subsumes"
+        if code_b in self.ancestors(code_a):
+            return "subsumed-by"
+        return "not-subsumed"
+
+    def __contains__(self, code: str) -> bool:
+        return code in self.parents
+
+
+class HierarchyIndex:
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._graphs: Dict[UUID, CodeSystemHierarchy] = {}
+
+    def _load(self, db: Session, codesystem_id: UUID) -> CodeSystemHierarchy:
+        graph = CodeSystemHierarchy()
+        rows = db.query(Concept.code, Concept.properties, Concept.raw).filter(
+            Concept.codesystem_id == codesystem_id
+        ).yield_per(10000)
+        for code, properties, raw in rows:
+            graph.set_parents(code, parent_codes(properties, raw))
+        self._graphs[codesystem_id] = graph
+        logger.info(f"Built hierarchy for codesystem {codesystem_id} with {len(graph.parents)} concepts")
+        return graph
+
+    def get(self, db: Session, codesystem_id: UUID) -> CodeSystemHierarchy:
+        """Hierarchy of a codesystem, building it on first use"""
+        graph = self._graphs.get(codesystem_id)
+        if graph is None:
+            with self._lock:
+                graph = self._graphs.get(codesystem_id) or self._load(db, codesystem_id)
+        return graph
+
+    def subtree_codes(self, db: Session, codesystem_id: UUID, code: str) -> Optional[List[str]]:
+        """``code`` plus all its descendants, or ``None`` for an unknown code"""
+        graph = self.get(db, codesystem_id)
+        if code not in graph:
+            return None
+        return [code] + graph.descendants(code)
+
+    def invalidate(self, codesystem_id: Optional[UUID] = None) -> None:
+        with self._lock:
+            if codesystem_id is None:
+                self._graphs.clear()
+            else:
+                self._graphs.pop(codesystem_id, None)
+
+    def on_concept_change(self, event: ChangeEvent) -> None:
+        with self._lock:
+            if is_bulk(event):
+                for keys in (event.old, event.new):
+                    if keys:
+                        self._graphs.pop(keys["codesystem_id"], None)
+                return
+            if event.old:
+                graph = self._graphs.get(event.old["codesystem_id"])
+                if graph is not None:
+                    graph.remove(event.old["code"])
+            if event.new:
+                graph = self._graphs.get(event.new["codesystem_id"])
+                if graph is not None:
+                    if "parents" in event.new:
+                        graph.set_parents(event.new["code"], event.new["parents"])
+                    else:
+                        self._graphs.pop(event.new["codesystem_id"], None)
+
+    def on_codesystem_change(self, event: ChangeEvent) -> None:
+        if event.operation == "DELETE":
+            self.invalidate(event.record_id)
+
+
+hierarchy_index = HierarchyIndex()
+subscribe("concept", hierarchy_index.on_concept_change)
+subscribe("codesystem", hierarchy_index.on_codesystem_change)
+on_resync(hierarchy_index.invalidate)
@@ -0,0 +1,221 @@
+"""Background jobs for long-running imports, exports and deletes.
+
+Operations that would outlast a load balancer's timeout are recorded in the
+``job`` table and answered with ``202 Accepted`` and a ``Content-Location``
+status URL, as in FHIR asynchronous requests.  Each worker process runs a
+dispatcher thread, started from the app lifespan, that claims queued jobs
+while it has a free slot in its thread pool; ``JOB_WORKERS`` bounds how many
+database connections jobs hold per process, and ``JOB_MAX_QUEUED`` turns a
+flood of submissions away.  Handlers report progress through
+:class:`JobContext`, which also tells them when a cancellation was requested.
+Running jobs are heartbeated by their dispatcher; a job whose worker died is
+failed after ``JOB_STALE_SECONDS`` rather than re-run, since handlers are not
+assumed to be idempotent.
+"""
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional, Set
+from uuid import UUID
+
+from fastapi import Request
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from sqlalchemy.orm import Session
+
+from app import db as database
+from app.crud import job as job_crud
+from app.crud import sync as sync_crud
+from app.schemas import Job as JobSchema
+from app.utils.metrics import registry
+import logging
+
+logger = logging.getLogger(__name__)
+
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+JOB_MAX_QUEUED = int(os.getenv("JOB_MAX_QUEUED", "100"))
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "1.0"))
+JOB_PROGRESS_INTERVAL = float(os.getenv("JOB_PROGRESS_INTERVAL", "1.0"))
+JOB_STALE_SECONDS = float(os.getenv("JOB_STALE_SECONDS", "120"))
+HEARTBEAT_INTERVAL = 10.0
+# Seconds between tombstone pruning passes of one dispatcher
+TOMBSTONE_PRUNE_INTERVAL = 3600.0
+
+jobs_total = registry.counter("fhirfly_jobs_total", "Background jobs finished, by kind and status")
+
+
+class JobCancelled(Exception):
+    """Raised inside a handler when its job was cancelled"""
+
+
+class JobQueueFull(Exception):
+    """Too many jobs are already waiting"""
+
+
+class JobContext:
+    """Handed to a job handler for progress reporting and cancellation checks"""
+
+    def __init__(self, job_id: UUID):
+        self.job_id = job_id
+        self._reported = 0.0
+        self._cancelled = False
+
+    def progress(self, done: int, total: Optional[int] = None, force: bool = False) -> None:
+        """Record progress (at most every JOB_PROGRESS_INTERVAL); raises JobCancelled when asked to stop"""
+        now = time.monotonic()
+        if force or now - self._reported >= JOB_PROGRESS_INTERVAL:
+            self._reported = now
+            # Own session: the handler's transaction may still be open
+            db = database.get_sync_db()
+            try:
+                self._cancelled = job_crud.job.report_progress(db, self.job_id, done, total)
+            finally:
+                db.close()
+        if self._cancelled:
+            raise JobCancelled()
+
+
+# handler(db, context, params) -> result document
+JobHandler = Callable[[Session, JobContext, Dict[str, Any]], Optional[Dict[str, Any]]]
+
+
+class JobRunner:
+    def __init__(self, workers: int = JOB_WORKERS, max_queued: int = JOB_MAX_QUEUED):
+        self.workers = workers
+        self.max_queued = max_queued
+        self.handlers: Dict[str, JobHandler] = {}
+        self._lock = threading.Lock()
+        self._running: Set[UUID] = set()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._thread: Optional[threading.Thread] = None
+        registry.gauge("fhirfly_jobs_running", "Jobs running in this process", lambda: len(self._running))
+
+    def register(self, kind: str, handler: JobHandler) -> None:
+        self.handlers[kind] = handler
+
+    def submit(self, db: Session, kind: str, params: Optional[Dict[str, Any]] = None):
+        """Queue a job of a registered kind; raises JobQueueFull when the queue is at its limit"""
+        if kind not in self.handlers:
+            raise ValueError(f"Unknown job kind '{kind}'")
+        if job_crud.job.count(db, status="queued") >= self.max_queued:
+            raise JobQueueFull(f"{self.max_queued} jobs are already queued")
+        job = job_crud.job.create(db, kind=kind, params=params)
+        self._wake.set()
+        return job
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="job")
+        self._thread = threading.Thread(target=self._dispatch, name="job-dispatcher", daemon=True)
+        self._thread.start()
+        logger.info(f"Job runner started with {self.workers} workers")
+
+    def stop(self, timeout: float = 5.0) -> None:
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._wake.set()
+        self._thread.join(timeout)
+        # Running handlers finish in the background; unfinished ones go stale
+        self._executor.shutdown(wait=False)
+        self._thread = None
+        self._executor = None
+
+    def _dispatch(self) -> None:
+        last_heartbeat = 0.0
+        last_prune = float("-inf")
+        while not self._stop.is_set():
+            self._wake.clear()
+            try:
+                if time.monotonic() - last_heartbeat >= HEARTBEAT_INTERVAL:
+                    last_heartbeat = time.monotonic()
+                    self._heartbeat()
+                if time.monotonic() - last_prune >= TOMBSTONE_PRUNE_INTERVAL:
+                    last_prune = time.monotonic()
+                    self._prune()
+                while len(self._running) < self.workers and self._claim():
+                    pass
+            except Exception as e:
+                logger.error(f"Job dispatcher error: {e}")
+            self._wake.wait(JOB_POLL_INTERVAL)
+
+    def _heartbeat(self) -> None:
+        db = database.get_sync_db()
+        try:
+            with self._lock:
+                running = list(self._running)
+            job_crud.job.heartbeat(db, running)
+            job_crud.job.fail_stale(db, JOB_STALE_SECONDS)
+        finally:
+            db.close()
+
+    def _prune(self) -> None:
+        db = database.get_sync_db()
+        try:
+            sync_crud.sync.prune_expired(db)
+        finally:
+            db.close()
+
+    def _claim(self) -> bool:
+        db = database.get_sync_db()
+        try:
+            job = job_crud.job.claim_next(db, list(self.handlers), owner=database.instance_name())
+            if not job:
+                return False
+            job_id, kind, params = job.id, job.kind, dict(job.params or {})
+        finally:
+            db.close()
+        with self._lock:
+            self._running.add(job_id)
+        self._executor.submit(self._run, job_id, kind, params)
+        return True
+
+    def _run(self, job_id: UUID, kind: str, params: Dict[str, Any]) -> None:
+        status, result, error = "completed", None, None
+        db = database.get_sync_db()
+        try:
+            logger.info(f"Running {kind} job {job_id}")
+            result = self.handlers[kind](db, JobContext(job_id), params)
+        except JobCancelled:
+            db.rollback()
+            status = "cancelled"
+        except Exception as e:
+            logger.error(f"{kind} job {job_id} failed: {e}")
+            db.rollback()
+            status, error = "failed", str(e)
+        finally:
+            db.close()
+        db = database.get_sync_db()
+        try:
+            job_crud.job.finish(db, job_id, status, result=result, error=error)
+        except Exception as e:
+            logger.error(f"Failed to record outcome of job {job_id}: {e}")
+        finally:
+            db.close()
+            with self._lock:
+                self._running.discard(job_id)
+            jobs_total.inc(kind=kind, status=status)
+            self._wake.set()
+
+
+def respond_async(request: Request) -> bool:
+    """Whether the client asked for FHIR asynchronous processing"""
+    return "respond-async" in request.headers.get("prefer", "").lower()
+
+
+def accepted_response(request: Request, job) -> JSONResponse:
+    """``202 Accepted`` pointing at the job's status URL"""
+    location = str(request.url_for("read_job", job_id=str(job.id)))
+    return JSONResponse(
+        status_code=202,
+        content=jsonable_encoder(JobSchema.model_validate(job)),
+        headers={"Content-Location": location},
+    )
+
+
+job_runner = JobRunner()
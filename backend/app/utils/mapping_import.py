@@ -0,0 +1,291 @@
+"""Bulk ConceptMap import from FHIR ConceptMap resources or CSV.
+
+Mappings arrive keyed by codes rather than concept IDs: as a FHIR
+``ConceptMap`` (or a ``Bundle`` of them) with ``group``/``element``/``target``,
+or as CSV with ``source_system,source_code,target_system,target_code`` and an
+optional ``equivalence`` column, where systems are canonical URLs or
+codesystem names.  Each batch of ``IMPORT_BATCH_SIZE`` mappings resolves all
+of its codes with one query on the (codesystem_id, code) unique index, so a
+mapping can no longer point at a concept that does not exist or belongs to
+another codesystem.  Valid rows go in with one multi-row
+``INSERT ... ON CONFLICT DO NOTHING``: mappings already stored, or repeated
+in the upload, are counted as duplicates instead of being stored twice, and
+re-running an upload is harmless.  With ``reject=True`` nothing is inserted
+if any row is invalid.
+"""
+import csv
+import io
+import os
+import uuid
+from typing import Any, Dict, Iterable, Iterator, List, NamedTuple, Optional, Set, Tuple
+from uuid import UUID
+
+from sqlalchemy.orm import Session
+
+from app.crud import concept as concept_crud, conceptmap as conceptmap_crud
+from app.utils.membership import membership_index
+import logging
+
+logger = logging.getLogger(__name__)
+
+IMPORT_BATCH_SIZE = int(os.getenv("IMPORT_BATCH_SIZE", "5000"))
+MAX_REPORTED_ERRORS = 1000
+
+# FHIR R4 ConceptMap equivalence codes
+EQUIVALENCES = {
+    "relatedto", "equivalent", "equal", "wider", "subsumes", "narrower", "specializes", "inexact", "unmatched", "disjoint"
+}
+# FHIR R5 relationship codes in R4 terms
+RELATIONSHIPS = {
+    "related-to": "relatedto",
+    "equivalent": "equivalent",
+    "source-is-narrower-than-target": "wider",
+    "source-is-broader-than-target": "narrower",
+    "not-related-to": "disjoint",
+}
+
+CSV_COLUMNS = ("source_system", "source_code", "target_system", "target_code")
+
+
+class ImportFormatError(ValueError):
+    """The upload is not a ConceptMap, Bundle or mapping CSV"""
+
+
+class MappingInput(NamedTuple):
+    location: str  # e.g. "line 12" or "ConceptMap/x group[0].element[3].target[0]"
+    source_system: Optional[str]
+    source_code: Optional[str]
+    target_system: Optional[str]
+    target_code: Optional[str]
+    equivalence: Optional[str] = None
+    source_version: Optional[str] = None
+    target_version: Optional[str] = None
+
+
+def _clean(value: Any) -> Optional[str]:
+    if value is None:
+        return None
+    value = str(value).strip()
+    return value or None
+
+
+def parse_fhir(resource: Dict[str, Any]) -> Iterator[MappingInput]:
+    """Source/target code pairs of a ConceptMap, or of every ConceptMap in a Bundle"""
+    resource_type = resource.get("resourceType") if isinstance(resource, dict) else None
+    if resource_type not in ("ConceptMap", "Bundle"):
+        raise ImportFormatError(f"Expected a ConceptMap or Bundle resource, got {resource_type!r}")
+    if resource_type == "ConceptMap":
+        conceptmaps = [resource]
+    else:
+        conceptmaps = [
+            entry["resource"]
+            for i, entry in enumerate(_objects(resource.get("entry"), "Bundle entry"))
+            if (_object(entry.get("resource"), f"Bundle entry[{i}].resource") or {}).get("resourceType") == "ConceptMap"
+        ]
+    # The whole upload is already in memory; check its shape before any row is imported
+    for conceptmap in conceptmaps:
+        _check_conceptmap(conceptmap)
+    return (mapping for conceptmap in conceptmaps for mapping in _fhir_mappings(conceptmap))
+
+
+def _object(value: Any, location: str) -> Optional[Dict[str, Any]]:
+    if value is not None and not isinstance(value, dict):
+        raise ImportFormatError(f"{location} must be an object, got {type(value).__name__}")
+    return value
+
+
+def _objects(value: Any, location: str) -> List[Dict[str, Any]]:
+    """A list of objects, or [] when absent"""
+    if value is None:
+        return []
+    if not isinstance(value, list):
+        raise ImportFormatError(f"{location} must be a list, got {type(value).__name__}")
+    for i, item in enumerate(value):
+        if not isinstance(item, dict):
+            raise ImportFormatError(f"{location}[{i}] must be an object, got {type(item).__name__}")
+    return value
+
+
+def _name(resource: Dict[str, Any]) -> str:
+    return f"ConceptMap/{resource['id']}" if resource.get("id") else "ConceptMap"
+
+
+def _check_conceptmap(resource: Dict[str, Any]) -> None:
+    name = _name(resource)
+    for g, group in enumerate(_objects(resource.get("group"), f"{name} group")):
+        for e, element in enumerate(_objects(group.get("element"), f"{name} group[{g}].element")):
+            _objects(element.get("target"), f"{name} group[{g}].element[{e}].target")
+
+
+def _fhir_mappings(resource: Dict[str, Any]) -> Iterator[MappingInput]:
+    name = _name(resource)
+    for g, group in enumerate(resource.get("group") or []):
+        for e, element in enumerate(group.get("element") or []):
+            for t, target in enumerate(element.get("target") or []):
+                equivalence = _clean(target.get("equivalence"))
+                if equivalence is None and target.get("relationship"):
+                    relationship = _clean(target["relationship"])
+                    equivalence = RELATIONSHIPS.get(relationship, relationship)
+                yield MappingInput(
+                    location=f"{name} group[{g}].element[{e}].target[{t}]",
+                    source_system=_clean(group.get("source")),
+                    source_code=_clean(element.get("code")),
+                    target_system=_clean(group.get("target")),
+                    target_code=_clean(target.get("code")),
+                    equivalence=equivalence,
+                    source_version=_clean(group.get("sourceVersion")),
+                    target_version=_clean(group.get("targetVersion")),
+                )
+
+
+def parse_csv(text: str) -> Iterator[MappingInput]:
+    """Rows of a mapping CSV; the header names the columns, in any order"""
+    reader = csv.DictReader(io.StringIO(text))
+    fields = {(name or "").strip().lower(): name for name in reader.fieldnames or []}
+    missing = [column for column in CSV_COLUMNS if column not in fields]
+    if missing:
+        raise ImportFormatError(
+            f"CSV is missing column(s): {', '.join(missing)}; expected {', '.join(CSV_COLUMNS)}[,equivalence]"
+        )
+    return _csv_mappings(reader, fields)
+
+
+def _csv_mappings(reader: csv.DictReader, fields: Dict[str, str]) -> Iterator[MappingInput]:
+    def get(row: Dict[str, str], column: str) -> Optional[str]:
+        return _clean(row.get(fields[column])) if column in fields else None
+
+    for row in reader:
+        yield MappingInput(
+            location=f"line {reader.line_num}",
+            source_system=get(row, "source_system"),
+            source_code=get(row, "source_code"),
+            target_system=get(row, "target_system"),
+            target_code=get(row, "target_code"),
+            equivalence=get(row, "equivalence") or get(row, "relationship"),
+            source_version=get(row, "source_version"),
+            target_version=get(row, "target_version"),
+        )
+
+
+class MappingImport:
+    """Resolves and inserts one upload batch by batch, collecting its report"""
+
+    def __init__(self, db: Session, reject: bool = False):
+        self.db = db
+        self.reject = reject
+        self.report: Dict[str, Any] = {"received": 0, "inserted": 0, "duplicates": 0, "invalid": 0, "errors": []}
+        self._systems: Dict[str, Optional[UUID]] = {}
+        self._seen: Set[Tuple[UUID, UUID]] = set()
+        # Held back until every row is known to be valid
+        self._pending: List[Dict[str, Any]] = []
+
+    def _error(self, mapping: MappingInput, message: str) -> None:
+        self.report["invalid"] += 1
+        if len(self.report["errors"]) < MAX_REPORTED_ERRORS:
+            self.report["errors"].append({
+                "location": mapping.location,
+                "source": f"{mapping.source_system}|{mapping.source_code}",
+                "target": f"{mapping.target_system}|{mapping.target_code}",
+                "error": message,
+            })
+
+    def _system(self, system: str, version: Optional[str]) -> Tuple[Optional[UUID], Optional[str]]:
+        """Codesystem ID of a URL or name, or the reason it cannot be used"""
+        if system not in self._systems:
+            self._systems[system] = membership_index.resolve_system(self.db, system)
+        codesystem_id = self._systems[system]
+        if codesystem_id is None:
+            return None, f"Unknown codesystem '{system}'"
+        stored = membership_index.version_of(codesystem_id)
+        if version and stored and version != stored:
+            return None, f"Codesystem '{system}' is at version {stored}, not {version}"
+        return codesystem_id, None
+
+    def add(self, batch: List[MappingInput]) -> None:
+        self.report["received"] += len(batch)
+        candidates = []
+        for mapping in batch:
+            if not (mapping.source_system and mapping.source_code and mapping.target_system and mapping.target_code):
+                self._error(mapping, "Source and target system and code are required")
+                continue
+            if mapping.equivalence and mapping.equivalence not in EQUIVALENCES:
+                self._error(mapping, f"Unknown equivalence '{mapping.equivalence}'")
+                continue
+            source_id, problem = self._system(mapping.source_system, mapping.source_version)
+            target_id, target_problem = self._system(mapping.target_system, mapping.target_version)
+            if problem or target_problem:
+                self._error(mapping, problem or target_problem)
+                continue
+            candidates.append((mapping, source_id, target_id))
+
+        concept_ids = concept_crud.concept.get_ids_by_codings(self.db, sorted({
+            coding
+            for mapping, source_id, target_id in candidates
+            for coding in ((source_id, mapping.source_code), (target_id, mapping.target_code))
+        }))
+
+        rows = []
+        for mapping, source_id, target_id in candidates:
+            source_concept = concept_ids.get((source_id, mapping.source_code))
+            target_concept = concept_ids.get((target_id, mapping.target_code))
+            if source_concept is None or target_concept is None:
+                unknown = mapping.source_code if source_concept is None else mapping.target_code
+                system = mapping.source_system if source_concept is None else mapping.target_system
+                self._error(mapping, f"Unknown code '{unknown}' in '{system}'")
+                continue
+            if (source_concept, target_concept) in self._seen:
+                self.report["duplicates"] += 1
+                continue
+            self._seen.add((source_concept, target_concept))
+            rows.append({
+                "id": uuid.uuid4(),
+                "source_codesystem_id": source_id,
+                "target_codesystem_id": target_id,
+                "source_code": source_concept,
+                "target_code": target_concept,
+                "equivalence": mapping.equivalence,
+            })
+        # The session only read; end its transaction before the next batch
+        self.db.rollback()
+
+        if self.reject:
+            self._pending.extend(rows)
+        else:
+            self._insert(rows)
+
+    def _insert(self, rows: List[Dict[str, Any]]) -> None:
+        for start in range(0, len(rows), IMPORT_BATCH_SIZE):
+            chunk = rows[start:start + IMPORT_BATCH_SIZE]
+            inserted = conceptmap_crud.conceptmap.bulk_create(self.db, chunk)
+            self.report["inserted"] += inserted
+            self.report["duplicates"] += len(chunk) - inserted
+
+    def finish(self) -> Dict[str, Any]:
+        if self.reject:
+            if self.report["invalid"]:
+                self.report["rejected"] = True
+            else:
+                self._insert(self._pending)
+            self._pending = []
+        return self.report
+
+
+def import_mappings(
+    db: Session, mappings: Iterable[MappingInput], reject: bool = False, batch_size: int = IMPORT_BATCH_SIZE
+) -> Dict[str, Any]:
+    """Validate and insert ``mappings``; returns received/inserted/duplicates/invalid counts and the errors"""
+    importer = MappingImport(db, reject=reject)
+    batch: List[MappingInput] = []
+    for mapping in mappings:
+        batch.append(mapping)
+        if len(batch) >= batch_size:
+            importer.add(batch)
+            batch = []
+    if batch:
+        importer.add(batch)
+    report = importer.finish()
+    logger.info(
+        f"Imported {report['inserted']} of {report['received']} mappings "
+        f"({report['duplicates']} duplicates, {report['invalid']} invalid)"
+    )
+    return report
@@ -0,0 +1,181 @@
+"""In-memory code membership index used by $lookup and $validate-code.
+
+Each codesystem gets a hash set of its codes with a Bloom filter in front of
+it, so a code that does not exist is rejected without touching Postgres.  The
+index is filled lazily per codesystem (or eagerly via ``warm``) and kept in
+sync with concept writes through ``app.utils.events``.
+"""
+import hashlib
+import math
+import threading
+from typing import Dict, Optional, Set, Tuple
+from uuid import UUID
+
+from sqlalchemy.orm import Session
+
+from app.models import CodeSystem, Concept
+from app.utils.cache import read_cache
+from app.utils.events import ChangeEvent, is_bulk, on_resync, subscribe
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class BloomFilter:
+    """Fixed-size Bloom filter over strings using double hashing"""
+
+    def __init__(self, capacity: int, error_rate: float = 0.01):
+        capacity = max(capacity, 1024)
+        self.capacity = capacity
+        self.size = int(-capacity * math.log(error_rate) / (math.log(2) ** 2))
+        self.hash_count = max(int(round(self.size / capacity * math.log(2))), 1)
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, item: str):
+        digest = hashlib.blake2b(item.encode("utf-8"), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        for i in range(self.hash_count):
+            yield (h1 + i * h2) % self.size
+
+    def add(self, item: str) -> None:
+        for pos in self._positions(item):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+        self.count += 1
+
+    def __contains__(self, item: str) -> bool:
+        return all(self.bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(item))
+
+
+class CodeSystemMembership:
+    """Codes of one codesystem"""
+
+    def __init__(self, codesystem_id: UUID, codes: Set[str]):
+        self.codesystem_id = codesystem_id
+        self.codes = codes
+        self._rebuild_bloom()
+
+    def _rebuild_bloom(self) -> None:
+        self.bloom = BloomFilter(capacity=len(self.codes) * 2)
+        for code in self.codes:
+            self.bloom.add(code)
+
+    def __contains__(self, code: str) -> bool:
+        # The Bloom filter answers most misses; the set settles false positives
+        # and codes that were deleted after being added to the filter.
+        return code in self.bloom and code in self.codes
+
+    def add(self, code: str) -> None:
+        if code in self.codes:
+            return
+        self.codes.add(code)
+        if self.bloom.count >= self.bloom.capacity:
+            self._rebuild_bloom()
+        else:
+            self.bloom.add(code)
+
+    def discard(self, code: str) -> None:
+        self.codes.discard(code)
+
+
+class CodeMembershipIndex:
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._members: Dict[UUID, CodeSystemMembership] = {}
+        # canonical URL or name -> codesystem id
+        self._systems: Dict[str, UUID] = {}
+        self._versions: Dict[UUID, Optional[str]] = {}
+
+    def _remember_codesystem(self, codesystem: CodeSystem) -> None:
+        self._remember(codesystem.id, codesystem.url, codesystem.name, codesystem.version)
+
+    def _remember(self, codesystem_id: UUID, url: Optional[str], name: Optional[str], version: Optional[str]) -> None:
+        if url:
+            self._systems[url] = codesystem_id
+        if name:
+            self._systems.setdefault(name, codesystem_id)
+        self._versions[codesystem_id] = version
+
+    def _find_system(self, db: Session, system: str) -> Optional[Tuple[UUID, Optional[str], Optional[str], Optional[str]]]:
+        columns = (CodeSystem.id, CodeSystem.url, CodeSystem.name, CodeSystem.version)
+        row = db.query(*columns).filter(CodeSystem.url == system).first()
+        if not row:
+            row = db.query(*columns).filter(CodeSystem.name == system).first()
+        return tuple(row) if row else None
+
+    def resolve_system(self, db: Session, system: str) -> Optional[UUID]:
+        """Resolve a canonical URL (or name) to a codesystem ID"""
+        with self._lock:
+            if system in self._systems:
+                return self._systems[system]
+        # Shared with the other nodes through the read cache
+        found = read_cache.get("codesystem", system, lambda: self._find_system(db, system))
+        if not found:
+            return None
+        with self._lock:
+            self._remember(*found)
+        return found[0]
+
+    def version_of(self, codesystem_id: UUID) -> Optional[str]:
+        with self._lock:
+            return self._versions.get(codesystem_id)
+
+    def _load(self, db: Session, codesystem_id: UUID) -> CodeSystemMembership:
+        codes = {row[0] for row in db.query(Concept.code).filter(Concept.codesystem_id == codesystem_id).yield_per(10000)}
+        members = CodeSystemMembership(codesystem_id, codes)
+        self._members[codesystem_id] = members
+        logger.info(f"Loaded {len(codes)} codes into membership index for codesystem {codesystem_id}")
+        return members
+
+    def contains(self, db: Session, codesystem_id: UUID, code: str) -> bool:
+        """Whether ``code`` exists in the codesystem, loading it on first use"""
+        members = self._members.get(codesystem_id)
+        if members is None:
+            with self._lock:
+                members = self._members.get(codesystem_id) or self._load(db, codesystem_id)
+        return code in members
+
+    def warm(self, db: Session) -> None:
+        """Load every codesystem up front"""
+        with self._lock:
+            for codesystem in db.query(CodeSystem).all():
+                self._remember_codesystem(codesystem)
+                if codesystem.id not in self._members:
+                    self._load(db, codesystem.id)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._members.clear()
+            self._systems.clear()
+            self._versions.clear()
+
+    def on_concept_change(self, event: ChangeEvent) -> None:
+        with self._lock:
+            if is_bulk(event):
+                for keys in (event.old, event.new):
+                    if keys:
+                        self._members.pop(keys["codesystem_id"], None)
+                return
+            if event.old:
+                members = self._members.get(event.old["codesystem_id"])
+                if members is not None:
+                    members.discard(event.old["code"])
+            if event.new:
+                members = self._members.get(event.new["codesystem_id"])
+                if members is not None:
+                    members.add(event.new["code"])
+
+    def on_codesystem_change(self, event: ChangeEvent) -> None:
+        # URLs, names and versions are re-resolved lazily after any change
+        with self._lock:
+            self._systems = {k: v for k, v in self._systems.items() if v != event.record_id}
+            self._versions.pop(event.record_id, None)
+            if event.operation == "DELETE":
+                self._members.pop(event.record_id, None)
+
+
+membership_index = CodeMembershipIndex()
+subscribe("concept", membership_index.on_concept_change)
+subscribe("codesystem", membership_index.on_codesystem_change)
+on_resync(membership_index.clear)
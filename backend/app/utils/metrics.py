@@ -0,0 +1,78 @@
+"""Process-local counters and gauges rendered in the Prometheus text format"""
+import threading
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+def _labels(key: LabelKey) -> str:
+    if not key:
+        return ""
+    return "{" + ",".join(f'{name}="{value}"' for name, value in key) + "}"
+
+
+class Counter:
+    def __init__(self, name: str, help: str):
+        self.name = name
+        self.help = help
+        self._lock = threading.Lock()
+        self._values: Dict[LabelKey, float] = {}
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels: str) -> float:
+        return self._values.get(tuple(sorted(labels.items())), 0)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            lines.extend(f"{self.name}{_labels(key)} {value:g}" for key, value in sorted(self._values.items()))
+        return lines
+
+
+class Gauge:
+    """Value read from a callback at scrape time.
+
+    With ``label`` the callback returns ``{label value: value}`` instead,
+    rendered as one sample per label value.
+    """
+
+    def __init__(self, name: str, help: str, read: Callable[[], Any], label: Optional[str] = None):
+        self.name = name
+        self.help = help
+        self.read = read
+        self.label = label
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} gauge"]
+        if self.label is None:
+            lines.append(f"{self.name} {self.read():g}")
+        else:
+            lines.extend(
+                f"{self.name}{_labels(((self.label, str(key)),))} {value:g}"
+                for key, value in sorted(self.read().items())
+            )
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, object] = {}
+
+    def counter(self, name: str, help: str) -> Counter:
+        return self._metrics.setdefault(name, Counter(name, help))
+
+    def gauge(self, name: str, help: str, read: Callable[[], Any], label: Optional[str] = None) -> Gauge:
+        return self._metrics.setdefault(name, Gauge(name, help, read, label))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
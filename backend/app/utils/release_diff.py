@@ -0,0 +1,93 @@
+"""Added, changed and removed concepts of an incoming codesystem release.
+
+The stored side is read once as ``code -> content_hash``; that map is the
+build side of a hash join.  Incoming concepts are probed against it as they
+are parsed, in chunks and possibly in several worker processes, so the
+release itself is never held in memory: only the codes seen and the rows
+that differ are kept.
+A concept is *added* when its code is not stored, *changed* when its content
+hash differs (a stored hash of ``NULL``, e.g. after an API edit, always
+differs), and *removed* when a stored code never appears in the release.
+"""
+from typing import Any, Dict, Iterable, List, Optional, Set
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from app.models import Concept
+
+# Codes of each set kept in a release summary
+SUMMARY_CODES = 1000
+
+StoredHashes = Dict[str, Optional[str]]
+
+
+def stored_hashes(db: Session, codesystem_id) -> StoredHashes:
+    """Content hash of every stored concept of the codesystem"""
+    rows = db.execute(
+        select(Concept.code, Concept.content_hash).where(Concept.codesystem_id == codesystem_id),
+        execution_options={"yield_per": 10000},
+    )
+    return {code: content_hash for code, content_hash in rows}
+
+
+def probe(stored: StoredHashes, rows: Iterable[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Rows of an incoming chunk that are new or differ from the stored concept"""
+    # The () default never equals a hash, so unknown codes always count as new
+    return [row for row in rows if stored.get(row["code"], ()) != row["content_hash"]]
+
+
+class ReleaseDiff:
+    """Accumulates probed chunks of one release into its added, changed and removed sets"""
+
+    def __init__(self, stored: StoredHashes):
+        self.stored = stored
+        self.seen: Set[str] = set()
+        self.added: Dict[str, Dict[str, Any]] = {}
+        self.changed: Dict[str, Dict[str, Any]] = {}
+        self.duplicates = 0
+
+    def merge(self, codes: List[str], delta: List[Dict[str, Any]]) -> None:
+        """Record a chunk: every code it contained and its rows returned by ``probe``"""
+        for code in codes:
+            if code in self.seen:
+                self.duplicates += 1
+            self.seen.add(code)
+        for row in delta:
+            # A code repeated in the release: the last occurrence wins
+            (self.changed if row["code"] in self.stored else self.added)[row["code"]] = row
+
+    def add(self, rows: List[Dict[str, Any]]) -> None:
+        self.merge([row["code"] for row in rows], probe(self.stored, rows))
+
+    @property
+    def removed(self) -> List[str]:
+        return sorted(code for code in self.stored if code not in self.seen)
+
+    @property
+    def unchanged(self) -> int:
+        return len(self.seen) - len(self.added) - len(self.changed)
+
+    @property
+    def upserts(self) -> List[Dict[str, Any]]:
+        return list(self.added.values()) + list(self.changed.values())
+
+    def counts(self) -> Dict[str, int]:
+        return {
+            "added": len(self.added),
+            "changed": len(self.changed),
+            "removed": len(self.stored) - len(self.stored.keys() & self.seen),
+            "unchanged": self.unchanged,
+            "duplicates": self.duplicates,
+        }
+
+    def summary(self, limit: int = SUMMARY_CODES) -> Dict[str, Any]:
+        """Counts plus the first ``limit`` codes of each set, in code order"""
+        return {
+            **self.counts(),
+            "codes": {
+                "added": sorted(self.added)[:limit],
+                "changed": sorted(self.changed)[:limit],
+                "removed": self.removed[:limit],
+            },
+        }
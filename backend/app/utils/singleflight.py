@@ -0,0 +1,169 @@
+"""Single-flight coalescing of identical concurrent reads.
+
+When a popular code is looked up or many tabs fire the same search, each
+request would otherwise run the same page, count and mapping queries.  This
+ASGI middleware lets the first request for a key (method, normalized path,
+sorted query string and, for POST, the canonical JSON body) run; identical
+requests arriving while it is in flight wait for it and are answered with a
+copy of its serialized response.  Waiting is bounded: a follower that has
+not been answered within ``SINGLE_FLIGHT_WAIT`` seconds, or whose leader
+failed, lost its client or ran out of its own deadline, runs the request
+itself.  Any terminology write
+ends the sharing of reads already in flight, so requests made after a write
+never get a response computed before it.  Only the routes in
+``COALESCED_ROUTES`` are coalesced, and only within one worker process.
+"""
+import asyncio
+import hashlib
+import json
+import os
+import re
+import weakref
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import parse_qsl, urlencode
+
+from app.utils.events import ChangeEvent, subscribe
+from app.utils.metrics import registry
+import logging
+
+logger = logging.getLogger(__name__)
+
+SINGLE_FLIGHT_ENABLED = os.getenv("SINGLE_FLIGHT_ENABLED", "true").lower() == "true"
+SINGLE_FLIGHT_WAIT = float(os.getenv("SINGLE_FLIGHT_WAIT", "5.0"))
+
+COALESCED_ROUTES: List[Tuple[str, str]] = [
+    ("GET", r"/api/v1/concepts"),
+    ("GET", r"/api/v1/concepts/by-code/[^/]+/[^/]+"),
+    ("POST", r"/api/v1/conceptmaps/translate"),
+    ("GET", r"/api/v1/codesystems"),
+]
+
+requests_total = registry.counter(
+    "fhirfly_singleflight_requests_total",
+    "Coalescable requests by role: leader (ran the handler), collapsed (shared a leader's response), "
+    "timeout or failed (waited, then ran the handler itself)",
+)
+
+# status, headers, body
+CapturedResponse = Tuple[int, List[Tuple[bytes, bytes]], bytes]
+
+# Answers that depend on the leader's own deadline or load, not on the request
+UNSHARED_STATUSES = (503, 504)
+
+
+def _canonical_body(body: bytes) -> bytes:
+    try:
+        return json.dumps(json.loads(body), sort_keys=True, separators=(",", ":")).encode("utf-8")
+    except ValueError:
+        return body
+
+
+class SingleFlightMiddleware:
+    def __init__(self, app, routes: List[Tuple[str, str]] = COALESCED_ROUTES, wait: float = SINGLE_FLIGHT_WAIT):
+        self.app = app
+        self.routes = [(method, re.compile(pattern + "/?")) for method, pattern in routes]
+        self.wait = wait
+        self._inflight: Dict[str, "asyncio.Future[Optional[CapturedResponse]]"] = {}
+        _middlewares.add(self)
+
+    def on_change(self, event: ChangeEvent) -> None:
+        # Running requests finish normally; new arrivals start a fresh flight
+        self._inflight.clear()
+
+    def _coalesced(self, scope) -> bool:
+        return any(scope["method"] == method and pattern.fullmatch(scope["path"]) for method, pattern in self.routes)
+
+    def _key(self, scope, body: bytes) -> str:
+        query = urlencode(sorted(parse_qsl(scope.get("query_string", b"").decode("latin-1"), keep_blank_values=True)))
+        digest = hashlib.sha256(_canonical_body(body)).hexdigest() if body else ""
+        return f"{scope['method']} {scope['path'].rstrip('/')}?{query} {digest}"
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self._coalesced(scope):
+            await self.app(scope, receive, send)
+            return
+
+        body = b""
+        if scope["method"] == "POST":
+            more = True
+            while more:
+                message = await receive()
+                if message["type"] == "http.disconnect":
+                    return
+                body += message.get("body", b"")
+                more = message.get("more_body", False)
+        replayed = False
+        client_gone = False
+
+        async def replay_receive():
+            nonlocal replayed, client_gone
+            if not replayed:
+                replayed = True
+                return {"type": "http.request", "body": body, "more_body": False}
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                client_gone = True
+            return message
+
+        key = self._key(scope, body)
+        leader = self._inflight.get(key)
+        if leader is not None:
+            try:
+                result = await asyncio.wait_for(asyncio.shield(leader), self.wait)
+            except asyncio.TimeoutError:
+                result = None
+                requests_total.inc(role="timeout")
+            else:
+                requests_total.inc(role="collapsed" if result is not None else "failed")
+            if result is not None:
+                await self._send(send, result)
+                return
+            await self.app(scope, replay_receive, send)
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        requests_total.inc(role="leader")
+        result = None
+        try:
+            result = await self._capture(scope, replay_receive)
+        finally:
+            if self._inflight.get(key) is future:
+                self._inflight.pop(key, None)
+            # None tells followers to run the request themselves.  A leader
+            # whose client went away may have had its work cancelled, and a
+            # 503/504 reflects the leader's deadline, so neither is shared.
+            shared = not client_gone and result is not None and result[0] not in UNSHARED_STATUSES
+            future.set_result(result if shared else None)
+        await self._send(send, result)
+
+    async def _capture(self, scope, receive) -> CapturedResponse:
+        status, headers, chunks = 500, [], []
+
+        async def capture_send(message):
+            nonlocal status, headers
+            if message["type"] == "http.response.start":
+                status, headers = message["status"], list(message.get("headers", []))
+            elif message["type"] == "http.response.body":
+                chunks.append(message.get("body", b""))
+
+        await self.app(scope, receive, capture_send)
+        return status, headers, b"".join(chunks)
+
+    async def _send(self, send, result: CapturedResponse) -> None:
+        status, headers, body = result
+        await send({"type": "http.response.start", "status": status, "headers": headers})
+        await send({"type": "http.response.body", "body": body, "more_body": False})
+
+
+# Instances ended by a write; a rebuilt middleware stack leaves no subscriber behind
+_middlewares: "weakref.WeakSet[SingleFlightMiddleware]" = weakref.WeakSet()
+
+
+def _on_change(event: ChangeEvent) -> None:
+    for middleware in list(_middlewares):
+        middleware.on_change(event)
+
+
+for _table in ("codesystem", "concept", "conceptmap"):
+    subscribe(_table, _on_change)
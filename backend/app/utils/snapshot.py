@@ -0,0 +1,377 @@
+"""Memory-mapped translation snapshot shared by all worker processes.
+
+The ``conceptmap`` table and the concept code <-> UUID maps are serialised
+into one file of sorted, fixed-width columns.  Each worker maps the file
+read-only and answers translate and enrichment lookups with
+``np.searchsorted`` over the mapped columns, so the mapping data sits once in
+the page cache however many workers run, and nothing is deserialised.
+
+Layout (little-endian, every column 8-byte aligned after a 64-byte header):
+
+    header          magic, format, code width, snapshot version, row counts
+    equivalence     JSON list of the distinct equivalence strings
+    maps            source_code (sorted), target_code, source/target
+                    codesystem ids, equivalence index
+    maps_by_target  target_code (sorted) and row numbers into ``maps``
+    concepts        codesystem id + code key (sorted) and concept id
+    concepts_by_id  concept id (sorted) and row numbers into ``concepts``
+
+Builds hold an exclusive lock next to the file, write a temp file and rename
+it into place.  A worker starts a full rebuild at most once per
+``SNAPSHOT_MIN_INTERVAL`` seconds; lookups use the database in between.  Readers stat the path at most once per
+``SNAPSHOT_CHECK_INTERVAL`` seconds and switch when the file changes.
+"""
+import fcntl
+import json
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+from uuid import UUID
+
+import numpy as np
+from sqlalchemy.orm import Session
+
+from app.models import Concept, ConceptMap
+from app.utils.events import ChangeEvent, on_resync, subscribe
+import logging
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_PATH = os.getenv("TRANSLATION_SNAPSHOT_PATH", "")
+SNAPSHOT_REBUILD_DELAY = float(os.getenv("SNAPSHOT_REBUILD_DELAY", "2"))
+SNAPSHOT_MIN_INTERVAL = float(os.getenv("SNAPSHOT_MIN_INTERVAL", "30"))
+SNAPSHOT_CHECK_INTERVAL = 1.0
+
+MAGIC = b"FHIRSNAP"
+FORMAT_VERSION = 1
+# magic, format, code width, snapshot version, maps, concepts, equivalence bytes
+HEADER = struct.Struct("<8sIIQQQQ")
+HEADER_SIZE = 64
+
+
+class SnapshotMapping(NamedTuple):
+    source_codesystem_id: UUID
+    target_codesystem_id: UUID
+    source_code: UUID
+    target_code: UUID
+    equivalence: Optional[str]
+
+
+def _layout(n_maps: int, n_concepts: int, code_width: int, equivalence_size: int) -> Tuple[Dict[str, Tuple[int, np.dtype, int]], int]:
+    """Offset, dtype and length of every column, and the total file size"""
+    columns = [
+        ("equivalence", "S1", equivalence_size),
+        ("source_code", "S16", n_maps),
+        ("target_code", "S16", n_maps),
+        ("source_codesystem_id", "S16", n_maps),
+        ("target_codesystem_id", "S16", n_maps),
+        ("equivalence_index", "<u2", n_maps),
+        ("target_sorted", "S16", n_maps),
+        ("target_rows", "<u4", n_maps),
+        ("concept_key", f"S{16 + code_width}", n_concepts),
+        ("concept_id", "S16", n_concepts),
+        ("id_sorted", "S16", n_concepts),
+        ("id_rows", "<u4", n_concepts),
+    ]
+    layout = {}
+    offset = HEADER_SIZE
+    for name, dtype, count in columns:
+        dtype = np.dtype(dtype)
+        layout[name] = (offset, dtype, count)
+        offset = (offset + dtype.itemsize * count + 7) & ~7
+    return layout, offset
+
+
+def _uuid(value: bytes) -> UUID:
+    # numpy drops trailing NUL bytes of "S" items
+    return UUID(bytes=value.ljust(16, b"\0"))
+
+
+def _concept_key(codesystem_id: UUID, code: str) -> bytes:
+    return codesystem_id.bytes + code.encode("utf-8")
+
+
+class TranslationSnapshot:
+    """Read-only view over one snapshot file"""
+
+    def __init__(self, path: str):
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, fmt, code_width, version, n_maps, n_concepts, equivalence_size = HEADER.unpack_from(self._mmap, 0)
+        if magic != MAGIC or fmt != FORMAT_VERSION:
+            raise ValueError(f"{path} is not a version {FORMAT_VERSION} translation snapshot")
+        layout, size = _layout(n_maps, n_concepts, code_width, equivalence_size)
+        if len(self._mmap) < size:
+            raise ValueError(f"{path} is truncated")
+        columns = {
+            name: np.frombuffer(self._mmap, dtype=dtype, count=count, offset=offset) if count else np.empty(0, dtype)
+            for name, (offset, dtype, count) in layout.items()
+        }
+        self.version = version
+        self.code_width = code_width
+        self.equivalences: List[Optional[str]] = json.loads(columns.pop("equivalence").tobytes() or b"[]")
+        self._columns = columns
+        self.map_count = n_maps
+        self.concept_count = n_concepts
+
+    def _range(self, column: str, key: bytes) -> range:
+        values = self._columns[column]
+        return range(int(np.searchsorted(values, key, "left")), int(np.searchsorted(values, key, "right")))
+
+    def _mapping(self, row: int) -> SnapshotMapping:
+        c = self._columns
+        return SnapshotMapping(
+            source_codesystem_id=_uuid(c["source_codesystem_id"][row]),
+            target_codesystem_id=_uuid(c["target_codesystem_id"][row]),
+            source_code=_uuid(c["source_code"][row]),
+            target_code=_uuid(c["target_code"][row]),
+            equivalence=self.equivalences[c["equivalence_index"][row]],
+        )
+
+    def translate(self, source_codesystem_id: UUID, target_codesystem_id: UUID, source_code: UUID) -> Optional[SnapshotMapping]:
+        """First mapping of ``source_code`` between the two codesystems"""
+        for row in self._range("source_code", source_code.bytes):
+            mapping = self._mapping(row)
+            if mapping.source_codesystem_id == source_codesystem_id and mapping.target_codesystem_id == target_codesystem_id:
+                return mapping
+        return None
+
+    def mappings_for_concepts(self, concept_ids: Iterable[UUID]) -> List[SnapshotMapping]:
+        """Mappings whose source or target is one of ``concept_ids``"""
+        rows = set()
+        for concept_id in concept_ids:
+            rows.update(self._range("source_code", concept_id.bytes))
+            target_rows = self._columns["target_rows"]
+            rows.update(int(target_rows[i]) for i in self._range("target_sorted", concept_id.bytes))
+        return [self._mapping(row) for row in sorted(rows)]
+
+    def concept_id(self, codesystem_id: UUID, code: str) -> Optional[UUID]:
+        """UUID of a concept by codesystem and code"""
+        key = _concept_key(codesystem_id, code)
+        if len(key) > 16 + self.code_width:
+            return None
+        found = self._range("concept_key", key)
+        return _uuid(self._columns["concept_id"][found[0]]) if found else None
+
+    def concept_code(self, concept_id: UUID) -> Optional[Tuple[UUID, str]]:
+        """(codesystem id, code) of a concept by UUID"""
+        found = self._range("id_sorted", concept_id.bytes)
+        if not found:
+            return None
+        key = self._columns["concept_key"][int(self._columns["id_rows"][found[0]])]
+        return UUID(bytes=key[:16]), key[16:].decode("utf-8")
+
+
+@contextmanager
+def _build_lock(path: str):
+    with open(path + ".lock", "a") as lock:
+        fcntl.flock(lock.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock.fileno(), fcntl.LOCK_UN)
+
+
+def build_snapshot(db: Session, path: str) -> int:
+    """Write a snapshot of the current mappings and concept codes to ``path``; returns its version"""
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    with _build_lock(path):
+        version = time.time_ns()
+        maps = db.query(
+            ConceptMap.source_code, ConceptMap.target_code,
+            ConceptMap.source_codesystem_id, ConceptMap.target_codesystem_id, ConceptMap.equivalence
+        ).all()
+        concepts = db.query(Concept.id, Concept.codesystem_id, Concept.code).all()
+
+        equivalences = sorted({m.equivalence for m in maps}, key=lambda e: (e is not None, e or ""))
+        equivalence_index = {e: i for i, e in enumerate(equivalences)}
+        source_code = np.array([m.source_code.bytes for m in maps], dtype="S16")
+        order = np.argsort(source_code, kind="stable")
+        columns = {
+            "source_code": source_code[order],
+            "target_code": np.array([m.target_code.bytes for m in maps], dtype="S16")[order],
+            "source_codesystem_id": np.array([m.source_codesystem_id.bytes for m in maps], dtype="S16")[order],
+            "target_codesystem_id": np.array([m.target_codesystem_id.bytes for m in maps], dtype="S16")[order],
+            "equivalence_index": np.array([equivalence_index[m.equivalence] for m in maps], dtype="<u2")[order],
+        }
+        columns["target_rows"] = np.argsort(columns["target_code"], kind="stable").astype("<u4")
+        columns["target_sorted"] = columns["target_code"][columns["target_rows"]]
+
+        keys = [_concept_key(c.codesystem_id, c.code) for c in concepts]
+        code_width = max((len(k) - 16 for k in keys), default=1) or 1
+        concept_key = np.array(keys, dtype=f"S{16 + code_width}")
+        order = np.argsort(concept_key, kind="stable")
+        columns["concept_key"] = concept_key[order]
+        columns["concept_id"] = np.array([c.id.bytes for c in concepts], dtype="S16")[order]
+        columns["id_rows"] = np.argsort(columns["concept_id"], kind="stable").astype("<u4")
+        columns["id_sorted"] = columns["concept_id"][columns["id_rows"]]
+
+        equivalence_bytes = json.dumps(equivalences).encode("utf-8")
+        columns["equivalence"] = np.frombuffer(equivalence_bytes, dtype="S1")
+        layout, size = _layout(len(maps), len(concepts), code_width, len(equivalence_bytes))
+
+        fd, tmp = tempfile.mkstemp(prefix=".snapshot-", dir=directory)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(HEADER.pack(MAGIC, FORMAT_VERSION, code_width, version, len(maps), len(concepts), len(equivalence_bytes)))
+                for name, (offset, dtype, count) in layout.items():
+                    f.seek(offset)
+                    f.write(np.ascontiguousarray(columns[name], dtype=dtype).tobytes())
+                f.truncate(size)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, path)
+        except Exception:
+            if os.path.exists(tmp):
+                os.unlink(tmp)
+            raise
+    logger.info(f"Wrote translation snapshot {version} with {len(maps)} mappings and {len(concepts)} concepts to {path}")
+    return version
+
+
+class SnapshotStore:
+    """The current snapshot of this process, reloaded when the file is replaced"""
+
+    def __init__(self, path: str = SNAPSHOT_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._snapshot: Optional[TranslationSnapshot] = None
+        self._identity: Optional[Tuple[int, int, int]] = None
+        self._checked = 0.0
+        self._timer: Optional[threading.Timer] = None
+        # Set between a local write and the rebuild that includes it; callers
+        # fall back to the database meanwhile so they read their own writes
+        self._dirty = False
+        # Local writes seen so far; a rebuild clears _dirty only if none
+        # arrived while it read the database
+        self._writes = 0
+        self._last_build = float("-inf")
+        # After another worker's write, snapshots started before this
+        # time_ns() are stale; the writer rebuilds the shared file
+        self._stale_before = 0
+
+    def current(self) -> Optional[TranslationSnapshot]:
+        """The snapshot to answer from, or ``None`` to use the database"""
+        if not self.path or self._dirty:
+            return None
+        now = time.monotonic()
+        if now - self._checked >= SNAPSHOT_CHECK_INTERVAL:
+            self._checked = now
+            self._refresh()
+        if self._snapshot is not None and self._snapshot.version < self._stale_before:
+            return None
+        return self._snapshot
+
+    def _refresh(self) -> None:
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return
+        identity = (st.st_ino, st.st_mtime_ns, st.st_size)
+        if identity == self._identity:
+            return
+        with self._lock:
+            try:
+                snapshot = TranslationSnapshot(self.path)
+            except (OSError, ValueError) as e:
+                logger.warning(f"Could not open translation snapshot {self.path}: {e}")
+                return
+            if self._snapshot is None or snapshot.version != self._snapshot.version:
+                logger.info(f"Using translation snapshot {snapshot.version} ({snapshot.map_count} mappings)")
+            # The previous mapping is released once in-flight lookups drop it
+            self._snapshot, self._identity = snapshot, identity
+
+    def rebuild(self, db: Session) -> Optional[TranslationSnapshot]:
+        """Rebuild the snapshot file from the database and switch to it"""
+        writes = self._writes
+        self._last_build = time.monotonic()
+        build_snapshot(db, self.path)
+        self._checked = time.monotonic()
+        self._refresh()
+        with self._lock:
+            if self._writes == writes:
+                self._dirty = False
+        return self._snapshot
+
+    def ensure(self, db: Session) -> None:
+        """Build the snapshot if no worker has written one yet"""
+        if self.path and not os.path.exists(self.path):
+            self.rebuild(db)
+
+    def _rebuild_in_background(self) -> None:
+        from app.db import get_sync_db
+        if not self._dirty:
+            # Only remote writes pending: skip if their worker already rebuilt
+            self._refresh()
+            if self._snapshot is not None and self._snapshot.version >= self._stale_before:
+                return
+        db = get_sync_db()
+        try:
+            self.rebuild(db)
+        except Exception as e:
+            logger.error(f"Failed to rebuild translation snapshot: {e}")
+            if self._dirty:
+                self._schedule(SNAPSHOT_REBUILD_DELAY)
+        finally:
+            db.close()
+
+    def schedule_rebuild(self) -> None:
+        """Rebuild after ``SNAPSHOT_REBUILD_DELAY`` seconds without further writes,
+        and no sooner than ``SNAPSHOT_MIN_INTERVAL`` after the last rebuild"""
+        with self._lock:
+            self._dirty = True
+            self._writes += 1
+        self._schedule(SNAPSHOT_REBUILD_DELAY)
+
+    def _schedule(self, delay: float) -> None:
+        delay = max(delay, self._last_build + SNAPSHOT_MIN_INTERVAL - time.monotonic())
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+            self._timer = threading.Timer(delay, self._rebuild_in_background)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def on_change(self, event: ChangeEvent) -> None:
+        if not self.path:
+            return
+        if event.remote:
+            self.mark_stale()
+        else:
+            self.schedule_rebuild()
+
+    def mark_stale(self) -> None:
+        """Use the database until a snapshot newer than now is available,
+        rebuilding here if no other worker has written one in time"""
+        if not self.path:
+            return
+        self._stale_before = time.time_ns()
+        if not self._dirty:
+            self._schedule(2 * SNAPSHOT_REBUILD_DELAY)
+
+
+snapshot_store = SnapshotStore()
+subscribe("conceptmap", snapshot_store.on_change)
+subscribe("concept", snapshot_store.on_change)
+on_resync(snapshot_store.mark_stale)
+
+
+if __name__ == "__main__":
+    import sys
+    from app.db import get_sync_db
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+    target = sys.argv[1] if len(sys.argv) > 1 else SNAPSHOT_PATH
+    if not target:
+        sys.exit("usage: python -m app.utils.snapshot PATH (or set TRANSLATION_SNAPSHOT_PATH)")
+    session = get_sync_db()
+    try:
+        build_snapshot(session, target)
+    finally:
+        session.close()
@@ -0,0 +1,361 @@
+"""TF-IDF mapping suggestions between code systems.
+
+The concepts of a target codesystem are vectorised once into an L2-normalised
+sparse matrix of word and character n-gram TF-IDF weights over ``display``
+and ``definition``.  Source concepts are vectorised with the same vocabulary
+and scored in batches, one sparse matrix product per batch, so cosine
+similarity is never computed pair by pair in Python.
+
+Indexes are written under ``SUGGEST_INDEX_DIR`` as ``.npy`` files and opened
+with ``mmap_mode="r"``, so worker processes share the pages instead of each
+holding its own copy.  Each build goes to a directory of its own and the
+index path is a symlink that is swapped to it in one rename.  An index on disk
+is reused while the concept count and latest ``updated_at`` of its
+codesystem are unchanged; an explicit rebuild tells the other workers to
+reopen it.
+"""
+import json
+import math
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+import unicodedata
+from collections import Counter
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+from uuid import UUID
+
+import numpy as np
+from scipy import sparse
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from app.crud import concept as concept_crud
+from app.models import Concept
+from app.utils.changefeed import broadcast
+from app.utils.events import ChangeEvent, on_resync, subscribe
+import logging
+
+logger = logging.getLogger(__name__)
+
+SUGGEST_INDEX_DIR = os.getenv("SUGGEST_INDEX_DIR", "data/suggest")
+FORMAT_VERSION = 1
+CHAR_NGRAMS = (3, 4)
+# Features present in more than this share of targets carry almost no signal
+# but make every product row dense; only pruned on corpora of MIN_PRUNE_DOCS+
+MAX_DF = 0.5
+MIN_PRUNE_DOCS = 1000
+# Source rows scored per sparse matrix product
+BATCH_SIZE = 256
+ARRAYS = ("data", "indices", "indptr", "idf", "ids", "codes", "displays")
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+
+
+def _normalize(text: Optional[str]) -> str:
+    text = unicodedata.normalize("NFKD", text or "")
+    return "".join(c for c in text if not unicodedata.combining(c)).lower()
+
+
+def features(display: Optional[str], definition: Optional[str]) -> List[str]:
+    """Word and char n-gram features; the display is counted twice"""
+    out = []
+    for text in (display, display, definition):
+        for token in _TOKEN.findall(_normalize(text)):
+            out.append("w:" + token)
+            padded = f" {token} "
+            for n in CHAR_NGRAMS:
+                out.extend("c:" + padded[i:i + n] for i in range(len(padded) - n + 1))
+    return out
+
+
+def _term_counts(
+    texts: Iterable[Tuple[Optional[str], Optional[str]]],
+    vocabulary: Dict[str, int],
+    grow: bool,
+) -> sparse.csr_matrix:
+    """Sublinear term-frequency matrix; unknown features are added only when ``grow``"""
+    indptr, indices, data = [0], [], []
+    for display, definition in texts:
+        for feature, count in Counter(features(display, definition)).items():
+            column = vocabulary.get(feature)
+            if column is None:
+                if not grow:
+                    continue
+                column = vocabulary[feature] = len(vocabulary)
+            indices.append(column)
+            data.append(1.0 + math.log(count))
+        indptr.append(len(indices))
+    return sparse.csr_matrix(
+        (np.asarray(data, dtype=np.float32), np.asarray(indices, dtype=np.int32), np.asarray(indptr, dtype=np.int64)),
+        shape=(len(indptr) - 1, len(vocabulary)),
+    )
+
+
+def _l2_normalize(matrix: sparse.csr_matrix) -> sparse.csr_matrix:
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+    norms[norms == 0] = 1.0
+    return sparse.csr_matrix(sparse.diags(1.0 / norms.astype(np.float32)) @ matrix)
+
+
+class TfidfIndex:
+    """Target-side TF-IDF weights, stored transposed (features x targets)"""
+
+    def __init__(
+        self,
+        weights: sparse.csr_matrix,
+        idf: np.ndarray,
+        vocabulary: Dict[str, int],
+        ids: np.ndarray,
+        codes: np.ndarray,
+        displays: np.ndarray,
+        meta: Dict[str, Any],
+    ):
+        self.weights = weights
+        self.idf = idf
+        self.vocabulary = vocabulary
+        self.ids = ids
+        self.codes = codes
+        self.displays = displays
+        self.meta = meta
+
+    @classmethod
+    def build(cls, rows: Sequence, meta: Dict[str, Any]) -> "TfidfIndex":
+        """Fit the vocabulary and IDF on ``rows`` of (id, code, display, definition)"""
+        vocabulary: Dict[str, int] = {}
+        counts = _term_counts(((r.display, r.definition) for r in rows), vocabulary, grow=True)
+        n_docs = counts.shape[0]
+        df = np.bincount(counts.indices, minlength=counts.shape[1])
+        keep = np.ones(counts.shape[1], dtype=bool)
+        if n_docs >= MIN_PRUNE_DOCS:
+            keep = df <= MAX_DF * n_docs
+        columns = np.flatnonzero(keep)
+        new_column = np.cumsum(keep) - 1
+        remap = {feature: int(new_column[c]) for feature, c in vocabulary.items() if keep[c]}
+        idf = (np.log((1.0 + n_docs) / (1.0 + df[columns])) + 1.0).astype(np.float32)
+
+        matrix = _l2_normalize(sparse.csr_matrix(counts[:, columns] @ sparse.diags(idf)))
+        weights = sparse.csr_matrix(matrix.T)
+        weights.sort_indices()
+        meta = dict(meta, version=FORMAT_VERSION, concepts=n_docs, features=len(columns),
+                    built_at=datetime.now(timezone.utc).isoformat())
+        return cls(
+            weights=weights,
+            idf=idf,
+            vocabulary=remap,
+            ids=np.array([str(r.id) for r in rows]),
+            codes=np.array([r.code for r in rows]),
+            displays=np.array([r.display or "" for r in rows]),
+            meta=meta,
+        )
+
+    def transform(self, texts: Iterable[Tuple[Optional[str], Optional[str]]]) -> sparse.csr_matrix:
+        """Vectorise source texts with the target vocabulary and IDF"""
+        counts = _term_counts(texts, self.vocabulary, grow=False)
+        counts.data *= self.idf[counts.indices]
+        return _l2_normalize(counts)
+
+    def top_k(self, queries: sparse.csr_matrix, k: int, min_score: float = 0.0) -> List[List[Tuple[int, float]]]:
+        """Best ``k`` (target row, cosine score) pairs per query row, best first"""
+        results = []
+        for start in range(0, queries.shape[0], BATCH_SIZE):
+            scores = sparse.csr_matrix(queries[start:start + BATCH_SIZE] @ self.weights)
+            for row in range(scores.shape[0]):
+                lo, hi = scores.indptr[row], scores.indptr[row + 1]
+                data, columns = scores.data[lo:hi], scores.indices[lo:hi]
+                if min_score > 0:
+                    mask = data >= min_score
+                    data, columns = data[mask], columns[mask]
+                if len(data) > k:
+                    best = np.argpartition(-data, k)[:k]
+                    data, columns = data[best], columns[best]
+                order = np.argsort(-data, kind="stable")
+                results.append([(int(columns[i]), float(data[i])) for i in order])
+        return results
+
+    def save(self, path: str) -> None:
+        """Write the index to a new directory and point the ``path`` symlink at it.
+
+        Readers resolve the link once per load, so they see the old or the new
+        index, never a mix.  The previous build is kept for loads in flight;
+        older ones are removed.
+        """
+        path = os.path.abspath(path)
+        parent, base = os.path.split(path)
+        os.makedirs(parent, exist_ok=True)
+        tmp = tempfile.mkdtemp(prefix=".build-", dir=parent)
+        try:
+            arrays = {
+                "data": self.weights.data, "indices": self.weights.indices, "indptr": self.weights.indptr,
+                "idf": self.idf, "ids": self.ids, "codes": self.codes, "displays": self.displays,
+            }
+            for name, array in arrays.items():
+                np.save(os.path.join(tmp, f"{name}.npy"), np.ascontiguousarray(array))
+            vocabulary = sorted(self.vocabulary, key=self.vocabulary.get)
+            with open(os.path.join(tmp, "vocabulary.json"), "w", encoding="utf-8") as f:
+                json.dump(vocabulary, f, ensure_ascii=False)
+            with open(os.path.join(tmp, "meta.json"), "w", encoding="utf-8") as f:
+                json.dump(dict(self.meta, shape=list(self.weights.shape)), f, indent=2)
+            target = f"{base}.{time.time_ns()}"
+            os.replace(tmp, os.path.join(parent, target))
+        except Exception:
+            shutil.rmtree(tmp, ignore_errors=True)
+            raise
+        previous = os.readlink(path) if os.path.islink(path) else None
+        if os.path.isdir(path) and previous is None:
+            # Written before indexes were versioned
+            shutil.rmtree(path)
+        link = os.path.join(parent, f".link-{target}")
+        os.symlink(target, link)
+        os.replace(link, path)
+        if previous is None:
+            return
+        # Only builds older than the previous one: a concurrent save may have written a newer one
+        oldest_kept = int(previous.rpartition(".")[2])
+        for entry in os.listdir(parent):
+            version = entry[len(base) + 1:]
+            if entry.startswith(f"{base}.") and version.isdigit() and int(version) < oldest_kept:
+                shutil.rmtree(os.path.join(parent, entry), ignore_errors=True)
+
+    @classmethod
+    def load(cls, path: str) -> "TfidfIndex":
+        """Open an index written by ``save`` with its arrays memory-mapped"""
+        path = os.path.realpath(path)
+        with open(os.path.join(path, "meta.json"), encoding="utf-8") as f:
+            meta = json.load(f)
+        if meta.get("version") != FORMAT_VERSION:
+            raise ValueError(f"Unsupported suggestion index version: {meta.get('version')}")
+        arrays = {name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r") for name in ARRAYS}
+        with open(os.path.join(path, "vocabulary.json"), encoding="utf-8") as f:
+            vocabulary = {feature: i for i, feature in enumerate(json.load(f))}
+        weights = sparse.csr_matrix(
+            (arrays["data"], arrays["indices"], arrays["indptr"]), shape=tuple(meta["shape"]), copy=False
+        )
+        return cls(weights, arrays["idf"], vocabulary, arrays["ids"], arrays["codes"], arrays["displays"], meta)
+
+
+def _fingerprint(db: Session, codesystem_id: UUID) -> Dict[str, Any]:
+    count, updated_at = db.query(func.count(Concept.id), func.max(Concept.updated_at)).filter(
+        Concept.codesystem_id == codesystem_id
+    ).one()
+    return {"count": count, "updated_at": updated_at.isoformat() if updated_at else None}
+
+
+class SuggestionIndexes:
+    """Per-target-codesystem TF-IDF indexes, loaded from disk or built on first use"""
+
+    def __init__(self, base_dir: str = SUGGEST_INDEX_DIR):
+        self.base_dir = base_dir
+        self._lock = threading.Lock()
+        self._indexes: Dict[UUID, TfidfIndex] = {}
+
+    def path(self, codesystem_id: UUID) -> str:
+        return os.path.join(self.base_dir, str(codesystem_id))
+
+    def _open(self, db: Session, codesystem_id: UUID, force: bool = False) -> TfidfIndex:
+        fingerprint = _fingerprint(db, codesystem_id)
+        path = self.path(codesystem_id)
+        if not force and os.path.exists(path):
+            try:
+                index = TfidfIndex.load(path)
+                if index.meta.get("fingerprint") == fingerprint:
+                    return index
+                logger.info(f"Suggestion index for codesystem {codesystem_id} is stale, rebuilding")
+            except Exception as e:
+                logger.warning(f"Could not load suggestion index {path}: {e}")
+
+        rows = concept_crud.concept.get_text_rows(db=db, codesystem_id=codesystem_id)
+        index = TfidfIndex.build(rows, {"codesystem_id": str(codesystem_id), "fingerprint": fingerprint})
+        logger.info(
+            f"Built suggestion index for codesystem {codesystem_id}: "
+            f"{index.meta['concepts']} concepts, {index.meta['features']} features"
+        )
+        try:
+            index.save(path)
+            return TfidfIndex.load(path)
+        except OSError as e:
+            logger.warning(f"Could not persist suggestion index {path}, keeping it in memory: {e}")
+            return index
+
+    def get(self, db: Session, codesystem_id: UUID) -> TfidfIndex:
+        """Index of a target codesystem"""
+        index = self._indexes.get(codesystem_id)
+        if index is None:
+            with self._lock:
+                index = self._indexes.get(codesystem_id)
+                if index is None:
+                    index = self._indexes[codesystem_id] = self._open(db, codesystem_id)
+        return index
+
+    def rebuild(self, db: Session, codesystem_id: UUID) -> TfidfIndex:
+        """Rebuild and persist the index of a target codesystem; other workers reopen it"""
+        with self._lock:
+            index = self._indexes[codesystem_id] = self._open(db, codesystem_id, force=True)
+        broadcast(ChangeEvent("suggest_index", "UPDATE", codesystem_id))
+        return index
+
+    def invalidate(self, codesystem_id: Optional[UUID] = None) -> None:
+        with self._lock:
+            if codesystem_id is None:
+                self._indexes.clear()
+            else:
+                self._indexes.pop(codesystem_id, None)
+
+    def on_concept_change(self, event: ChangeEvent) -> None:
+        for keys in (event.old, event.new):
+            if keys:
+                self.invalidate(keys["codesystem_id"])
+
+    def on_codesystem_change(self, event: ChangeEvent) -> None:
+        self.invalidate(event.record_id)
+
+    def on_index_change(self, event: ChangeEvent) -> None:
+        # Another worker rebuilt the index on disk
+        if event.remote:
+            self.invalidate(event.record_id)
+
+
+suggestion_indexes = SuggestionIndexes()
+subscribe("concept", suggestion_indexes.on_concept_change)
+subscribe("codesystem", suggestion_indexes.on_codesystem_change)
+subscribe("suggest_index", suggestion_indexes.on_index_change)
+on_resync(suggestion_indexes.invalidate)
+
+
+def suggest_mappings(
+    db: Session,
+    source_codesystem_id: UUID,
+    target_codesystem_id: UUID,
+    codes: Optional[List[str]] = None,
+    k: int = 5,
+    min_score: float = 0.0,
+) -> Tuple[List[Dict[str, Any]], List[str]]:
+    """Top-``k`` target candidates for each source concept, plus codes that were not found"""
+    index = suggestion_indexes.get(db, target_codesystem_id)
+    sources = concept_crud.concept.get_text_rows(db=db, codesystem_id=source_codesystem_id, codes=codes)
+    missing = sorted(set(codes) - {s.code for s in sources}) if codes is not None else []
+
+    queries = index.transform((s.display, s.definition) for s in sources)
+    ranked = index.top_k(queries, k=k, min_score=min_score)
+    items = [
+        {
+            "source_concept_id": source.id,
+            "source_code": source.code,
+            "source_display": source.display,
+            "candidates": [
+                {
+                    "target_concept_id": UUID(str(index.ids[row])),
+                    "code": str(index.codes[row]),
+                    "display": str(index.displays[row]) or None,
+                    "score": round(score, 4),
+                }
+                for row, score in candidates
+            ],
+        }
+        for source, candidates in zip(sources, ranked)
+    ]
+    logger.info(f"Scored {len(sources)} source concepts against {index.meta['concepts']} targets")
+    return items, missing
@@ -0,0 +1,73 @@
+"""Opaque watermark tokens for the delta sync endpoints.
+
+A watermark holds one keyset cursor per stream: ``(updated_at, id)`` of the
+last changed row returned, and ``(deleted_at, id)`` of the last tombstone.
+It is serialized as URL-safe base64 JSON so clients store and echo it back
+without parsing it.  ``_since`` also accepts a plain ISO-8601 instant, which
+starts both streams at that time; one without an offset is taken as UTC.
+"""
+import base64
+import binascii
+import json
+from datetime import datetime, timezone
+from typing import NamedTuple, Optional
+from uuid import UUID
+
+WATERMARK_VERSION = 1
+NIL_ID = UUID(int=0)
+
+
+class WatermarkError(ValueError):
+    """Malformed or unsupported watermark"""
+
+
+class Cursor(NamedTuple):
+    at: datetime
+    id: UUID
+
+
+class Watermark(NamedTuple):
+    changed: Optional[Cursor] = None
+    deleted: Optional[Cursor] = None
+
+
+def _dump(cursor: Optional[Cursor]):
+    return [cursor.at.isoformat(), str(cursor.id)] if cursor else None
+
+
+def _load(value) -> Optional[Cursor]:
+    if value is None:
+        return None
+    at, id = value
+    at = datetime.fromisoformat(at)
+    # SQLite returns naive timestamps, stored as UTC
+    return Cursor(at if at.tzinfo else at.replace(tzinfo=timezone.utc), UUID(id))
+
+
+def encode_watermark(watermark: Watermark) -> str:
+    payload = {"v": WATERMARK_VERSION, "c": _dump(watermark.changed), "d": _dump(watermark.deleted)}
+    raw = json.dumps(payload, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_watermark(token: Optional[str]) -> Watermark:
+    """Parse a token from :func:`encode_watermark` or an ISO-8601 instant"""
+    if not token:
+        return Watermark()
+    try:
+        since = datetime.fromisoformat(token.replace("Z", "+00:00"))
+    except ValueError:
+        pass
+    else:
+        if since.tzinfo is None:
+            since = since.replace(tzinfo=timezone.utc)
+        return Watermark(Cursor(since, NIL_ID), Cursor(since, NIL_ID))
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)))
+        if payload.get("v") != WATERMARK_VERSION:
+            raise WatermarkError(f"Unsupported watermark version {payload.get('v')}")
+        return Watermark(_load(payload.get("c")), _load(payload.get("d")))
+    except WatermarkError:
+        raise
+    except (binascii.Error, ValueError, TypeError, AttributeError) as e:
+        raise WatermarkError(f"Invalid watermark: {e}")
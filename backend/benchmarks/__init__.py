@@ -0,0 +1,10 @@
+"""Reproducible benchmark suite for the FHIR terminology backend.
+
+Usage (from the ``backend/`` directory, against a local Postgres configured
+through the usual ``DB_*`` environment variables)::
+
+    python -m benchmarks seed --scale 10k
+    uvicorn app.main:app --workers 4 &
+    python -m benchmarks run --scale 10k --base-url http://localhost:8000
+    python -m benchmarks compare results/old.json results/new.json
+"""
@@ -0,0 +1,213 @@
+import argparse
+import json
+import logging
+import sys
+
+import httpx
+
+from benchmarks import datagen, runner
+from benchmarks.datagen import DatasetSpec
+from benchmarks.scenarios import SCENARIOS
+
+logger = logging.getLogger("benchmarks")
+
+
+def _spec(args) -> DatasetSpec:
+    return DatasetSpec(scale=args.scale, seed=args.seed)
+
+
+def cmd_seed(args) -> int:
+    counts = datagen.seed_database(_spec(args), batch_size=args.batch_size, reset=args.reset)
+    print(json.dumps(counts))
+    return 0
+
+
+def cmd_reset(args) -> int:
+    datagen.reset_dataset(_spec(args))
+    return 0
+
+
+def cmd_run(args) -> int:
+    names = args.scenario or [name for name, s in SCENARIOS.items() if not (args.quick and "heavy" in s.tags)]
+    unknown = [n for n in names if n not in SCENARIOS]
+    if unknown:
+        logger.error(f"Unknown scenario(s): {', '.join(unknown)}")
+        return 2
+    try:
+        result = runner.run_suite(
+            [SCENARIOS[n] for n in names],
+            _spec(args),
+            base_url=args.base_url,
+            requests=args.requests,
+            concurrency=args.concurrency,
+            warmup=args.warmup,
+        )
+    except httpx.ConnectError as e:
+        logger.error(f"Server not reachable at {args.base_url}: {e}")
+        return 2
+    path = runner.write_results(result, args.out)
+    print(path)
+    return 0
+
+
+def cmd_compare(args) -> int:
+    with open(args.baseline) as fh:
+        baseline = json.load(fh)
+    with open(args.candidate) as fh:
+        candidate = json.load(fh)
+    regressions = runner.compare(baseline, candidate, threshold=args.threshold)
+    for line in regressions:
+        print(f"REGRESSION {line}")
+    return 1 if regressions else 0
+
+
+def cmd_plans(args) -> int:
+    from benchmarks import plans
+    results = plans.check_plans(_spec(args), min_rows=args.min_rows)
+    if args.out:
+        with open(args.out, "w") as fh:
+            json.dump(results, fh, indent=2)
+    failed = [r for r in results if not r["ok"]]
+    for r in failed:
+        print(f"SEQ SCAN {r['case']}: {', '.join(r['seq_scans'])}")
+    return 1 if failed else 0
+
+
+def cmd_backends(args) -> int:
+    from benchmarks import backends
+    results = backends.compare_backends(_spec(args), args.offline, iterations=args.iterations, warmup=args.warmup)
+    if args.out:
+        with open(args.out, "w") as fh:
+            json.dump(results, fh, indent=2)
+    for backend, cases in results.items():
+        for name, summary in cases.items():
+            print(f"{backend:16} {name:28} p50 {summary['p50_ms']:8.3f}ms  p95 {summary['p95_ms']:8.3f}ms  p99 {summary['p99_ms']:8.3f}ms")
+    return 0
+
+
+def cmd_export(args) -> int:
+    from benchmarks import bulk_export
+    result = bulk_export.measure_export(args.type, since=args.since, part_rows=args.part_rows, keep=args.keep)
+    print(json.dumps(result, indent=2))
+    return 0
+
+
+def cmd_mapping_import(args) -> int:
+    from benchmarks import mapping_import
+    result = mapping_import.measure_import(_spec(args), rows=args.rows)
+    print(json.dumps(result, indent=2))
+    return 0
+
+
+def cmd_ingest(args) -> int:
+    from benchmarks import ingest
+    result = ingest.measure_ingest(_spec(args), workers=args.workers)
+    print(json.dumps(result, indent=2))
+    return 0
+
+
+def cmd_round_trips(args) -> int:
+    from benchmarks import round_trips
+    results = round_trips.measure_round_trips()
+    if args.out:
+        with open(args.out, "w") as fh:
+            json.dump(results, fh, indent=2)
+    for name, result in results.items():
+        print(f"{name:28} {result['status']:4} {result['round_trips']:3} round trips "
+              f"({result['statements']} statements, {result['commits']} commits, {result['rollbacks']} rollbacks)")
+    return 0
+
+
+def cmd_changefeed(args) -> int:
+    from benchmarks import changefeed
+    summary = changefeed.measure_invalidation(_spec(args), workers=args.workers, writes=args.writes, timeout=args.timeout)
+    print(json.dumps(summary, indent=2))
+    # Every worker must have seen every write
+    return 1 if summary["errors"] else 0
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks", description="FHIR backend benchmark suite")
+    parser.add_argument("--log-level", default="INFO")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    def add_dataset_args(p):
+        p.add_argument("--scale", choices=sorted(datagen.SCALES), default="10k")
+        p.add_argument("--seed", type=int, default=datagen.DEFAULT_SEED)
+
+    p = sub.add_parser("seed", help="Generate and bulk load a synthetic dataset")
+    add_dataset_args(p)
+    p.add_argument("--batch-size", type=int, default=5000)
+    p.add_argument("--reset", action="store_true", help="Delete an existing dataset with the same seed first")
+    p.set_defaults(func=cmd_seed)
+
+    p = sub.add_parser("reset", help="Delete a synthetic dataset")
+    add_dataset_args(p)
+    p.set_defaults(func=cmd_reset)
+
+    p = sub.add_parser("run", help="Run scenarios against a running server")
+    add_dataset_args(p)
+    p.add_argument("--base-url", default="http://localhost:8000")
+    p.add_argument("--scenario", action="append", help=f"One of: {', '.join(SCENARIOS)} (repeatable)")
+    p.add_argument("--quick", action="store_true", help="Skip scenarios tagged heavy (bundle_10000, suggest_all)")
+    p.add_argument("--requests", type=int, default=1000)
+    p.add_argument("--concurrency", type=int, default=8)
+    p.add_argument("--warmup", type=int, default=20)
+    p.add_argument("--out", default="benchmarks/results")
+    p.set_defaults(func=cmd_run)
+
+    p = sub.add_parser("plans", help="EXPLAIN CRUD queries and fail on sequential scans of large tables")
+    add_dataset_args(p)
+    p.add_argument("--min-rows", type=int, default=5000, help="Only tables at least this large must avoid seq scans")
+    p.add_argument("--out", help="Write the plan report as JSON")
+    p.set_defaults(func=cmd_plans)
+
+    p = sub.add_parser("backends", help="Compare lookup/translate latency against an offline SQLite export")
+    add_dataset_args(p)
+    p.add_argument("--offline", required=True, help="SQLite file written by python -m app.export")
+    p.add_argument("--iterations", type=int, default=2000)
+    p.add_argument("--warmup", type=int, default=100)
+    p.add_argument("--out", help="Write the latency report as JSON")
+    p.set_defaults(func=cmd_backends)
+
+    p = sub.add_parser("changefeed", help="Measure write-to-invalidation latency across worker processes")
+    add_dataset_args(p)
+    p.add_argument("--workers", type=int, default=4)
+    p.add_argument("--writes", type=int, default=200)
+    p.add_argument("--timeout", type=float, default=5.0, help="Seconds to wait for stragglers after the last write")
+    p.set_defaults(func=cmd_changefeed)
+
+    p = sub.add_parser("export", help="Measure $export rows/sec and peak RSS against the configured database")
+    p.add_argument("--type", action="append", choices=["CodeSystem", "ConceptMap"], help="Resource type (repeatable, default all)")
+    p.add_argument("--since", help="Only resources updated at or after this ISO-8601 instant")
+    p.add_argument("--part-rows", type=int, default=100000)
+    p.add_argument("--keep", help="Write the parts to this directory and keep them")
+    p.set_defaults(func=cmd_export)
+
+    p = sub.add_parser("mapping-import", help="Measure bulk ConceptMap import rows/min against the seeded dataset")
+    add_dataset_args(p)
+    p.add_argument("--rows", type=int, default=100000)
+    p.set_defaults(func=cmd_mapping_import)
+
+    p = sub.add_parser("ingest", help="Measure release file ingestion: first load, unchanged re-run, minor release diff and revised re-run")
+    add_dataset_args(p)
+    p.add_argument("--workers", type=int, default=4)
+    p.set_defaults(func=cmd_ingest)
+
+    p = sub.add_parser("round-trips", help="Count database round trips per PUT and DELETE against the configured database")
+    p.add_argument("--out", help="Write the counts as JSON")
+    p.set_defaults(func=cmd_round_trips)
+
+    p = sub.add_parser("compare", help="Diff two result files and fail on regressions")
+    p.add_argument("baseline")
+    p.add_argument("candidate")
+    p.add_argument("--threshold", type=float, default=0.10)
+    p.set_defaults(func=cmd_compare)
+
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=args.log_level, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
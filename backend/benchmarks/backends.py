@@ -0,0 +1,81 @@
+"""Lookup and translate latency: configured database vs an offline SQLite export.
+
+Runs the same CRUD calls the read routes make, in-process, against the
+configured (Postgres) engine and against a file written by
+``python -m app.export``, so the numbers compare the storage paths without
+HTTP overhead.  Both databases must hold the same seeded dataset.
+"""
+import random
+import time
+from typing import Any, Callable, Dict, List, Tuple
+
+from sqlalchemy import create_engine
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session, sessionmaker
+
+from app.crud import concept as concept_crud
+from app.crud import conceptmap as conceptmap_crud
+from app.db import engine as default_engine
+from benchmarks import datagen
+from benchmarks.datagen import DatasetSpec
+from benchmarks.runner import summarize
+import logging
+
+logger = logging.getLogger(__name__)
+
+Case = Tuple[str, Callable[[Session, DatasetSpec, random.Random], Any]]
+
+CASES: List[Case] = [
+    ("concept.get_by_code", lambda db, s, rng: concept_crud.concept.get_by_code(
+        db, s.namaste_codesystem_id, datagen.namaste_code(rng.randrange(s.namaste_count)))),
+    ("conceptmap.get_translation", lambda db, s, rng: conceptmap_crud.conceptmap.get_translation(
+        db, s.namaste_codesystem_id, s.icd11_codesystem_id,
+        datagen.namaste_concept_id(s, rng.randrange(s.namaste_count)))),
+]
+
+
+def offline_engine(path: str) -> Engine:
+    return create_engine(
+        f"sqlite:///file:{path}?mode=ro&uri=true",
+        connect_args={"check_same_thread": False},
+    )
+
+
+def _time_case(bind: Engine, spec: DatasetSpec, name: str, fn, iterations: int, warmup: int) -> Dict[str, Any]:
+    rng = random.Random(f"{spec.seed}:{name}")
+    db = sessionmaker(bind=bind)()
+    latencies: List[float] = []
+    misses = 0
+    try:
+        for i in range(warmup + iterations):
+            started = time.perf_counter()
+            found = fn(db, spec, rng)
+            elapsed = (time.perf_counter() - started) * 1000.0
+            # Keep the identity map from turning later lookups into cache hits
+            db.expunge_all()
+            if i < warmup:
+                continue
+            latencies.append(elapsed)
+            misses += found is None
+    finally:
+        db.close()
+    wall = sum(latencies) / 1000.0
+    return summarize(latencies, errors=misses, statuses={}, wall_s=wall)
+
+
+def compare_backends(
+    spec: DatasetSpec,
+    offline_path: str,
+    iterations: int = 2000,
+    warmup: int = 100,
+) -> Dict[str, Dict[str, Any]]:
+    """Latency summary per backend and case; ``errors`` counts lookups that found nothing"""
+    backends = {default_engine.dialect.name: default_engine, "offline-sqlite": offline_engine(offline_path)}
+    results: Dict[str, Dict[str, Any]] = {}
+    for backend, bind in backends.items():
+        results[backend] = {}
+        for name, fn in CASES:
+            summary = _time_case(bind, spec, name, fn, iterations, warmup)
+            results[backend][name] = summary
+            logger.info(f"{backend} {name}: p50 {summary['p50_ms']}ms p95 {summary['p95_ms']}ms")
+    return results
@@ -0,0 +1,29 @@
+"""Throughput and memory of the FHIR Bulk Data ``$export`` writers.
+
+Runs the same writers the ``bulk-export`` job uses, in this process, into a
+scratch directory and reports rows/sec per stream, compressed bytes and the
+process's peak RSS.  Peak RSS should not grow with the dataset scale.
+"""
+import os
+import shutil
+import tempfile
+from typing import Any, Dict, List, Optional
+
+from app.utils.bulk_export import EXPORT_PART_ROWS, RESOURCE_TYPES, export_resources, parse_since
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def measure_export(
+    types: Optional[List[str]] = None, since: Optional[str] = None, part_rows: int = EXPORT_PART_ROWS, keep: Optional[str] = None
+) -> Dict[str, Any]:
+    directory = keep or tempfile.mkdtemp(prefix="fhirfly-export-")
+    try:
+        result = export_resources(directory, types or list(RESOURCE_TYPES), since=parse_since(since), part_rows=part_rows)
+        result["bytes"] = sum(os.path.getsize(os.path.join(directory, output["file"])) for output in result["output"])
+        result["parts"] = len(result.pop("output"))
+    finally:
+        if not keep:
+            shutil.rmtree(directory, ignore_errors=True)
+    return result
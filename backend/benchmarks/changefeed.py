@@ -0,0 +1,104 @@
+"""Write-to-invalidation latency of the LISTEN/NOTIFY change feed.
+
+Starts several worker processes, each with its own ``ChangeFeedListener`` (as
+every uvicorn worker has), then updates seeded concepts from this process and
+records when each worker receives the resulting event.  Requires a seeded
+Postgres database with migration 0011 applied.
+"""
+import multiprocessing
+import queue
+import time
+from typing import Any, Dict, List, Tuple
+
+from sqlalchemy import text
+
+from app.db import SessionLocal
+from benchmarks import datagen
+from benchmarks.datagen import DatasetSpec
+from benchmarks.runner import summarize
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def _worker(index: int, events, ready) -> None:
+    from app.utils.changefeed import ChangeFeedListener
+    from app.utils.events import is_bulk, subscribe
+
+    subscribe("concept", lambda event: events.put((
+        index, str(event.record_id) if event.record_id else None, is_bulk(event), time.time(),
+    )))
+    listener = ChangeFeedListener()
+    listener.start()
+    listener.ready.wait(30)
+    ready.put(index)
+    while True:
+        time.sleep(3600)
+
+
+def start_workers(workers: int) -> Tuple[List[Any], Any]:
+    """Listening worker processes and the queue of ``(worker, record_id, bulk, received_at)`` they fill"""
+    ctx = multiprocessing.get_context("spawn")
+    events, ready = ctx.Queue(), ctx.Queue()
+    processes = [ctx.Process(target=_worker, args=(i, events, ready), daemon=True) for i in range(workers)]
+    for process in processes:
+        process.start()
+    try:
+        for _ in processes:
+            ready.get(timeout=60)
+    except BaseException:
+        stop_workers(processes)
+        raise
+    return processes, events
+
+
+def stop_workers(processes: List[Any]) -> None:
+    for process in processes:
+        process.terminate()
+
+
+def measure_invalidation(spec: DatasetSpec, workers: int = 4, writes: int = 200, timeout: float = 5.0) -> Dict[str, Any]:
+    """Latency from commit to receipt, over every (write, worker) pair"""
+    processes, events = start_workers(workers)
+    try:
+        committed: Dict[str, float] = {}
+        received: List[float] = []
+        last_received = started = time.time()
+
+        def record(record_id: str, at: float) -> None:
+            nonlocal last_received
+            received.append((at - committed[record_id]) * 1000.0)
+            last_received = max(last_received, at)
+
+        db = SessionLocal()
+        try:
+            for i in range(writes):
+                concept_id = str(datagen.namaste_concept_id(spec, i % spec.namaste_count))
+                db.execute(text("UPDATE concept SET display = display WHERE id = :id"), {"id": concept_id})
+                committed[concept_id] = time.time()
+                db.commit()
+                # Drain as we go so queue order does not skew later receipts
+                while True:
+                    try:
+                        _, record_id, _, at = events.get_nowait()
+                    except queue.Empty:
+                        break
+                    record(record_id, at)
+        finally:
+            db.close()
+        deadline = time.monotonic() + timeout
+        while len(received) < writes * workers and time.monotonic() < deadline:
+            try:
+                _, record_id, _, at = events.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            record(record_id, at)
+    finally:
+        stop_workers(processes)
+    missing = writes * workers - len(received)
+    # From the first write to the last receipt, so throughput covers the whole run
+    summary = summarize(received, errors=missing, statuses={}, wall_s=last_received - started)
+    summary["workers"] = workers
+    summary["writes"] = writes
+    logger.info(f"Invalidation latency over {workers} workers: p50 {summary['p50_ms']}ms p99 {summary['p99_ms']}ms, {missing} missed")
+    return summary
@@ -0,0 +1,353 @@
+"""Deterministic synthetic NAMASTE / ICD-11 data generator.
+
+Every row is derived from ``(seed, kind, index)`` only, so any concept can be
+regenerated in isolation.  The scenario drivers rely on this to pick request
+parameters without reading the database back.
+"""
+import random
+import uuid
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterator, List, Optional
+
+from sqlalchemy import delete, insert, or_
+
+from app.db import Base, SessionLocal, engine
+from app.models import AuditLog, CodeSystem, Concept, ConceptMap
+import logging
+
+logger = logging.getLogger(__name__)
+
+SCALES = {"10k": 10_000, "100k": 100_000, "1m": 1_000_000}
+DEFAULT_SEED = 1729
+
+# Share of generated concepts that belong to the NAMASTE codesystem; the rest
+# are ICD-11 TM2 concepts.
+NAMASTE_SHARE = 0.6
+NAMASTE_FANOUT = 8
+ICD11_FANOUT = 12
+
+NAMASTE_URL = "https://fhirfly.me/fhir/CodeSystem/namaste"
+ICD11_URL = "http://id.who.int/icd/release/11/mms"
+
+BENCHMARK_USER = "benchmark"
+_NAMESPACE = uuid.UUID("6b0f3c1e-4d5a-4f7e-9a51-2f9f6c3e8d10")
+_EPOCH = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+DOSHAS = ["vata", "pitta", "kapha", "vata-pitta", "pitta-kapha", "vata-kapha", "tridosha"]
+SYSTEMS = ["ayurveda", "siddha", "unani"]
+EQUIVALENCES = ["equivalent", "equivalent", "wider", "narrower", "relatedto", "inexact"]
+QUALIFIERS = [
+    "acute", "chronic", "recurrent", "bilateral", "primary", "secondary",
+    "nocturnal", "seasonal", "mild", "severe", "juvenile", "post-partum",
+]
+TERMS = [
+    "jvara", "kasa", "shvasa", "amavata", "prameha", "arsha", "atisara",
+    "grahani", "kamala", "pandu", "shotha", "udara", "kushtha", "visarpa",
+    "vatarakta", "sandhivata", "shirashula", "pratishyaya", "tamaka", "hikka",
+]
+CONDITIONS = [
+    "fever", "cough", "dyspnoea", "arthritis", "diabetes", "haemorrhoids",
+    "diarrhoea", "malabsorption", "jaundice", "anaemia", "oedema", "ascites",
+    "dermatosis", "erysipelas", "gout", "osteoarthritis", "headache",
+    "rhinitis", "asthma", "hiccup", "disorder", "pattern", "syndrome",
+]
+
+
+@dataclass(frozen=True)
+class DatasetSpec:
+    """Shape of a synthetic dataset at a given scale and seed"""
+    scale: str = "10k"
+    seed: int = DEFAULT_SEED
+
+    @property
+    def total(self) -> int:
+        return SCALES[self.scale]
+
+    @property
+    def namaste_count(self) -> int:
+        return int(self.total * NAMASTE_SHARE)
+
+    @property
+    def icd11_count(self) -> int:
+        return self.total - self.namaste_count
+
+    @property
+    def audit_count(self) -> int:
+        return max(self.total // 10, 1)
+
+    @property
+    def namaste_codesystem_id(self) -> uuid.UUID:
+        return stable_uuid(self.seed, "codesystem", "namaste")
+
+    @property
+    def icd11_codesystem_id(self) -> uuid.UUID:
+        return stable_uuid(self.seed, "codesystem", "icd11")
+
+
+def stable_uuid(seed: int, *parts: Any) -> uuid.UUID:
+    """Deterministic UUID for a generated row"""
+    return uuid.uuid5(_NAMESPACE, ":".join(str(p) for p in (seed,) + parts))
+
+
+def _rng(seed: int, *parts: Any) -> random.Random:
+    return random.Random(":".join(str(p) for p in (seed,) + parts))
+
+
+def _base36(value: int, width: int) -> str:
+    digits = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ"
+    out = []
+    while value:
+        value, rem = divmod(value, 36)
+        out.append(digits[rem])
+    return "".join(reversed(out)).rjust(width, "0")
+
+
+def namaste_code(index: int) -> str:
+    """NAMASTE-style code, e.g. ``AAB-12``"""
+    chapter = "A" + "ABCDEFGHIJKLMNOPQRSTUVWXYZ"[(index // 676) % 26] + "ABCDEFGHIJKLMNOPQRSTUVWXYZ"[(index // 26) % 26]
+    return f"{chapter}-{index}"
+
+
+def icd11_code(index: int) -> str:
+    """ICD-11 TM2-style code, e.g. ``SA0001``"""
+    return f"S{_base36(index, 5)}"
+
+
+def namaste_parent(index: int) -> Optional[int]:
+    return (index - 1) // NAMASTE_FANOUT if index > 0 else None
+
+
+def icd11_parent(index: int) -> Optional[int]:
+    return (index - 1) // ICD11_FANOUT if index > 0 else None
+
+
+def namaste_concept_id(spec: DatasetSpec, index: int) -> uuid.UUID:
+    return stable_uuid(spec.seed, "namaste", index)
+
+
+def icd11_concept_id(spec: DatasetSpec, index: int) -> uuid.UUID:
+    return stable_uuid(spec.seed, "icd11", index)
+
+
+def codesystem_rows(spec: DatasetSpec) -> List[Dict[str, Any]]:
+    """The two codesystems every dataset is built on"""
+    return [
+        {
+            "id": spec.namaste_codesystem_id,
+            "external_id": "namaste",
+            "url": NAMASTE_URL,
+            "version": "1.0.0",
+            "name": "NAMASTE",
+            "title": "National AYUSH Morbidity and Standardized Terminologies Electronic",
+            "status": "active",
+            "publisher": "Ministry of AYUSH",
+            "content": "complete",
+            "meta": {"benchmark": True, "scale": spec.scale, "seed": spec.seed},
+            "resource": {
+                "resourceType": "CodeSystem",
+                "url": NAMASTE_URL,
+                "hierarchyMeaning": "is-a",
+                "count": spec.namaste_count,
+                "property": [
+                    {"code": "parent", "type": "code"},
+                    {"code": "dosha", "type": "code"},
+                    {"code": "system", "type": "code"},
+                ],
+            },
+        },
+        {
+            "id": spec.icd11_codesystem_id,
+            "external_id": "icd11-tm2",
+            "url": ICD11_URL,
+            "version": "2024-01",
+            "name": "ICD-11",
+            "title": "ICD-11 for Mortality and Morbidity Statistics (TM2)",
+            "status": "active",
+            "publisher": "World Health Organization",
+            "content": "fragment",
+            "meta": {"benchmark": True, "scale": spec.scale, "seed": spec.seed},
+            "resource": {
+                "resourceType": "CodeSystem",
+                "url": ICD11_URL,
+                "hierarchyMeaning": "is-a",
+                "count": spec.icd11_count,
+                "property": [
+                    {"code": "parent", "type": "code"},
+                    {"code": "kind", "type": "code"},
+                    {"code": "chapter", "type": "string"},
+                ],
+            },
+        },
+    ]
+
+
+def namaste_concept(spec: DatasetSpec, index: int) -> Dict[str, Any]:
+    """Generate NAMASTE concept ``index``"""
+    rng = _rng(spec.seed, "namaste", index)
+    term = rng.choice(TERMS)
+    qualifier = rng.choice(QUALIFIERS)
+    condition = rng.choice(CONDITIONS)
+    code = namaste_code(index)
+    properties = [
+        {"code": "dosha", "valueCode": rng.choice(DOSHAS)},
+        {"code": "system", "valueCode": rng.choice(SYSTEMS)},
+    ]
+    parent = namaste_parent(index)
+    if parent is not None:
+        properties.insert(0, {"code": "parent", "valueCode": namaste_code(parent)})
+    return {
+        "id": namaste_concept_id(spec, index),
+        "codesystem_id": spec.namaste_codesystem_id,
+        "code": code,
+        "display": f"{qualifier.capitalize()} {term} ({condition})",
+        "definition": f"{qualifier.capitalize()} presentation of {term}, a {condition} described in classical texts.",
+        "properties": properties,
+        "raw": {
+            "NAMC_CODE": code,
+            "NAMC_TERM": term,
+            "NAMC_term_diacritical": term.replace("a", "ā", 1),
+            "Short_definition": f"{term} ({condition})",
+            "Long_definition": f"{qualifier.capitalize()} {term}; {condition} of {rng.choice(DOSHAS)} origin.",
+            "Ontology_branches": [rng.choice(CONDITIONS) for _ in range(rng.randint(1, 3))],
+            "source_row": index,
+        },
+    }
+
+
+def icd11_concept(spec: DatasetSpec, index: int) -> Dict[str, Any]:
+    """Generate ICD-11 TM2 concept ``index``"""
+    rng = _rng(spec.seed, "icd11", index)
+    condition = rng.choice(CONDITIONS)
+    qualifier = rng.choice(QUALIFIERS)
+    code = icd11_code(index)
+    kind = "category" if index >= ICD11_FANOUT else "block"
+    properties = [
+        {"code": "kind", "valueCode": kind},
+        {"code": "chapter", "valueString": "26"},
+    ]
+    parent = icd11_parent(index)
+    if parent is not None:
+        properties.insert(0, {"code": "parent", "valueCode": icd11_code(parent)})
+    entity = 1_000_000_000 + index
+    return {
+        "id": icd11_concept_id(spec, index),
+        "codesystem_id": spec.icd11_codesystem_id,
+        "code": code,
+        "display": f"{qualifier.capitalize()} {condition} pattern (TM2)",
+        "definition": f"A {qualifier} {condition} pattern in traditional medicine.",
+        "properties": properties,
+        "raw": {
+            "foundationUri": f"http://id.who.int/icd/entity/{entity}",
+            "linearizationUri": f"http://id.who.int/icd/release/11/mms/{entity}",
+            "classKind": kind,
+            "isResidual": rng.random() < 0.05,
+            "chapterNo": "26",
+        },
+    }
+
+
+def conceptmap_rows(spec: DatasetSpec, index: int) -> List[Dict[str, Any]]:
+    """Many-to-many mappings from NAMASTE concept ``index`` to ICD-11"""
+    rng = _rng(spec.seed, "map", index)
+    targets = sorted({rng.randrange(spec.icd11_count) for _ in range(rng.choice([0, 1, 1, 1, 2, 3]))})
+    return [
+        {
+            "id": stable_uuid(spec.seed, "map", index, target),
+            "source_codesystem_id": spec.namaste_codesystem_id,
+            "target_codesystem_id": spec.icd11_codesystem_id,
+            "source_code": namaste_concept_id(spec, index),
+            "target_code": icd11_concept_id(spec, target),
+            "equivalence": rng.choice(EQUIVALENCES),
+            "conceptmap_metadata": {"source": "benchmark", "confidence": round(rng.random(), 3)},
+        }
+        for target in targets
+    ]
+
+
+def audit_row(spec: DatasetSpec, index: int) -> Dict[str, Any]:
+    rng = _rng(spec.seed, "audit", index)
+    table_name = rng.choice(["concept", "concept", "conceptmap", "codesystem"])
+    return {
+        "id": stable_uuid(spec.seed, "audit", index),
+        "table_name": table_name,
+        "operation": rng.choice(["INSERT", "INSERT", "UPDATE", "DELETE"]),
+        "record_id": namaste_concept_id(spec, rng.randrange(spec.namaste_count)),
+        "user_id": BENCHMARK_USER,
+        "changed_at": _EPOCH + timedelta(seconds=rng.randrange(90 * 24 * 3600)),
+        "new_data": {"source_row": index},
+        "meta": {"benchmark": True},
+    }
+
+
+def _batched(rows: Iterator[Dict[str, Any]], size: int) -> Iterator[List[Dict[str, Any]]]:
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def iter_concepts(spec: DatasetSpec) -> Iterator[Dict[str, Any]]:
+    for i in range(spec.namaste_count):
+        yield namaste_concept(spec, i)
+    for i in range(spec.icd11_count):
+        yield icd11_concept(spec, i)
+
+
+def iter_conceptmaps(spec: DatasetSpec) -> Iterator[Dict[str, Any]]:
+    for i in range(spec.namaste_count):
+        yield from conceptmap_rows(spec, i)
+
+
+def iter_audit_logs(spec: DatasetSpec) -> Iterator[Dict[str, Any]]:
+    for i in range(spec.audit_count):
+        yield audit_row(spec, i)
+
+
+def reset_dataset(spec: DatasetSpec) -> None:
+    """Remove every row belonging to this dataset's codesystems"""
+    cs_ids = [spec.namaste_codesystem_id, spec.icd11_codesystem_id]
+    db = SessionLocal()
+    try:
+        db.execute(delete(ConceptMap).where(or_(
+            ConceptMap.source_codesystem_id.in_(cs_ids),
+            ConceptMap.target_codesystem_id.in_(cs_ids),
+        )))
+        db.execute(delete(Concept).where(Concept.codesystem_id.in_(cs_ids)))
+        db.execute(delete(CodeSystem).where(CodeSystem.id.in_(cs_ids)))
+        db.execute(delete(AuditLog).where(AuditLog.user_id == BENCHMARK_USER))
+        db.commit()
+    finally:
+        db.close()
+    logger.info(f"Removed benchmark dataset scale={spec.scale} seed={spec.seed}")
+
+
+def seed_database(spec: DatasetSpec, batch_size: int = 5000, reset: bool = False) -> Dict[str, int]:
+    """Bulk load the dataset into the configured database"""
+    Base.metadata.create_all(bind=engine)
+    if reset:
+        reset_dataset(spec)
+
+    counts = {"codesystem": 0, "concept": 0, "conceptmap": 0, "audit_log": 0}
+    db = SessionLocal()
+    try:
+        db.execute(insert(CodeSystem), codesystem_rows(spec))
+        db.commit()
+        counts["codesystem"] = 2
+        for model, key, rows in (
+            (Concept, "concept", iter_concepts(spec)),
+            (ConceptMap, "conceptmap", iter_conceptmaps(spec)),
+            (AuditLog, "audit_log", iter_audit_logs(spec)),
+        ):
+            for batch in _batched(rows, batch_size):
+                db.execute(insert(model), batch)
+                db.commit()
+                counts[key] += len(batch)
+            logger.info(f"Seeded {counts[key]} {key} rows")
+    finally:
+        db.close()
+    return counts
@@ -0,0 +1,71 @@
+"""Throughput of ``python -m app.ingest`` on a NAMASTE release file.
+
+Writes the dataset's NAMASTE concepts as a release CSV and ingests it into a
+scratch codesystem four times: into an empty codesystem, again unchanged
+(every row skipped by content hash), as a minor release with 1% of the terms
+edited applied through the release diff (``--release``), and with every
+tenth term edited.  The scratch codesystem, its concepts and its release
+history are deleted afterwards, so a seeded dataset is left alone.
+"""
+import csv
+import os
+import tempfile
+from typing import Any, Dict
+
+from sqlalchemy import delete
+
+from app.db import SessionLocal
+from app.ingest import ingest_file, ingest_release
+from app.models import CodeSystem, CodeSystemRelease, Concept
+from benchmarks import datagen
+from benchmarks.datagen import DatasetSpec
+import logging
+
+logger = logging.getLogger(__name__)
+
+SCRATCH_URL = "https://fhirfly.me/fhir/CodeSystem/ingest-benchmark"
+HEADER = ["NAMC_CODE", "NAMC_term", "NAMC_term_diacritical", "Short_definition", "Long_definition", "Ontology_branches"]
+
+
+def _write_release(spec: DatasetSpec, path: str, edit_every: int = 0, edit: str = " (revised)") -> None:
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(HEADER)
+        for i in range(spec.namaste_count):
+            raw = datagen.namaste_concept(spec, i)["raw"]
+            term = raw["NAMC_TERM"] + (edit if edit_every and i % edit_every == 0 else "")
+            writer.writerow([
+                raw["NAMC_CODE"], term, raw["NAMC_term_diacritical"], raw["Short_definition"],
+                raw["Long_definition"], ";".join(raw["Ontology_branches"]),
+            ])
+
+
+def _timed(path: str, workers: int) -> Dict[str, Any]:
+    totals = ingest_file(path, format_name="namaste", url=SCRATCH_URL, workers=workers)
+    totals["rows_per_min"] = round(totals["rows"] / totals["seconds"] * 60) if totals["seconds"] > 0 else 0
+    return totals
+
+
+def measure_ingest(spec: DatasetSpec, workers: int) -> Dict[str, Any]:
+    with tempfile.TemporaryDirectory() as directory:
+        release = os.path.join(directory, "namaste.csv")
+        revised = os.path.join(directory, "namaste-revised.csv")
+        minor = os.path.join(directory, "namaste-minor.csv")
+        _write_release(spec, release)
+        _write_release(spec, revised, edit_every=10)
+        _write_release(spec, minor, edit_every=100, edit=" (minor)")
+        try:
+            results = {"first": _timed(release, workers), "repeat": _timed(release, workers)}
+            results["release"] = ingest_release(minor, "minor", format_name="namaste", url=SCRATCH_URL, workers=workers)
+            results["revised"] = _timed(revised, workers)
+            return results
+        finally:
+            db = SessionLocal()
+            try:
+                codesystem_ids = [row.id for row in db.query(CodeSystem.id).filter(CodeSystem.url == SCRATCH_URL)]
+                db.execute(delete(Concept).where(Concept.codesystem_id.in_(codesystem_ids)))
+                db.execute(delete(CodeSystem).where(CodeSystem.id.in_(codesystem_ids)))
+                db.execute(delete(CodeSystemRelease).where(CodeSystemRelease.codesystem_id.in_(codesystem_ids)))
+                db.commit()
+            finally:
+                db.close()
@@ -0,0 +1,67 @@
+"""Throughput of the bulk ConceptMap import.
+
+Builds a mapping CSV from the seeded dataset and imports it in this process
+with the same code path as ``POST /api/v1/conceptmaps/bulk``, then imports
+it again to time the all-duplicates case.  The generated mappings run from
+ICD-11 to NAMASTE, a direction the seeded dataset never maps, and are
+deleted afterwards.
+"""
+import csv
+import io
+import random
+import time
+from typing import Any, Dict
+
+from sqlalchemy import and_, delete
+
+from app.db import SessionLocal
+from app.models import ConceptMap
+from app.utils.mapping_import import import_mappings, parse_csv
+from benchmarks import datagen
+from benchmarks.datagen import DatasetSpec
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def _mapping_csv(spec: DatasetSpec, rows: int) -> str:
+    rng = random.Random(spec.seed)
+    pairs = set()
+    while len(pairs) < min(rows, spec.icd11_count * spec.namaste_count):
+        pairs.add((rng.randrange(spec.icd11_count), rng.randrange(spec.namaste_count)))
+    out = io.StringIO()
+    writer = csv.writer(out)
+    writer.writerow(["source_system", "source_code", "target_system", "target_code", "equivalence"])
+    for source, target in pairs:
+        writer.writerow([datagen.ICD11_URL, datagen.icd11_code(source), datagen.NAMASTE_URL, datagen.namaste_code(target), "relatedto"])
+    return out.getvalue()
+
+
+def _timed_import(text: str) -> Dict[str, Any]:
+    db = SessionLocal()
+    try:
+        started = time.perf_counter()
+        report = import_mappings(db, parse_csv(text))
+        seconds = time.perf_counter() - started
+    finally:
+        db.close()
+    report.pop("errors")
+    report["seconds"] = round(seconds, 3)
+    report["rows_per_min"] = round(report["received"] / seconds * 60) if seconds > 0 else 0
+    return report
+
+
+def measure_import(spec: DatasetSpec, rows: int = 100000) -> Dict[str, Any]:
+    text = _mapping_csv(spec, rows)
+    try:
+        return {"first": _timed_import(text), "repeat": _timed_import(text)}
+    finally:
+        db = SessionLocal()
+        try:
+            db.execute(delete(ConceptMap).where(and_(
+                ConceptMap.source_codesystem_id == spec.icd11_codesystem_id,
+                ConceptMap.target_codesystem_id == spec.namaste_codesystem_id,
+            )))
+            db.commit()
+        finally:
+            db.close()
@@ -0,0 +1,107 @@
+"""Query-plan regression checks.
+
+Each case calls a real CRUD method against a seeded Postgres database while
+capturing the SQL it emits, then runs ``EXPLAIN (FORMAT JSON)`` on every
+captured statement.  A sequential scan on a large table fails the check.
+"""
+from typing import Any, Callable, Dict, List, Tuple
+
+from sqlalchemy import event, text
+from sqlalchemy.orm import Session
+
+from app.crud import audit_log as audit_log_crud
+from app.crud import codesystem as codesystem_crud
+from app.crud import concept as concept_crud
+from app.crud import conceptmap as conceptmap_crud
+from app.db import SessionLocal, engine
+from benchmarks import datagen
+from benchmarks.datagen import DatasetSpec
+import logging
+
+logger = logging.getLogger(__name__)
+
+TABLES = ("codesystem", "concept", "conceptmap", "audit_log")
+
+PlanCase = Tuple[str, Callable[[Session, DatasetSpec], Any]]
+
+CASES: List[PlanCase] = [
+    ("codesystem.get_by_url", lambda db, s: codesystem_crud.codesystem.get_by_url(db, datagen.NAMASTE_URL)),
+    ("codesystem.get_by_name", lambda db, s: codesystem_crud.codesystem.get_by_name(db, "ICD-11")),
+    ("concept.get_by_code", lambda db, s: concept_crud.concept.get_by_code(
+        db, s.namaste_codesystem_id, datagen.namaste_code(s.namaste_count // 2))),
+    ("concept.get_by_codes", lambda db, s: concept_crud.concept.get_by_codes(
+        db, s.icd11_codesystem_id, [datagen.icd11_code(i) for i in range(0, s.icd11_count, max(s.icd11_count // 50, 1))])),
+    ("concept.get_multi[codes]", lambda db, s: concept_crud.concept.get_multi(
+        db, codesystem_id=s.namaste_codesystem_id, codes=[datagen.namaste_code(i) for i in range(9, 18)])),
+    ("conceptmap.get_translation", lambda db, s: conceptmap_crud.conceptmap.get_translation(
+        db, s.namaste_codesystem_id, s.icd11_codesystem_id, datagen.namaste_concept_id(s, s.namaste_count // 3))),
+    ("conceptmap.get_by_concept_ids", lambda db, s: conceptmap_crud.conceptmap.get_by_concept_ids(
+        db, [datagen.namaste_concept_id(s, i) for i in range(50)])),
+    ("conceptmap.get_mappings_for_codings", lambda db, s: conceptmap_crud.conceptmap.get_mappings_for_codings(
+        db, [(s.namaste_codesystem_id, datagen.namaste_code(i)) for i in range(0, s.namaste_count, max(s.namaste_count // 100, 1))])),
+    ("audit_log.get_multi", lambda db, s: audit_log_crud.audit_log.get_multi(db, limit=20)),
+    ("audit_log.get_multi[table_name]", lambda db, s: audit_log_crud.audit_log.get_multi(db, limit=20, table_name="conceptmap")),
+    ("audit_log.get_by_record", lambda db, s: audit_log_crud.audit_log.get_by_record(
+        db, "concept", datagen.namaste_concept_id(s, 1))),
+]
+
+
+def _capture(db: Session, spec: DatasetSpec, fn) -> List[Tuple[str, Any]]:
+    captured = []
+
+    def listener(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith("SELECT"):
+            captured.append((statement, parameters))
+
+    event.listen(engine, "before_cursor_execute", listener)
+    try:
+        fn(db, spec)
+    finally:
+        event.remove(engine, "before_cursor_execute", listener)
+    return captured
+
+
+def _seq_scans(node: Dict[str, Any], large_tables: set) -> List[str]:
+    found = []
+    if node.get("Node Type") == "Seq Scan" and node.get("Relation Name") in large_tables:
+        found.append(node["Relation Name"])
+    for child in node.get("Plans") or []:
+        found.extend(_seq_scans(child, large_tables))
+    return found
+
+
+def check_plans(spec: DatasetSpec, min_rows: int = 5000) -> List[Dict[str, Any]]:
+    """EXPLAIN every case; tables with at least ``min_rows`` rows must not be seq scanned"""
+    db = SessionLocal()
+    try:
+        for table in TABLES:
+            db.execute(text(f"ANALYZE {table}"))
+        sizes = dict(db.execute(text(
+            "SELECT relname, reltuples FROM pg_class WHERE relname = ANY(:names)"
+        ), {"names": list(TABLES)}).all())
+        large_tables = {name for name, rows in sizes.items() if rows >= min_rows}
+
+        results = []
+        for name, fn in CASES:
+            statements = _capture(db, spec, fn)
+            for statement, parameters in statements:
+                plan = db.connection().exec_driver_sql(
+                    "EXPLAIN (FORMAT JSON) " + statement, parameters
+                ).scalar()
+                root = plan[0]["Plan"]
+                scans = _seq_scans(root, large_tables)
+                results.append({
+                    "case": name,
+                    "ok": not scans,
+                    "seq_scans": scans,
+                    "large_tables": sorted(large_tables),
+                    "node": root.get("Node Type"),
+                    "total_cost": root.get("Total Cost"),
+                    "statement": " ".join(statement.split()),
+                })
+                status = "OK  " if not scans else "SEQ "
+                logger.info(f"{status}{name}: {root.get('Node Type')} cost={root.get('Total Cost')} {scans or ''}")
+        db.rollback()
+        return results
+    finally:
+        db.close()
@@ -0,0 +1,90 @@
+"""Database round trips per write request.
+
+Sends PUT and DELETE requests for each resource through the app in this
+process (``TestClient``, no server needed) against the configured database,
+and counts what each request sends to it: every statement, plus the COMMIT
+or ROLLBACK that ends a transaction.  The writes go to scratch rows created
+first (and not counted), so a seeded dataset is left alone.  psycopg2 opens
+transactions implicitly with the first statement, so BEGIN is not a round
+trip of its own.
+"""
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, Optional
+
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+
+from app import db as database
+import logging
+
+logger = logging.getLogger(__name__)
+
+SCRATCH_URL = "https://fhirfly.me/fhir/CodeSystem/round-trips"
+
+
+@contextmanager
+def _counting() -> Iterator[Dict[str, int]]:
+    counts = {"statements": 0, "commits": 0, "rollbacks": 0}
+
+    def on_statement(conn, cursor, statement, parameters, context, executemany):
+        counts["statements"] += 1
+
+    def on_commit(conn):
+        counts["commits"] += 1
+
+    def on_rollback(conn):
+        counts["rollbacks"] += 1
+
+    listeners = [("before_cursor_execute", on_statement), ("commit", on_commit), ("rollback", on_rollback)]
+    for name, fn in listeners:
+        event.listen(database.engine, name, fn)
+    try:
+        yield counts
+    finally:
+        for name, fn in listeners:
+            event.remove(database.engine, name, fn)
+
+
+def measure_round_trips() -> Dict[str, Dict[str, Any]]:
+    """Status and round trips of each write; ``[stale]`` cases send an outdated If-Match"""
+    from app.main import app
+
+    client = TestClient(app)
+    results: Dict[str, Dict[str, Any]] = {}
+
+    def write(name: str, method: str, path: str, json: Optional[dict] = None, etag: Optional[str] = None):
+        headers = {"If-Match": etag} if etag else {}
+        with _counting() as counts:
+            response = client.request(method, f"/api/v1{path}", json=json, headers=headers)
+        results[name] = {"status": response.status_code, **counts, "round_trips": sum(counts.values())}
+        return response
+
+    def create(path: str, body: dict) -> dict:
+        response = client.post(f"/api/v1{path}", json=body)
+        response.raise_for_status()
+        return response.json()
+
+    codesystem = create("/codesystems/", {"url": SCRATCH_URL, "name": "round-trips", "status": "draft"})
+    source = create("/concepts/", {"codesystem_id": codesystem["id"], "code": "RT-1", "display": "Source"})
+    target = create("/concepts/", {"codesystem_id": codesystem["id"], "code": "RT-2", "display": "Target"})
+    conceptmap = create("/conceptmaps/", {
+        "source_codesystem_id": codesystem["id"], "target_codesystem_id": codesystem["id"],
+        "source_code": source["id"], "target_code": target["id"], "equivalence": "relatedto",
+    })
+
+    for name, path, body, record in (
+        ("codesystem", "/codesystems", {"title": "Round trips"}, codesystem),
+        ("concept", "/concepts", {"display": "Source (edited)"}, source),
+        ("conceptmap", "/conceptmaps", {"equivalence": "equivalent"}, conceptmap),
+    ):
+        url = f"{path}/{record['id']}"
+        etag = write(f"{name}.put", "PUT", url, json=body).headers.get("ETag")
+        write(f"{name}.put[if-match]", "PUT", url, json=body, etag=etag)
+        write(f"{name}.put[stale]", "PUT", url, json=body, etag=etag)
+        record["etag"] = client.get(f"/api/v1{url}").headers.get("ETag")
+
+    write("conceptmap.delete", "DELETE", f"/conceptmaps/{conceptmap['id']}", etag=conceptmap["etag"])
+    write("concept.delete", "DELETE", f"/concepts/{source['id']}", etag=source["etag"])
+    client.delete(f"/api/v1/concepts/{target['id']}")
+    write("codesystem.delete", "DELETE", f"/codesystems/{codesystem['id']}", etag=codesystem["etag"])
+    return results
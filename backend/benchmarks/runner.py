@@ -0,0 +1,169 @@
+"""Load driver, latency statistics and JSON result files"""
+import json
+import math
+import os
+import platform
+import random
+import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+from benchmarks.datagen import DatasetSpec
+from benchmarks.scenarios import Scenario
+import logging
+
+logger = logging.getLogger(__name__)
+
+RESULT_FORMAT_VERSION = 1
+
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    rank = max(math.ceil(pct / 100.0 * len(sorted_values)) - 1, 0)
+    return sorted_values[min(rank, len(sorted_values) - 1)]
+
+
+def summarize(latencies_ms: List[float], errors: int, statuses: Dict[int, int], wall_s: float) -> Dict[str, Any]:
+    values = sorted(latencies_ms)
+    count = len(values)
+    return {
+        "requests": count,
+        "errors": errors,
+        "status_codes": {str(k): v for k, v in sorted(statuses.items())},
+        "wall_time_s": round(wall_s, 4),
+        "throughput_rps": round(count / wall_s, 2) if wall_s > 0 else 0.0,
+        "mean_ms": round(sum(values) / count, 3) if count else 0.0,
+        "p50_ms": round(percentile(values, 50), 3),
+        "p95_ms": round(percentile(values, 95), 3),
+        "p99_ms": round(percentile(values, 99), 3),
+        "max_ms": round(values[-1], 3) if values else 0.0,
+    }
+
+
+def run_scenario(
+    client: httpx.Client,
+    scenario: Scenario,
+    spec: DatasetSpec,
+    requests: int,
+    concurrency: int,
+    warmup: int = 20,
+    seed: Optional[int] = None,
+) -> Dict[str, Any]:
+    """Fire ``requests`` requests at ``concurrency`` and summarize latencies"""
+    rng = random.Random(f"{spec.seed}:{scenario.name}:{seed if seed is not None else 0}")
+    planned = [scenario.build(spec, rng) for _ in range(warmup + requests)]
+
+    for method, path, kwargs in planned[:warmup]:
+        client.request(method, path, **kwargs)
+
+    latencies: List[float] = []
+    statuses: Dict[int, int] = {}
+    payload_bytes = 0
+    errors = 0
+    lock = threading.Lock()
+
+    def fire(request):
+        nonlocal errors, payload_bytes
+        method, path, kwargs = request
+        started = time.perf_counter()
+        size = 0
+        try:
+            response = client.request(method, path, **kwargs)
+            status = response.status_code
+            size = len(response.content)
+        except httpx.HTTPError:
+            status = 0
+        elapsed = (time.perf_counter() - started) * 1000.0
+        with lock:
+            latencies.append(elapsed)
+            payload_bytes += size
+            statuses[status] = statuses.get(status, 0) + 1
+            # 404 is an expected answer for lookup misses
+            if status == 0 or status >= 500:
+                errors += 1
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(fire, planned[warmup:]))
+    wall = time.perf_counter() - started
+
+    stats = summarize(latencies, errors, statuses, wall)
+    stats["mean_response_bytes"] = round(payload_bytes / len(latencies)) if latencies else 0
+    logger.info(
+        f"{scenario.name}: {stats['throughput_rps']} req/s "
+        f"p50={stats['p50_ms']}ms p95={stats['p95_ms']}ms p99={stats['p99_ms']}ms "
+        f"{stats['mean_response_bytes']}B/response errors={errors}"
+    )
+    return stats
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], stderr=subprocess.DEVNULL, text=True
+        ).strip()
+    except Exception:
+        return None
+
+
+def run_suite(
+    scenarios: List[Scenario],
+    spec: DatasetSpec,
+    base_url: str,
+    requests: int,
+    concurrency: int,
+    warmup: int = 20,
+    timeout: float = 30.0,
+) -> Dict[str, Any]:
+    """Run every scenario and return a result document"""
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    results: Dict[str, Any] = {}
+    with httpx.Client(base_url=base_url, timeout=timeout, limits=limits) as client:
+        for scenario in scenarios:
+            results[scenario.name] = run_scenario(
+                client, scenario, spec, requests=requests, concurrency=concurrency, warmup=warmup
+            )
+    return {
+        "format_version": RESULT_FORMAT_VERSION,
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "git_commit": _git_commit(),
+        "host": platform.node(),
+        "python": platform.python_version(),
+        "base_url": base_url,
+        "scale": spec.scale,
+        "seed": spec.seed,
+        "requests_per_scenario": requests,
+        "concurrency": concurrency,
+        "scenarios": results,
+    }
+
+
+def write_results(result: Dict[str, Any], out_dir: str) -> str:
+    os.makedirs(out_dir, exist_ok=True)
+    stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+    path = os.path.join(out_dir, f"{stamp}-{result['scale']}-{result.get('git_commit') or 'nogit'}.json")
+    with open(path, "w") as fh:
+        json.dump(result, fh, indent=2, sort_keys=True)
+    return path
+
+
+def compare(baseline: Dict[str, Any], candidate: Dict[str, Any], threshold: float = 0.10) -> List[str]:
+    """Return human-readable regressions of ``candidate`` against ``baseline``"""
+    regressions = []
+    for name, new in candidate.get("scenarios", {}).items():
+        old = baseline.get("scenarios", {}).get(name)
+        if not old:
+            continue
+        for metric in ("p50_ms", "p95_ms", "p99_ms"):
+            if old[metric] and new[metric] > old[metric] * (1 + threshold):
+                regressions.append(f"{name}.{metric}: {old[metric]} -> {new[metric]}")
+        if old["throughput_rps"] and new["throughput_rps"] < old["throughput_rps"] * (1 - threshold):
+            regressions.append(f"{name}.throughput_rps: {old['throughput_rps']} -> {new['throughput_rps']}")
+    return regressions
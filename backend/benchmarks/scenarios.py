@@ -0,0 +1,155 @@
+"""Scenario drivers for the public API endpoints.
+
+A scenario turns a random generator into one HTTP request.  Parameters are
+derived from the synthetic dataset spec, so the requests hit real rows.
+"""
+import random
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Tuple
+
+from benchmarks import datagen
+from benchmarks.datagen import DatasetSpec
+
+# (method, path, httpx keyword arguments)
+Request = Tuple[str, str, Dict[str, Any]]
+
+API = "/api/v1"
+
+
+@dataclass
+class Scenario:
+    name: str
+    description: str
+    build: Callable[[DatasetSpec, random.Random], Request]
+    tags: List[str] = field(default_factory=list)
+
+
+def _concept_search(spec: DatasetSpec, rng: random.Random) -> Request:
+    term = rng.choice(datagen.TERMS + datagen.CONDITIONS)
+    return "GET", f"{API}/concepts/", {"params": {"search": term, "page": 1, "size": 20}}
+
+
+def _concept_list(**fields: str) -> Callable[[DatasetSpec, random.Random], Request]:
+    # Same pages for every variant, so payload and latency compare like for like
+    def build(spec: DatasetSpec, rng: random.Random) -> Request:
+        codesystem_id = rng.choice([spec.namaste_codesystem_id, spec.icd11_codesystem_id])
+        return "GET", f"{API}/concepts/", {
+            "params": {"codesystem_id": str(codesystem_id), "page": rng.randint(1, 50), "size": 50, **fields}
+        }
+    return build
+
+
+def _concept_by_code(spec: DatasetSpec, rng: random.Random) -> Request:
+    if rng.random() < 0.5:
+        codesystem_id, code = spec.namaste_codesystem_id, datagen.namaste_code(rng.randrange(spec.namaste_count))
+    else:
+        codesystem_id, code = spec.icd11_codesystem_id, datagen.icd11_code(rng.randrange(spec.icd11_count))
+    # Roughly one lookup in ten misses, as with real EMR traffic
+    if rng.random() < 0.1:
+        code = code + "X"
+    return "GET", f"{API}/concepts/by-code/{codesystem_id}/{code}", {}
+
+
+def _concept_fuzzy(spec: DatasetSpec, rng: random.Random) -> Request:
+    code = list(datagen.icd11_code(rng.randrange(spec.icd11_count)))
+    code[rng.randrange(len(code))] = rng.choice("0123456789ABCDEFXYZ")
+    return "GET", f"{API}/concepts/fuzzy/{spec.icd11_codesystem_id}/{''.join(code)}", {}
+
+
+def _translate(spec: DatasetSpec, rng: random.Random) -> Request:
+    source = datagen.namaste_concept_id(spec, rng.randrange(spec.namaste_count))
+    return "POST", f"{API}/conceptmaps/translate", {"json": {
+        "source_codesystem": datagen.NAMASTE_URL,
+        "target_codesystem": datagen.ICD11_URL,
+        "source_code": str(source),
+    }}
+
+
+def _validate_code(spec: DatasetSpec, rng: random.Random) -> Request:
+    code = datagen.namaste_code(rng.randrange(spec.namaste_count))
+    if rng.random() < 0.1:
+        code = code + "X"
+    return "GET", f"{API}/CodeSystem/$validate-code", {"params": {"url": datagen.NAMASTE_URL, "code": code}}
+
+
+def _valueset_expand(spec: DatasetSpec, rng: random.Random) -> Request:
+    return "GET", f"{API}/ValueSet/$expand", {"params": {
+        "url": datagen.NAMASTE_URL,
+        "filter": rng.choice(datagen.TERMS),
+        "offset": rng.randint(0, 10) * 50,
+        "count": 50,
+    }}
+
+
+def make_bundle(spec: DatasetSpec, rng: random.Random, entries: int) -> Dict[str, Any]:
+    """Batch Bundle of Condition resources coded with NAMASTE only"""
+    return {
+        "resourceType": "Bundle",
+        "type": "batch",
+        "entry": [
+            {
+                "request": {"method": "POST", "url": "Condition"},
+                "resource": {
+                    "resourceType": "Condition",
+                    "subject": {"reference": f"Patient/{rng.randrange(10_000)}"},
+                    "code": {"coding": [{
+                        "system": datagen.NAMASTE_URL,
+                        "code": datagen.namaste_code(rng.randrange(spec.namaste_count)),
+                    }]},
+                },
+            }
+            for _ in range(entries)
+        ],
+    }
+
+
+def _bundle(entries: int) -> Callable[[DatasetSpec, random.Random], Request]:
+    def build(spec: DatasetSpec, rng: random.Random) -> Request:
+        return "POST", f"{API}/Bundle", {"json": make_bundle(spec, rng, entries)}
+    return build
+
+
+def _audit_list(spec: DatasetSpec, rng: random.Random) -> Request:
+    params: Dict[str, Any] = {"page": rng.randint(1, 20), "size": 20}
+    if rng.random() < 0.5:
+        params["table_name"] = rng.choice(["concept", "conceptmap", "codesystem"])
+    return "GET", f"{API}/audit-logs/", {"params": params}
+
+
+def _suggest_one(spec: DatasetSpec, rng: random.Random) -> Request:
+    return "POST", f"{API}/conceptmaps/suggest", {"json": {
+        "source_codesystem": datagen.NAMASTE_URL,
+        "target_codesystem": datagen.ICD11_URL,
+        "source_codes": [datagen.namaste_code(rng.randrange(spec.namaste_count))],
+        "k": 5,
+    }}
+
+
+def _suggest_all(spec: DatasetSpec, rng: random.Random) -> Request:
+    return "POST", f"{API}/conceptmaps/suggest", {"json": {
+        "source_codesystem": datagen.NAMASTE_URL,
+        "target_codesystem": datagen.ICD11_URL,
+        "k": 5,
+    }}
+
+
+SCENARIOS: Dict[str, Scenario] = {
+    s.name: s
+    for s in [
+        Scenario("concept_search", "ILIKE search over code/display/definition", _concept_search, ["search"]),
+        Scenario("concept_list_enriched", "Paginated concept listing with mapping enrichment", _concept_list(), ["search"]),
+        Scenario("concept_list_summary", "Paginated concept listing with _summary=true", _concept_list(_summary="true"), ["search"]),
+        Scenario("concept_list_elements", "Paginated concept listing with _elements=code,display", _concept_list(_elements="code,display"), ["search"]),
+        Scenario("concept_by_code", "Concept lookup by codesystem and code", _concept_by_code, ["lookup"]),
+        Scenario("concept_fuzzy", "Did-you-mean lookup for a mistyped ICD-11 code", _concept_fuzzy, ["lookup"]),
+        Scenario("translate", "NAMASTE to ICD-11 translation", _translate, ["lookup"]),
+        Scenario("validate_code", "FHIR CodeSystem $validate-code", _validate_code, ["lookup"]),
+        Scenario("valueset_expand", "Paged ValueSet $expand with a text filter", _valueset_expand, ["search"]),
+        Scenario("bundle_1", "Dual-code a 1-entry Condition bundle", _bundle(1), ["write"]),
+        Scenario("bundle_100", "Dual-code a 100-entry Condition bundle", _bundle(100), ["write"]),
+        Scenario("bundle_10000", "Dual-code a 10,000-entry Condition bundle", _bundle(10_000), ["write", "heavy"]),
+        Scenario("audit_list", "Audit log listing with filters", _audit_list, ["search"]),
+        Scenario("suggest_1", "TF-IDF mapping suggestions for one NAMASTE code", _suggest_one, ["search"]),
+        Scenario("suggest_all", "TF-IDF mapping suggestions for every NAMASTE concept", _suggest_all, ["search", "heavy"]),
+    ]
+}
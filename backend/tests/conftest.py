@@ -0,0 +1,44 @@
+"""Shared test setup.
+
+Tests run against ``DATABASE_URL`` (or the ``DB_*`` variables) when set, and
+otherwise against a scratch SQLite file created here.  Tests marked
+``postgres`` exercise Postgres-only behavior and are skipped on SQLite.
+"""
+import os
+import tempfile
+
+if not os.getenv("DATABASE_URL") and not os.getenv("DB_HOST"):
+    os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(tempfile.mkdtemp(prefix="fhirfly-tests-"), "test.sqlite")
+os.environ.setdefault("CHANGE_FEED_ENABLED", "false")
+os.environ.setdefault("WARM_INDEXES", "false")
+
+import pytest
+
+from app.db import IS_SQLITE, Base, engine
+import app.models  # noqa: F401  (registers the tables)
+
+
+def pytest_collection_modifyitems(config, items):
+    if IS_SQLITE:
+        skip = pytest.mark.skip(reason="needs Postgres: set DATABASE_URL")
+        for item in items:
+            if "postgres" in item.keywords:
+                item.add_marker(skip)
+
+
+@pytest.fixture(scope="session", autouse=True)
+def schema():
+    """Tables for the scratch SQLite database; Postgres is expected to be migrated"""
+    if IS_SQLITE:
+        Base.metadata.create_all(engine)
+    yield
+
+
+@pytest.fixture
+def db():
+    from app.db import SessionLocal
+    session = SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
@@ -0,0 +1,43 @@
+"""Requests are sorted into admission lanes and reported per lane"""
+import asyncio
+
+from app.utils.admission import ROUTE_LANES, AdmissionMiddleware, compile_routes, lane_for
+from app.utils.metrics import registry
+
+
+def test_export_lanes():
+    routes = compile_routes(ROUTE_LANES)
+    assert lane_for(routes, "GET", "/api/v1/$export") == "lookup"
+    assert lane_for(routes, "GET", "/api/v1/$export-poll-status/job-1") == "lookup"
+    assert lane_for(routes, "GET", "/api/v1/$export-poll-status/job-1/Concept-1.ndjson") == "download"
+    assert lane_for(routes, "GET", "/api/v1/sync/concepts") == "sync"
+    assert lane_for(routes, "POST", "/api/v1/conceptmaps/bulk") == "export"
+
+
+def test_downloads_are_not_limited():
+    middleware = AdmissionMiddleware(None, limits={"lookup": 1, "export": 1, "sync": 1})
+    assert middleware.lanes.get(middleware.lane_for("GET", "/api/v1/$export-poll-status/job-1/Concept-1.ndjson")) is None
+
+
+def test_gauges_report_every_instance():
+    started = asyncio.Event()
+    release = asyncio.Event()
+
+    async def app(scope, receive, send):
+        started.set()
+        await release.wait()
+
+    first = AdmissionMiddleware(app, limits={"sync": 1})
+    second = AdmissionMiddleware(app, limits={"sync": 1})
+
+    async def scenario():
+        scope = {"type": "http", "method": "GET", "path": "/api/v1/sync/concepts"}
+        running = [asyncio.ensure_future(m(scope, None, None)) for m in (first, second)]
+        await started.wait()
+        await asyncio.sleep(0)
+        rendered = registry.render()
+        release.set()
+        await asyncio.gather(*running)
+        return rendered
+
+    assert 'fhirfly_admission_in_flight{lane="sync"} 2' in asyncio.run(scenario())
@@ -0,0 +1,94 @@
+"""Two-tier read cache against the in-memory shared tier"""
+import threading
+
+from app.utils import cache
+from app.utils.cache import InMemoryBackend, TieredCache
+
+
+class FailingBackend(InMemoryBackend):
+    def get_many(self, keys):
+        raise ConnectionError("cache down")
+
+    def set_many(self, items, ttl):
+        raise ConnectionError("cache down")
+
+    def add(self, key, value, ttl):
+        raise ConnectionError("cache down")
+
+    def delete(self, key):
+        raise ConnectionError("cache down")
+
+    def incr(self, key):
+        raise ConnectionError("cache down")
+
+
+def _nodes(shared, count=2):
+    return [TieredCache(shared=shared, prefix="test:", version_ttl=0.0) for _ in range(count)]
+
+
+def test_miss_is_loaded_once_across_nodes():
+    first, second = _nodes(InMemoryBackend())
+    calls = []
+    loader = lambda: calls.append(1) or "value"
+    assert first.get("ns", "key", loader) == "value"
+    assert second.get("ns", "key", loader) == "value"
+    assert len(calls) == 1
+    assert second.stats["shared_hits"] == 1
+
+
+def test_concurrent_misses_load_once():
+    node = TieredCache(shared=InMemoryBackend(), prefix="test:")
+    calls = []
+    started = threading.Event()
+
+    def loader():
+        calls.append(1)
+        started.wait(1)
+        return "value"
+
+    threads = [threading.Thread(target=node.get, args=("ns", "key", loader)) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    started.set()
+    for thread in threads:
+        thread.join()
+    assert len(calls) == 1
+
+
+def test_invalidate_retires_keys_on_other_node():
+    first, second = _nodes(InMemoryBackend())
+    assert second.get("ns", "key", lambda: "old") == "old"
+    first.invalidate("ns")
+    assert second.get("ns", "key", lambda: "new") == "new"
+
+
+def test_get_many_caches_absent_keys_as_none():
+    node = TieredCache(shared=InMemoryBackend(), prefix="test:")
+    requested = []
+
+    def loader(keys):
+        requested.append(list(keys))
+        return {"a": 1}
+
+    assert node.get_many("ns", ["a", "b"], loader) == {"a": 1, "b": None}
+    assert node.get_many("ns", ["a", "b"], loader) == {"a": 1, "b": None}
+    assert requested == [["a", "b"]]
+
+
+def test_shared_errors_degrade_to_a_miss():
+    node = TieredCache(shared=FailingBackend(), prefix="test:")
+    assert node.get("ns", "key", lambda: "value") == "value"
+    assert node.get_many("ns", ["a"], lambda keys: {"a": 1}) == {"a": 1}
+    node.invalidate("ns")
+    assert node.stats["shared_errors"] > 0
+
+
+def test_waiting_node_leaves_the_holders_lock(monkeypatch):
+    monkeypatch.setattr(cache, "LOCK_WAIT", 0.05)
+    shared = InMemoryBackend()
+    node = TieredCache(shared=shared, prefix="test:")
+    lock_key = node._full_key("ns", 0, "key") + ":lock"
+    # Another node holds the lock and has not written the value yet
+    assert shared.add(lock_key, b"1", 10)
+    assert node.get("ns", "key", lambda: "value") == "value"
+    assert shared.get_many([lock_key]) == [b"1"]
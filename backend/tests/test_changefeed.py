@@ -0,0 +1,78 @@
+"""Writes reach every listening worker through the Postgres change feed.
+
+Worker processes each run a ``ChangeFeedListener``, as every uvicorn worker
+does; writes made here must arrive in all of them.  Needs a migrated
+Postgres database.
+"""
+import queue
+import time
+import uuid
+from typing import List, Tuple
+
+import pytest
+from sqlalchemy import delete, update
+
+from app.models import CodeSystem, Concept
+from benchmarks.changefeed import start_workers, stop_workers
+
+WORKERS = 2
+# Seconds every worker may take to see a write
+TIMEOUT = 10.0
+
+pytestmark = pytest.mark.postgres
+
+
+@pytest.fixture
+def concepts(db):
+    cs = CodeSystem(url=f"https://example.org/cs/{uuid.uuid4()}", name="changefeed-test")
+    db.add(cs)
+    db.flush()
+    rows = [Concept(codesystem_id=cs.id, code=f"F{i}", display=f"Concept {i}") for i in range(20)]
+    db.add_all(rows)
+    db.commit()
+    yield cs.id, [row.id for row in rows]
+    db.rollback()
+    db.execute(delete(Concept).where(Concept.codesystem_id == cs.id))
+    db.execute(delete(CodeSystem).where(CodeSystem.id == cs.id))
+    db.commit()
+
+
+@pytest.fixture
+def workers():
+    processes, events = start_workers(WORKERS)
+    yield events
+    stop_workers(processes)
+
+
+def _drain(events, expected: int, timeout: float) -> List[Tuple]:
+    received = []
+    deadline = time.monotonic() + timeout
+    while len(received) < expected and time.monotonic() < deadline:
+        try:
+            received.append(events.get(timeout=0.1))
+        except queue.Empty:
+            continue
+    return received
+
+
+def test_every_worker_sees_each_write(db, concepts, workers):
+    _, concept_ids = concepts
+    started = time.time()
+    for concept_id in concept_ids:
+        db.execute(update(Concept).where(Concept.id == concept_id).values(display=Concept.display + " (edited)"))
+        db.commit()
+    received = _drain(workers, len(concept_ids) * WORKERS, TIMEOUT)
+    assert {(worker, record_id) for worker, record_id, bulk, _ in received} == {
+        (worker, str(concept_id)) for worker in range(WORKERS) for concept_id in concept_ids
+    }
+    # Write to invalidation on every worker, well within the timeout
+    assert max(at for _, _, _, at in received) - started < TIMEOUT
+
+
+def test_bulk_statement_sends_one_summary(db, concepts, workers):
+    codesystem_id, concept_ids = concepts
+    db.execute(update(Concept).where(Concept.codesystem_id == codesystem_id).values(display=Concept.display + " (bulk)"))
+    db.commit()
+    # Wait long enough that per-row notifications would have arrived too
+    received = _drain(workers, len(concept_ids) * WORKERS, 2.0)
+    assert sorted((worker, bulk) for worker, _, bulk, _ in received) == [(worker, True) for worker in range(WORKERS)]
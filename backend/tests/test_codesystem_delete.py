@@ -0,0 +1,50 @@
+"""Cascading codesystem deletes and the invalidation of derived structures"""
+import uuid
+
+import pytest
+
+from app.crud.codesystem import codesystem as codesystem_crud
+from app.models import CodeSystem, Concept
+from app.utils.events import _subscribers, subscribe
+
+
+class Cancelled(Exception):
+    pass
+
+
+@pytest.fixture
+def published(monkeypatch):
+    events = []
+    monkeypatch.setitem(_subscribers, "codesystem", [])
+    subscribe("codesystem", events.append)
+    return events
+
+
+def _codesystem(db, concepts: int) -> CodeSystem:
+    cs = CodeSystem(url=f"https://example.org/cs/{uuid.uuid4()}", name="cascade-test")
+    db.add(cs)
+    db.flush()
+    db.add_all(Concept(codesystem_id=cs.id, code=f"C{i}", display=f"Concept {i}") for i in range(concepts))
+    db.commit()
+    return cs
+
+
+def test_cancelled_cascade_still_invalidates(db, published):
+    cs = _codesystem(db, 10)
+
+    def progress(done, total):
+        if done:
+            raise Cancelled()
+
+    with pytest.raises(Cancelled):
+        codesystem_crud.delete(db, cs.id, progress=progress, batch_size=3)
+    # One batch was committed before the cancel
+    assert db.query(Concept).filter(Concept.codesystem_id == cs.id).count() == 7
+    assert [(e.operation, e.record_id) for e in published if e.record_id == cs.id] == [("DELETE", cs.id)]
+
+
+def test_completed_cascade_invalidates_once(db, published):
+    cs = _codesystem(db, 10)
+    codesystem_crud.delete(db, cs.id, batch_size=3)
+    assert db.get(CodeSystem, cs.id) is None
+    assert [e.operation for e in published if e.record_id == cs.id] == ["DELETE"]
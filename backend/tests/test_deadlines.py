@@ -0,0 +1,175 @@
+"""Abandoned requests stop their queries on the database server.
+
+A route runs a deliberately slow statement through ``get_db`` behind
+``DeadlineMiddleware`` (``pg_sleep`` on Postgres, a long recursive count on
+SQLite) and turns errors into 500s the way the API routes do.  Requests are
+driven straight through the ASGI app so a test can disconnect mid-query.
+"""
+import asyncio
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+import pytest
+from fastapi import Depends, FastAPI, HTTPException
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from app.db import IS_SQLITE, SessionLocal, get_db, instance_name
+from app.utils.deadline import DeadlineMiddleware
+from app.utils.singleflight import SingleFlightMiddleware
+
+# Seconds an abandoned statement may take to stop
+GRACE = 1.0
+
+SLOW_QUERY = (
+    "WITH RECURSIVE n(x) AS (SELECT 1 UNION ALL SELECT x + 1 FROM n LIMIT 1000000000) SELECT count(*) FROM n"
+    if IS_SQLITE else "SELECT pg_sleep(60)"
+)
+
+
+class SlowRoute:
+    """A FastAPI app whose /slow statement runs until stopped, recording when it returned"""
+
+    def __init__(self, slow_calls: int = 1_000_000):
+        self.slow_calls = slow_calls
+        self.calls = 0
+        self.finished = threading.Event()
+        self.finished_at: Optional[float] = None
+        self.app = FastAPI()
+
+        @self.app.get("/slow")
+        def slow(delay: float = 0.0, db: Session = Depends(get_db)):
+            self.calls += 1
+            time.sleep(delay)
+            try:
+                if self.calls > self.slow_calls:
+                    return {"slow": False}
+                db.execute(text(SLOW_QUERY)).all()
+                return {"slow": True}
+            except Exception:
+                raise HTTPException(status_code=500, detail="Failed to run query")
+            finally:
+                if self.finished_at is None:
+                    self.finished_at = time.monotonic()
+                    self.finished.set()
+
+    def stopped_after(self, started: float) -> Optional[float]:
+        self.finished.wait(GRACE + 10)
+        return self.finished_at - started if self.finished_at is not None else None
+
+
+async def call(app, headers: List = (), path: str = "/slow", disconnect_after: Optional[float] = None) -> Dict[str, Any]:
+    """One GET through the ASGI app; the client disconnects after ``disconnect_after`` seconds"""
+    messages: List[dict] = []
+    sent_request = False
+
+    async def receive():
+        nonlocal sent_request
+        if not sent_request:
+            sent_request = True
+            return {"type": "http.request", "body": b"", "more_body": False}
+        if disconnect_after is None:
+            await asyncio.Event().wait()
+        else:
+            await asyncio.sleep(disconnect_after)
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        messages.append(message)
+
+    path, _, query = path.partition("?")
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET", "scheme": "http",
+        "path": path, "raw_path": path.encode(), "query_string": query.encode(), "root_path": "",
+        "headers": list(headers), "client": ("127.0.0.1", 0), "server": ("testserver", 80),
+    }
+    await app(scope, receive, send)
+    start = next(m for m in messages if m["type"] == "http.response.start")
+    body = b"".join(m.get("body", b"") for m in messages if m["type"] == "http.response.body")
+    return {"status": start["status"], "headers": dict(start["headers"]), "body": body}
+
+
+def active_slow_queries() -> int:
+    """pg_sleep statements of this process still running on the server"""
+    db = SessionLocal()
+    try:
+        return db.execute(text(
+            "SELECT count(*) FROM pg_stat_activity WHERE application_name = :name "
+            "AND state = 'active' AND query LIKE 'SELECT pg_sleep%' AND pid <> pg_backend_pid()"
+        ), {"name": instance_name()}).scalar()
+    finally:
+        db.close()
+
+
+def _timed_out() -> float:
+    route = SlowRoute()
+    started = time.monotonic()
+    response = asyncio.run(call(DeadlineMiddleware(route.app), [(b"x-request-timeout", b"0.5")]))
+    assert response["status"] == 504
+    return route.stopped_after(started)
+
+
+def _disconnected() -> float:
+    route = SlowRoute()
+    started = time.monotonic()
+    asyncio.run(call(DeadlineMiddleware(route.app), [(b"x-request-timeout", b"60")], disconnect_after=0.5))
+    return route.stopped_after(started)
+
+
+def test_timeout_stops_statement():
+    assert _timed_out() <= 0.5 + GRACE
+
+
+def test_spent_budget_is_refused_before_querying():
+    route = SlowRoute()
+    started = time.monotonic()
+    response = asyncio.run(call(DeadlineMiddleware(route.app), [(b"x-request-timeout", b"0.2")], "/slow?delay=0.5"))
+    assert response["status"] == 503
+    assert response["headers"][b"retry-after"] == b"1"
+    assert route.stopped_after(started) <= 0.5 + GRACE
+
+
+def test_disconnect_cancels_statement():
+    assert _disconnected() <= 0.5 + GRACE
+
+
+@pytest.mark.postgres
+def test_abandoned_statements_leave_no_active_query():
+    _timed_out()
+    assert active_slow_queries() == 0
+    _disconnected()
+    assert active_slow_queries() == 0
+
+
+def test_followers_of_cancelled_leader_run_themselves():
+    # Only the leader's call is slow; a follower that ran itself answers at once
+    route = SlowRoute(slow_calls=1)
+    app = SingleFlightMiddleware(DeadlineMiddleware(route.app), routes=[("GET", r"/slow")])
+
+    async def scenario():
+        async def follower():
+            await asyncio.sleep(0.1)
+            return await call(app, [(b"x-request-timeout", b"10")])
+        return await asyncio.gather(call(app, [(b"x-request-timeout", b"60")], disconnect_after=0.5), follower())
+
+    _, follower = asyncio.run(scenario())
+    assert follower["status"] == 200
+    assert follower["body"] == b'{"slow":false}'
+
+
+def test_followers_of_timed_out_leader_run_themselves():
+    # The leader's short deadline gives it a 504; a follower with time to spare gets its own answer
+    route = SlowRoute(slow_calls=1)
+    app = SingleFlightMiddleware(DeadlineMiddleware(route.app), routes=[("GET", r"/slow")])
+
+    async def scenario():
+        async def follower():
+            await asyncio.sleep(0.1)
+            return await call(app, [(b"x-request-timeout", b"30")])
+        return await asyncio.gather(call(app, [(b"x-request-timeout", b"0.5")]), follower())
+
+    leader, follower = asyncio.run(scenario())
+    assert leader["status"] == 504
+    assert follower["status"] == 200
+    assert follower["body"] == b'{"slow":false}'
@@ -0,0 +1,96 @@
+"""Bulk change events drop the structures derived from their codesystem"""
+import uuid
+
+import pytest
+
+from app.crud.concept import concept as concept_crud
+from app.crud.conceptmap import conceptmap as conceptmap_crud
+from app.models import CodeSystem, Concept, ConceptMap
+from app.schemas import ConceptMapUpdate, ConceptUpdate
+from app.utils.events import ChangeEvent, _subscribers, is_bulk, publish, subscribe
+from app.utils.fuzzy import fuzzy_code_index
+from app.utils.hierarchy import hierarchy_index
+from app.utils.membership import membership_index
+
+
+@pytest.fixture
+def codesystem_id(db):
+    cs = CodeSystem(url=f"https://example.org/cs/{uuid.uuid4()}", name="events-test")
+    db.add(cs)
+    db.flush()
+    db.add_all(Concept(codesystem_id=cs.id, code=f"E{i}", display=f"Concept {i}") for i in range(5))
+    db.commit()
+    return cs.id
+
+
+def test_is_bulk():
+    cs = uuid.uuid4()
+    assert is_bulk(ChangeEvent("concept", "UPDATE", old={"codesystem_id": cs, "code": None}, new={"codesystem_id": cs, "code": None}))
+    assert is_bulk(ChangeEvent("conceptmap", "INSERT", new={
+        "source_codesystem_id": cs, "target_codesystem_id": cs, "source_code": None, "target_code": None,
+    }))
+    assert not is_bulk(ChangeEvent("concept", "DELETE", uuid.uuid4(), old={"codesystem_id": cs, "code": "A"}))
+    assert not is_bulk(ChangeEvent("codesystem", "UPDATE", cs))
+
+
+def test_bulk_concept_event_drops_codesystem_indexes(db, codesystem_id):
+    fuzzy_code_index.get(db, codesystem_id)
+    hierarchy_index.get(db, codesystem_id)
+    membership_index.contains(db, codesystem_id, "E0")
+
+    publish(ChangeEvent("concept", "INSERT", new={"codesystem_id": codesystem_id, "code": None}, remote=True))
+
+    assert codesystem_id not in fuzzy_code_index._indexes
+    assert codesystem_id not in hierarchy_index._graphs
+    assert codesystem_id not in membership_index._members
+
+
+def test_row_event_patches_indexes(db, codesystem_id):
+    fuzzy_code_index.get(db, codesystem_id)
+    publish(ChangeEvent("concept", "INSERT", uuid.uuid4(), new={"codesystem_id": codesystem_id, "code": "E99"}, remote=True))
+    assert codesystem_id in fuzzy_code_index._indexes
+    assert fuzzy_code_index.suggest(db, codesystem_id, "E99", max_distance=0)[0][0] == "E99"
+
+
+def test_bulk_upsert_publishes_one_event_per_operation(db, codesystem_id, monkeypatch):
+    received = []
+    monkeypatch.setitem(_subscribers, "concept", [])
+    subscribe("concept", received.append)
+    rows = [
+        {"code": f"E{i}", "display": f"Concept {i}", "definition": None, "properties": None, "raw": None,
+         "content_hash": f"hash-{i}"}
+        for i in range(10)
+    ]
+    counts = concept_crud.bulk_upsert(db, codesystem_id, rows)
+    assert (counts["inserted"], counts["updated"]) == (5, 5)
+    assert sorted(event.operation for event in received) == ["INSERT", "UPDATE"]
+    assert all(is_bulk(event) and event.record_id is None for event in received)
+
+
+def _capture(monkeypatch, table):
+    received = []
+    monkeypatch.setitem(_subscribers, table, [])
+    subscribe(table, received.append)
+    return received
+
+
+def test_concept_update_event_carries_old_code(db, codesystem_id, monkeypatch):
+    received = _capture(monkeypatch, "concept")
+    concept = db.query(Concept).filter(Concept.codesystem_id == codesystem_id, Concept.code == "E1").one()
+    concept_crud.update(db, concept.id, ConceptUpdate(code="E1-renamed"))
+    [event] = received
+    assert event.old["code"] == "E1"
+    assert event.new["code"] == "E1-renamed"
+
+
+def test_conceptmap_update_event_carries_old_target(db, codesystem_id, monkeypatch):
+    received = _capture(monkeypatch, "conceptmap")
+    source, first, second = (uuid.uuid4() for _ in range(3))
+    row = ConceptMap(source_codesystem_id=codesystem_id, target_codesystem_id=codesystem_id,
+                     source_code=source, target_code=first, equivalence="equivalent")
+    db.add(row)
+    db.commit()
+    conceptmap_crud.update(db, row.id, ConceptMapUpdate(target_code=second))
+    [event] = received
+    assert event.old["target_code"] == first
+    assert event.new["target_code"] == second
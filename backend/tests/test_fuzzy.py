@@ -0,0 +1,57 @@
+"""Fuzzy code lookup agrees with a brute-force edit distance"""
+import itertools
+
+import pytest
+
+from app.utils.fuzzy import MAX_DISTANCE, SymmetricDeleteIndex, edit_distances, within
+
+CODES = ["A", "B", "AB", "BA", "AC", "ABC", "ACB", "BCA", "ABCD", "ABDC", "XYZ", "A1", "AA11", "TM2"]
+QUERIES = ["", "A", "Z", "AB", "CA", "ABC", "BAC", "AXC", "ABCDE", "XY", "TM", "1", "A11", "AB11"]
+
+
+def osa(a: str, b: str) -> int:
+    """Optimal string alignment distance, straight from its definition"""
+    d = [[i + j if i == 0 or j == 0 else 0 for j in range(len(b) + 1)] for i in range(len(a) + 1)]
+    for i, j in itertools.product(range(1, len(a) + 1), range(1, len(b) + 1)):
+        d[i][j] = min(d[i - 1][j] + 1, d[i][j - 1] + 1, d[i - 1][j - 1] + (a[i - 1] != b[j - 1]))
+        if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+            d[i][j] = min(d[i][j], d[i - 2][j - 2] + 1)
+    return d[len(a)][len(b)]
+
+
+@pytest.fixture(scope="module")
+def index():
+    index = SymmetricDeleteIndex()
+    for code in CODES:
+        index.add(code)
+    return index
+
+
+@pytest.mark.parametrize("query", QUERIES)
+@pytest.mark.parametrize("max_distance", range(MAX_DISTANCE + 1))
+def test_lookup_matches_brute_force(index, query, max_distance):
+    expected = sorted((osa(query, code), code) for code in CODES if osa(query, code) <= max_distance)
+    found = index.lookup(query, limit=len(CODES), max_distance=max_distance)
+    assert found == [(code, dist) for dist, code in expected]
+
+
+def test_substitution_on_one_character_code(index):
+    assert ("B", 1) in index.lookup("A", limit=len(CODES), max_distance=1)
+
+
+@pytest.mark.parametrize("query", QUERIES)
+def test_distance_helpers_match_brute_force(query):
+    for code in CODES:
+        distance = osa(query, code)
+        for limit in range(MAX_DISTANCE + 1):
+            assert within(query, code, limit) == (distance <= limit)
+        if code:
+            assert edit_distances(query, [code]).tolist() == [min(distance, MAX_DISTANCE + 1)]
+
+
+def test_discard_removes_short_codes():
+    index = SymmetricDeleteIndex()
+    for code in ("A", "B"):
+        index.add(code)
+    index.discard("B")
+    assert index.lookup("C", limit=5) == [("A", 1)]
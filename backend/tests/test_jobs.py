@@ -0,0 +1,101 @@
+"""Job claiming, cancellation, stale detection and queue limits"""
+import uuid
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.crud.job import job as job_crud
+from app.db import SessionLocal
+from app.main import app
+from app.models import Job
+from app.utils.jobs import JobCancelled, JobContext, job_runner
+
+
+@pytest.fixture
+def kind():
+    # A kind of its own, so a dispatcher started by another test never claims these jobs
+    return f"test-{uuid.uuid4()}"
+
+
+def _queue(db, kind, age_seconds=0):
+    job = job_crud.create(db, kind=kind)
+    job.created_at = datetime.now(timezone.utc) - timedelta(seconds=age_seconds)
+    db.commit()
+    return job
+
+
+def test_claim_takes_oldest_queued_job_once(db, kind):
+    newer = _queue(db, kind, age_seconds=10)
+    older = _queue(db, kind, age_seconds=20)
+    assert job_crud.claim_next(db, [kind], owner="a").id == older.id
+    assert job_crud.claim_next(db, [kind], owner="b").id == newer.id
+    assert job_crud.claim_next(db, [kind], owner="c") is None
+    db.refresh(older)
+    assert (older.status, older.owner) == ("running", "a")
+
+
+@pytest.mark.postgres
+def test_claim_skips_a_job_locked_by_another_worker(db, kind):
+    locked = _queue(db, kind, age_seconds=20)
+    free = _queue(db, kind, age_seconds=10)
+    other = SessionLocal()
+    try:
+        # Another worker is between its SELECT ... FOR UPDATE and its commit
+        other.query(Job).filter(Job.id == locked.id).with_for_update().one()
+        assert job_crud.claim_next(db, [kind], owner="a").id == free.id
+    finally:
+        other.rollback()
+        other.close()
+
+
+def test_cancel_queued_job(db, kind):
+    job = _queue(db, kind)
+    assert job_crud.request_cancel(db, job).status == "cancelled"
+    assert job_crud.claim_next(db, [kind], owner="a") is None
+
+
+def test_cancel_racing_a_claim_asks_the_runner_to_stop(db, kind):
+    job = _queue(db, kind)
+    assert job.status == "queued"
+    # Another worker claims the job after this request read it as queued
+    other = SessionLocal()
+    try:
+        job_crud.claim_next(other, [kind], owner="other")
+    finally:
+        other.close()
+    cancelled = job_crud.request_cancel(db, job)
+    assert (cancelled.status, cancelled.cancel_requested) == ("running", True)
+
+
+def test_progress_raises_once_cancel_requested(db, kind):
+    job = _queue(db, kind)
+    job_crud.claim_next(db, [kind], owner="a")
+    context = JobContext(job.id)
+    context.progress(1, 10, force=True)
+    job_crud.request_cancel(db, job)
+    with pytest.raises(JobCancelled):
+        context.progress(2, 10, force=True)
+    db.refresh(job)
+    assert (job.progress, job.total) == (2, 10)
+
+
+def test_fail_stale(db, kind):
+    stale = _queue(db, kind, age_seconds=20)
+    live = _queue(db, kind, age_seconds=10)
+    job_crud.claim_next(db, [kind], owner="a")
+    job_crud.claim_next(db, [kind], owner="b")
+    db.query(Job).filter(Job.id == stale.id).update({Job.heartbeat_at: datetime.now(timezone.utc) - timedelta(hours=1)})
+    db.commit()
+    assert job_crud.fail_stale(db, stale_after=120) >= 1
+    db.refresh(stale)
+    db.refresh(live)
+    assert (stale.status, live.status) == ("failed", "running")
+
+
+def test_full_queue_answers_429(monkeypatch):
+    monkeypatch.setattr(job_runner, "max_queued", 0)
+    with TestClient(app) as client:
+        response = client.get("/api/v1/$export")
+    assert response.status_code == 429
+    assert response.headers["retry-after"] == "30"
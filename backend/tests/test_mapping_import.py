@@ -0,0 +1,37 @@
+"""Bulk mapping import rejects malformed uploads with a 400"""
+import pytest
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.utils.mapping_import import ImportFormatError, parse_fhir
+
+
+@pytest.mark.parametrize("resource, location", [
+    ({"resourceType": "ConceptMap", "group": ["x"]}, "ConceptMap group[0]"),
+    ({"resourceType": "ConceptMap", "id": "m", "group": {"element": []}}, "ConceptMap/m group"),
+    ({"resourceType": "ConceptMap", "group": [{"element": [1]}]}, "group[0].element[0]"),
+    ({"resourceType": "ConceptMap", "group": [{"element": [{"code": "A", "target": "B"}]}]}, "element[0].target"),
+    ({"resourceType": "Bundle", "entry": ["x"]}, "Bundle entry[0]"),
+    ({"resourceType": "Bundle", "entry": [{"resource": {"resourceType": "ConceptMap", "group": [None]}}]}, "group[0]"),
+])
+def test_malformed_conceptmap_is_a_format_error(resource, location):
+    with pytest.raises(ImportFormatError, match=location.replace("[", r"\[").replace("]", r"\]")):
+        parse_fhir(resource)
+
+
+def test_malformed_conceptmap_upload_is_400():
+    with TestClient(app) as client:
+        response = client.post("/api/v1/conceptmaps/bulk", json={"resourceType": "ConceptMap", "group": ["x"]})
+    assert response.status_code == 400
+    assert "group[0] must be an object" in response.json()["detail"]
+
+
+def test_well_formed_conceptmap_reports_row_errors():
+    resource = {"resourceType": "ConceptMap", "group": [{
+        "source": "https://example.org/unknown", "target": "https://example.org/unknown",
+        "element": [{"code": "A", "target": [{"code": "B", "equivalence": "equivalent"}]}],
+    }]}
+    with TestClient(app) as client:
+        response = client.post("/api/v1/conceptmaps/bulk", json=resource)
+    assert response.status_code == 200
+    assert (response.json()["received"], response.json()["invalid"]) == (1, 1)
@@ -0,0 +1,44 @@
+"""Property filters match values of every type, compared as text"""
+import uuid
+
+import pytest
+
+from app.crud.concept import concept as concept_crud
+from app.models import CodeSystem, Concept
+
+
+@pytest.fixture
+def codesystem_id(db):
+    cs = CodeSystem(url=f"https://example.org/cs/{uuid.uuid4()}", name="property-test")
+    db.add(cs)
+    db.flush()
+    db.add_all([
+        Concept(codesystem_id=cs.id, code="A", properties=[
+            {"code": "dosha", "valueCode": "vata"},
+            {"code": "inactive", "valueBoolean": True},
+            {"code": "level", "valueInteger": 2},
+        ]),
+        Concept(codesystem_id=cs.id, code="B", properties=[
+            {"code": "dosha", "valueString": "pitta"},
+            {"code": "inactive", "valueBoolean": False},
+            {"code": "level", "valueInteger": 12},
+        ]),
+    ])
+    db.commit()
+    return cs.id
+
+
+@pytest.mark.parametrize("code, values, expected", [
+    ("dosha", ["vata"], ["A"]),
+    ("dosha", ["pitta"], ["B"]),
+    ("inactive", ["true"], ["A"]),
+    ("inactive", ["false"], ["B"]),
+    ("level", ["12"], ["B"]),
+    ("level", ["2", "12"], ["A", "B"]),
+    ("level", ["02"], []),
+    ("inactive", ["1"], []),
+])
+def test_property_filter(db, codesystem_id, code, values, expected):
+    found = concept_crud.get_multi(db, codesystem_id=codesystem_id, properties=[(code, values)])
+    assert sorted(c.code for c in found) == expected
+    assert concept_crud.count(db, codesystem_id=codesystem_id, properties=[(code, values)]) == len(expected)
@@ -0,0 +1,115 @@
+"""Release diffs and applying them to a codesystem"""
+import uuid
+
+from app.crud.release import release as release_crud
+from app.models import CodeSystem, CodeSystemRelease, Concept, ConceptMap, Tombstone
+from app.utils.release_diff import ReleaseDiff, stored_hashes
+
+
+def _row(code: str, display: str) -> dict:
+    # Tests only need hashes that differ exactly when the content does
+    return {
+        "code": code, "display": display, "definition": None, "properties": {}, "raw": {},
+        "content_hash": f"hash:{display}",
+    }
+
+
+def _codesystem(db, version: str = "1.0") -> CodeSystem:
+    cs = CodeSystem(url=f"https://example.org/cs/{uuid.uuid4()}", name="release-test", version=version)
+    db.add(cs)
+    db.commit()
+    return cs
+
+
+def _concept(db, cs: CodeSystem, code: str, display: str, content_hash="") -> Concept:
+    concept = Concept(
+        codesystem_id=cs.id, code=code, display=display,
+        content_hash=f"hash:{display}" if content_hash == "" else content_hash,
+    )
+    db.add(concept)
+    db.commit()
+    return concept
+
+
+def test_diff_sorts_rows_into_added_changed_removed():
+    diff = ReleaseDiff({"A": "hash:a", "B": "hash:b", "C": "hash:c"})
+    diff.add([_row("A", "a"), _row("B", "b2"), _row("D", "d")])
+    assert sorted(diff.added) == ["D"]
+    assert sorted(diff.changed) == ["B"]
+    assert diff.removed == ["C"]
+    assert diff.counts() == {"added": 1, "changed": 1, "removed": 1, "unchanged": 1, "duplicates": 0}
+
+
+def test_diff_null_stored_hash_is_changed():
+    diff = ReleaseDiff({"A": None})
+    diff.add([_row("A", "a")])
+    assert sorted(diff.changed) == ["A"]
+    assert diff.counts()["unchanged"] == 0
+
+
+def test_diff_duplicate_code_counts_once_and_last_wins():
+    diff = ReleaseDiff({"A": "hash:a"})
+    diff.add([_row("B", "first")])
+    diff.add([_row("B", "second"), _row("A", "a")])
+    assert diff.added["B"]["display"] == "second"
+    assert diff.counts() == {"added": 1, "changed": 0, "removed": 0, "unchanged": 1, "duplicates": 1}
+
+
+def test_diff_summary_lists_codes_in_order():
+    diff = ReleaseDiff({})
+    diff.add([_row(code, code) for code in ("C", "A", "B")])
+    assert diff.summary(limit=2)["codes"] == {"added": ["A", "B"], "changed": [], "removed": []}
+
+
+def test_apply_writes_delta_tombstones_and_bumps_version(db):
+    cs = _codesystem(db)
+    other = _codesystem(db)
+    kept = _concept(db, cs, "KEEP", "keep")
+    _concept(db, cs, "EDIT", "edited via API", content_hash=None)
+    gone = _concept(db, cs, "GONE", "gone")
+    target = _concept(db, other, "T1", "target")
+    mapping = ConceptMap(
+        source_codesystem_id=cs.id, target_codesystem_id=other.id,
+        source_code=gone.id, target_code=target.id, equivalence="equivalent",
+    )
+    kept_mapping = ConceptMap(
+        source_codesystem_id=cs.id, target_codesystem_id=other.id,
+        source_code=kept.id, target_code=target.id, equivalence="equivalent",
+    )
+    db.add_all([mapping, kept_mapping])
+    db.commit()
+    mapping_id, gone_id, kept_version = mapping.id, gone.id, kept.version_id
+
+    diff = ReleaseDiff(stored_hashes(db, cs.id))
+    diff.add([_row("KEEP", "keep"), _row("EDIT", "edit"), _row("NEW", "new")])
+    release = release_crud.apply(db, cs.id, diff, "2.0", source="release.csv")
+
+    db.expire_all()
+    concepts = {c.code: c for c in db.query(Concept).filter(Concept.codesystem_id == cs.id)}
+    assert sorted(concepts) == ["EDIT", "KEEP", "NEW"]
+    assert concepts["EDIT"].display == "edit"
+    assert concepts["EDIT"].content_hash == "hash:edit"
+    assert concepts["KEEP"].version_id == kept_version
+    assert db.get(ConceptMap, mapping_id) is None
+    assert db.get(ConceptMap, kept_mapping.id) is not None
+
+    tombstones = {(t.table_name, t.record_id) for t in db.query(Tombstone).filter(
+        Tombstone.record_id.in_([gone_id, mapping_id]))}
+    assert tombstones == {("concept", gone_id), ("conceptmap", mapping_id)}
+
+    assert db.get(CodeSystem, cs.id).version == "2.0"
+    assert (release.previous_version, release.version) == ("1.0", "2.0")
+    assert (release.added, release.changed, release.removed, release.unchanged) == (1, 1, 1, 1)
+    assert release.summary["conceptmaps_removed"] == 1
+    assert db.query(CodeSystemRelease).filter(CodeSystemRelease.codesystem_id == cs.id).count() == 1
+
+
+def test_apply_same_version_keeps_version_id(db):
+    cs = _codesystem(db)
+    version_id = cs.version_id
+    diff = ReleaseDiff(stored_hashes(db, cs.id))
+    diff.add([_row("A", "a")])
+    release_crud.apply(db, cs.id, diff, "1.0")
+    db.expire_all()
+    stored = db.get(CodeSystem, cs.id)
+    assert (stored.version, stored.version_id) == ("1.0", version_id)
@@ -0,0 +1,80 @@
+"""Identical concurrent reads share one handler run"""
+import asyncio
+import uuid
+
+from app.utils import events
+from app.utils.events import ChangeEvent, publish
+from app.utils.singleflight import SingleFlightMiddleware
+from tests.test_deadlines import call
+
+
+class CountingApp:
+    """Answers after ``release`` is set, counting how often it ran"""
+
+    def __init__(self):
+        self.calls = 0
+        self.release = asyncio.Event()
+
+    async def __call__(self, scope, receive, send):
+        self.calls += 1
+        await self.release.wait()
+        body = str(self.calls).encode()
+        await send({"type": "http.response.start", "status": 200, "headers": [(b"content-length", str(len(body)).encode())]})
+        await send({"type": "http.response.body", "body": body, "more_body": False})
+
+
+def _run(scenario):
+    async def main():
+        app = CountingApp()
+        return app, await scenario(app, SingleFlightMiddleware(app, routes=[("GET", r"/slow")], wait=0.3))
+    return asyncio.run(main())
+
+
+def test_identical_requests_run_handler_once():
+    async def scenario(app, middleware):
+        first = asyncio.ensure_future(call(middleware))
+        second = asyncio.ensure_future(call(middleware))
+        await asyncio.sleep(0.05)
+        app.release.set()
+        return await asyncio.gather(first, second)
+
+    app, responses = _run(scenario)
+    assert app.calls == 1
+    assert [r["body"] for r in responses] == [b"1", b"1"]
+
+
+def test_follower_runs_itself_after_wait():
+    async def scenario(app, middleware):
+        leader = asyncio.ensure_future(call(middleware))
+        await asyncio.sleep(0.05)
+        follower = asyncio.ensure_future(call(middleware))
+        await asyncio.sleep(0.4)
+        # Past the 0.3s wait the follower has started its own run
+        calls = app.calls
+        app.release.set()
+        await asyncio.gather(leader, follower)
+        return calls
+
+    app, calls_before_release = _run(scenario)
+    assert calls_before_release == 2
+
+
+def test_change_event_starts_fresh_flight():
+    async def scenario(app, middleware):
+        leader = asyncio.ensure_future(call(middleware))
+        await asyncio.sleep(0.05)
+        publish(ChangeEvent("concept", "UPDATE", new={"codesystem_id": uuid.uuid4(), "code": None}))
+        after_write = asyncio.ensure_future(call(middleware))
+        await asyncio.sleep(0.05)
+        app.release.set()
+        return await asyncio.gather(leader, after_write)
+
+    app, responses = _run(scenario)
+    assert app.calls == 2
+
+
+def test_middleware_instances_add_no_subscribers():
+    before = {table: len(callbacks) for table, callbacks in events._subscribers.items()}
+    for _ in range(3):
+        SingleFlightMiddleware(CountingApp())
+    assert {table: len(callbacks) for table, callbacks in events._subscribers.items()} == before
@@ -0,0 +1,57 @@
+"""The translation snapshot is not trusted until it includes every local write"""
+import pytest
+
+from app.utils import snapshot
+from app.utils.snapshot import SnapshotStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = SnapshotStore(str(tmp_path / "translation.snap"))
+    yield store
+    if store._timer is not None:
+        store._timer.cancel()
+
+
+def test_rebuild_switches_to_new_snapshot(db, store):
+    store.schedule_rebuild()
+    assert store.current() is None
+    store.rebuild(db)
+    assert store.current() is not None
+
+
+def test_old_snapshot_unused_until_rebuild_swaps(db, store, monkeypatch):
+    store.rebuild(db)
+    build = snapshot.build_snapshot
+    during_build = []
+
+    def build_and_look(session, path):
+        during_build.append(store.current())
+        return build(session, path)
+
+    monkeypatch.setattr(snapshot, "build_snapshot", build_and_look)
+    store.schedule_rebuild()
+    store.rebuild(db)
+    assert during_build == [None]
+    assert store.current() is not None
+
+
+def test_write_during_rebuild_keeps_database_reads(db, store, monkeypatch):
+    build = snapshot.build_snapshot
+
+    def build_with_concurrent_write(session, path):
+        version = build(session, path)
+        store.schedule_rebuild()
+        return version
+
+    monkeypatch.setattr(snapshot, "build_snapshot", build_with_concurrent_write)
+    store.schedule_rebuild()
+    store.rebuild(db)
+    assert store.current() is None
+
+
+def test_rebuilds_are_rate_limited(db, store, monkeypatch):
+    monkeypatch.setattr(snapshot, "SNAPSHOT_MIN_INTERVAL", 30.0)
+    store.rebuild(db)
+    store.schedule_rebuild()
+    assert store._timer.interval > 25
@@ -0,0 +1,48 @@
+"""Subtree listings are paged from the hierarchy, not the database"""
+import uuid
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+
+from app.db import engine
+from app.main import app
+from app.models import CodeSystem, Concept
+
+
+@pytest.fixture
+def codesystem_id(db):
+    cs = CodeSystem(url=f"https://example.org/cs/{uuid.uuid4()}", name="subtree-test")
+    db.add(cs)
+    db.flush()
+    db.add(Concept(codesystem_id=cs.id, code="ROOT", display="Root"))
+    db.add_all(
+        Concept(codesystem_id=cs.id, code=f"C{i:02d}", display=f"Child {i}", properties=[{"code": "parent", "valueCode": "ROOT"}])
+        for i in range(25)
+    )
+    db.commit()
+    return cs.id
+
+
+def test_subtree_pages_cover_every_descendant(codesystem_id):
+    statements = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    seen = []
+    with TestClient(app) as client:
+        event.listen(engine, "before_cursor_execute", capture)
+        try:
+            for page in (1, 2, 3):
+                response = client.get("/api/v1/concepts/", params={
+                    "codesystem_id": str(codesystem_id), "subtree": "ROOT", "page": page, "size": 10,
+                })
+                assert response.status_code == 200
+                body = response.json()
+                assert (body["total"], body["pages"]) == (26, 3)
+                seen.extend(item["code"] for item in body["items"])
+        finally:
+            event.remove(engine, "before_cursor_execute", capture)
+    assert sorted(seen) == sorted(["ROOT"] + [f"C{i:02d}" for i in range(25)])
+    assert not any("count(" in statement.lower() and "FROM concept" in statement for statement in statements)
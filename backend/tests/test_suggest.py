@@ -0,0 +1,39 @@
+"""Suggestion indexes are swapped in atomically and reopened by other workers"""
+import os
+import uuid
+from types import SimpleNamespace
+
+from app.utils.events import ChangeEvent, publish
+from app.utils.suggest import TfidfIndex, suggestion_indexes
+
+
+def _index(*displays):
+    rows = [SimpleNamespace(id=uuid.uuid4(), code=f"T{i}", display=d, definition=None) for i, d in enumerate(displays)]
+    return TfidfIndex.build(rows, {})
+
+
+def test_save_swaps_symlink(tmp_path):
+    path = str(tmp_path / "index")
+    for displays in (("fever",), ("fever", "cough"), ("fever", "cough", "headache")):
+        _index(*displays).save(path)
+        assert os.path.islink(path)
+        assert TfidfIndex.load(path).meta["concepts"] == len(displays)
+    # The current build and the one before it
+    assert len([entry for entry in os.listdir(tmp_path) if entry.startswith("index.")]) == 2
+
+
+def test_save_replaces_unversioned_directory(tmp_path):
+    path = str(tmp_path / "index")
+    os.makedirs(path)
+    _index("fever").save(path)
+    assert os.path.islink(path)
+
+
+def test_remote_rebuild_drops_loaded_index(monkeypatch):
+    codesystem_id = uuid.uuid4()
+    index = _index("fever")
+    monkeypatch.setitem(suggestion_indexes._indexes, codesystem_id, index)
+    publish(ChangeEvent("suggest_index", "UPDATE", codesystem_id))
+    assert suggestion_indexes._indexes[codesystem_id] is index
+    publish(ChangeEvent("suggest_index", "UPDATE", codesystem_id, remote=True))
+    assert codesystem_id not in suggestion_indexes._indexes
@@ -0,0 +1,51 @@
+"""Delta sync watermarks and tombstone retention"""
+import uuid
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.crud import sync as sync_crud
+from app.main import app
+from app.models import Tombstone
+from app.utils.watermark import Cursor, Watermark, decode_watermark, encode_watermark
+
+
+@pytest.fixture
+def client():
+    with TestClient(app) as client:
+        yield client
+
+
+def test_naive_since_is_utc():
+    watermark = decode_watermark("2026-01-02T03:04:05")
+    assert watermark.changed.at == datetime(2026, 1, 2, 3, 4, 5, tzinfo=timezone.utc)
+
+
+def test_prune_tombstones(db):
+    now = datetime.now(timezone.utc)
+    old, recent = uuid.uuid4(), uuid.uuid4()
+    db.add_all([
+        Tombstone(table_name="concept", record_id=old, deleted_at=now - timedelta(days=100)),
+        Tombstone(table_name="concept", record_id=recent, deleted_at=now - timedelta(days=1)),
+    ])
+    db.commit()
+    assert sync_crud.sync.prune_tombstones(db, now - timedelta(days=90), batch_size=1) >= 1
+    remaining = {row.record_id for row in db.query(Tombstone.record_id)}
+    assert old not in remaining and recent in remaining
+
+
+def test_watermark_past_retention_is_gone(client, monkeypatch):
+    monkeypatch.setattr(sync_crud, "TOMBSTONE_RETENTION_DAYS", 30.0)
+    since = (datetime.now(timezone.utc) - timedelta(days=31)).isoformat()
+    assert client.get("/api/v1/sync/concepts", params={"_since": since}).status_code == 410
+    since = (datetime.now(timezone.utc) - timedelta(days=29)).isoformat()
+    assert client.get("/api/v1/sync/concepts", params={"_since": since}).status_code == 200
+
+
+def test_quiet_deletion_stream_moves_forward(client):
+    stale = datetime.now(timezone.utc) - timedelta(days=10)
+    token = encode_watermark(Watermark(None, Cursor(stale, uuid.UUID(int=0))))
+    response = client.get("/api/v1/sync/codesystems", params={"_since": token, "_count": 5000})
+    assert response.status_code == 200
+    assert decode_watermark(response.json()["next"]).deleted.at > stale